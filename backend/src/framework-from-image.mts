@@ -138,7 +138,8 @@ export class FrameworkFromImage {
   }
 
   /**
-   * Gets the path to the get-oci-image-annotations.py script.
+   * Gets the content of the get-oci-image-annotations.py script, with oci_registry_lib.py
+   * prepended when it is available.
    * Uses jsonPath from PersistenceManager, which can be configured during initialization.
    */
   private static getScriptContent(): string {
@@ -150,6 +151,15 @@ export class FrameworkFromImage {
     if (!scriptContent) {
       throw new Error("get-oci-image-annotations.py not found in shared scripts");
     }
+    // Prepend the shared registry client like a template "library".
+    // Without it the script falls back to skopeo.
+    const libraryContent = repositories.getScript({
+      name: "oci_registry_lib.py",
+      scope: "shared",
+    });
+    if (libraryContent) {
+      return `${libraryContent}\n\n# --- Script starts here ---\n${scriptContent}`;
+    }
     return scriptContent;
   }
 
@@ -236,7 +236,8 @@ export class TemplateDocumentGenerator {
             }
             commandDetails = `\`${scriptDisplay}\``;
             if (cmd.library) {
-              commandDetails += ` (library: \`${cmd.library}\`)`;
+              const libraries = Array.isArray(cmd.library) ? cmd.library : [cmd.library];
+              commandDetails += ` (library: ${libraries.map((l) => `\`${l}\``).join(", ")})`;
             }
           } else if (cmd.command) {
             commandType = "Command";
@@ -433,20 +433,37 @@ export class TemplateProcessor extends EventEmitter {
         };
         
         if (cmd.library !== undefined) {
-          const libraryResolution = this.resolver.resolveLibraryContent(opts.application, cmd.library);
-          scriptValidator.validateLibraryContent(
-            cmd.library,
-            opts.errors,
-            libraryResolution.content,
-            opts.requestedIn,
-            opts.parentTemplate,
-          );
-          const libraryPath = this.resolver.resolveLibraryPath(libraryResolution.ref);
-          if (libraryResolution.content !== null) {
-            commandWithLibrary.libraryContent = libraryResolution.content;
+          // Several libraries are concatenated in the given order
+          const libraries = Array.isArray(cmd.library) ? cmd.library : [cmd.library];
+          const libraryContents: string[] = [];
+          const libraryPaths: string[] = [];
+          for (const library of libraries) {
+            const libraryResolution = this.resolver.resolveLibraryContent(opts.application, library);
+            scriptValidator.validateLibraryContent(
+              library,
+              opts.errors,
+              libraryResolution.content,
+              opts.requestedIn,
+              opts.parentTemplate,
+            );
+            const libraryPath = this.resolver.resolveLibraryPath(libraryResolution.ref);
+            if (libraryResolution.content !== null) {
+              libraryContents.push(libraryResolution.content);
+            }
+            if (libraryPath) {
+              libraryPaths.push(libraryPath);
+            }
           }
-          if (libraryPath) {
-            commandWithLibrary.libraryPath = libraryPath;
+          // Content is only set when every library resolved; the missing ones are in opts.errors
+          if (libraryContents.length === libraries.length) {
+            commandWithLibrary.libraryContent = libraryContents.join("\n\n");
+          }
+          if (Array.isArray(cmd.library)) {
+            if (libraryPaths.length > 0) {
+              commandWithLibrary.libraryPaths = libraryPaths;
+            }
+          } else if (libraryPaths.length > 0) {
+            commandWithLibrary.libraryPath = libraryPaths[0]!;
           }
         }
         
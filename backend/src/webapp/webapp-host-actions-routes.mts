@@ -0,0 +1,215 @@
+import express from "express";
+import {
+  ApiUri,
+  ICommand,
+  IHostAction,
+  IHostActionResponse,
+  IHostActionsResponse,
+  IOciImagePlanResponse,
+  IParameterValue,
+  IPostHostActionBody,
+  IPostOciImagePlanBody,
+} from "@src/types.mjs";
+import { IVEContext } from "../backend-types.mjs";
+import { ContextManager } from "../context-manager.mjs";
+import { PersistenceManager } from "../persistence/persistence-manager.mjs";
+import { VeExecution } from "../ve-execution/ve-execution.mjs";
+import { determineExecutionMode } from "../ve-execution/ve-execution-constants.mjs";
+import { serializeError } from "./webapp-error-utils.mjs";
+
+/**
+ * Maintenance actions of the VE host: shared templates that act on the host itself
+ * rather than on an application, by action id. Only these can be run through
+ * ApiUri.HostAction.
+ */
+export const HOST_ACTIONS: Record<string, string> = {
+  "prefetch-oci-images": "012-prefetch-oci-images.json",
+  "gc-oci-images": "013-gc-oci-images.json",
+  "plan-oci-image": "014-plan-oci-image.json",
+  "start-oci-cache-server": "015-start-oci-cache-server.json",
+  "start-oci-update-prefetcher": "016-start-oci-update-prefetcher.json",
+};
+
+class HostActionError extends Error {
+  constructor(
+    message: string,
+    public status: number,
+  ) {
+    super(message);
+  }
+}
+
+/**
+ * Runs the commands of a shared template on the VE host, outside of any application.
+ * Scripts and libraries are resolved like the template processor does; inputs not
+ * declared as template parameters are ignored, undeclared ones get their defaults.
+ */
+export async function runSharedTemplate(
+  veContext: IVEContext,
+  templateName: string,
+  values: Record<string, IParameterValue | undefined>,
+): Promise<Map<string, string | number | boolean>> {
+  const repositories = PersistenceManager.getInstance().getRepositories();
+  const template = repositories.getTemplate({ name: templateName, scope: "shared" });
+  if (!template) {
+    throw new HostActionError(`Template ${templateName} not found`, 500);
+  }
+  const inputs: { id: string; value: IParameterValue }[] = [];
+  for (const param of template.parameters ?? []) {
+    const value = values[param.id] ?? param.default;
+    if (value === undefined || value === "") {
+      if (param.required) {
+        throw new HostActionError(`Missing parameter ${param.id}`, 400);
+      }
+      continue;
+    }
+    inputs.push({ id: param.id, value });
+  }
+
+  const commands: ICommand[] = template.commands.map((command) => {
+    const resolved: ICommand = { ...command };
+    if (template.execute_on !== undefined) resolved.execute_on = template.execute_on;
+    if (command.script) {
+      const scriptContent = repositories.getScript({ name: command.script, scope: "shared" });
+      if (!scriptContent) {
+        throw new HostActionError(`${command.script} not found (expected in local/shared/scripts or json/shared/scripts)`, 500);
+      }
+      resolved.scriptContent = scriptContent;
+    }
+    if (command.library !== undefined) {
+      const libraries = Array.isArray(command.library) ? command.library : [command.library];
+      resolved.libraryContent = libraries
+        .map((name) => {
+          const content = repositories.getScript({ name, scope: "shared" });
+          if (!content) {
+            throw new HostActionError(`${name} not found (expected in local/shared/scripts or json/shared/scripts)`, 500);
+          }
+          return content;
+        })
+        .join("\n\n");
+    }
+    return resolved;
+  });
+
+  const ve = new VeExecution(
+    commands,
+    inputs,
+    veContext,
+    new Map(),
+    undefined,
+    determineExecutionMode(),
+  );
+  await ve.run(null);
+  return ve.outputs;
+}
+
+function parseJsonOutput(raw: unknown): unknown {
+  return typeof raw === "string" && raw.trim().length > 0 ? JSON.parse(raw) : undefined;
+}
+
+function sendError(res: express.Response, err: any): void {
+  if (err instanceof HostActionError) {
+    res.status(err.status).json({ error: err.message });
+    return;
+  }
+  const serializedError = serializeError(err);
+  res.status(500).json({
+    error: err instanceof Error ? err.message : String(err),
+    serializedError: serializedError,
+  });
+}
+
+export function registerHostActionsRoutes(
+  app: express.Application,
+  storageContext: ContextManager,
+): void {
+  app.get(ApiUri.HostActions, (_req, res) => {
+    try {
+      const repositories = PersistenceManager.getInstance().getRepositories();
+      const payload: IHostActionsResponse = [];
+      for (const [id, templateName] of Object.entries(HOST_ACTIONS)) {
+        const template = repositories.getTemplate({ name: templateName, scope: "shared" });
+        if (!template) continue;
+        const action: IHostAction = {
+          id,
+          name: template.name,
+          parameters: template.parameters ?? [],
+        };
+        if (template.description !== undefined) action.description = template.description;
+        payload.push(action);
+      }
+      res.status(200).json(payload);
+    } catch (err: any) {
+      sendError(res, err);
+    }
+  });
+
+  app.post(ApiUri.HostAction, express.json(), async (req, res) => {
+    try {
+      const templateName = HOST_ACTIONS[String(req.params.action || "")];
+      if (!templateName) {
+        res.status(404).json({ error: `Unknown host action ${req.params.action}` });
+        return;
+      }
+      const veContextKey = String(req.params.veContext || "").trim();
+      if (!veContextKey) {
+        res.status(400).json({ error: "Missing veContext" });
+        return;
+      }
+      const veContext = storageContext.getVEContextByKey(veContextKey);
+      if (!veContext) {
+        res.status(404).json({ error: "VE context not found" });
+        return;
+      }
+      const body = (req.body ?? {}) as IPostHostActionBody;
+      const values: Record<string, IParameterValue> = {};
+      for (const param of Array.isArray(body.params) ? body.params : []) {
+        if (param && typeof param.name === "string") values[param.name] = param.value;
+      }
+      const outputs = await runSharedTemplate(veContext, templateName, values);
+      const payload: IHostActionResponse = {
+        outputs: [...outputs.entries()].map(([id, value]) => ({ id, value })),
+      };
+      res.status(200).json(payload);
+    } catch (err: any) {
+      sendError(res, err);
+    }
+  });
+
+  // What installing an OCI image would download, asked by the UI before an installation
+  app.post(ApiUri.OciImagePlan, express.json(), async (req, res) => {
+    try {
+      const veContextKey = String(req.params.veContext || "").trim();
+      if (!veContextKey) {
+        res.status(400).json({ error: "Missing veContext" });
+        return;
+      }
+      const veContext = storageContext.getVEContextByKey(veContextKey);
+      if (!veContext) {
+        res.status(404).json({ error: "VE context not found" });
+        return;
+      }
+      const body = (req.body ?? {}) as IPostOciImagePlanBody;
+      if (typeof body.oci_image !== "string" || !body.oci_image.trim()) {
+        res.status(400).json({ error: "Missing oci_image" });
+        return;
+      }
+      const outputs = await runSharedTemplate(veContext, "014-plan-oci-image.json", {
+        oci_image: body.oci_image.trim(),
+        storage: body.storage,
+        registry_username: body.registry_username,
+        registry_password: body.registry_password,
+        platform: body.platform,
+        probe_peers: body.probe_peers === true,
+      });
+      const payload = parseJsonOutput(outputs.get("pull_plan")) as IOciImagePlanResponse | undefined;
+      if (!payload) {
+        res.status(500).json({ error: "plan-oci-image.py returned no plan" });
+        return;
+      }
+      res.status(200).json(payload);
+    } catch (err: any) {
+      sendError(res, err);
+    }
+  });
+}
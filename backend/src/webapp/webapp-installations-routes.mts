@@ -37,12 +37,26 @@ export function registerInstallationsRoutes(
         });
         return;
       }
+      // The script parses the notes markers with deployer_common_lib.py, prepended like a template "library"
+      const libraryContent = repositories.getScript({
+        name: "deployer_common_lib.py",
+        scope: "shared",
+      });
+      if (!libraryContent) {
+        res.status(500).json({
+          error:
+            "deployer_common_lib.py not found (expected in local/shared/scripts or json/shared/scripts)",
+        });
+        return;
+      }
 
       const cmd: ICommand = {
         name: "List Managed OCI Containers",
         execute_on: "ve",
         script: "list-managed-oci-containers.py",
         scriptContent,
+        library: "deployer_common_lib.py",
+        libraryContent,
         outputs: ["containers"],
       };
 
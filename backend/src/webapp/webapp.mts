@@ -4,6 +4,7 @@ import path from "path";
 import { ContextManager } from "../context-manager.mjs";
 import { registerApplicationRoutes } from "./webapp-application-routes.mjs";
 import { registerFrameworkRoutes } from "./webapp-framework-routes.mjs";
+import { registerHostActionsRoutes } from "./webapp-host-actions-routes.mjs";
 import { WebAppIconEndpoint } from "./webapp-icon-endpoint.mjs";
 import { registerInstallationsRoutes } from "./webapp-installations-routes.mjs";
 import { registerSshRoutes } from "./webapp-ssh-routes.mjs";
@@ -36,6 +37,7 @@ export class VEWebApp {
       this.returnResponse.bind(this),
     );
     registerInstallationsRoutes(this.app, this.storageContext);
+    registerHostActionsRoutes(this.app, this.storageContext);
     registerFrameworkRoutes(
       this.app,
       this.storageContext,
@@ -0,0 +1,92 @@
+import { spawnSync } from "child_process";
+import { createTestEnvironment, type TestEnvironment } from "./test-environment.mjs";
+import { TestPersistenceHelper, Volume } from "./test-persistence-helper.mjs";
+
+export interface PythonScriptResult {
+  stdout: string;
+  stderr: string;
+  exitCode: number;
+  /** stdout parsed as JSON, undefined if it is not JSON */
+  json: any;
+}
+
+export interface RunPythonScriptOptions {
+  /** Added to process.env */
+  env?: Record<string, string>;
+  /** Milliseconds (default: 10000) */
+  timeout?: number;
+}
+
+/**
+ * Runs a Python script via stdin with libraries from json/shared/scripts
+ * prepended, like the template system does with "library" + script.
+ */
+export function runPythonScript(
+  persistenceHelper: TestPersistenceHelper,
+  libraries: string[],
+  script: string,
+  opts: RunPythonScriptOptions = {},
+): PythonScriptResult {
+  const library = libraries
+    .map((name) => persistenceHelper.readTextSync(Volume.JsonSharedScripts, name))
+    .join("\n\n");
+  const result = spawnSync("python3", [], {
+    input: libraries.length ? `${library}\n\n# --- Script starts here ---\n${script}` : script,
+    env: { ...process.env, ...opts.env },
+    encoding: "utf-8",
+    timeout: opts.timeout ?? 10000,
+  });
+  const stdout = result.stdout || "";
+  let json: any = undefined;
+  try {
+    json = JSON.parse(stdout);
+  } catch {
+    json = undefined;
+  }
+  return { stdout, stderr: result.stderr || "", exitCode: result.status || 0, json };
+}
+
+export interface OciLibTestSetup {
+  env: TestEnvironment;
+  persistenceHelper: TestPersistenceHelper;
+  /** LXC_MANAGER_OCI_CACHE_DIR of the drivers */
+  cacheDir: string;
+  /** vztmpl cache directory of the storage, STORAGE_DIR of the drivers */
+  storageDir: string;
+  /** Runs a driver snippet after the libraries of the setup */
+  run: (driver: string) => PythonScriptResult;
+  cleanup: () => void;
+}
+
+/**
+ * Test environment for the oci_*_lib.py libraries: an OCI cache and a storage
+ * in the temp dir, and a runner that prepends `libraries` (in template order).
+ */
+export function createOciLibTestSetup(testFileUrl: string, libraries: string[]): OciLibTestSetup {
+  const env = createTestEnvironment(testFileUrl, {
+    jsonIncludePatterns: ["^shared/scripts/(deployer_common|oci_\\w+)_lib\\.py$"],
+  });
+  env.initPersistence({ enableCache: false });
+  const persistenceHelper = new TestPersistenceHelper({
+    repoRoot: env.repoRoot,
+    localRoot: env.localDir,
+    jsonRoot: env.jsonDir,
+    schemasRoot: env.schemaDir,
+  });
+  const cacheDir = persistenceHelper.resolve(Volume.LocalRoot, "oci-cache");
+  const storageDir = persistenceHelper.resolve(Volume.LocalRoot, "template/cache");
+  persistenceHelper.ensureDirSync(Volume.LocalRoot, "template/cache");
+  const driverEnv = {
+    LXC_MANAGER_OCI_CACHE_DIR: cacheDir,
+    STORAGE_DIR: storageDir,
+    LXC_MANAGER_HOST_CAPABILITIES: persistenceHelper.resolve(Volume.LocalRoot, "run/host-capabilities.json"),
+  };
+  return {
+    env,
+    persistenceHelper,
+    cacheDir,
+    storageDir,
+    run: (driver) => runPythonScript(persistenceHelper, libraries, driver, { env: driverEnv }),
+    cleanup: () => env.cleanup(),
+  };
+}
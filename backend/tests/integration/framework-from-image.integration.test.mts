@@ -31,7 +31,7 @@ describe("FrameworkFromImage - Integration Tests", () => {
 
     beforeAll(() => {
       env = createTestEnvironment(import.meta.url, {
-        jsonIncludePatterns: ["^shared/scripts/get-oci-image-annotations\\.py$"],
+        jsonIncludePatterns: ["^shared/scripts/(get-oci-image-annotations|oci_registry_lib)\\.py$"],
       });
       persistenceHelper = new TestPersistenceHelper({
         repoRoot: env.repoRoot,
@@ -24,7 +24,7 @@ describe("WebApp Installations API", () => {
 
     env = createTestEnvironment(import.meta.url, {
       // Provide required script for /api/installations via json/ (no manual copying)
-      jsonIncludePatterns: [".*list-managed-oci-containers.*"],
+      jsonIncludePatterns: [".*list-managed-oci-containers.*", ".*deployer_common_lib.*"],
       // Schemas are read from repo directly by default (no copying)
     });
     tmpPve = createTempDir("lxc-pve-");
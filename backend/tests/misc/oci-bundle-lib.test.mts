@@ -0,0 +1,133 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import { createOciLibTestSetup, type OciLibTestSetup } from "@tests/helper/python-script-helper.mjs";
+
+// In the order of the templates' "library" lists
+const LIBRARIES = [
+  "deployer_common_lib.py",
+  "oci_registry_lib.py",
+  "oci_store_lib.py",
+  "oci_squash_lib.py",
+  "oci_mirror_lib.py",
+  "oci_gc_lib.py",
+  "oci_rootfs_lib.py",
+  "oci_pull_lib.py",
+  "oci_bundle_lib.py",
+];
+
+describe("oci_bundle_lib.py", () => {
+  let setup: OciLibTestSetup;
+
+  beforeEach(() => {
+    setup = createOciLibTestSetup(import.meta.url, LIBRARIES);
+  });
+
+  afterEach(() => {
+    setup.cleanup();
+  });
+
+  it("should import offline bundles with verified layers like a pull", () => {
+    const result = setup.run(`
+import io
+
+bundle = os.path.join(os.path.dirname(os.path.dirname(os.environ["STORAGE_DIR"])), "bundle")
+
+def blob(blobs, data):
+    digest = sha256_digest(data)
+    blobs[digest] = data
+    return {"digest": digest, "size": len(data)}
+
+def image(blobs, os_release, arch="amd64"):
+    layers = []
+    for name, data in (("etc/os-release", os_release.encode("utf-8")), ("app/data", os.urandom(200000))):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        layers.append(blob(blobs, gzip.compress(buf.getvalue())))
+    config = blob(blobs, json.dumps({"architecture": arch, "os": "linux",
+                                     "config": {"Env": [os_release], "Labels": {"org.opencontainers.image.version": "2.1"}}}).encode("utf-8"))
+    return blob(blobs, json.dumps({"schemaVersion": 2, "mediaType": OCI_MANIFEST_MEDIA_TYPE,
+                                   "config": config, "layers": layers}).encode("utf-8"))
+
+# A layout with a multi-platform index and an oci-archive with one image manifest
+layout_blobs, archive_blobs = {}, {}
+amd64, arm64 = image(layout_blobs, "ID=debian"), image(layout_blobs, "ID=debian", "arm64")
+top = blob(layout_blobs, json.dumps({"schemaVersion": 2, "mediaType": "application/vnd.oci.image.index.v1+json", "manifests": [
+    {"mediaType": OCI_MANIFEST_MEDIA_TYPE, **arm64, "platform": {"os": "linux", "architecture": "arm64"}},
+    {"mediaType": OCI_MANIFEST_MEDIA_TYPE, **amd64, "platform": {"os": "linux", "architecture": "amd64"}}]}).encode("utf-8"))
+os.makedirs(os.path.join(bundle, "web", "blobs", "sha256"))
+for digest, data in layout_blobs.items():
+    with open(os.path.join(bundle, "web", "blobs", "sha256", digest[7:]), "wb") as f:
+        f.write(data)
+app = image(archive_blobs, "ID=alpine")
+with tarfile.open(os.path.join(bundle, "app.tar"), "w") as tar:
+    for digest, data in archive_blobs.items():
+        info = tarfile.TarInfo("blobs/sha256/" + digest[7:])
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+write_json_atomic(os.path.join(bundle, BUNDLE_MANIFEST), {"images": [
+    {"image": "app:latest", "digest": app["digest"], "path": "app.tar"},
+    {"image": "ghcr.io/owner/web:1.0", "digest": top["digest"], "path": "web"}]})
+
+index = StorageIndex("local", os.environ["STORAGE_DIR"])
+index.refresh()
+imported = import_bundle(bundle, index, PullOptions(), workers=4)
+result = {"imported": imported, "app": app["digest"], "web": top["digest"], "amd64": amd64["digest"],
+          "files": sorted(os.listdir(index.storage_dir)),
+          "recorded": index.lookup_digest("ghcr.io/owner/web", top["digest"]),
+          "layout": find_manifest_descriptor(layout_dir("ghcr.io/owner/web"), "1.0")["digest"],
+          "inspect": load_cached_inspect("ghcr.io/owner/web", "1.0", None)["manifest_digest"]}
+
+# A second import writes nothing; a corrupt layer fails before anything is stored
+mtime = os.stat(os.path.join(index.storage_dir, "app_2.1.tar")).st_mtime_ns
+result["again"] = [r["template_path"] for r in import_bundle(bundle, index, PullOptions())]
+result["rewritten"] = os.stat(os.path.join(index.storage_dir, "app_2.1.tar")).st_mtime_ns != mtime
+other = image(layout_blobs, "ID=ubuntu")
+os.makedirs(os.path.join(bundle, "other", "blobs", "sha256"))
+manifest = json.loads(layout_blobs[other["digest"]])
+for digest, data in layout_blobs.items():
+    if digest == manifest["layers"][1]["digest"]:
+        data = data[:-1] + bytes([data[-1] ^ 1])
+    with open(os.path.join(bundle, "other", "blobs", "sha256", digest[7:]), "wb") as f:
+        f.write(data)
+write_json_atomic(os.path.join(bundle, BUNDLE_MANIFEST), {"images": [
+    {"image": "other:1.0", "digest": other["digest"], "path": "other"}]})
+try:
+    import_bundle(bundle, index, PullOptions())
+    result["corrupt"] = None
+except PullError as e:
+    result["corrupt"] = str(e)
+result["corrupt_stored"] = has_blob(manifest["layers"][1]["digest"])
+result["intact_stored"] = has_blob(manifest["layers"][0]["digest"])
+write_json_atomic(os.path.join(bundle, BUNDLE_MANIFEST), {"images": [
+    {"image": "other:1.0", "digest": other["digest"], "path": "../other"}]})
+try:
+    import_bundle(bundle, index, PullOptions())
+except PullError as e:
+    result["outside"] = str(e)
+print(json.dumps(result))
+`);
+    expect(result.exitCode).toBe(0);
+    const [app, web] = result.json.imported;
+    // "latest" is stored under the version from the labels, like a pull does
+    expect(app).toEqual({
+      template_path: "local:vztmpl/app_2.1.tar", ostype: "alpine", application_id: "app",
+      oci_image: "app:latest", oci_image_tag: "2.1", rootfs_clone_source: "",
+    });
+    expect(web.template_path).toBe("local:vztmpl/web_1.0.tar");
+    expect(web.ostype).toBe("debian");
+    expect(result.json.files).toEqual([".app_2.1.tar.verified", ".web_1.0.tar.verified",
+      "app_2.1.tar", "web_1.0.tar"]);
+    // Recorded by the digest of the index, archived with the amd64 manifest
+    expect(result.json.recorded).toBe("local:vztmpl/web_1.0.tar");
+    expect(result.json.layout).toBe(result.json.amd64);
+    expect(result.json.inspect).toBe(result.json.web);
+    expect(result.json.again).toEqual(["local:vztmpl/app_2.1.tar", "local:vztmpl/web_1.0.tar"]);
+    expect(result.json.rewritten).toBe(false);
+    expect(result.json.corrupt).toContain("Checksum mismatch");
+    expect(result.json.corrupt_stored).toBe(false);
+    expect(result.json.intact_stored).toBe(true);
+    expect(result.json.outside).toContain("outside the bundle directory");
+  });
+});
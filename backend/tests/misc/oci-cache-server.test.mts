@@ -0,0 +1,291 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import { createTestEnvironment, TestEnvironment } from "@tests/helper/test-environment.mjs";
+import { TestPersistenceHelper, Volume } from "@tests/helper/test-persistence-helper.mjs";
+import { runPythonScript, type PythonScriptResult } from "@tests/helper/python-script-helper.mjs";
+
+// The "library" list of 015-start-oci-cache-server.json
+const LIBRARIES = [
+  "deployer_common_lib.py",
+  "oci_registry_lib.py",
+  "oci_store_lib.py",
+  "oci_mirror_lib.py",
+  "oci_daemon_lib.py",
+];
+
+describe("oci-cache-server.py", () => {
+  let env: TestEnvironment;
+  let persistenceHelper: TestPersistenceHelper;
+
+  beforeEach(async () => {
+    env = createTestEnvironment(import.meta.url, {
+      jsonIncludePatterns: [
+        "^shared/scripts/(deployer_common|oci_\\w+)_lib\\.py$",
+        "^shared/scripts/oci-cache-server\\.py$",
+      ],
+    });
+    env.initPersistence({ enableCache: false });
+    persistenceHelper = new TestPersistenceHelper({
+      repoRoot: env.repoRoot,
+      localRoot: env.localDir,
+      jsonRoot: env.jsonDir,
+      schemasRoot: env.schemaDir,
+    });
+  });
+
+  afterEach(async () => {
+    env.cleanup();
+  });
+
+  /**
+   * Runs library + server script without its main (which would daemonize),
+   * followed by a driver that starts the server in a thread.
+   */
+  function runServerDriver(driver: string): PythonScriptResult {
+    const script = persistenceHelper
+      .readTextSync(Volume.JsonSharedScripts, "oci-cache-server.py")
+      .split('\nif __name__ == "__main__":')[0];
+    return runPythonScript(persistenceHelper, LIBRARIES, `${script}\n${driver}`, {
+      env: {
+        LXC_MANAGER_OCI_CACHE_DIR: persistenceHelper.resolve(Volume.LocalRoot, "oci-cache"),
+        LXC_MANAGER_OCI_MIRROR_CONFIG: persistenceHelper.resolve(Volume.LocalRoot, "pve/oci-mirror.json"),
+        LXC_MANAGER_HOST_CAPABILITIES: persistenceHelper.resolve(Volume.LocalRoot, "run/host-capabilities.json"),
+      },
+      timeout: 20000,
+    });
+  }
+
+  it("should download each blob once for concurrent clients and pass manifests through", () => {
+    const result = runServerDriver(`
+import http.server
+import urllib.request
+
+layer = os.urandom(2 * 1024 * 1024 + 7)
+layer_digest = sha256_digest(layer)
+config = json.dumps({"architecture": "amd64", "os": "linux", "config": {}}).encode("utf-8")
+manifest = json.dumps({"schemaVersion": 2, "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                       "config": {"digest": sha256_digest(config), "size": len(config)},
+                       "layers": [{"digest": layer_digest, "size": len(layer)}]}).encode("utf-8")
+upstream_requests = {}
+
+class Registry(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get("Authorization") != "Basic " + base64.b64encode(b"u:p").decode():
+            self.send_response(401)
+            self.send_header("WWW-Authenticate", 'Basic realm="test"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        key = self.path.rsplit("/", 2)[1]
+        upstream_requests[key] = upstream_requests.get(key, 0) + 1
+        body = {"/v2/owner/app/manifests/1.2": manifest, "/v2/owner/app/blobs/" + sha256_digest(config): config,
+                "/v2/owner/app/blobs/" + layer_digest: layer}.get(self.path)
+        self.send_response(200 if body else 404)
+        self.send_header("Content-Length", str(len(body or b"")))
+        self.end_headers()
+        # Slow enough for the clients to overlap
+        for i in range(0, len(body or b""), 256 * 1024):
+            self.wfile.write(body[i:i + 256 * 1024])
+            time.sleep(0.02)
+
+upstream = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Registry)
+threading.Thread(target=upstream.serve_forever, daemon=True).start()
+registry = f"localhost:{upstream.server_address[1]}"
+cache = CacheServer(("127.0.0.1", 0), 300, 0, RegistryAllowList([registry]))
+threading.Thread(target=cache.serve_forever, daemon=True).start()
+mirror = f"http://127.0.0.1:{cache.server_address[1]}"
+source = mirror_source(f"localhost:{upstream.server_address[1]}/owner/app", mirror)
+
+try:
+    with RegistryClient(mirror_netloc(mirror)) as client:
+        client.inspect(source, "1.2")
+    anonymous = 200
+except RegistryError as e:
+    anonymous = e.status
+digests = []
+for _ in range(2):
+    with RegistryClient(mirror_netloc(mirror), "u", "p") as client:
+        digests.append(client.inspect(source, "1.2")["Digest"])
+
+bodies = []
+def fetch():
+    req = urllib.request.Request(f"{mirror}/v2/{source.split('/', 1)[1]}/blobs/{layer_digest}",
+                                 headers={"Authorization": "Basic " + base64.b64encode(b"u:p").decode()})
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        bodies.append(resp.read() == layer)
+threads = [threading.Thread(target=fetch) for _ in range(3)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+cache.shutdown()
+upstream.shutdown()
+print(json.dumps({"anonymous": anonymous, "digests": digests, "manifest_digest": sha256_digest(manifest),
+                  "bodies": bodies, "in_store": has_blob(layer_digest), "requests": upstream_requests}))
+`);
+    expect(result.exitCode).toBe(0);
+    // Without credentials the client gets a Basic challenge it can answer
+    expect(result.json.anonymous).toBe(401);
+    // Manifests pass through unchanged, the second inspect comes from the cache
+    expect(result.json.digests).toEqual([result.json.manifest_digest, result.json.manifest_digest]);
+    expect(result.json.requests["manifests"]).toBe(1);
+    // Three concurrent clients, one upstream download of the layer (plus the config)
+    expect(result.json.bodies).toEqual([true, true, true]);
+    expect(result.json.in_store).toBe(true);
+    expect(result.json.requests["blobs"]).toBe(2);
+  });
+
+  it("should proxy only allowed registries and serve stored blobs only to credentials with access", () => {
+    const result = runServerDriver(`
+import http.server
+import tempfile
+import urllib.request
+
+layer = os.urandom(100000)
+layer_digest = sha256_digest(layer)
+config = json.dumps({"architecture": "amd64", "os": "linux", "config": {}}).encode("utf-8")
+manifest = json.dumps({"schemaVersion": 2, "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                       "config": {"digest": sha256_digest(config), "size": len(config)},
+                       "layers": [{"digest": layer_digest, "size": len(layer)}]}).encode("utf-8")
+
+class Registry(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        # Private repository: only u:p may read it
+        if self.headers.get("Authorization") != "Basic " + base64.b64encode(b"u:p").decode():
+            self.send_response(401)
+            self.send_header("WWW-Authenticate", 'Basic realm="test"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = {"/v2/owner/app/manifests/1.2": manifest, "/v2/owner/app/blobs/" + sha256_digest(config): config,
+                "/v2/owner/app/blobs/" + layer_digest: layer}.get(self.path)
+        self.send_response(200 if body else 404)
+        self.send_header("Content-Length", str(len(body or b"")))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body or b"")
+
+upstream = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Registry)
+threading.Thread(target=upstream.serve_forever, daemon=True).start()
+registry = f"localhost:{upstream.server_address[1]}"
+cache = CacheServer(("127.0.0.1", 0), 300, 0, RegistryAllowList([registry]))
+threading.Thread(target=cache.serve_forever, daemon=True).start()
+mirror = f"http://127.0.0.1:{cache.server_address[1]}"
+
+def status(path, credentials=None):
+    headers = {"Authorization": "Basic " + base64.b64encode(credentials).decode()} if credentials else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(f"{mirror}/v2/{path}", headers=headers), timeout=30) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+with RegistryClient(mirror_netloc(mirror), "u", "p") as client:
+    client.inspect(mirror_source(f"{registry}/owner/app", mirror), "1.2")
+result = {
+    "owner": status(f"{registry}/owner/app/blobs/{layer_digest}", b"u:p"),
+    "other": status(f"{registry}/owner/app/blobs/{layer_digest}", b"x:y"),
+    "anonymous": status(f"{registry}/owner/app/blobs/{layer_digest}"),
+    "not_allowed": status(f"evil.invalid/owner/app/manifests/1.2", b"u:p"),
+    "in_store": has_blob(layer_digest),
+}
+cache.shutdown()
+upstream.shutdown()
+
+# Registries of managed containers on any node are allowed without configuring them
+PVE_NODES_DIR = tempfile.mkdtemp()
+os.makedirs(os.path.join(PVE_NODES_DIR, "pve2", "lxc"))
+with open(os.path.join(PVE_NODES_DIR, "pve2", "lxc", "101.conf"), "w") as f:
+    f.write("description: <!-- oci-lxc-deployer:managed -->%0A<!-- oci-lxc-deployer:oci-image docker://ghcr.io/owner/app:1.0 -->%0A\\nhostname: app\\n")
+allow = RegistryAllowList([" Docker.io "])
+result["managed"] = allow.allows("ghcr.io")
+result["configured"] = allow.allows("index.docker.io")
+result["other_registry"] = allow.allows("quay.io")
+
+# The cache listens on the node's cluster address by default
+PVE_MEMBERS_FILE = os.path.join(PVE_NODES_DIR, ".members")
+write_json_atomic(PVE_MEMBERS_FILE, {"nodelist": {socket.gethostname().split(".")[0]: {"ip": "10.1.2.3", "online": 1}}})
+result["listen"] = node_address()
+result["url"] = advertised_url(None, "0.0.0.0", 5050)
+print(json.dumps(result))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.in_store).toBe(true);
+    expect(result.json.owner).toBe(200);
+    // The blob is in the store, but the registry does not give it to these credentials
+    expect(result.json.other).toBe(401);
+    expect(result.json.anonymous).toBe(401);
+    expect(result.json.not_allowed).toBe(403);
+    expect(result.json.managed).toBe(true);
+    expect(result.json.configured).toBe(true);
+    expect(result.json.other_registry).toBe(false);
+    expect(result.json.listen).toBe("10.1.2.3");
+    expect(result.json.url).toBe("http://10.1.2.3:5050");
+  });
+
+  it("should only use an announced cache that is fresh and answers with the announced instance", () => {
+    const result = runServerDriver(`
+import http.server
+
+cache = CacheServer(("127.0.0.1", 0), 300, 0, RegistryAllowList([]))
+threading.Thread(target=cache.serve_forever, daemon=True).start()
+url = f"http://127.0.0.1:{cache.server_address[1]}"
+
+def use(announcement):
+    _mirror_reachable.clear()
+    _mirror_instances.clear()
+    if announcement is None:
+        withdraw()
+    else:
+        os.makedirs(os.path.dirname(OCI_MIRROR_CONFIG), exist_ok=True)
+        with open(OCI_MIRROR_CONFIG, "w", encoding="utf-8") as f:
+            json.dump(announcement, f)
+    mirror = configured_mirror()
+    return mirror_source("docker.io/library/alpine", mirror) is not None
+
+now = int(time.time())
+announce(url, cache.instance, now)
+result = {"announced": use(read_json(OCI_MIRROR_CONFIG))}
+# A restarted node: the address answers, but not with this announcement's instance
+result["other_instance"] = use({"url": url, "node": "pve2", "instance": "0" * 32, "heartbeat_at": now})
+result["no_instance"] = use({"url": url, "node": "pve2", "started_at": now})
+result["stale"] = use({"url": url, "node": "pve2", "instance": cache.instance,
+                       "heartbeat_at": now - MIRROR_ANNOUNCEMENT_MAX_AGE - 60})
+# An explicit oci_mirror is used without an announcement
+_mirror_reachable.clear()
+result["override"] = mirror_source("docker.io/library/alpine", configured_mirror(url + "/")) is not None
+
+# Stopping removes only this node's announcement of this instance
+announce(url, cache.instance, now)
+withdraw("another-instance")
+result["kept_for_other_instance"] = os.path.exists(OCI_MIRROR_CONFIG)
+withdraw(cache.instance)
+result["withdrawn"] = not os.path.exists(OCI_MIRROR_CONFIG)
+cache.shutdown()
+print(json.dumps(result))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json).toEqual({
+      announced: true,
+      other_instance: false,
+      no_instance: false,
+      stale: false,
+      override: true,
+      kept_for_other_instance: true,
+      withdrawn: true,
+    });
+  });
+});
@@ -0,0 +1,59 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import { createOciLibTestSetup, type OciLibTestSetup } from "@tests/helper/python-script-helper.mjs";
+
+// In the order of the templates' "library" lists
+const LIBRARIES = [
+  "deployer_common_lib.py",
+  "oci_registry_lib.py",
+  "oci_store_lib.py",
+  "oci_gc_lib.py",
+];
+
+describe("oci_gc_lib.py", () => {
+  let setup: OciLibTestSetup;
+
+  beforeEach(() => {
+    setup = createOciLibTestSetup(import.meta.url, LIBRARIES);
+  });
+
+  afterEach(() => {
+    setup.cleanup();
+  });
+
+  it("should evict least recently used archives but keep referenced and fresh ones", () => {
+    const result = setup.run(`
+lxc_dir = os.path.join(os.environ["STORAGE_DIR"], "..", "lxc")
+os.makedirs(lxc_dir, exist_ok=True)
+index = StorageIndex("local", os.environ["STORAGE_DIR"])
+for n, name in enumerate(["foo.tar", "old_1.0.tar", "used_1.0.tar", "mid_1.0.tar", "new_1.0.tar"]):
+    with open(os.path.join(index.storage_dir, name), "wb") as f:
+        f.write(b"x" * 1000)
+index.refresh()
+for n, name in enumerate(["foo.tar", "old_1.0.tar", "used_1.0.tar", "mid_1.0.tar", "new_1.0.tar"]):
+    index.entries[name]["last_used"] = time.time() - 2 * 86400 + n * 3600
+    if name != "foo.tar":
+        index.entries[name]["image"] = "docker.io/library/" + name[:-8] + ":1.0"
+index.entries["new_1.0.tar"]["last_used"] = time.time()
+index.save()
+with open(os.path.join(lxc_dir, "101.conf"), "w") as f:
+    f.write("description: <!-- lxc-manager:managed -->%0A<!-- lxc-manager:template local:vztmpl/used_1.0.tar -->%0A\narch: amd64\n")
+with open(os.path.join(lxc_dir, "102.conf"), "w") as f:
+    f.write("description: <!-- lxc-manager:template local:vztmpl/mid_1.0.tar -->%0A\n")
+dry = collect_garbage(index, budget_bytes=2500, dry_run=True, lxc_dir=lxc_dir)
+result = collect_garbage(index, budget_bytes=2500, lxc_dir=lxc_dir)
+print(json.dumps({"dry": dry["removed"], "removed": result["removed"], "protected": result["protected"],
+                  "total": result["total_bytes"], "left": sorted(os.listdir(index.storage_dir))}))
+`);
+    expect(result.exitCode).toBe(0);
+    // A dry run reports the same archives without removing them
+    expect(result.json.dry).toEqual(["old_1.0.tar", "mid_1.0.tar"]);
+    // used_1.0.tar is the template of a managed container, new_1.0.tar was just used;
+    // the unmanaged container 102 does not protect mid_1.0.tar
+    expect(result.json.removed).toEqual(["old_1.0.tar", "mid_1.0.tar"]);
+    expect(result.json.protected).toEqual(["used_1.0.tar"]);
+    // foo.tar was not written by a pull (uploaded by hand): it is neither counted nor
+    // evicted, although it is the least recently used file
+    expect(result.json.total).toBe(2000);
+    expect(result.json.left).toEqual(["foo.tar", "new_1.0.tar", "used_1.0.tar"]);
+  });
+});
@@ -0,0 +1,86 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import { createOciLibTestSetup, type OciLibTestSetup } from "@tests/helper/python-script-helper.mjs";
+
+// In the order of the templates' "library" lists
+const LIBRARIES = [
+  "deployer_common_lib.py",
+  "oci_registry_lib.py",
+  "oci_store_lib.py",
+  "oci_squash_lib.py",
+  "oci_mirror_lib.py",
+  "oci_gc_lib.py",
+  "oci_rootfs_lib.py",
+  "oci_pull_lib.py",
+  "oci_prefetch_lib.py",
+];
+
+describe("oci_prefetch_lib.py", () => {
+  let setup: OciLibTestSetup;
+
+  beforeEach(() => {
+    setup = createOciLibTestSetup(import.meta.url, LIBRARIES);
+  });
+
+  afterEach(() => {
+    setup.cleanup();
+  });
+
+  it("should prefetch new versions of the images managed containers run", () => {
+    const result = setup.run(`
+lxc_dir = os.path.join(os.environ["STORAGE_DIR"], "..", "lxc")
+os.makedirs(lxc_dir, exist_ok=True)
+notes = {
+    "101": "oci-image docker://ghcr.io/owner/app:latest -->%0AVersion: 1.0",
+    "102": "oci-image docker://ghcr.io/owner/app:latest -->%0AVersion: 1.1",
+    "103": "oci-image docker://alpine:3.19 -->",
+    "104": "oci-image docker://ghcr.io/owner/private:2 -->",
+    "105": "oci-image docker://ghcr.io/owner/late:1 -->",
+}
+for vm_id, note in notes.items():
+    with open(os.path.join(lxc_dir, vm_id + ".conf"), "w") as f:
+        f.write(f"description: <!-- oci-lxc-deployer:managed -->%0A<!-- oci-lxc-deployer:{note}%0A\\narch: amd64\\n")
+with open(os.path.join(lxc_dir, "106.conf"), "w") as f:
+    f.write("description: <!-- oci-lxc-deployer:oci-image docker://unmanaged:1 -->%0A\\n")
+
+def plan_pull(oci_image, index, options):
+    if "private" in oci_image:
+        raise PullError("unauthorized")
+    if "alpine" in oci_image:
+        return {"cached": True, "version": "3.19", "template_path": "local:vztmpl/alpine_3.19.tar"}
+    return {"cached": False, "version": "1.2", "bytes_to_download": 1024}
+
+pulled = []
+def pull_image(oci_image, index, application_id, options):
+    pulled.append(oci_image)
+    return {"oci_image_tag": "1.2", "template_path": "local:vztmpl/app_1.2.tar"}
+
+containers = managed_containers(lxc_dir)
+index = StorageIndex("local", os.environ["STORAGE_DIR"])
+records = prefetch_updates(containers[:4], index, PullOptions(inspect_cache_ttl=0))
+deferred = prefetch_updates(containers[4:], index, PullOptions(inspect_cache_ttl=0), deadline=time.time() - 1)
+print(json.dumps({"vm_ids": [c["vm_id"] for c in containers], "records": records,
+                  "deferred": deferred, "pulled": pulled}))
+`);
+    expect(result.exitCode).toBe(0);
+    // 106 is not managed
+    expect(result.json.vm_ids).toEqual([101, 102, 103, 104, 105]);
+    // One check per image reference, not per container
+    expect(result.json.records).toEqual([
+      {
+        oci_image: "docker://ghcr.io/owner/app:latest", vm_ids: [101, 102], versions: ["1.0", "1.1"],
+        version: "1.2", status: "prefetched", template_path: "local:vztmpl/app_1.2.tar",
+      },
+      {
+        oci_image: "docker://alpine:3.19", vm_ids: [103], versions: [],
+        version: "3.19", status: "up_to_date", template_path: "local:vztmpl/alpine_3.19.tar",
+      },
+      {
+        oci_image: "docker://ghcr.io/owner/private:2", vm_ids: [104], versions: [],
+        status: "failed", error: "unauthorized",
+      },
+    ]);
+    // After the end of the window, updates are only reported
+    expect(result.json.deferred[0].status).toBe("deferred");
+    expect(result.json.pulled).toEqual(["docker://ghcr.io/owner/app:latest"]);
+  });
+});
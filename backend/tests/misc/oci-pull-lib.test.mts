@@ -0,0 +1,446 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import { createOciLibTestSetup, type OciLibTestSetup } from "@tests/helper/python-script-helper.mjs";
+
+// In the order of the templates' "library" lists
+const LIBRARIES = [
+  "deployer_common_lib.py",
+  "oci_registry_lib.py",
+  "oci_store_lib.py",
+  "oci_squash_lib.py",
+  "oci_mirror_lib.py",
+  "oci_gc_lib.py",
+  "oci_rootfs_lib.py",
+  "oci_pull_lib.py",
+];
+
+describe("oci_pull_lib.py", () => {
+  let setup: OciLibTestSetup;
+
+  beforeEach(() => {
+    setup = createOciLibTestSetup(import.meta.url, LIBRARIES);
+  });
+
+  afterEach(() => {
+    setup.cleanup();
+  });
+
+  it("should use a stale cached inspect result when the registry is not reachable", () => {
+    const result = setup.run(`
+# Nothing listens on port 1: every registry request fails with a connection error
+image = "127.0.0.1:1/owner/app"
+cached = {"Name": image, "Digest": "sha256:" + "d" * 64, "Layers": []}
+store_cached_inspect(image, "1.2", None, cached, "sha256:" + "d" * 64)
+entry = load_cached_inspect(image, "1.2", None)
+entry["fetched_at"] = time.time() - 3600
+write_json_atomic(inspect_cache_path(image, "1.2", None), entry)
+inspect = inspect_image("docker://" + image + ":1.2", image, "1.2", None, None, None, 60)
+print(json.dumps({"digest": inspect["Digest"],
+                  "fetched_at": load_cached_inspect(image, "1.2", None)["fetched_at"],
+                  "stale_at": entry["fetched_at"]}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.digest).toBe("sha256:" + "d".repeat(64));
+    // Served, but not marked fresh: the next pull asks the registry again
+    expect(result.json.fetched_at).toBe(result.json.stale_at);
+    expect(result.stderr).toContain("using stale cached inspect result");
+  });
+
+  it("should copy an archive of the same digest from a peer node and reject corrupt ones", () => {
+    const result = setup.run(`
+local_root = os.path.dirname(os.path.dirname(os.environ["STORAGE_DIR"]))
+peer_dir = os.path.join(local_root, "peer", "template", "cache")
+os.makedirs(peer_dir, exist_ok=True)
+
+# The peer is this host with its storage under peer/: run the ssh payload locally
+def peer_command(address, args, connect_timeout=5):
+    mapped = [arg.replace(os.path.join(local_root, "template"), os.path.join(local_root, "peer", "template")) for arg in args]
+    return ["sh", "-c", " ".join(shlex.quote(arg) for arg in mapped)]
+
+PVE_MEMBERS_FILE = os.path.join(local_root, "members.json")
+write_json_atomic(PVE_MEMBERS_FILE, {"nodelist": {socket.gethostname(): {"online": 1, "ip": "10.0.0.1"},
+                                                  "pve2": {"online": 1, "ip": "10.0.0.2"},
+                                                  "pve3": {"online": 0, "ip": "10.0.0.3"}}})
+
+def put(data):
+    digest = sha256_digest(data)
+    os.makedirs(os.path.dirname(blob_path(digest)), exist_ok=True)
+    with open(blob_path(digest), "wb") as f:
+        f.write(data)
+    return {"digest": digest, "size": len(data)}
+
+ensure_cache_dirs()
+layer, config = put(os.urandom(100000)), put(b'{"os": "linux"}')
+manifest = put(json.dumps({"schemaVersion": 2, "config": config, "layers": [layer]}).encode("utf-8"))
+layout = layout_dir("app")
+os.makedirs(layout, exist_ok=True)
+write_json_atomic(os.path.join(layout, "index.json"), {"schemaVersion": 2, "manifests": [
+    {"mediaType": "application/vnd.oci.image.manifest.v1+json", **manifest, "annotations": {REF_NAME_ANNOTATION: "1.2"}}]})
+peer = StorageIndex("local", peer_dir)
+install_oci_archive(layout, "1.2", peer_dir, "app_1.2.tar")
+peer.refresh()
+peer.record("app", "1.2", "sha256:" + "d" * 64)
+
+index = StorageIndex("local", os.environ["STORAGE_DIR"])
+index.refresh()
+result = {"peers": cluster_peers(),
+          "other_digest": fetch_from_peer(index, "app", "1.2", "sha256:" + "e" * 64),
+          "copied": fetch_from_peer(index, "app", "1.2", "sha256:" + "d" * 64)}
+with open(os.path.join(peer_dir, "app_1.2.tar"), "rb") as a, open(os.path.join(index.storage_dir, "app_1.2.tar"), "rb") as b:
+    result["same_bytes"] = a.read() == b.read()
+result["recorded"] = index.lookup_digest("app", "sha256:" + "d" * 64)
+
+index.remove("app_1.2.tar")
+# A plan only asks the peers when told to
+def inspect_image(*args, **kwargs):
+    return {"Digest": "sha256:" + "d" * 64, "LayersData": []}
+result["plan_peer"] = [plan_pull("app:1.2", index, PullOptions(inspect_cache_ttl=0), probe)["peer_node"]
+                       for probe in (False, True)]
+
+# Flip one bit inside the layer blob of the peer's archive
+with open(os.path.join(peer_dir, "app_1.2.tar"), "r+b") as f:
+    data = bytearray(f.read())
+    data[len(data) // 2] ^= 1
+    f.seek(0)
+    f.write(data)
+result["corrupt"] = fetch_from_peer(index, "app", "1.2", "sha256:" + "d" * 64)
+result["left"] = os.listdir(index.storage_dir)
+print(json.dumps(result))
+`);
+    expect(result.exitCode).toBe(0);
+    // Only online nodes other than this one are asked
+    expect(result.json.peers).toEqual([["pve2", "10.0.0.2"]]);
+    expect(result.json.plan_peer).toEqual([null, "pve2"]);
+    expect(result.json.other_digest).toBeNull();
+    expect(result.json.copied).toBe("local:vztmpl/app_1.2.tar");
+    expect(result.json.same_bytes).toBe(true);
+    expect(result.json.recorded).toBe("local:vztmpl/app_1.2.tar");
+    // A blob that does not match its sha256 fails the copy without leaving files behind
+    expect(result.json.corrupt).toBeNull();
+    expect(result.stderr).toContain("Checksum mismatch");
+    expect(result.json.left).toEqual([]);
+  });
+
+  it("should read storage paths from storage.cfg and not rewrite archives on shared storage", () => {
+    const result = setup.run(`
+local_root = os.path.dirname(os.path.dirname(os.environ["STORAGE_DIR"]))
+PVE_STORAGE_CFG = os.path.join(local_root, "storage.cfg")
+with open(PVE_STORAGE_CFG, "w") as f:
+    f.write("dir: local\\n\\tpath /var/lib/vz\\n\\tcontent iso,vztmpl\\n\\n"
+            "lvmthin: local-lvm\\n\\tthinpool data\\n\\tvgname pve\\n\\n"
+            "nfs: nas\\n\\texport /export\\n\\tserver 10.0.0.5\\n\\tnodes pve1,pve2\\n\\n"
+            f"dir: shared\\n\\tpath {local_root}/shared\\n\\tshared 1\\n\\tcontent vztmpl\\n")
+storages = pve_storages()
+node_a = open_storage_index("shared")
+node_b = open_storage_index("shared")
+os.makedirs(node_a.storage_dir)
+with open(os.path.join(node_a.storage_dir, "app_1.0.tar"), "wb") as f:
+    f.write(b"x" * 100)
+node_a.record("ghcr.io/owner/app", "1.0", "sha256:${"a".repeat(64)}")
+# The layout does not exist: node B must find node A's archive instead of writing it
+template_path = import_to_proxmox(node_b, os.path.join(local_root, "missing-layout"), "1.0",
+                                  "ghcr.io/owner/app", "1.0", "sha256:${"a".repeat(64)}")
+print(json.dumps({
+    "nas": storages["nas"], "lvm_path": storages["local-lvm"]["path"],
+    "local": [resolve_storage_dir("local"), storage_is_shared("local")],
+    "shared": [node_b.storage_dir == os.path.join(local_root, "shared/template/cache"), node_b.shared],
+    "template_path": template_path,
+    "locks": os.listdir(os.path.join(local_root, "shared/template/.oci-lxc-deployer-locks")),
+}))
+`);
+    expect(result.exitCode).toBe(0);
+    // Network file systems are shared and mounted under /mnt/pve without a path option
+    expect(result.json.nas).toEqual({
+      type: "nfs", path: "/mnt/pve/nas", shared: true, content: [], nodes: ["pve1", "pve2"],
+    });
+    expect(result.json.lvm_path).toBeNull();
+    expect(result.json.local).toEqual(["/var/lib/vz/template/cache", false]);
+    expect(result.json.shared).toEqual([true, true]);
+    expect(result.json.template_path).toBe("shared:vztmpl/app_1.0.tar");
+    // The cluster-wide lock file lives on the shared storage
+    expect(result.json.locks).toHaveLength(1);
+  });
+
+  it("should detect the ostype from /etc/os-release in the top layers and cache it", () => {
+    const result = setup.run(`
+import gzip
+import http.server
+import io
+
+def layer(files):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, content in files:
+            info = tarfile.TarInfo(name)
+            if content.startswith("->"):
+                info.type, info.linkname = tarfile.SYMTYPE, content[2:]
+                tar.addfile(info)
+            else:
+                data = content.encode("utf-8")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    data = gzip.compress(buf.getvalue())
+    return data, sha256_digest(data)
+
+ensure_cache_dirs()
+# Debian: etc/os-release is a symlink into usr/lib, the app layer on top has neither
+base, base_digest = layer([("etc/os-release", "->../usr/lib/os-release"),
+                           ("usr/lib/os-release", 'PRETTY_NAME="Debian GNU/Linux 12"\\nID=debian\\n')])
+app, app_digest = layer([("app/server.js", "x" * 10000)])
+for data, digest in ((base, base_digest), (app, app_digest)):
+    with open(blob_path(digest), "wb") as f:
+        f.write(data)
+debian = {"ConfigDigest": "sha256:" + "c" * 64, "Labels": {},
+          "LayersData": [{"Digest": base_digest}, {"Digest": app_digest}]}
+first = detect_ostype(debian, "registry.invalid/owner/app")
+os.unlink(blob_path(base_digest))
+cached = detect_ostype(debian, "registry.invalid/owner/app")
+
+# Not in the blob store: only the top layer is downloaded, it has the file
+top, top_digest = layer([("etc/os-release", "ID=rocky\\nID_LIKE=\"rhel centos fedora\"\\n")])
+bottom, bottom_digest = layer([("etc/os-release", "ID=alpine\\n")])
+static, static_digest = layer([("app/server", "x" * 10000)])
+requested = []
+
+class Registry(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        digest = self.path.rsplit("/", 1)[1]
+        requested.append(digest)
+        body = {top_digest: top, bottom_digest: bottom, static_digest: static}[digest]
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Registry)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+PLAIN_HTTP_REGISTRIES.add(f"127.0.0.1:{server.server_address[1]}")
+rocky = {"ConfigDigest": "sha256:" + "d" * 64, "Labels": {},
+         "LayersData": [{"Digest": bottom_digest}, {"Digest": top_digest}]}
+streamed = detect_ostype(rocky, f"127.0.0.1:{server.server_address[1]}/owner/rocky")
+top_only = requested == [top_digest]
+# The file is deeper than the limits allow: labels, not cached
+capped = {"ConfigDigest": "sha256:" + "a" * 64, "Labels": {"io.hass.base.name": "alpine"},
+          "LayersData": [{"Digest": bottom_digest}, {"Digest": static_digest}]}
+OS_RELEASE_MAX_STREAMED_LAYERS = 1
+by_layers = detect_ostype(capped, f"127.0.0.1:{server.server_address[1]}/owner/capped")
+OS_RELEASE_MAX_STREAMED_LAYERS, OS_RELEASE_MAX_STREAMED_BYTES = 3, 100
+requested.clear()
+by_bytes = detect_ostype(capped, f"127.0.0.1:{server.server_address[1]}/owner/capped")
+server.shutdown()
+# Unreadable layers fall back to the labels and are not cached
+broken = {"ConfigDigest": "sha256:" + "e" * 64, "Labels": {"io.hass.base.name": "alpine"},
+          "LayersData": [{"Digest": "sha256:" + "f" * 64}]}
+fallback = detect_ostype(broken, "127.0.0.1:1/owner/broken")
+print(json.dumps({"first": first, "cached": cached, "streamed": streamed,
+                  "top_only": top_only, "fallback": fallback,
+                  "fallback_cached": os.path.exists(ostype_cache_path(broken)),
+                  "by_layers": by_layers, "by_bytes": by_bytes, "capped_requests": requested,
+                  "static_digest": static_digest, "capped_cached": os.path.exists(ostype_cache_path(capped))}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.first).toBe("debian");
+    expect(result.json.cached).toBe("debian");
+    expect(result.json.streamed).toBe("centos");
+    expect(result.json.top_only).toBe(true);
+    expect(result.json.fallback).toBe("alpine");
+    expect(result.json.fallback_cached).toBe(false);
+    expect(result.json.by_layers).toBe("alpine");
+    expect(result.json.by_bytes).toBe("alpine");
+    // The byte limit stops the first download, the base layer is never requested
+    expect(result.json.capped_requests).toEqual([result.json.static_digest]);
+    expect(result.json.capped_cached).toBe(false);
+  });
+
+  it("should trust verified archives by their sidecar and remove corrupt ones", () => {
+    const result = setup.run(`
+ensure_cache_dirs()
+layer = os.urandom(100000)
+config = b'{"os": "linux"}'
+manifest = json.dumps({"schemaVersion": 2, "config": {"digest": store_blob(config), "size": len(config)},
+                       "layers": [{"digest": store_blob(layer), "size": len(layer)}]}).encode("utf-8")
+layout = layout_dir("app")
+os.makedirs(layout, exist_ok=True)
+write_json_atomic(os.path.join(layout, "index.json"), {"schemaVersion": 2, "manifests": [
+    {"mediaType": OCI_MANIFEST_MEDIA_TYPE, "digest": store_blob(manifest), "size": len(manifest),
+     "annotations": {REF_NAME_ANNOTATION: "1.0"}}]})
+storage_dir = os.environ["STORAGE_DIR"]
+install_oci_archive(layout, "1.0", storage_dir, "app_1.0.tar")
+index = StorageIndex("local", storage_dir)
+index.refresh()
+path = os.path.join(storage_dir, "app_1.0.tar")
+result = {"manifest": sha256_digest(manifest), "sidecar": verified_manifest_digest(storage_dir, "app_1.0.tar"),
+          "blob_recorded": blob_is_verified(sha256_digest(layer))}
+
+# A touched archive is verified again and gets a new sidecar
+os.utime(path, ns=(0, 0))
+result["touched"] = verified_manifest_digest(storage_dir, "app_1.0.tar")
+result["reverified"] = intact_archive(index, "local:vztmpl/app_1.0.tar")
+result["sidecar_again"] = verified_manifest_digest(storage_dir, "app_1.0.tar")
+
+# Flip one bit inside the layer blob of the archive, keeping size and mtime
+st = os.stat(path)
+with open(path, "r+b") as f:
+    data = bytearray(f.read())
+    data[len(data) // 2] ^= 1
+    f.seek(0)
+    f.write(data)
+os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+result["trusted"] = intact_archive(index, "local:vztmpl/app_1.0.tar")
+os.utime(path, ns=(10**9, 10**9))
+result["corrupt"] = intact_archive(index, "local:vztmpl/app_1.0.tar")
+result["left"] = os.listdir(storage_dir)
+
+# A corrupt blob in the store (changed since it was recorded) fails the archive and is
+# removed from the store
+with open(blob_path(sha256_digest(layer)), "r+b") as f:
+    f.write(b"x")
+os.utime(blob_path(sha256_digest(layer)), ns=(10**9, 10**9))
+result["blob_recorded_after_change"] = blob_is_verified(sha256_digest(layer))
+try:
+    install_oci_archive(layout, "1.0", storage_dir, "app_1.0.tar")
+    result["error"] = None
+except IOError as e:
+    result["error"] = str(e)
+result["blob_left"] = os.path.exists(blob_path(sha256_digest(layer)))
+result["left_after_error"] = os.listdir(storage_dir)
+print(json.dumps(result))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.sidecar).toBe(result.json.manifest);
+    // Hashed once while the first archive was written, copied without reading afterwards
+    expect(result.json.blob_recorded).toBe(true);
+    expect(result.json.touched).toBeNull();
+    expect(result.json.reverified).toBe("local:vztmpl/app_1.0.tar");
+    expect(result.json.sidecar_again).toBe(result.json.manifest);
+    // An unchanged sidecar is trusted without reading the archive
+    expect(result.json.trusted).toBe("local:vztmpl/app_1.0.tar");
+    expect(result.json.corrupt).toBeNull();
+    expect(result.stderr).toContain("Checksum mismatch");
+    expect(result.json.left).toEqual([]);
+    expect(result.json.blob_recorded_after_change).toBe(false);
+    expect(result.json.error).toContain("corrupt");
+    expect(result.json.blob_left).toBe(false);
+    expect(result.json.left_after_error).toEqual([]);
+  });
+
+  it("should bypass a plain-HTTP OCI cache for pulls with registry credentials", () => {
+    const result = setup.run(`
+plain = PullOptions.from_params(registry_username="user", registry_password="secret",
+                                oci_mirror="http://10.0.0.5:5000")
+tls = PullOptions.from_params(registry_username="user", registry_password="secret",
+                              oci_mirror="https://cache.example:5000")
+anonymous = PullOptions.from_params(oci_mirror="http://10.0.0.5:5000")
+print(json.dumps({"plain": plain.mirror, "tls": tls.mirror, "anonymous": anonymous.mirror}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.plain).toBeNull();
+    expect(result.stderr).toContain("plain HTTP");
+    expect(result.json.tls).toBe("https://cache.example:5000");
+    expect(result.json.anonymous).toBe("http://10.0.0.5:5000");
+  });
+
+  it("should share one bandwidth limit between processes and follow the schedule", () => {
+    const result = setup.run(`
+local_root = os.path.dirname(os.path.dirname(os.environ["STORAGE_DIR"]))
+HOST_BANDWIDTH_CONFIG = os.path.join(local_root, "bandwidth.json")
+HOST_BANDWIDTH_STATE = os.path.join(local_root, "run", "bandwidth-bucket")
+PullOptions.from_params(oci_mirror="none", host_max_bandwidth="4096",
+                        bandwidth_schedule="00:00-06:00=0, 22:00-24:00=2048")
+kept = PullOptions.from_params(max_bandwidth="1024", oci_mirror="none", host_max_bandwidth="NOT_DEFINED")
+try:
+    PullOptions.from_params(oci_mirror="none", bandwidth_schedule="evening=1")
+    invalid = None
+except ValueError as e:
+    invalid = str(e)
+
+def local(hour):
+    return time.mktime(time.localtime()[:3] + (hour, 30, 0, 0, 0, -1))
+
+rates = [kept.limiter.host.rate(local(hour)) for hour in (3, 12, 23)]
+# Two processes (separate limiters on the same bucket file) pull 12 MiB at 4 MiB/s in
+# the daytime: 1 s of burst, then 2 s of waiting
+write_json_atomic(HOST_BANDWIDTH_CONFIG, {"max_bandwidth": 4 * 1024 * 1024})
+limiters = [HostBandwidthLimiter(), HostBandwidthLimiter()]
+start = time.monotonic()
+threads = [threading.Thread(target=lambda l=l: [l.consume(256 * 1024) for _ in range(24)]) for l in limiters]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+print(json.dumps({"rates": rates, "invalid": invalid,
+                  "per_pull": kept.limiter.rate, "elapsed": time.monotonic() - start}))
+`);
+    expect(result.exitCode).toBe(0);
+    // Unlimited at night, the evening window, the stored day limit otherwise
+    expect(result.json.rates).toEqual([0, 4096 * 1024, 2048 * 1024]);
+    expect(result.json.invalid).toContain("evening");
+    expect(result.json.per_pull).toBe(1024 * 1024);
+    expect(result.json.elapsed).toBeGreaterThan(1.8);
+    expect(result.json.elapsed).toBeLessThan(3.5);
+  });
+
+  it("should never leave a rate-limited skopeo stopped behind", () => {
+    const result = setup.run(`
+class Progress(PullProgress):
+    def sample(self):
+        # 1 MiB per sample against a 1 MiB/s limit: skopeo is paused (SIGSTOP) while
+        # the limiter waits, and the script is stopped (SIGTERM) during the second pause
+        downloaded = self.bytes_done + 1024 * 1024
+        sample = super().sample()
+        self.bytes_done = downloaded
+        self.last_change = time.monotonic()
+        return sample
+
+class Limiter(BandwidthLimiter):
+    def consume(self, n):
+        self.calls = getattr(self, "calls", 0) + 1
+        if self.calls == 2:
+            raise SystemExit(143)
+        super().consume(n)
+
+started = []
+real_popen = subprocess.Popen
+def popen(*args, **kwargs):
+    started.append(real_popen(*args, **kwargs))
+    return started[-1]
+subprocess.Popen = popen
+try:
+    run_with_progress(["sleep", "30"], Progress(os.environ["STORAGE_DIR"], []), "docker://app:1.0",
+                      limiter=Limiter(1024 * 1024))
+    interrupted = False
+except SystemExit:
+    interrupted = True
+subprocess.Popen = real_popen
+child = started[0]
+
+# A skopeo stopped while its script is killed outright dies with it (PR_SET_PDEATHSIG)
+read_end, write_end = os.pipe()
+script = os.fork()
+if script == 0:
+    proc = subprocess.Popen(["sleep", "30"], preexec_fn=_die_with_parent)
+    proc.send_signal(signal.SIGSTOP)
+    os.write(write_end, str(proc.pid).encode())
+    os._exit(0)
+os.close(write_end)
+orphan = os.read(read_end, 32).decode()
+os.waitpid(script, 0)
+time.sleep(0.5)
+try:
+    with open(f"/proc/{orphan}/stat") as f:
+        orphan_state = f.read().rsplit(")", 1)[1].split()[0]
+except OSError:
+    orphan_state = None
+print(json.dumps({"interrupted": interrupted, "child_returncode": child.returncode,
+                  "orphan_state": orphan_state}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.interrupted).toBe(true);
+    // Continued and killed, not left stopped
+    expect(result.json.child_returncode).toBe(-9);
+    // Gone (or a zombie waiting for init), not stopped
+    expect([null, "Z"]).toContain(result.json.orphan_state);
+  });
+});
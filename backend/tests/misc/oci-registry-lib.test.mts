@@ -0,0 +1,161 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import { createOciLibTestSetup, type OciLibTestSetup } from "@tests/helper/python-script-helper.mjs";
+
+// In the order of the templates' "library" lists
+const LIBRARIES = [
+  "oci_registry_lib.py",
+];
+
+describe("oci_registry_lib.py", () => {
+  let setup: OciLibTestSetup;
+
+  beforeEach(() => {
+    setup = createOciLibTestSetup(import.meta.url, LIBRARIES);
+  });
+
+  afterEach(() => {
+    setup.cleanup();
+  });
+
+  it("should inspect an image through a local registry stand-in on one connection", () => {
+    const result = setup.run(`
+import http.server
+import threading
+
+def _blob(data):
+    raw = json.dumps(data).encode("utf-8")
+    return raw, sha256_digest(raw)
+
+config, config_digest = _blob({"architecture": "arm64", "os": "linux", "config": {"Labels": {"org.opencontainers.image.version": "1.2.3"}, "Env": ["A=1"]}, "history": [{"created_by": "VOLUME [/data]"}]})
+manifest, manifest_digest = _blob({"schemaVersion": 2, "mediaType": "application/vnd.oci.image.manifest.v1+json", "config": {"digest": config_digest, "size": len(config)}, "layers": [{"mediaType": "application/vnd.oci.image.layer.v1.tar+gzip", "digest": "sha256:" + "b" * 64, "size": 42}]})
+index, index_digest = _blob({"schemaVersion": 2, "mediaType": "application/vnd.oci.image.index.v1+json", "manifests": [
+    {"digest": "sha256:" + "c" * 64, "platform": {"os": "linux", "architecture": "amd64"}},
+    {"digest": manifest_digest, "platform": {"os": "linux", "architecture": "arm64"}}]})
+stats = {"connections": 0, "tokens": 0}
+
+class Registry(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        stats["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        port = self.server.server_address[1]
+        if self.path.startswith("/token"):
+            stats["tokens"] += 1
+            return self.reply(200, b'{"token": "t0k"}')
+        if self.headers.get("Authorization") != "Bearer t0k":
+            return self.reply(401, headers={"WWW-Authenticate": f'Bearer realm="http://127.0.0.1:{port}/token",service="test",scope="repository:owner/app:pull"'})
+        blobs = {"/v2/owner/app/manifests/1.2": index, "/v2/owner/app/manifests/" + index_digest: index,
+                 "/v2/owner/app/manifests/" + manifest_digest: manifest, "/v2/owner/app/blobs/" + config_digest: config}
+        if self.path in blobs:
+            body = blobs[self.path]
+            return self.reply(200, body, {"Docker-Content-Digest": sha256_digest(body)})
+        self.reply(404)
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Registry)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+with RegistryClient(f"localhost:{server.server_address[1]}") as client:
+    image = f"localhost:{server.server_address[1]}/owner/app"
+    missing = client.head_manifest("owner/app", "9.9")
+    head = client.head_manifest("owner/app", "1.2")
+    inspect = client.inspect(image, "1.2", "linux/arm64")
+server.shutdown()
+print(json.dumps({"missing": missing, "head": head, "index_digest": index_digest, "digest": inspect["Digest"],
+                  "arch": inspect["Architecture"], "layers": inspect["Layers"], "labels": inspect["Labels"],
+                  "history": len(inspect["History"]), **stats}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.missing).toBeNull();
+    expect(result.json.head).toBe(result.json.index_digest);
+    expect(result.json.digest).toBe(result.json.index_digest);
+    expect(result.json.arch).toBe("arm64");
+    expect(result.json.layers).toEqual(["sha256:" + "b".repeat(64)]);
+    expect(result.json.labels["org.opencontainers.image.version"]).toBe("1.2.3");
+    expect(result.json.history).toBe(1);
+    // One keep-alive connection to the registry plus one to the token endpoint
+    expect(result.json.connections).toBe(2);
+    expect(result.json.tokens).toBe(1);
+  });
+
+  it("should reuse cached registry tokens across clients and replace rejected ones", () => {
+    const result = setup.run(`
+import http.server
+import threading
+
+stats = {"tokens": 0, "unauthorized": 0}
+
+class Registry(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        port = self.server.server_address[1]
+        if self.path.startswith("/token"):
+            stats["tokens"] += 1
+            return self.reply(200, json.dumps({"token": f"t{stats['tokens']}", "expires_in": 300}).encode())
+        if self.headers.get("Authorization") != f"Bearer t{stats['tokens']}":
+            stats["unauthorized"] += 1
+            return self.reply(401, headers={"WWW-Authenticate": f'Bearer realm="http://127.0.0.1:{port}/token",service="test",scope="repository:owner/app:pull"'})
+        self.reply(200, headers={"Docker-Content-Digest": "sha256:" + "d" * 64})
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Registry)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+registry = f"localhost:{server.server_address[1]}"
+results = []
+# Separate clients stand for separate script runs: only the first one asks for a token
+for _run in range(2):
+    with RegistryClient(registry) as client:
+        results.append(client.head_manifest("owner/app", "1.0"))
+after_two_runs = dict(stats)
+# A token the registry no longer accepts is replaced once
+stats["tokens"] += 1
+with RegistryClient(registry) as client:
+    results.append(client.head_manifest("owner/app", "1.0"))
+server.shutdown()
+path = token_cache_path(registry, repository_scope("owner/app"), None, None)
+print(json.dumps({"results": results, "after_two_runs": after_two_runs, "final": stats,
+                  "mode": oct(os.stat(path).st_mode & 0o777), "dir_mode": oct(os.stat(token_cache_dir()).st_mode & 0o777),
+                  "cached": load_cached_token(registry, repository_scope("owner/app"), None, None),
+                  "other_creds": load_cached_token(registry, repository_scope("owner/app"), "user", "pw")}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.results).toEqual(Array(3).fill("sha256:" + "d".repeat(64)));
+    expect(result.json.after_two_runs).toEqual({ tokens: 1, unauthorized: 1 });
+    expect(result.json.final).toEqual({ tokens: 3, unauthorized: 2 });
+    expect(result.json.mode).toBe("0o600");
+    expect(result.json.dir_mode).toBe("0o700");
+    expect(result.json.cached).toBe("Bearer t3");
+    expect(result.json.other_creds).toBeNull();
+  });
+});
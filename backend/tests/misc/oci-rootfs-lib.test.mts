@@ -0,0 +1,109 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import { createOciLibTestSetup, type OciLibTestSetup } from "@tests/helper/python-script-helper.mjs";
+
+// In the order of the templates' "library" lists
+const LIBRARIES = [
+  "deployer_common_lib.py",
+  "oci_registry_lib.py",
+  "oci_store_lib.py",
+  "oci_rootfs_lib.py",
+];
+
+describe("oci_rootfs_lib.py", () => {
+  let setup: OciLibTestSetup;
+
+  beforeEach(() => {
+    setup = createOciLibTestSetup(import.meta.url, LIBRARIES);
+  });
+
+  afterEach(() => {
+    setup.cleanup();
+  });
+
+  it("should build rootfs templates for linked clones and find them by archive digest", () => {
+    const result = setup.run(`
+local_root = os.path.dirname(os.path.dirname(os.environ["STORAGE_DIR"]))
+lxc_dir = os.path.join(local_root, "lxc")
+bin_dir = os.path.join(local_root, "bin")
+os.makedirs(lxc_dir)
+os.makedirs(bin_dir)
+os.environ["LXC_MANAGER_PVE_LXC_DIR"] = lxc_dir
+os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+# pct stand-in: writes the config like Proxmox (notes as # comment lines)
+with open(os.path.join(bin_dir, "pct"), "w") as f:
+    f.write("""#!/usr/bin/env python3
+import os, sys, urllib.parse
+conf = os.path.join(os.environ["LXC_MANAGER_PVE_LXC_DIR"], sys.argv[2] + ".conf")
+args = dict(zip(sys.argv[4::2], sys.argv[5::2]))
+if sys.argv[1] == "create":
+    storage, size = args["--rootfs"].split(":")
+    with open(conf, "w") as f:
+        for line in args["--description"].splitlines():
+            f.write("#" + urllib.parse.quote(line, safe=" <>!-:/@._") + "\\\\n")
+        f.write(f"ostype: {args['--ostype']}\\\\nrootfs: {storage}:subvol-{sys.argv[2]}-disk-0,size={size}G\\\\n")
+elif sys.argv[1] == "template":
+    with open(conf, "a") as f:
+        f.write("template: 1\\\\n")
+elif sys.argv[1] == "destroy":
+    if os.path.exists(conf + ".clones"):
+        sys.exit("base volume is used by linked clones")
+    os.unlink(conf)
+""")
+os.chmod(os.path.join(bin_dir, "pct"), 0o755)
+# pvesh stand-in: 990003 is used on another node (not yet in the VM list)
+with open(os.path.join(bin_dir, "pvesh"), "w") as f:
+    f.write("""#!/usr/bin/env python3
+import sys
+if sys.argv[-1] == "990003":
+    sys.exit("VM 990003 already exists")
+print(sys.argv[-1])
+""")
+os.chmod(os.path.join(bin_dir, "pvesh"), 0o755)
+PVE_STORAGE_CFG = os.path.join(local_root, "storage.cfg")
+with open(PVE_STORAGE_CFG, "w") as f:
+    f.write("dir: local\\n\\tpath /var/lib/vz\\n\\tcontent vztmpl\\n\\nzfspool: local-zfs\\n\\tpool rpool/data\\n")
+PVE_VMLIST_FILE = os.path.join(local_root, ".vmlist")
+write_json_atomic(PVE_VMLIST_FILE, {"ids": {"100": {"type": "lxc"}, "990000": {"type": "qemu"}}})
+
+index = StorageIndex("local", os.environ["STORAGE_DIR"])
+with open(os.path.join(index.storage_dir, "app_1.0.tar"), "wb") as f:
+    f.write(b"x" * 100)
+index.record("ghcr.io/owner/app", "1.0", "sha256:${"a".repeat(64)}")
+template_path = "local:vztmpl/app_1.0.tar"
+first = build_rootfs_template(index, template_path, "local-zfs", 4.0, "alpine")
+source = rootfs_clone_source(index, template_path)
+open(os.path.join(lxc_dir, f"{first}.conf.clones"), "w").close()
+# The tag was pulled again with new content: the first template no longer matches
+index.record("ghcr.io/owner/app", "1.0", "sha256:${"b".repeat(64)}")
+stale = rootfs_clone_source(index, template_path)
+second = build_rootfs_template(index, template_path, "local-zfs", 0.5, "alpine")
+print(json.dumps({
+    "first": first, "source": source, "stale": stale, "second": second,
+    "templates": [[t["vm_id"], t["digest"][:8], t["storage"], t["size_gib"]] for t in rootfs_templates()],
+    "dir_storage": build_rootfs_template(index, template_path, "local", 4.0, "alpine"),
+    "marker": "oci-lxc-deployer:rootfs-cache" in read_lxc_conf(second),
+    "taken_on_peer": free_rootfs_template_id(990003),
+    "configured": free_rootfs_template_id(5000),
+    "rootfs": conf_rootfs("arch: amd64\\nrootfs: local-lvm:vm-101-disk-0,mountoptions=noatime,size=512M\\n"),
+}))
+`);
+    expect(result.exitCode).toBe(0);
+    // 990000 is taken in the cluster's VM list
+    expect(result.json.first).toBe(990001);
+    expect(result.json.source).toBe("990001");
+    expect(result.json.stale).toBe("");
+    expect(result.json.second).toBe(990002);
+    // The outdated template stays while linked clones use it
+    expect(result.json.templates).toEqual([
+      [990001, "sha256:a", "local-zfs", 4],
+      [990002, "sha256:b", "local-zfs", 1],
+    ]);
+    // A directory storage has no linked clones
+    expect(result.json.dir_storage).toBeNull();
+    expect(result.json.marker).toBe(true);
+    // pvesh has the last word on IDs the VM list does not show yet
+    expect(result.json.taken_on_peer).toBe(990004);
+    expect(result.json.configured).toBe(5000);
+    expect(result.json.rootfs).toEqual(["local-lvm", 0.5]);
+  });
+});
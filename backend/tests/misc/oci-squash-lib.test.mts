@@ -0,0 +1,94 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import { createOciLibTestSetup, type OciLibTestSetup } from "@tests/helper/python-script-helper.mjs";
+
+// In the order of the templates' "library" lists
+const LIBRARIES = [
+  "oci_registry_lib.py",
+  "oci_store_lib.py",
+  "oci_squash_lib.py",
+];
+
+describe("oci_squash_lib.py", () => {
+  let setup: OciLibTestSetup;
+
+  beforeEach(() => {
+    setup = createOciLibTestSetup(import.meta.url, LIBRARIES);
+  });
+
+  afterEach(() => {
+    setup.cleanup();
+  });
+
+  it("should squash layers without deleted, replaced and pruned content", () => {
+    const result = setup.run(`
+import io
+
+def layer(entries):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, content in entries:
+            info = tarfile.TarInfo(name)
+            if content is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif content.startswith("=>"):
+                info.type, info.linkname = tarfile.LNKTYPE, content[2:]
+                tar.addfile(info)
+            else:
+                data = content.encode("utf-8")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    data = gzip.compress(buf.getvalue())
+    return {"mediaType": "application/vnd.oci.image.layer.v1.tar+gzip", "digest": store_blob(data), "size": len(data)}
+
+ensure_cache_dirs()
+layers = [
+    layer([("etc", None), ("etc/os-release", "ID=alpine"), ("tmp", None), ("tmp/build.log", "big"),
+           ("old", None), ("old/a", "1"), ("var", None), ("var/cache", None), ("var/cache/apk", None),
+           ("var/cache/apk/index.tar.gz", "cache"), ("app", None), ("app/v1", "1")]),
+    layer([("tmp/.wh.build.log", ""), (".wh.old", ""), ("app/.wh..wh..opq", ""), ("app/v2", "2"),
+           ("app/v2-link", "=>app/v2"), ("etc/os-release", "ID=alpine\\nVERSION_ID=3.19")]),
+]
+config = json.dumps({"architecture": "amd64", "os": "linux", "config": {},
+                     "rootfs": {"type": "layers", "diff_ids": ["sha256:x", "sha256:y"]}}).encode("utf-8")
+manifest = json.dumps({"schemaVersion": 2, "mediaType": OCI_MANIFEST_MEDIA_TYPE,
+                       "config": {"mediaType": "application/vnd.oci.image.config.v1+json",
+                                  "digest": store_blob(config), "size": len(config)},
+                       "layers": layers}).encode("utf-8")
+layout = layout_dir("ghcr.io/owner/app")
+os.makedirs(layout, exist_ok=True)
+write_json_atomic(os.path.join(layout, "index.json"), {"schemaVersion": 2, "manifests": [
+    {"mediaType": OCI_MANIFEST_MEDIA_TYPE, "digest": store_blob(manifest), "size": len(manifest),
+     "annotations": {REF_NAME_ANNOTATION: "1.0"}}]})
+
+ref = squash_image(layout, "1.0", ["/var/cache/apk"])
+again = squash_image(layout, "1.0", ["/var/cache/apk/"])
+squashed = read_blob_json(find_manifest_descriptor(layout, ref)["digest"])
+with tarfile.open(blob_path(squashed["layers"][0]["digest"]), "r:gz") as tar:
+    members = {m.name: (tar.extractfile(m).read().decode() if m.isfile() else m.linkname or "dir")
+               for m in tar.getmembers()}
+diff_id = read_blob_json(squashed["config"]["digest"])["rootfs"]["diff_ids"]
+with open(blob_path(squashed["layers"][0]["digest"]), "rb") as f:
+    diff_ok = diff_id == [sha256_digest(gzip.decompress(f.read()))]
+install_oci_archive(layout, ref, os.environ["STORAGE_DIR"], "app_1.0.tar")
+with tarfile.open(os.path.join(os.environ["STORAGE_DIR"], "app_1.0.tar")) as tar:
+    archive_ref = json.load(tar.extractfile("index.json"))["manifests"][0]["annotations"][REF_NAME_ANNOTATION]
+print(json.dumps({"ref": ref, "again": again, "layers": len(squashed["layers"]), "members": members,
+                  "diff_ok": diff_ok, "archive_ref": archive_ref, "single": squash_image(layout, ref)}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.ref).toBe("1.0-squashed");
+    // The same image and prune paths reuse the squashed manifest
+    expect(result.json.again).toBe("1.0-squashed");
+    expect(result.json.layers).toBe(1);
+    expect(result.json.members).toEqual({
+      etc: "dir", "etc/os-release": "ID=alpine\nVERSION_ID=3.19", tmp: "dir", var: "dir", "var/cache": "dir",
+      "var/cache/apk": "dir", app: "dir", "app/v2": "2", "app/v2-link": "app/v2",
+    });
+    expect(result.json.diff_ok).toBe(true);
+    // Proxmox sees the image's own ref name
+    expect(result.json.archive_ref).toBe("1.0");
+    // A single layer without pruning is left as it is
+    expect(result.json.single).toBe("1.0-squashed");
+  });
+});
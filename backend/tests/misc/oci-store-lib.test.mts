@@ -0,0 +1,141 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import { createOciLibTestSetup, type OciLibTestSetup } from "@tests/helper/python-script-helper.mjs";
+import { Volume } from "@tests/helper/test-persistence-helper.mjs";
+
+// In the order of the templates' "library" lists
+const LIBRARIES = [
+  "oci_registry_lib.py",
+  "oci_store_lib.py",
+];
+
+describe("oci_store_lib.py", () => {
+  let setup: OciLibTestSetup;
+
+  beforeEach(() => {
+    setup = createOciLibTestSetup(import.meta.url, LIBRARIES);
+  });
+
+  afterEach(() => {
+    setup.cleanup();
+  });
+
+  it("should look up archives by exact image and tag", () => {
+    setup.persistenceHelper.writeTextSync(Volume.LocalRoot, "template/cache/app_1.23.tar", "x");
+    const result = setup.run(`
+index = StorageIndex("local", os.environ["STORAGE_DIR"])
+index.refresh()
+print(json.dumps({"hit": index.lookup("app", "1.23"), "miss": index.lookup("app", "1.2")}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.hit).toBe("local:vztmpl/app_1.23.tar");
+    expect(result.json.miss).toBeNull();
+  });
+
+  it("should keep recorded digests across refreshes and pick up new files", () => {
+    setup.persistenceHelper.writeTextSync(Volume.LocalRoot, "template/cache/app_1.0.tar", "x");
+    let result = setup.run(`
+index = StorageIndex("local", os.environ["STORAGE_DIR"])
+index.refresh()
+index.record("ghcr.io/owner/app", "1.0", "sha256:${"a".repeat(64)}")
+print(json.dumps({"ok": True}))
+`);
+    expect(result.exitCode).toBe(0);
+
+    setup.persistenceHelper.writeTextSync(Volume.LocalRoot, "template/cache/app_2.0.tar", "yy");
+    result = setup.run(`
+index = StorageIndex("local", os.environ["STORAGE_DIR"])
+index.refresh()
+print(json.dumps({
+    "digest": index.lookup_digest("ghcr.io/owner/app", "sha256:${"a".repeat(64)}"),
+    "other": index.lookup_digest("ghcr.io/owner/other", "sha256:${"a".repeat(64)}"),
+    "new": index.lookup("app", "2.0"),
+}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.digest).toBe("local:vztmpl/app_1.0.tar");
+    expect(result.json.other).toBeNull();
+    expect(result.json.new).toBe("local:vztmpl/app_2.0.tar");
+  });
+
+  it("should make a second lock holder wait and time out", () => {
+    const result = setup.run(`
+first = FileLock("image docker.io/library/app:1.0", 1)
+first.acquire()
+try:
+    FileLock("image docker.io/library/app:1.0", 1).acquire()
+    contended = "acquired"
+except LockTimeout:
+    contended = "timeout"
+first.release()
+with FileLock("image docker.io/library/app:1.0", 1) as again:
+    waited = again.waited
+print(json.dumps({"contended": contended, "waited": waited}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.contended).toBe("timeout");
+    expect(result.json.waited).toBe(0);
+    expect(result.stderr).toContain("Waiting for concurrent pull");
+  });
+
+  it("should reject pulls that do not fit into the free space of cache and storage", () => {
+    const result = setup.run(`
+free = storage_free_bytes(os.environ["STORAGE_DIR"])
+small = [{"Digest": "sha256:" + "a" * 64, "Size": 1024}]
+# Half the free space each for download and archive: fits separately, not on one filesystem
+half = [{"Digest": "sha256:" + "b" * 64, "Size": free // 2}]
+ensure_cache_dirs()
+with open(staging_path("sha256:" + "b" * 64), "wb") as f:
+    f.truncate(free // 2)
+staged = space_shortages(half, os.environ["STORAGE_DIR"])
+os.unlink(staging_path("sha256:" + "b" * 64))
+print(json.dumps({"small": space_shortages(small, os.environ["STORAGE_DIR"]),
+                  "half": space_shortages(half, os.environ["STORAGE_DIR"]),
+                  "staged": staged, "unknown": space_shortages([], os.environ["STORAGE_DIR"])}))
+`);
+    expect(result.exitCode).toBe(0);
+    expect(result.json.small).toEqual([]);
+    // Cache and storage share the test filesystem, so download and archive add up
+    expect(result.json.half).toHaveLength(1);
+    expect(result.json.half[0]).toContain("free");
+    // Bytes staged by an interrupted run are not downloaded again
+    expect(result.json.staged).toEqual([]);
+    expect(result.json.unknown).toEqual([]);
+  });
+
+  it("should probe host tools once and again only after they changed", () => {
+    const driver = `
+bin_dir = os.path.join(os.environ["STORAGE_DIR"], "..", "bin")
+os.makedirs(bin_dir, exist_ok=True)
+os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+calls = os.path.join(bin_dir, "..", "calls")
+skopeo = os.path.join(bin_dir, "skopeo")
+if not os.path.exists(skopeo):
+    with open(skopeo, "w") as f:
+        f.write("#!/bin/sh\\necho \\"$@\\" >> " + calls + "\\n"
+                "[ \\"$1\\" = --version ] && echo 'skopeo version 1.14.2'\\n"
+                "echo '  --retry-times int'\\n")
+    os.chmod(skopeo, 0o755)
+if os.environ.get("TOUCH"):
+    os.utime(skopeo, (1, 1))
+print(json.dumps({"skopeo": host_tool("skopeo"), "retry": skopeo_supports("--retry-times"),
+                  "missing": tool_path("no-such-tool"), "calls": open(calls).read().splitlines()}))
+`;
+    const first = setup.run(driver);
+    expect(first.exitCode).toBe(0);
+    expect(first.json.skopeo.version).toBe("1.14.2");
+    expect(first.json.retry).toBe(true);
+    expect(first.json.missing).toBeNull();
+    expect(first.json.calls).toEqual(["--version", "copy --help"]);
+    // Second run is served from the cache file without spawning skopeo
+    const second = setup.run(driver);
+    expect(second.json.calls).toHaveLength(2);
+    // An upgraded binary (new mtime) is probed again
+    process.env.TOUCH = "1";
+    try {
+      const third = setup.run(driver);
+      expect(third.json.calls).toHaveLength(4);
+    } finally {
+      delete process.env.TOUCH;
+    }
+  });
+});
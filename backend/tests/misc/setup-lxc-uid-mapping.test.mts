@@ -1,7 +1,10 @@
 import { describe, it, expect, beforeEach, afterEach } from "vitest";
-import { spawnSync } from "child_process";
 import { createTestEnvironment, TestEnvironment } from "@tests/helper/test-environment.mjs";
 import { TestPersistenceHelper, Volume } from "@tests/helper/test-persistence-helper.mjs";
+import { runPythonScript, type PythonScriptResult } from "@tests/helper/python-script-helper.mjs";
+
+// Both libraries, in the order of the template's "library" list
+const LIBRARIES = ["deployer_common_lib.py", "setup_lxc_idmap_common.py"];
 
 describe("setup-lxc-uid-mapping.py", () => {
   let env: TestEnvironment;
@@ -16,6 +19,7 @@ describe("setup-lxc-uid-mapping.py", () => {
         "^shared/scripts/setup-lxc-uid-mapping\\.py$",
         "^shared/scripts/setup-lxc-gid-mapping\\.py$",
         "^shared/scripts/setup_lxc_idmap_common\\.py$",
+        "^shared/scripts/deployer_common_lib\\.py$",
       ],
     });
     env.initPersistence({ enableCache: false });
@@ -35,7 +39,7 @@ describe("setup-lxc-uid-mapping.py", () => {
     env.cleanup();
   });
 
-  function runUidScript(uid: string, vmId?: string): { stdout: string; stderr: string; exitCode: number } {
+  function runUidScript(uid: string, vmId?: string): PythonScriptResult {
     let scriptContent = persistenceHelper.readTextSync(
       Volume.JsonSharedScripts,
       "setup-lxc-uid-mapping.py",
@@ -46,34 +50,17 @@ describe("setup-lxc-uid-mapping.py", () => {
       // In case the template contains gid placeholders in comments/legacy text
       .replace(/\{\{\s*gid\s*\}\}/g, "0");
 
-    const commonModule = persistenceHelper.readTextSync(
-      Volume.JsonSharedScripts,
-      "setup_lxc_idmap_common.py",
-    );
-    const combined = `${commonModule}\n\n${scriptContent}`;
-
-    const execEnv = {
-      ...process.env,
-      MOCK_SUBUID_PATH: subuidPath,
-      MOCK_CONFIG_DIR: configDir,
-      PYTHONPATH: env.rootDir,
-    };
-
-    const result = spawnSync("python3", [], {
-      input: combined,
-      env: execEnv,
-      encoding: "utf-8",
+    return runPythonScript(persistenceHelper, LIBRARIES, scriptContent, {
+      env: {
+        MOCK_SUBUID_PATH: subuidPath,
+        MOCK_CONFIG_DIR: configDir,
+        PYTHONPATH: env.rootDir,
+      },
       timeout: 5000,
     });
-
-    return {
-      stdout: result.stdout || "",
-      stderr: result.stderr || "",
-      exitCode: result.status || 0,
-    };
   }
 
-  function runGidScript(gid: string, vmId?: string): { stdout: string; stderr: string; exitCode: number } {
+  function runGidScript(gid: string, vmId?: string): PythonScriptResult {
     let scriptContent = persistenceHelper.readTextSync(
       Volume.JsonSharedScripts,
       "setup-lxc-gid-mapping.py",
@@ -83,31 +70,14 @@ describe("setup-lxc-uid-mapping.py", () => {
       .replace(/\{\{\s*vm_id\s*\}\}/g, vmId || "")
       .replace(/\{\{\s*uid\s*\}\}/g, "0");
 
-    const commonModule = persistenceHelper.readTextSync(
-      Volume.JsonSharedScripts,
-      "setup_lxc_idmap_common.py",
-    );
-    const combined = `${commonModule}\n\n${scriptContent}`;
-
-    const execEnv = {
-      ...process.env,
-      MOCK_SUBGID_PATH: subgidPath,
-      MOCK_CONFIG_DIR: configDir,
-      PYTHONPATH: env.rootDir,
-    };
-
-    const result = spawnSync("python3", [], {
-      input: combined,
-      env: execEnv,
-      encoding: "utf-8",
+    return runPythonScript(persistenceHelper, LIBRARIES, scriptContent, {
+      env: {
+        MOCK_SUBGID_PATH: subgidPath,
+        MOCK_CONFIG_DIR: configDir,
+        PYTHONPATH: env.rootDir,
+      },
       timeout: 5000,
     });
-
-    return {
-      stdout: result.stdout || "",
-      stderr: result.stderr || "",
-      exitCode: result.status || 0,
-    };
   }
 
   it("should configure single UID mapping correctly", () => {
@@ -264,4 +234,16 @@ rootfs: local-lvm:vm-102-disk-0,size=8G
     // New idmap entries should be added
     expect(configContent).toContain("lxc.idmap: u 1000 1000 1");
   });
+
+  it("should report phase timings next to the mapped ids", () => {
+    const resultUid = runUidScript("1000", "100");
+    expect(resultUid.exitCode).toBe(0);
+
+    const outputs = JSON.parse(resultUid.stdout);
+    expect(outputs[0].id).toBe("mapped_uid");
+    expect(outputs[1].id).toBe("setup_lxc_uid_mapping_timings");
+    const timings = JSON.parse(outputs[1].value);
+    expect(timings.phases.map((p: any) => p.phase)).toEqual(["subuid", "lxc_config"]);
+    expect(timings.total_seconds).toBeGreaterThanOrEqual(0);
+  });
 });
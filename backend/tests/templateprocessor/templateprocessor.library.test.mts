@@ -162,5 +162,88 @@ describe("TemplateProcessor - Library support", () => {
     expect(result.commands[0]!.libraryPath).toBeDefined();
     expect(result.commands[0]!.libraryPath).toContain("test-library.sh");
   });
-});
 
+  it("should prepend several libraries in the given order", async () => {
+    const appId = "test-library-app-multiple";
+    const templatesDir = persistenceHelper.resolve(Volume.JsonApplications, `${appId}/templates`);
+    const scriptsDir = persistenceHelper.resolve(Volume.JsonApplications, `${appId}/scripts`);
+
+    fs.mkdirSync(templatesDir, { recursive: true });
+    fs.mkdirSync(scriptsDir, { recursive: true });
+
+    persistenceHelper.writeTextSync(Volume.JsonApplications, `${appId}/scripts/base-library.sh`, "function base_function() { echo 'base'; }");
+    persistenceHelper.writeTextSync(Volume.JsonApplications, `${appId}/scripts/test-library.sh`, "function test_function() { base_function; }");
+    persistenceHelper.writeTextSync(Volume.JsonApplications, `${appId}/scripts/test-script.sh`, "test_function");
+
+    const template = {
+      "execute_on": "ve",
+      "name": "Test Template",
+      "commands": [
+        {
+          "name": "Test Command",
+          "script": "test-script.sh",
+          "library": ["base-library.sh", "test-library.sh"]
+        }
+      ]
+    };
+    const applicationJson = {
+      "name": "Test Library App",
+      "description": "Test application for library support",
+      "installation": ["test-template.json"],
+    };
+    persistenceHelper.writeJsonSync(Volume.JsonApplications, `${appId}/application.json`, applicationJson);
+    persistenceHelper.writeJsonSync(Volume.JsonApplications, `${appId}/templates/test-template.json`, template);
+
+    const result = await tp.loadApplication(appId, "installation", veContext, ExecutionMode.TEST);
+
+    expect(result.commands.length).toBe(1);
+    const libraryContent = result.commands[0]!.libraryContent!;
+    expect(libraryContent.indexOf("base_function()")).toBeGreaterThanOrEqual(0);
+    expect(libraryContent.indexOf("base_function()")).toBeLessThan(libraryContent.indexOf("test_function()"));
+    expect(result.commands[0]!.libraryPath).toBeUndefined();
+    expect(result.commands[0]!.libraryPaths).toHaveLength(2);
+    expect(result.commands[0]!.libraryPaths![0]).toContain("base-library.sh");
+    expect(result.commands[0]!.libraryPaths![1]).toContain("test-library.sh");
+  });
+
+  it("should error naming only the missing library of several", async () => {
+    const appId = "test-library-app-multiple-missing";
+    const templatesDir = persistenceHelper.resolve(Volume.JsonApplications, `${appId}/templates`);
+    const scriptsDir = persistenceHelper.resolve(Volume.JsonApplications, `${appId}/scripts`);
+
+    fs.mkdirSync(templatesDir, { recursive: true });
+    fs.mkdirSync(scriptsDir, { recursive: true });
+
+    persistenceHelper.writeTextSync(Volume.JsonApplications, `${appId}/scripts/base-library.sh`, "function base_function() { echo 'base'; }");
+    persistenceHelper.writeTextSync(Volume.JsonApplications, `${appId}/scripts/test-script.sh`, "base_function");
+
+    const template = {
+      "execute_on": "ve",
+      "name": "Test Template",
+      "commands": [
+        {
+          "name": "Test Command",
+          "script": "test-script.sh",
+          "library": ["base-library.sh", "non-existent-library.sh"]
+        }
+      ]
+    };
+    const applicationJson = {
+      "name": "Test Library App",
+      "description": "Test application for library support",
+      "installation": ["test-template.json"],
+    };
+    persistenceHelper.writeJsonSync(Volume.JsonApplications, `${appId}/application.json`, applicationJson);
+    persistenceHelper.writeJsonSync(Volume.JsonApplications, `${appId}/templates/test-template.json`, template);
+
+    try {
+      await tp.loadApplication(appId, "installation", veContext, ExecutionMode.TEST);
+      expect.fail("Should have thrown an error");
+    } catch (e: any) {
+      const errorDetails = e.details || [];
+      const allErrors = [e.message || String(e), ...errorDetails.map((d: any) => d.message || String(d))].join(" ");
+      expect(allErrors).toMatch(/Library file not found: non-existent-library\.sh/);
+      expect(allErrors).not.toMatch(/Library file not found: base-library\.sh/);
+    }
+  });
+});
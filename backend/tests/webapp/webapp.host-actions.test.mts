@@ -0,0 +1,88 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import request from "supertest";
+import express from "express";
+import path from "node:path";
+import { ApiUri } from "@src/types.mjs";
+import {
+  createWebAppTestSetup,
+  type WebAppTestSetup,
+  createTempDir,
+  ensureDirs,
+  writeTextFile,
+} from "../helper/webapp-test-helper.mjs";
+
+describe("WebApp host actions API", () => {
+  let app: express.Application;
+  let setup: WebAppTestSetup;
+  const veContextKey = "ve_testhost";
+  const actionUrl = (action: string) =>
+    ApiUri.HostAction.replace(":action", action).replace(":veContext", veContextKey);
+
+  beforeEach(() => {
+    // Ensure VeExecution runs locally (no SSH) for this test
+    process.env.LXC_MANAGER_TEST_MODE = "true";
+
+    setup = createWebAppTestSetup(import.meta.url, {
+      jsonIncludePatterns: [
+        "^shared/templates/01[2-6]-.*\\.json$",
+        "^shared/scripts/.*oci.*\\.py$",
+        "^shared/scripts/(deployer_common|oci_\\w+)_lib\\.py$",
+      ],
+    });
+    setup.ctx.setVEContext({
+      host: "testhost",
+      port: 22,
+      current: true,
+    } as any);
+    app = setup.app;
+  });
+
+  afterEach(() => {
+    setup.cleanup();
+  });
+
+  it("lists the maintenance actions with the parameters of their templates", async () => {
+    const res = await request(app).get(ApiUri.HostActions);
+    expect(res.status).toBe(200);
+    const prefetch = res.body.find((action: any) => action.id === "prefetch-oci-images");
+    expect(prefetch.name).toBe("Prefetch OCI Images");
+    expect(prefetch.parameters.map((p: any) => p.id)).toContain("oci_images");
+    const plan = res.body.find((action: any) => action.id === "plan-oci-image");
+    expect(plan.parameters.find((p: any) => p.id === "probe_peers").default).toBe(false);
+    expect(res.body.map((action: any) => action.id)).toEqual(
+      expect.arrayContaining(["start-oci-cache-server", "start-oci-update-prefetcher"]),
+    );
+  });
+
+  it("runs only listed actions and checks required parameters", async () => {
+    const unknown = await request(app).post(actionUrl("create-lxc")).send({ params: [] });
+    expect(unknown.status).toBe(404);
+
+    const missing = await request(app).post(actionUrl("prefetch-oci-images")).send({ params: [] });
+    expect(missing.status).toBe(400);
+    expect(missing.body.error).toContain("oci_images");
+  });
+
+  it("reports what the OCI image clean-up would remove in a dry run", async () => {
+    const tmpRoot = createTempDir("lxc-gc-");
+    ensureDirs(tmpRoot, "template/cache", "lxc", "oci-cache", "run");
+    writeTextFile(path.join(tmpRoot, "storage.cfg"), `dir: local\n\tpath ${tmpRoot}\n\tcontent vztmpl\n`);
+    const env = {
+      LXC_MANAGER_PVE_STORAGE_CFG: path.join(tmpRoot, "storage.cfg"),
+      LXC_MANAGER_PVE_LXC_DIR: path.join(tmpRoot, "lxc"),
+      LXC_MANAGER_OCI_CACHE_DIR: path.join(tmpRoot, "oci-cache"),
+      LXC_MANAGER_HOST_CAPABILITIES: path.join(tmpRoot, "run/host-capabilities.json"),
+    };
+    Object.assign(process.env, env);
+    try {
+      const res = await request(app)
+        .post(actionUrl("gc-oci-images"))
+        .send({ params: [{ name: "dry_run", value: true }] });
+      expect(res.status).toBe(200);
+      const output = res.body.outputs.find((o: any) => o.id === "gc_result");
+      expect(JSON.parse(output.value)).toMatchObject({ removed: [], freed_bytes: 0 });
+    } finally {
+      for (const name of Object.keys(env)) delete process.env[name];
+    }
+  });
+});
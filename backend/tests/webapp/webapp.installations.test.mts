@@ -25,7 +25,7 @@ describe("WebApp Installations API", () => {
 
     setup = createWebAppTestSetup(import.meta.url, {
       // Provide required script for /api/installations via json/ (no manual copying)
-      jsonIncludePatterns: [".*list-managed-oci-containers.*"],
+      jsonIncludePatterns: [".*list-managed-oci-containers.*", ".*deployer_common_lib.*"],
       // Schemas are read from repo directly by default (no copying)
     });
     env = setup.env;
@@ -116,4 +116,33 @@ describe("WebApp Installations API", () => {
     const jsonFilesAfter = listFilesRecursive(env.jsonDir);
     expect(jsonFilesAfter).toEqual(jsonFilesBefore);
   });
+
+  it("returns containers with either marker prefix in numeric vm_id order", async () => {
+    const lxcDir = path.join(tmpPve, "lxc");
+    // older lxc-manager: prefix, still written by create-lxc-container.sh
+    writeTextFile(
+      path.join(lxcDir, "99.conf"),
+      [
+        "hostname: cont-99",
+        "description: <!-- lxc-manager:managed -->\\n<!-- lxc-manager:oci-image docker://nginx:1.27 -->",
+      ].join("\n"),
+      "utf-8",
+    );
+    writeTextFile(
+      path.join(lxcDir, "100.conf"),
+      [
+        "hostname: cont-100",
+        "description: <!-- oci-lxc-deployer:managed -->\\n<!-- oci-lxc-deployer:oci-image docker://redis:7 -->",
+      ].join("\n"),
+      "utf-8",
+    );
+
+    const url = ApiUri.Installations.replace(":veContext", veContextKey);
+    const res = await request(app).get(url);
+    expect(res.status).toBe(200);
+    expect(res.body.map((entry: any) => entry.vm_id)).toEqual([99, 100, 101, 104]);
+    expect(res.body[0].oci_image).toBe("docker://nginx:1.27");
+    expect(res.body[0].hostname).toBe("cont-99");
+    expect(res.body[1].oci_image).toBe("docker://redis:7");
+  });
 });
@@ -0,0 +1,79 @@
+import { describe, it, expect, beforeEach, afterEach } from "vitest";
+import request from "supertest";
+import express from "express";
+import path from "node:path";
+import { ApiUri } from "@src/types.mjs";
+import {
+  createWebAppTestSetup,
+  type WebAppTestSetup,
+  createTempDir,
+  ensureDirs,
+  writeTextFile,
+} from "../helper/webapp-test-helper.mjs";
+
+describe("WebApp OCI image plan API", () => {
+  let app: express.Application;
+  let setup: WebAppTestSetup;
+  let tmpRoot: string;
+  const veContextKey = "ve_testhost";
+  const url = ApiUri.OciImagePlan.replace(":veContext", veContextKey);
+
+  beforeEach(() => {
+    // Ensure VeExecution runs locally (no SSH) for this test
+    process.env.LXC_MANAGER_TEST_MODE = "true";
+
+    setup = createWebAppTestSetup(import.meta.url, {
+      jsonIncludePatterns: [
+        "^shared/templates/014-plan-oci-image\\.json$",
+        "^shared/scripts/plan-oci-image\\.py$",
+        "^shared/scripts/(deployer_common|oci_\\w+)_lib\\.py$",
+      ],
+    });
+    setup.ctx.setVEContext({
+      host: "testhost",
+      port: 22,
+      current: true,
+    } as any);
+
+    // Storage "local" with an archive of alpine:3.19, everything else in the temp dir
+    tmpRoot = createTempDir("lxc-plan-");
+    ensureDirs(tmpRoot, "template/cache", "oci-cache", "pve", "run");
+    writeTextFile(path.join(tmpRoot, "template/cache/alpine_3.19.tar"), "archive");
+    writeTextFile(path.join(tmpRoot, "storage.cfg"), `dir: local\n\tpath ${tmpRoot}\n\tcontent vztmpl\n`);
+    process.env.LXC_MANAGER_PVE_STORAGE_CFG = path.join(tmpRoot, "storage.cfg");
+    process.env.LXC_MANAGER_OCI_CACHE_DIR = path.join(tmpRoot, "oci-cache");
+    process.env.LXC_MANAGER_OCI_MIRROR_CONFIG = path.join(tmpRoot, "pve/oci-mirror.json");
+    process.env.LXC_MANAGER_HOST_CAPABILITIES = path.join(tmpRoot, "run/host-capabilities.json");
+
+    app = setup.app;
+  });
+
+  afterEach(() => {
+    for (const name of [
+      "LXC_MANAGER_PVE_STORAGE_CFG",
+      "LXC_MANAGER_OCI_CACHE_DIR",
+      "LXC_MANAGER_OCI_MIRROR_CONFIG",
+      "LXC_MANAGER_HOST_CAPABILITIES",
+    ]) {
+      delete process.env[name];
+    }
+    setup.cleanup();
+  });
+
+  it("answers from the storage index without contacting the registry", async () => {
+    const res = await request(app).post(url).send({ oci_image: "docker://alpine:3.19" });
+    expect(res.status).toBe(200);
+    expect(res.body).toMatchObject({
+      oci_image: "docker://alpine:3.19",
+      cached: true,
+      template_path: "local:vztmpl/alpine_3.19.tar",
+      bytes_to_download: 0,
+    });
+  });
+
+  it("rejects a request without an image", async () => {
+    const res = await request(app).post(url).send({ storage: "local" });
+    expect(res.status).toBe(400);
+    expect(res.body.error).toContain("oci_image");
+  });
+});
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 """
-Inspect any OCI image to extract volumes and environment variables using skopeo.
+Inspect any OCI image to extract volumes and environment variables.
+
+Uses the registry client from json/shared/scripts/oci_registry_lib.py (manifest and
+config over one connection, including the image History). skopeo is the fallback.
 
 Usage:
     python3 inspect-ha-image.py <image> [--username USER] [--password PASS]
@@ -11,15 +14,23 @@ Usage:
     python3 inspect-ha-image.py docker://alpine:latest
 
 Requirements:
-    - skopeo must be installed (apt install skopeo)
+    - skopeo (apt install skopeo) only if the native registry client fails
 """
 
 import json
+import os
 import sys
+import shutil
 import subprocess
 import argparse
 from typing import Optional, Dict, List
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'json', 'shared', 'scripts'))
+try:
+    from oci_registry_lib import RegistryClient, RegistryError, split_image_name
+except ImportError:
+    RegistryClient = None
+
 def log(message: str) -> None:
     """Print message to stderr (for logging)."""
     print(message, file=sys.stderr)
@@ -30,17 +41,8 @@ def error(message: str, exit_code: int = 1) -> None:
     sys.exit(exit_code)
 
 def check_skopeo() -> bool:
-    """Check if skopeo is available."""
-    try:
-        result = subprocess.run(['which', 'skopeo'], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            # Verify it's actually skopeo
-            version_result = subprocess.run(['skopeo', '--version'], capture_output=True, text=True, timeout=5)
-            if version_result.returncode == 0:
-                return True
-        return False
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        return False
+    """Check if skopeo is available (PATH lookup, no process spawn)."""
+    return shutil.which('skopeo') is not None
 
 def check_docker() -> bool:
     """Check if docker is available."""
@@ -140,6 +142,31 @@ def parse_image_ref(image_ref: str) -> str:
     
     return image_ref
 
+def registry_inspect(image_ref: str, username: Optional[str] = None, password: Optional[str] = None,
+                     platform: Optional[str] = None) -> Optional[dict]:
+    """
+    Inspect image with the native registry client.
+    
+    Returns skopeo-compatible output plus Config and History, or None if the client
+    is not available or fails (then skopeo is used).
+    """
+    if RegistryClient is None:
+        return None
+    image = image_ref.replace('docker://', '')
+    if '@' in image:
+        image, tag = image.split('@', 1)
+    elif ':' in image.split('/')[-1]:
+        image, tag = image.rsplit(':', 1)
+    else:
+        tag = 'latest'
+    try:
+        log(f"Inspecting {image_ref}...")
+        with RegistryClient(split_image_name(image)[0], username, password) as client:
+            return client.inspect(image, tag, platform)
+    except (RegistryError, OSError, ValueError) as e:
+        log(f"Native registry inspect failed ({e}), falling back to skopeo")
+        return None
+
 def skopeo_inspect(image_ref: str, username: Optional[str] = None, password: Optional[str] = None, 
                    platform: Optional[str] = None) -> dict:
     """
@@ -460,10 +487,6 @@ def simplify_inspect_output(inspect_output: dict) -> dict:
     return simplified_output
 
 def main():
-    # Check if skopeo is available
-    if not check_skopeo():
-        error("skopeo is required but not found. Please install it with: apt install skopeo")
-    
     parser = argparse.ArgumentParser(
         description='Inspect OCI image to extract volumes and environment variables using skopeo',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -491,13 +514,17 @@ Examples:
     # Parse and normalize image reference
     image_ref = parse_image_ref(args.image)
     
-    # Inspect image with skopeo
-    inspect_output = skopeo_inspect(image_ref, args.username, args.password, args.platform)
+    # Inspect image (native registry client, skopeo as fallback)
+    inspect_output = registry_inspect(image_ref, args.username, args.password, args.platform)
+    if inspect_output is None:
+        if not check_skopeo():
+            error("skopeo is required but not found. Please install it with: apt install skopeo")
+        inspect_output = skopeo_inspect(image_ref, args.username, args.password, args.platform)
     
-    # If docker is available and Config.Volumes is empty, try docker inspect for History
+    # If there is no History (skopeo output) and Config.Volumes is empty, try docker inspect
     # (docker inspect provides History which skopeo doesn't)
     docker_inspect_data = None
-    if docker_available:
+    if not inspect_output.get('History') and check_docker():
         config_data = inspect_output.get('Config', {}) or inspect_output.get('config', {}) or {}
         volumes = config_data.get('Volumes', {}) or inspect_output.get('Volumes', {}) or {}
         if not volumes:
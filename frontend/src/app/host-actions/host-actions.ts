@@ -0,0 +1,84 @@
+import { Component, inject, OnInit } from '@angular/core';
+import { FormControl, FormGroup, ReactiveFormsModule, Validators } from '@angular/forms';
+import { MatButtonModule } from '@angular/material/button';
+import { VeConfigurationService, VeConfigurationParam } from '../ve-configuration.service';
+import { ParameterGroupComponent } from '../ve-configuration-dialog/parameter-group.component';
+import { IHostAction, IParameter, IParameterValue } from '../../shared/types';
+
+interface HostActionState {
+  action: IHostAction;
+  form: FormGroup;
+  groupedParameters: Record<string, IParameter[]>;
+  expanded: boolean;
+  showAdvanced: boolean;
+  running: boolean;
+  outputs?: { id: string; value: IParameterValue }[];
+  error?: string;
+}
+
+/** Maintenance actions of the selected VE host (OCI image prefetch, cleanup, ...). */
+@Component({
+  selector: 'app-host-actions',
+  standalone: true,
+  imports: [ReactiveFormsModule, MatButtonModule, ParameterGroupComponent],
+  templateUrl: './host-actions.html',
+  styleUrl: './host-actions.scss',
+})
+export class HostActions implements OnInit {
+  actions: HostActionState[] = [];
+  loading = true;
+  error?: string;
+  private svc = inject(VeConfigurationService);
+
+  ngOnInit(): void {
+    this.svc.getHostActions().subscribe({
+      next: (actions) => {
+        this.actions = actions.map((action) => {
+          const form = new FormGroup({});
+          for (const param of action.parameters) {
+            const validators = param.required ? [Validators.required] : [];
+            form.addControl(param.id, new FormControl(param.default !== undefined ? param.default : '', validators));
+          }
+          return {
+            action,
+            form,
+            groupedParameters: { [action.name]: action.parameters },
+            expanded: false,
+            showAdvanced: false,
+            running: false,
+          };
+        });
+        this.loading = false;
+      },
+      error: () => {
+        this.error = 'Error loading host actions';
+        this.loading = false;
+      }
+    });
+  }
+
+  hasAdvancedParams(state: HostActionState): boolean {
+    return state.action.parameters.some((p) => p.advanced);
+  }
+
+  run(state: HostActionState): void {
+    if (state.form.invalid) return;
+    const params: VeConfigurationParam[] = [];
+    for (const [name, value] of Object.entries(state.form.value) as [string, IParameterValue][]) {
+      if (value !== null && value !== undefined && value !== '') params.push({ name, value });
+    }
+    state.running = true;
+    state.outputs = undefined;
+    state.error = undefined;
+    this.svc.postHostAction(state.action.id, params).subscribe({
+      next: (res) => {
+        state.outputs = res.outputs;
+        state.running = false;
+      },
+      error: (err: { error?: { error?: string } }) => {
+        state.error = err?.error?.error || `Error running ${state.action.name}`;
+        state.running = false;
+      }
+    });
+  }
+}
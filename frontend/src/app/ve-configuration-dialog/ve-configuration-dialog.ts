@@ -5,7 +5,7 @@ import { MAT_DIALOG_DATA, MatDialogModule, MatDialogRef, MatDialog } from '@angu
 
 import { ReactiveFormsModule, FormBuilder, FormGroup, Validators, FormControl } from '@angular/forms';
 import { MatButtonModule } from '@angular/material/button';
-import { IApplicationWeb, IParameter, IParameterValue, IEnumValuesResponse } from '../../shared/types';
+import { IApplicationWeb, IParameter, IParameterValue, IEnumValuesResponse, IOciImagePlanResponse } from '../../shared/types';
 import { VeConfigurationService, VeConfigurationParam } from '../ve-configuration.service';
 import { ErrorHandlerService } from '../shared/services/error-handler.service';
 import { ParameterGroupComponent } from './parameter-group.component';
@@ -30,6 +30,9 @@ export class VeConfigurationDialog implements OnInit {
   loading = signal(true);
   hasError = signal(false);
   showAdvanced = signal(false);
+  planning = signal(false);
+  pullPlan = signal<IOciImagePlanResponse | null>(null);
+  private plannedImage?: string;
   private initialValues = new Map<string, IParameterValue>();
   private enumRefreshAttempted = false;
   private configService: VeConfigurationService = inject(VeConfigurationService);
@@ -143,6 +146,56 @@ export class VeConfigurationDialog implements OnInit {
 
   save() {
     if (this.form.invalid) return;
+    // Before installing an OCI image, show what its pull would download; a second
+    // click installs. Images already in the storage install right away.
+    const ociImage = this.form.get('oci_image')?.value;
+    if (typeof ociImage === 'string' && ociImage.trim() && ociImage !== this.plannedImage) {
+      this.plannedImage = ociImage;
+      this.planning.set(true);
+      this.configService.postOciImagePlan({
+        oci_image: ociImage.trim(),
+        storage: this.optionalValue('storage'),
+        registry_username: this.optionalValue('registry_username'),
+        registry_password: this.optionalValue('registry_password'),
+        platform: this.optionalValue('platform'),
+      }).subscribe({
+        next: (plan) => {
+          this.planning.set(false);
+          this.pullPlan.set(plan);
+          if (plan.cached) this.install();
+        },
+        error: () => {
+          // The plan is only advisory
+          this.planning.set(false);
+          this.pullPlan.set(null);
+          this.install();
+        }
+      });
+      return;
+    }
+    this.install();
+  }
+
+  private optionalValue(id: string): string | undefined {
+    const value = this.form.get(id)?.value;
+    return typeof value === 'string' && value.trim() ? value.trim() : undefined;
+  }
+
+  get pullPlanSummary(): string {
+    const plan = this.pullPlan();
+    if (!plan || plan.cached) return '';
+    const mib = (bytes: number) => `${(bytes / (1024 * 1024)).toFixed(1)} MiB`;
+    let summary = `${plan.image}:${plan.version ?? plan.tag} is not in the storage yet: ${mib(plan.bytes_to_download)} to download`;
+    if (plan.layers_total) {
+      summary += ` (${plan.layers_reused ?? 0} of ${plan.layers_total} layers reused)`;
+    }
+    if (plan.peer_node) {
+      summary += `, or copied from node ${plan.peer_node}`;
+    }
+    return summary + '.';
+  }
+
+  private install() {
     this.loading.set(true);
     
     // Separate params and changed parameters
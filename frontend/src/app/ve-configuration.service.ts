@@ -1,6 +1,6 @@
 //
 
-import { ApiUri, ISsh, IApplicationsResponse, ISshConfigsResponse, ISshConfigKeyResponse, ISshCheckResponse, IUnresolvedParametersResponse, IDeleteSshConfigResponse, IPostVeConfigurationResponse, IPostVeConfigurationBody, IPostVeCopyUpgradeBody, IPostSshConfigResponse, IVeExecuteMessagesResponse, IFrameworkNamesResponse, IFrameworkParametersResponse, IPostFrameworkCreateApplicationBody, IPostFrameworkCreateApplicationResponse, IPostFrameworkFromImageBody, IPostFrameworkFromImageResponse, IInstallationsResponse, IVeConfigurationResponse, ITemplateProcessorLoadResult, IEnumValuesResponse, IPostEnumValuesBody } from '../shared/types';
+import { ApiUri, ISsh, IApplicationsResponse, ISshConfigsResponse, ISshConfigKeyResponse, ISshCheckResponse, IUnresolvedParametersResponse, IDeleteSshConfigResponse, IPostVeConfigurationResponse, IPostVeConfigurationBody, IPostVeCopyUpgradeBody, IPostSshConfigResponse, IVeExecuteMessagesResponse, IFrameworkNamesResponse, IFrameworkParametersResponse, IPostFrameworkCreateApplicationBody, IPostFrameworkCreateApplicationResponse, IPostFrameworkFromImageBody, IPostFrameworkFromImageResponse, IInstallationsResponse, IVeConfigurationResponse, ITemplateProcessorLoadResult, IEnumValuesResponse, IPostEnumValuesBody, IPostOciImagePlanBody, IOciImagePlanResponse, IHostActionsResponse, IHostActionResponse, IPostHostActionBody } from '../shared/types';
 import { Injectable, inject } from '@angular/core';
 import { Router } from '@angular/router';
 import { HttpClient } from '@angular/common/http';
@@ -79,6 +79,21 @@ export class VeConfigurationService {
     return this.get<IInstallationsResponse>(ApiUri.Installations);
   }
 
+  getHostActions(): Observable<IHostActionsResponse> {
+    return this.http.get<IHostActionsResponse>(ApiUri.HostActions);
+  }
+
+  // Errors are shown next to the action, so no global error handling
+  postHostAction(action: string, params: VeConfigurationParam[]): Observable<IHostActionResponse> {
+    const url = ApiUri.HostAction.replace(':action', encodeURIComponent(action));
+    return this.postWithoutGlobalErrorHandler<IHostActionResponse, IPostHostActionBody>(url, { params });
+  }
+
+  // The plan is advisory: callers handle errors themselves and install anyway
+  postOciImagePlan(body: IPostOciImagePlanBody): Observable<IOciImagePlanResponse> {
+    return this.postWithoutGlobalErrorHandler<IOciImagePlanResponse, IPostOciImagePlanBody>(ApiUri.OciImagePlan, body);
+  }
+
   getUnresolvedParameters(application: string, task: string): Observable<IUnresolvedParametersResponse> {
     const base = ApiUri.UnresolvedParameters
       .replace(":application", encodeURIComponent(application))
@@ -51,8 +51,9 @@ export interface ICommand {
   name: string;
   command?: string;
   script?: string;
-  library?: string;
+  library?: string | string[];
   libraryPath?: string; // Internal: resolved full path to library file
+  libraryPaths?: string[]; // Internal: resolved full paths when library is a list, in the same order
   template?: string;
   properties?: IOutputObject | IOutputObject[];
   outputs?: ({ id: string; default?: boolean } | string)[]; // Expected outputs from this command/script
@@ -129,6 +130,9 @@ export enum ApiUri {
   FrameworkParameters = "/api/framework-parameters/:frameworkId",
   FrameworkCreateApplication = "/api/framework-create-application",
   FrameworkFromImage = "/api/framework-from-image",
+  OciImagePlan = "/api/oci-image-plan/:veContext",
+  HostActions = "/api/host-actions",
+  HostAction = "/api/host-actions/:action/:veContext",
 }
 
 // Response interfaces for all backend endpoints (frontend mirror)
@@ -271,6 +275,49 @@ export interface IManagedOciContainer {
 
 export type IInstallationsResponse = IManagedOciContainer[];
 
+// Body and response of the OCI image plan (mirrors 014-plan-oci-image.json / plan_pull)
+export interface IPostOciImagePlanBody {
+  oci_image: string;
+  storage?: string;
+  registry_username?: string;
+  registry_password?: string;
+  platform?: string;
+  /** Ask the other cluster nodes for the image (a few seconds of SSH probes) */
+  probe_peers?: boolean;
+}
+
+export interface IOciImagePlanResponse {
+  oci_image: string;
+  image: string;
+  tag: string;
+  version?: string;
+  digest?: string;
+  cached: boolean;
+  template_path?: string;
+  layers_total?: number;
+  layers_reused?: number;
+  bytes_total?: number;
+  bytes_to_download: number;
+  reuse_ratio?: number;
+  space_shortages?: string[];
+  peer_node?: string | null;
+}
+
+// Maintenance actions of the VE host (shared templates, see webapp-host-actions-routes)
+export interface IHostAction {
+  id: string;
+  name: string;
+  description?: string;
+  parameters: IParameter[];
+}
+export type IHostActionsResponse = IHostAction[];
+export interface IPostHostActionBody {
+  params: { name: string; value: IParameterValue }[];
+}
+export interface IHostActionResponse {
+  outputs: { id: string; value: IParameterValue }[];
+}
+
 export type IVeExecuteMessagesResponse = ISingleExecuteMessagesResponse[];
 export interface IVeConfigurationResponse {
   success: boolean;
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Keep an extracted rootfs of an OCI archive for the next containers of the same image.
+
+Runs after create-lxc-container.sh. If rootfs_cache is enabled and the container was
+created from an OCI archive (not cloned), the archive is extracted once more, in the
+background, into a template container on the same rootfs storage and with the same
+disk size (build_rootfs_template in oci_rootfs_lib.py, prepended as library). The
+next get-oci-image.py run for that archive reports the template as rootfs_clone_source,
+and create-lxc-container.sh creates the container with `pct clone` instead of extracting:
+a linked clone on ZFS, LVM-thin, btrfs and RBD takes well under a second. On other
+storages no template is built.
+
+A template is only used for an archive of the same manifest digest; when a tag is
+pulled again with new content, the next creation builds a new template and removes the
+old one (unless linked clones still use it). The templates take the lowest free ID
+from rootfs_template_first_id up.
+
+Parameters (via template variables):
+  vm_id (required): ID of the container that was just created
+  template_path (required): Archive the container was created from
+  ostype (optional): ostype of the container
+  rootfs_cache (optional): Build the template (default: false)
+  rootfs_template_first_id (optional): First ID of the templates (default: 990000)
+  rootfs_clone_source (optional): Template the container was cloned from (then nothing
+    is built)
+
+Output (JSON to stdout):
+  [{"id": "rootfs_template", "value": "<ID>"}] with the ID of the template the container
+  was cloned from or that already exists, empty otherwise (also while it is built).
+
+All logs and errors go to stderr; the background build logs to
+/var/log/oci-lxc-deployer-rootfs-cache.log.
+"""
+
+import json
+import os
+import sys
+
+# Optional import for editor/type checking; at runtime this script is executed with the
+# library code prepended via stdin.
+try:
+    from oci_store_lib import *  # type: ignore
+    from oci_daemon_lib import *  # type: ignore
+    from oci_rootfs_lib import *  # type: ignore
+except Exception:
+    pass
+
+PID_FILE = "/run/oci-lxc-deployer-rootfs-cache.pid"
+LOG_FILE = "/var/log/oci-lxc-deployer-rootfs-cache.log"
+
+def log(message: str) -> None:
+    """Print message to stderr (for logging/progress)."""
+    print(message, file=sys.stderr, flush=True)
+
+def print_outputs(rootfs_template: str) -> None:
+    print(json.dumps([{"id": "rootfs_template", "value": rootfs_template}]))
+
+def build_in_background(index: StorageIndex, template_path: str, storage: str, size_gib: float,
+                        ostype: str, first_id: int) -> None:
+    """Build the template in a detached process; one build at a time per node."""
+    if not daemonize(PID_FILE, LOG_FILE):
+        return
+    try:
+        with FileLock("rootfs templates", 0):
+            build_rootfs_template(index, template_path, storage, size_gib, ostype, first_id)
+    except LockTimeout:
+        log("Another rootfs template is being built, skipping " + template_path)
+    except Exception as e:
+        log(f"Error: building the rootfs template of {template_path} failed: {e}")
+    finally:
+        try:
+            os.unlink(PID_FILE)
+        except OSError:
+            pass
+        os._exit(0)
+
+def main() -> None:
+    """Main function."""
+    vm_id = "{{ vm_id }}"
+    template_path = "{{ template_path }}"
+    ostype = "{{ ostype }}"
+    rootfs_cache = "{{ rootfs_cache }}"
+    clone_source = "{{ rootfs_clone_source }}"
+    first_id = "{{ rootfs_template_first_id }}"
+
+    if rootfs_cache.strip().lower() not in ("true", "1", "yes"):
+        print_outputs("")
+        return
+    if clone_source.strip() and clone_source != "NOT_DEFINED":
+        log(f"Container was cloned from rootfs template {clone_source}")
+        print_outputs(clone_source.strip())
+        return
+    if not vm_id.strip().isdigit() or ":vztmpl/" not in template_path or not template_path.endswith(".tar"):
+        log("Not caching the rootfs: the container was not created from an OCI archive")
+        print_outputs("")
+        return
+    if ostype == "NOT_DEFINED":
+        ostype = ""
+    first_id = int(first_id) if first_id.strip().isdigit() else ROOTFS_TEMPLATE_FIRST_ID
+
+    conf_text = read_lxc_conf(int(vm_id))
+    rootfs = conf_rootfs(conf_text or "")
+    if not rootfs:
+        log(f"Not caching the rootfs: no rootfs in the config of container {vm_id}")
+        print_outputs("")
+        return
+    index = open_storage_index(template_path.split(":", 1)[0])
+    existing = rootfs_clone_source(index, template_path)
+    if existing:
+        log(f"Rootfs template {existing} of {template_path} exists")
+        print_outputs(existing)
+        return
+    build_in_background(index, template_path, rootfs[0], rootfs[1], ostype, first_id)
+    log(f"Building the rootfs template of {template_path} in the background, log: {LOG_FILE}")
+    print_outputs("")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        log(f"Error: {e}")
+        sys.exit(1)
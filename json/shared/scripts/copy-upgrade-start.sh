@@ -186,6 +186,9 @@ write_notes_block() {
     if [ -n "$OCI_IMAGE_VISIBLE" ]; then
       printf "<!-- oci-lxc-deployer:oci-image %s -->\n" "$OCI_IMAGE_VISIBLE"
     fi
+    if [ -n "$TEMPLATE_PATH" ]; then
+      printf "<!-- oci-lxc-deployer:template %s -->\n" "$TEMPLATE_PATH"
+    fi
     if [ -n "$APP_ID" ]; then
       printf "<!-- oci-lxc-deployer:application-id %s -->\n" "$APP_ID"
     fi
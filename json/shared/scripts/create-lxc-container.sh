@@ -61,18 +61,45 @@ fi
 # We'll create the container and then remove any idmap entries that were created
 CONFIG_FILE="/etc/pve/lxc/${VMID}.conf"
 
+# A rootfs template extracted from the same archive (cache-oci-rootfs.py) can be
+# cloned instead: a linked clone on the same storage needs no extraction.
+# It is only used if its disk is not larger than the requested one.
+CLONE_SOURCE="{{ rootfs_clone_source }}"
+if [ "$CLONE_SOURCE" = "NOT_DEFINED" ]; then CLONE_SOURCE=""; fi
+if [ -n "$CLONE_SOURCE" ]; then
+  CLONE_CONF="/etc/pve/lxc/${CLONE_SOURCE}.conf"
+  CLONE_ROOTFS=$(awk '/^\[/ { exit } /^rootfs:/ { sub(/^rootfs:[ ]*/, ""); print; exit }' "$CLONE_CONF" 2>/dev/null)
+  CLONE_SIZE=$(printf "%s" "$CLONE_ROOTFS" | sed -n 's/.*,size=\([0-9]*\)G.*/\1/p')
+  if ! grep -q '^template: 1' "$CLONE_CONF" 2>/dev/null \
+    || [ "${CLONE_ROOTFS%%:*}" != "$stor" ] \
+    || [ -z "$CLONE_SIZE" ] || [ "$CLONE_SIZE" -gt "{{ disk_size }}" ]; then
+    echo "Rootfs template $CLONE_SOURCE does not match ($CLONE_ROOTFS), extracting the archive" >&2
+    CLONE_SOURCE=""
+  fi
+fi
+
 # Create the container
-# Note: The error "newuidmap: uid range [0-65536) -> [100000-165536) not allowed" 
+# Note: The error "newuidmap: uid range [0-65536) -> [100000-165536) not allowed"
 # occurs because Proxmox tries to use idmap during template extraction.
 # This happens even though we don't want idmap - uid/gid are only for volume permissions.
-pct create "$VMID" "$TEMPLATE_PATH" \
-  --rootfs "$ROOTFS" \
-  --hostname "{{ hostname }}" \
-  --memory "{{ memory }}" \
-  --net0 name=eth0,bridge="{{ bridge }}",ip=dhcp \
-  --ostype "{{ ostype }}" \
-  --unprivileged 1 >&2
-RC=$? 
+if [ -n "$CLONE_SOURCE" ]; then
+  echo "Cloning rootfs template $CLONE_SOURCE" >&2
+  pct clone "$CLONE_SOURCE" "$VMID" --hostname "{{ hostname }}" >&2 \
+    && pct set "$VMID" \
+      --memory "{{ memory }}" \
+      --net0 name=eth0,bridge="{{ bridge }}",ip=dhcp \
+      --ostype "{{ ostype }}" >&2 \
+    && if [ "$CLONE_SIZE" -lt "{{ disk_size }}" ]; then pct resize "$VMID" rootfs "{{ disk_size }}G" >&2; fi
+else
+  pct create "$VMID" "$TEMPLATE_PATH" \
+    --rootfs "$ROOTFS" \
+    --hostname "{{ hostname }}" \
+    --memory "{{ memory }}" \
+    --net0 name=eth0,bridge="{{ bridge }}",ip=dhcp \
+    --ostype "{{ ostype }}" \
+    --unprivileged 1 >&2
+fi
+RC=$?
 if [ $RC -ne 0 ]; then
   echo "Failed to create LXC container!" >&2
   echo "Note: If you see 'newuidmap' errors, this may be due to automatic UID/GID mapping." >&2
@@ -124,6 +151,9 @@ NOTES_TMP=$(mktemp)
   if [ -n "$OCI_IMAGE_VISIBLE" ]; then
     echo "<!-- lxc-manager:oci-image $OCI_IMAGE_VISIBLE -->"
   fi
+  if [ -n "$TEMPLATE_PATH_FOR_NOTES" ]; then
+    echo "<!-- lxc-manager:template $TEMPLATE_PATH_FOR_NOTES -->"
+  fi
   if [ -n "$APP_ID" ]; then
     echo "<!-- lxc-manager:application-id $APP_ID -->"
   fi
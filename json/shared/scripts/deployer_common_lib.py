@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Helpers shared by the Python scripts of oci-lxc-deployer on the VE host.
+
+Designed to be *prepended* (as "library") to list-managed-oci-containers.py and the
+Docker Compose scripts, and before the other libraries (oci_registry_lib.py and the
+oci_*_lib.py libraries, map_device_lib.py, setup_lxc_idmap_common.py) to the scripts
+that use those.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+The notes of a managed container (the "description:" of its LXC config) carry HTML
+comment markers, written by create-lxc-container.sh, plus visible lines:
+
+  <!-- oci-lxc-deployer:managed -->
+  <!-- oci-lxc-deployer:oci-image docker://alpine:3.19 -->
+  <!-- oci-lxc-deployer:template local:vztmpl/alpine_3.19.tar -->
+  <!-- oci-lxc-deployer:application-id alpine -->
+  <!-- oci-lxc-deployer:application-name Alpine -->
+  OCI image: docker://alpine:3.19
+  Version: 3.19
+
+parse_container_notes and managed_containers are the only parsers of these markers.
+
+Scripts report the durations of their phases with PhaseTimer as an output of their
+own, <script>_timings (e.g. get_oci_image_timings), that their template declares.
+The scripts of one installation share the outputs, so a common id would keep only
+the last script's value.
+"""
+
+import contextlib
+import json
+import os
+import re
+import time
+import urllib.parse
+from typing import List, Optional
+
+
+class PhaseTimer:
+    """Named phases with monotonic durations, printed as the script's timings output."""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.phases: List[dict] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str, **fields: object):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            # list.append is atomic, phases of concurrent pulls may interleave
+            self.phases.append({"phase": name, "seconds": round(time.monotonic() - start, 3), **fields})
+
+    def output(self, output_id: str) -> dict:
+        return {"id": output_id, "value": json.dumps({
+            "phases": self.phases, "total_seconds": round(time.monotonic() - self.started, 3)})}
+
+
+# Containers created by create-lxc-container.sh still carry the older lxc-manager: prefix.
+MANAGED_MARKER_RE = re.compile(r"(?:oci-lxc-deployer|lxc-manager):managed", re.IGNORECASE)
+OCI_IMAGE_MARKER_RE = re.compile(r"(?:oci-lxc-deployer|lxc-manager):oci-image\s+(.+?)\s*-->", re.IGNORECASE)
+OCI_IMAGE_VISIBLE_RE = re.compile(r"^\s*#?\s*OCI image:\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+TEMPLATE_MARKER_RE = re.compile(r"(?:oci-lxc-deployer|lxc-manager):template\s+(.+?)\s*-->", re.IGNORECASE)
+APP_ID_MARKER_RE = re.compile(r"(?:oci-lxc-deployer|lxc-manager):application-id\s+(.+?)\s*-->", re.IGNORECASE)
+APP_ID_VISIBLE_RE = re.compile(r"^\s*#?\s*Application\s+ID\s*:\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+APP_NAME_MARKER_RE = re.compile(r"(?:oci-lxc-deployer|lxc-manager):application-name\s+(.+?)\s*-->", re.IGNORECASE)
+APP_NAME_VISIBLE_RE = re.compile(r"^\s*#?\s*##\s+(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+VERSION_VISIBLE_RE = re.compile(r"^\s*#?\s*Version\s*:\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+HOSTNAME_RE = re.compile(r"^hostname:\s*(.+?)\s*$", re.MULTILINE)
+
+
+def lxc_conf_dir(lxc_dir: Optional[str] = None) -> str:
+    return lxc_dir or os.environ.get("LXC_MANAGER_PVE_LXC_DIR", "/etc/pve/lxc")
+
+
+def parse_container_notes(conf_text: str) -> Optional[dict]:
+    """Markers of a managed container from the text of its LXC config.
+
+    Returns {"hostname", "oci_image", "template", "application_id", "application_name",
+    "version"} with None for what the config does not have, or None if the container
+    is not managed. Proxmox stores the notes URL-encoded with literal "\\n" line breaks;
+    the decoded text is searched first, then the raw one.
+    """
+    conf_text = conf_text.replace("\\n", "\n")
+    texts = [urllib.parse.unquote(conf_text), conf_text]
+    if not any(MANAGED_MARKER_RE.search(text) for text in texts):
+        return None
+
+    def first(*patterns: "re.Pattern[str]") -> Optional[str]:
+        for text in texts:
+            for pattern in patterns:
+                m = pattern.search(text)
+                if m and m.group(1).strip():
+                    return m.group(1).strip()
+        return None
+
+    return {
+        "hostname": first(HOSTNAME_RE),
+        "oci_image": first(OCI_IMAGE_MARKER_RE, OCI_IMAGE_VISIBLE_RE),
+        "template": first(TEMPLATE_MARKER_RE),
+        "application_id": first(APP_ID_MARKER_RE, APP_ID_VISIBLE_RE),
+        "application_name": first(APP_NAME_MARKER_RE, APP_NAME_VISIBLE_RE),
+        "version": first(VERSION_VISIBLE_RE),
+    }
+
+
+def managed_containers(lxc_dir: Optional[str] = None) -> List[dict]:
+    """Managed containers in lxc_dir (default: this node's) in order of their ID.
+
+    Each is {"vm_id", ...} with the fields of parse_container_notes.
+    """
+    lxc_dir = lxc_conf_dir(lxc_dir)
+    try:
+        conf_names = [name for name in os.listdir(lxc_dir) if name.endswith(".conf")]
+    except FileNotFoundError:
+        return []
+    containers = []
+    for name in sorted(conf_names, key=lambda n: (len(n), n)):
+        if not name[:-len(".conf")].isdigit():
+            continue
+        try:
+            with open(os.path.join(lxc_dir, name), encoding="utf-8", errors="replace") as f:
+                notes = parse_container_notes(f.read())
+        except OSError:
+            continue
+        if notes is not None:
+            containers.append({"vm_id": int(name[:-len(".conf")]), **notes})
+    return containers
@@ -21,6 +21,13 @@ except ImportError:
     print("Error: PyYAML is required. Install it with: pip install pyyaml or apt install python3-yaml", file=sys.stderr)
     sys.exit(1)
 
+# Optional import for editor/type checking; at runtime deployer_common_lib.py (PhaseTimer)
+# is prepended via stdin.
+try:
+    from deployer_common_lib import PhaseTimer  # type: ignore
+except Exception:
+    pass
+
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
@@ -62,18 +69,21 @@ def extract_image_tags(services):
 
 def main():
     # Get parameters from template variables
+    timer = PhaseTimer()
     compose_file_base64 = "{{ compose_file }}"
     
     # Decode base64 compose file
     try:
-        compose_file_content = base64.b64decode(compose_file_base64).decode('utf-8')
+        with timer.phase("decode"):
+            compose_file_content = base64.b64decode(compose_file_base64).decode('utf-8')
     except Exception as e:
         eprint(f"Error: Failed to decode compose file: {e}")
         sys.exit(1)
     
     # Parse YAML
     try:
-        compose_data = yaml.safe_load(compose_file_content)
+        with timer.phase("parse_yaml"):
+            compose_data = yaml.safe_load(compose_file_content)
     except Exception as e:
         eprint(f"Error: Failed to parse YAML: {e}")
         sys.exit(1)
@@ -81,21 +91,21 @@ def main():
     if not compose_data:
         eprint("Error: Empty or invalid compose file")
         sys.exit(1)
-    
-    # Extract properties
-    services = compose_data.get("services", {})
-    service_names = list(services.keys()) if services else []
-    
-    # Extract port mappings
-    port_mappings = extract_port_mappings(services) if services else []
-    
-    # Extract image tags
-    image_tags = extract_image_tags(services) if services else []
-    
-    # Extract network names (custom networks, not default)
-    networks = []
-    if "networks" in compose_data:
-        networks = list(compose_data["networks"].keys())
+    with timer.phase("extract"):
+        # Extract properties
+        services = compose_data.get("services", {})
+        service_names = list(services.keys()) if services else []
+
+        # Extract port mappings
+        port_mappings = extract_port_mappings(services) if services else []
+
+        # Extract image tags
+        image_tags = extract_image_tags(services) if services else []
+
+        # Extract network names (custom networks, not default)
+        networks = []
+        if "networks" in compose_data:
+            networks = list(compose_data["networks"].keys())
     
     # Build output
     output = []
@@ -131,6 +141,7 @@ def main():
     eprint(f"Extracted properties: {len(service_names)} service(s), {len(port_mappings)} port(s), {len(image_tags)} image(s)")
     
     # Output JSON
+    output.append(timer.output("extract_properties_from_compose_timings"))
     print(json.dumps(output))
 
 if __name__ == "__main__":
@@ -23,11 +23,19 @@ except ImportError:
     print("Error: PyYAML is required. Install it with: pip install pyyaml or apt install python3-yaml", file=sys.stderr)
     sys.exit(1)
 
+# Optional import for editor/type checking; at runtime deployer_common_lib.py (PhaseTimer)
+# is prepended via stdin.
+try:
+    from deployer_common_lib import PhaseTimer  # type: ignore
+except Exception:
+    pass
+
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 def main():
     # Get parameters from template variables
+    timer = PhaseTimer()
     compose_file_base64 = "{{ compose_file }}"
     compose_project = "{{ compose_project }}"
     hostname = "{{ hostname }}"
@@ -41,14 +49,16 @@ def main():
     
     # Decode base64 compose file
     try:
-        compose_file_content = base64.b64decode(compose_file_base64).decode('utf-8')
+        with timer.phase("decode"):
+            compose_file_content = base64.b64decode(compose_file_base64).decode('utf-8')
     except Exception as e:
         eprint(f"Error: Failed to decode compose file: {e}")
         sys.exit(1)
     
     # Parse YAML
     try:
-        compose_data = yaml.safe_load(compose_file_content)
+        with timer.phase("parse_yaml"):
+            compose_data = yaml.safe_load(compose_file_content)
     except Exception as e:
         eprint(f"Error: Failed to parse YAML: {e}")
         sys.exit(1)
@@ -56,87 +66,87 @@ def main():
     if not compose_data:
         eprint("Error: Empty or invalid compose file")
         sys.exit(1)
-    
-    # Extract project name from compose file if not provided
-    if compose_project == "default" and "name" in compose_data:
-        compose_project = compose_data["name"]
-    elif compose_project == "default":
-        # Try to extract from x-project-name or use first service name
-        if "services" in compose_data and compose_data["services"]:
-            first_service = list(compose_data["services"].keys())[0]
-            compose_project = first_service.replace("_", "-")
-    
-    volumes_list = []
-    volume_names = set()
-    
-    # Extract volumes from services
-    if "services" in compose_data:
-        for service_name, service_config in compose_data["services"].items():
-            if "volumes" in service_config:
-                for volume_spec in service_config["volumes"]:
-                    # Parse volume specification
-                    # Format can be:
-                    # - "host_path:container_path"
-                    # - "host_path:container_path:ro" (read-only)
-                    # - "./data:/app/data" (relative path)
-                    # - "volume_name:/app/data" (named volume)
-                    # - "/absolute/path:/app/data" (absolute path)
-                    
-                    # Split by colon (but be careful with Windows paths and read-only flag)
-                    parts = volume_spec.split(":")
-                    
-                    if len(parts) < 2:
-                        eprint(f"Warning: Invalid volume specification '{volume_spec}', skipping")
-                        continue
-                    
-                    host_path = parts[0]
-                    container_path = parts[1]
-                    # parts[2] would be "ro" or "rw" if present
-                    
-                    # Skip if it's a named volume reference (no slash in host_path)
-                    if host_path and "/" not in host_path and host_path not in ["", "."]:
-                        # Check if it's defined in top-level volumes section
-                        if "volumes" in compose_data and host_path in compose_data["volumes"]:
-                            # Named volume - create path under volumes/<project>/<volume-name>
-                            volume_key = host_path
-                            volume_names.add(volume_key)
+    with timer.phase("extract"):
+        # Extract project name from compose file if not provided
+        if compose_project == "default" and "name" in compose_data:
+            compose_project = compose_data["name"]
+        elif compose_project == "default":
+            # Try to extract from x-project-name or use first service name
+            if "services" in compose_data and compose_data["services"]:
+                first_service = list(compose_data["services"].keys())[0]
+                compose_project = first_service.replace("_", "-")
+
+        volumes_list = []
+        volume_names = set()
+
+        # Extract volumes from services
+        if "services" in compose_data:
+            for service_name, service_config in compose_data["services"].items():
+                if "volumes" in service_config:
+                    for volume_spec in service_config["volumes"]:
+                        # Parse volume specification
+                        # Format can be:
+                        # - "host_path:container_path"
+                        # - "host_path:container_path:ro" (read-only)
+                        # - "./data:/app/data" (relative path)
+                        # - "volume_name:/app/data" (named volume)
+                        # - "/absolute/path:/app/data" (absolute path)
+
+                        # Split by colon (but be careful with Windows paths and read-only flag)
+                        parts = volume_spec.split(":")
+
+                        if len(parts) < 2:
+                            eprint(f"Warning: Invalid volume specification '{volume_spec}', skipping")
+                            continue
+
+                        host_path = parts[0]
+                        container_path = parts[1]
+                        # parts[2] would be "ro" or "rw" if present
+
+                        # Skip if it's a named volume reference (no slash in host_path)
+                        if host_path and "/" not in host_path and host_path not in ["", "."]:
+                            # Check if it's defined in top-level volumes section
+                            if "volumes" in compose_data and host_path in compose_data["volumes"]:
+                                # Named volume - create path under volumes/<project>/<volume-name>
+                                volume_key = host_path
+                                volume_names.add(volume_key)
+                                container_path_normalized = container_path.lstrip("/")
+                                volumes_list.append(f"{volume_key}={container_path_normalized}")
+                            else:
+                                # Unknown named volume, skip or create default path
+                                volume_key = host_path
+                                volume_names.add(volume_key)
+                                container_path_normalized = container_path.lstrip("/")
+                                volumes_list.append(f"{volume_key}={container_path_normalized}")
+                        elif host_path.startswith("./"):
+                            # Relative path - convert to volumes/<project>/<name>
+                            # ./data -> volumes/<project>/data
+                            relative_name = host_path[2:].rstrip("/")
+                            if not relative_name:
+                                relative_name = "data"
+                            # Keep directory structure but use as volume key
+                            volume_key = relative_name.replace("/", "_")
+                            container_path_normalized = container_path.lstrip("/")
+                            volumes_list.append(f"{volume_key}={container_path_normalized}")
+                        elif host_path.startswith("/"):
+                            # Absolute path - use last component as key
+                            volume_key = Path(host_path).name or "data"
                             container_path_normalized = container_path.lstrip("/")
                             volumes_list.append(f"{volume_key}={container_path_normalized}")
                         else:
-                            # Unknown named volume, skip or create default path
-                            volume_key = host_path
-                            volume_names.add(volume_key)
+                            # Other format, try to use as-is
+                            volume_key = host_path.replace("/", "_").replace(".", "_") or "data"
                             container_path_normalized = container_path.lstrip("/")
                             volumes_list.append(f"{volume_key}={container_path_normalized}")
-                    elif host_path.startswith("./"):
-                        # Relative path - convert to volumes/<project>/<name>
-                        # ./data -> volumes/<project>/data
-                        relative_name = host_path[2:].rstrip("/")
-                        if not relative_name:
-                            relative_name = "data"
-                        # Keep directory structure but use as volume key
-                        volume_key = relative_name.replace("/", "_")
-                        container_path_normalized = container_path.lstrip("/")
-                        volumes_list.append(f"{volume_key}={container_path_normalized}")
-                    elif host_path.startswith("/"):
-                        # Absolute path - use last component as key
-                        volume_key = Path(host_path).name or "data"
-                        container_path_normalized = container_path.lstrip("/")
-                        volumes_list.append(f"{volume_key}={container_path_normalized}")
-                    else:
-                        # Other format, try to use as-is
-                        volume_key = host_path.replace("/", "_").replace(".", "_") or "data"
-                        container_path_normalized = container_path.lstrip("/")
-                        volumes_list.append(f"{volume_key}={container_path_normalized}")
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_volumes = []
-    for vol in volumes_list:
-        key = vol.split("=")[0]
-        if key not in seen:
-            seen.add(key)
-            unique_volumes.append(vol)
+
+        # Remove duplicates while preserving order
+        seen = set()
+        unique_volumes = []
+        for vol in volumes_list:
+            key = vol.split("=")[0]
+            if key not in seen:
+                seen.add(key)
+                unique_volumes.append(vol)
     
     volumes_output = "\n".join(unique_volumes)
     
@@ -155,6 +165,7 @@ def main():
         original_compose_project == ""):
         output.append({"id": "compose_project", "value": compose_project})
     
+    output.append(timer.output("extract_volumes_from_compose_timings"))
     print(json.dumps(output))
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Remove unused OCI image archives from a Proxmox storage (LRU eviction).
+
+Archives imported by get-oci-image.py are removed in order of last use (pull or
+cache hit) until the archives fit into cache_budget and the storage has at least
+min_free of free space. Archives that a managed container references (template or
+OCI image marker in its notes) and archives used within the last hour are kept.
+On a shared storage (storage.cfg), the containers of all nodes count, and the eviction
+is locked cluster-wide.
+
+Parameters (via template variables):
+  storage (optional): Proxmox storage name (default: local)
+  cache_budget (optional): Size limit in MiB for all OCI archives (default: 0 = no limit)
+  min_free (optional): Free space in MiB the storage should have (default: 0 = disabled)
+  dry_run (optional): Only report which archives would be removed (default: false)
+
+Output (JSON to stdout):
+  [{"id": "gc_result", "value": "{\"removed\": [...], \"freed_bytes\": ..., ...}"}]
+
+All logs and errors go to stderr.
+"""
+
+import json
+import sys
+
+# Optional import for editor/type checking; at runtime this script is executed with the
+# library code prepended via stdin.
+try:
+    from oci_store_lib import *  # type: ignore
+    from oci_gc_lib import *  # type: ignore
+except Exception:
+    pass
+
+def log(message: str) -> None:
+    """Print message to stderr (for logging/progress)."""
+    print(message, file=sys.stderr, flush=True)
+
+def error(message: str, exit_code: int = 1) -> None:
+    """Print error to stderr and exit."""
+    log(f"Error: {message}")
+    sys.exit(exit_code)
+
+def mib_param(value: str) -> int:
+    """Convert a MiB template value to bytes (0 if not set)."""
+    value = value.strip()
+    return int(value) * 1024 * 1024 if value.isdigit() else 0
+
+def main() -> None:
+    """Main function."""
+    storage = "{{ storage }}"
+    cache_budget = "{{ cache_budget }}"
+    min_free = "{{ min_free }}"
+    dry_run = "{{ dry_run }}"
+
+    if not storage or storage == "NOT_DEFINED":
+        storage = "local"
+    budget_bytes = mib_param(cache_budget)
+    min_free_bytes = mib_param(min_free)
+    dry_run = dry_run.strip().lower() in ("true", "1", "yes")
+    if not budget_bytes and not min_free_bytes:
+        log("Neither cache_budget nor min_free is set, nothing to do")
+
+    index = open_storage_index(storage)
+    try:
+        with storage_lock(index, f"gc {index.storage_dir}"):
+            result = collect_garbage(index, budget_bytes, min_free_bytes, dry_run=dry_run)
+    except LockTimeout as e:
+        error(str(e))
+    log(f"{'Would free' if dry_run else 'Freed'} {result['freed_bytes']} bytes, "
+        f"{result['total_bytes']} bytes of OCI archives remain, {len(result['protected'])} in use")
+    print(json.dumps([{"id": "gc_result", "value": json.dumps(result)}]))
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        log("Interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        error(f"Unexpected error: {str(e)}", 1)
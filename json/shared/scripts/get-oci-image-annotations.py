@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 """
-Extract OCI image annotations from image config using skopeo.
+Extract OCI image annotations from image config.
 
 This script inspects an OCI image and extracts specific annotations
 that can be used to pre-fill framework/application metadata.
 
+The backend prepends oci_registry_lib.py, whose native registry client reads manifest
+and config over one connection. skopeo is only used as a fallback, or when the
+script runs without the library.
+
 Parameters (via command line):
   image: OCI image reference (e.g., mariadb:latest, ghcr.io/home-assistant/home-assistant:latest)
   tag: Image tag (optional, default: latest)
@@ -22,14 +26,22 @@ Output (JSON to stdout):
 All logs and errors go to stderr.
 
 Requirements:
-  - skopeo must be installed (apt install skopeo)
+  - skopeo (apt install skopeo) only for the fallback
 """
 
 import json
 import sys
 import subprocess
 import os
-from typing import Optional, Dict
+import shutil
+from typing import Optional, Dict, Tuple
+
+# Optional import for editor/type checking; at runtime the backend prepends the
+# library code to this script.
+try:
+    from oci_registry_lib import *  # type: ignore
+except Exception:
+    pass
 
 def log(message: str) -> None:
     """Print message to stderr (for logging)."""
@@ -41,16 +53,8 @@ def error(message: str, exit_code: int = 1) -> None:
     sys.exit(exit_code)
 
 def check_skopeo() -> bool:
-    """Check if skopeo is available."""
-    try:
-        result = subprocess.run(['which', 'skopeo'], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            version_result = subprocess.run(['skopeo', '--version'], capture_output=True, text=True, timeout=5)
-            if version_result.returncode == 0:
-                return True
-        return False
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        return False
+    """Check if skopeo is available (PATH lookup, no process spawn)."""
+    return shutil.which('skopeo') is not None
 
 def parse_image_ref(image: str, tag: str = 'latest') -> str:
     """
@@ -71,6 +75,15 @@ def parse_image_ref(image: str, tag: str = 'latest') -> str:
     
     return image
 
+def split_ref(image_ref: str) -> Tuple[str, str]:
+    """Split docker://image:tag (or image@sha256:...) into image name and tag."""
+    image = image_ref.replace('docker://', '')
+    if '@' in image:
+        return tuple(image.split('@', 1))
+    if ':' in image.split('/')[-1]:
+        return tuple(image.rsplit(':', 1))
+    return image, 'latest'
+
 def skopeo_inspect(image_ref: str, platform: str = 'linux/amd64') -> Dict:
     """
     Inspect image using skopeo and return JSON output.
@@ -196,20 +209,35 @@ def main():
         if '{{' in platform:
             platform = 'linux/amd64'
     
-    # Check if skopeo is available
-    if not check_skopeo():
-        error("skopeo is required but not found. Please install it with: apt install skopeo")
-    
     # Parse image reference
     image_ref = parse_image_ref(image, tag)
     
-    # First, quickly check if image exists using --raw (fast check)
-    if not check_image_exists(image_ref, platform):
-        # Image does not exist, exit with error code 1
-        error(f"Image {image_ref} not found", 1)
+    inspect_output = None
+    if 'RegistryClient' in globals():
+        image_name, image_tag = split_ref(image_ref)
+        registry, repository = split_image_name(image_name)
+        try:
+            with RegistryClient(registry) as client:
+                # Existence check (manifest HEAD), then manifest + config on the same connection
+                if client.head_manifest(repository, image_tag) is None:
+                    error(f"Image {image_ref} not found", 1)
+                log(f"Inspecting {image_ref}...")
+                inspect_output = client.inspect(image_name, image_tag, platform)
+        except (RegistryError, OSError, ValueError) as e:
+            log(f"Native registry inspect failed ({e}), falling back to skopeo")
     
-    # Image exists, now do full inspection for annotations
-    inspect_output = skopeo_inspect(image_ref, platform)
+    if inspect_output is None:
+        # Check if skopeo is available
+        if not check_skopeo():
+            error("skopeo is required but not found. Please install it with: apt install skopeo")
+        
+        # First, quickly check if image exists using --raw (fast check)
+        if not check_image_exists(image_ref, platform):
+            # Image does not exist, exit with error code 1
+            error(f"Image {image_ref} not found", 1)
+        
+        # Image exists, now do full inspection for annotations
+        inspect_output = skopeo_inspect(image_ref, platform)
     
     # Extract annotations
     annotations = extract_annotations(inspect_output)
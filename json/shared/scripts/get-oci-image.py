@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 """
-Download OCI image from Docker Registry and import to Proxmox storage using skopeo.
+Make an OCI image available as an LXC template archive in a Proxmox storage.
 
-This script uses skopeo to download OCI images, which supports all registry features
-including S3-compatible storage (required for some Docker Hub images like phpmyadmin).
+A thin wrapper around pull_image in oci_pull_lib.py (prepended as library). It
+returns an archive that is already in the storage (pulled before, or imported from
+an offline bundle), copies the archive of the same digest from a sibling node, or
+downloads the missing layers into the blob store with the native registry client,
+through the cluster's OCI cache if one is announced, and writes the archive from
+there. skopeo is only used when the native download fails.
 
 Parameters (via template variables):
   oci_image (required): OCI image reference (e.g., docker://alpine:latest, docker://phpmyadmin:latest)
@@ -11,24 +15,39 @@ Parameters (via template variables):
   registry_username (optional): Username for registry authentication
   registry_password (optional): Password for registry authentication
   platform (optional): Target platform (e.g., linux/amd64, linux/arm64). Default: linux/amd64
+  inspect_cache_ttl (optional): Seconds a cached inspect result is used as is (default: 3600)
+  pull_stall_timeout (optional): Seconds without download progress before abort (default: 300)
+  max_bandwidth (optional): Download limit of this pull in KiB/s (default: 0 = unlimited)
+  host_max_bandwidth (optional): Download limit of all pulls on the host in KiB/s
+  bandwidth_schedule (optional): Host limits per time of day, e.g. "00:00-06:00=0, 18:00-22:00=2048"
+  download_lock_timeout (optional): Seconds to wait for a concurrent pull of the image (default: 1800)
+  cache_budget (optional): Size limit in MiB for the OCI archives in the storage (default: 0 = off)
+  gc_min_free (optional): Free space in MiB the storage should keep (default: 0 = off)
+  oci_mirror (optional): URL of a pull-through OCI cache, "none" disables it
+  squash (optional): Flatten the layers into one before import (default: false)
+  squash_prune (optional): Comma separated paths the flattened layer leaves out
 
 Output (JSON to stdout):
-    [{"id": "template_path", "value": "storage:vztmpl/image_tag.tar"}, {"id": "ostype", "value": "alpine"}, {"id": "application_id", "value": "oci-lxc-deployer"}, {"id": "oci_image", "value": "ghcr.io/modbus2mqtt/oci-lxc-deployer:latest"}, {"id": "oci_image_tag", "value": "0.17.5"}]
+    [{"id": "template_path", "value": "storage:vztmpl/image_tag.tar"}, {"id": "ostype", "value": "alpine"}, {"id": "application_id", "value": "oci-lxc-deployer"}, {"id": "oci_image", "value": "ghcr.io/modbus2mqtt/oci-lxc-deployer:latest"}, {"id": "oci_image_tag", "value": "0.17.5"}, {"id": "rootfs_clone_source", "value": ""}, {"id": "get_oci_image_timings", "value": "{...}"}]
 
 All logs and progress go to stderr.
 
 Requirements:
-  - skopeo must be installed (apt install skopeo)
+  - skopeo (apt install skopeo) for the fallback download
 """
 
 import json
 import sys
-import os
-import re
-import subprocess
-import tempfile
-import shutil
-from typing import Optional, Tuple
+
+# Optional import for editor/type checking; at runtime this script is executed with the
+# library code prepended via stdin.
+try:
+    from deployer_common_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+    from oci_rootfs_lib import *  # type: ignore
+    from oci_pull_lib import *  # type: ignore
+except Exception:
+    pass
 
 def log(message: str) -> None:
     """Print message to stderr (for logging/progress)."""
@@ -40,253 +59,19 @@ def error(message: str, exit_code: int = 1) -> None:
     log(f"Error: {message}")
     sys.exit(exit_code)
 
-def check_skopeo() -> bool:
-    """Check if skopeo is available."""
-    try:
-        result = subprocess.run(['which', 'skopeo'], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            # Verify it's actually skopeo
-            version_result = subprocess.run(['skopeo', '--version'], capture_output=True, text=True, timeout=5)
-            if version_result.returncode == 0:
-                return True
-        return False
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        return False
-
-def parse_image_ref(oci_image: str) -> str:
-    """
-    Parse and normalize OCI image reference for skopeo.
-    
-    Returns docker:// formatted image reference.
-    Examples:
-      alpine:latest -> docker://alpine:latest
-      docker://alpine:latest -> docker://alpine:latest
-      docker://user/image:tag -> docker://user/image:tag
-      oci://ghcr.io/owner/repo:tag -> docker://ghcr.io/owner/repo:tag
-    """
-    # Remove protocol prefix if present
-    image_ref = re.sub(r'^[^:]+://', '', oci_image)
-    
-    # Add docker:// prefix (skopeo accepts docker:// for all registries)
-    if not image_ref.startswith('docker://'):
-        # Check if it's already a full registry URL
-        if '/' in image_ref and ('.' in image_ref.split('/')[0] or ':' in image_ref.split('/')[0]):
-            # Has explicit registry (e.g., ghcr.io/image:tag)
-            return f"docker://{image_ref}"
-        else:
-            # Docker Hub image (e.g., alpine:latest or user/image:tag)
-            return f"docker://{image_ref}"
-    
-    return image_ref
-
-def extract_version_from_inspect(inspect_output: dict) -> str:
-    """
-    Extract version tag from skopeo inspect output.
-    
-    Tries to find version in Labels:
-    - org.opencontainers.image.version
-    - io.hass.version
-    - org.opencontainers.image.revision
-    - version
-    
-    Returns the extracted version, or None if not found.
-    """
-    try:
-        labels = inspect_output.get('Labels', {})
-        if not labels:
-            return None
-        
-        # Try common version label fields (in order of preference)
-        version_fields = [
-            'org.opencontainers.image.version',
-            'io.hass.version',
-            'org.opencontainers.image.revision',
-            'version',
-        ]
-        
-        for field in version_fields:
-            if field in labels:
-                version = labels[field]
-                if version and version.strip():
-                    # Clean up version tag (remove leading 'v' if present)
-                    version = version.strip()
-                    if version.lower().startswith('v') and len(version) > 1:
-                        version = version[1:]
-                    return version
-        
-        return None
-    except Exception:
-        return None
-
-def detect_ostype_from_inspect(inspect_output: dict) -> str:
-    """
-    Detect operating system type from skopeo inspect output.
-    
-    Returns ostype compatible with Proxmox (alpine, debian, ubuntu, fedora, centos).
-    """
-    try:
-        # Check architecture
-        arch = inspect_output.get('Architecture', 'amd64')
-        
-        # Try to detect from labels
-        labels = inspect_output.get('Labels', {})
-        if labels:
-            # Check common label fields
-            os_name = labels.get('org.opencontainers.image.title', '').lower()
-            description = labels.get('org.opencontainers.image.description', '').lower()
-            combined = f"{os_name} {description}"
-            
-            # Check for known distributions
-            if 'alpine' in combined or 'alpine' in labels.get('io.hass.base.name', '').lower():
-                return 'alpine'
-            elif 'debian' in combined:
-                return 'debian'
-            elif 'ubuntu' in combined:
-                return 'ubuntu'
-            elif 'fedora' in combined:
-                return 'fedora'
-            elif 'centos' in combined or 'rocky' in combined:
-                return 'centos'
-        
-        # Check base image name
-        base_name = inspect_output.get('Labels', {}).get('io.hass.base.name', '').lower()
-        if 'alpine' in base_name:
-            return 'alpine'
-        elif 'debian' in base_name:
-            return 'debian'
-        elif 'ubuntu' in base_name:
-            return 'ubuntu'
-        
-        # Default to alpine (most common for container images)
-        return 'alpine'
-    except Exception:
-        return 'alpine'
-
-def skopeo_inspect(image_ref: str, username: Optional[str] = None, password: Optional[str] = None) -> dict:
-    """Inspect image using skopeo and return JSON output."""
-    cmd = ['skopeo', 'inspect', '--format', '{{json .}}']
-    
-    # Add authentication if provided
-    if username and password:
-        cmd.extend(['--creds', f'{username}:{password}'])
-    elif username:
-        # Password might be empty, use credentials anyway
-        cmd.extend(['--creds', f'{username}'])
-    
-    cmd.append(image_ref)
-    
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300, check=True)
-        return json.loads(result.stdout)
-    except subprocess.TimeoutExpired:
-        error(f"Timeout inspecting image {image_ref}")
-    except subprocess.CalledProcessError as e:
-        error(f"Failed to inspect image {image_ref}: {e.stderr}")
-    except json.JSONDecodeError as e:
-        error(f"Failed to parse inspect output: {e}")
-
-def skopeo_copy(image_ref: str, output_path: str, username: Optional[str] = None, 
-                password: Optional[str] = None, platform: Optional[str] = None) -> None:
-    """
-    Copy image using skopeo to oci-archive format (tarball).
-    
-    The format is specified by the 'oci-archive:' prefix in the destination URL,
-    not by the --format flag.
-    
-    Args:
-        image_ref: Source image reference (docker://image:tag)
-        output_path: Output path for oci-archive tarball
-        username: Registry username (optional)
-        password: Registry password (optional)
-        platform: Target platform (e.g., linux/amd64) (optional)
-    """
-    cmd = ['skopeo', 'copy']
-    
-    # Add platform override if specified
-    if platform:
-        # Parse platform (e.g., linux/amd64 -> arch=amd64, os=linux)
-        if '/' in platform:
-            os_type, arch = platform.split('/', 1)
-            cmd.extend(['--override-os', os_type, '--override-arch', arch])
-        else:
-            # Assume linux if only arch specified
-            cmd.extend(['--override-os', 'linux', '--override-arch', platform])
-    else:
-        # Default to linux/amd64
-        cmd.extend(['--override-os', 'linux', '--override-arch', 'amd64'])
-    
-    # Add authentication if provided
-    if username and password:
-        cmd.extend(['--creds', f'{username}:{password}'])
-    elif username:
-        cmd.extend(['--creds', f'{username}'])
-    
-    # Use oci-archive: prefix (creates a tarball) - format is determined by the prefix, not --format flag
-    cmd.extend([image_ref, f'oci-archive:{output_path}'])
-    
-    log(f"Downloading image with skopeo...")
-    try:
-        # skopeo copy outputs progress to stderr, which is fine
-        # Capture both stdout and stderr to prevent any output from going to stdout
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=1800, check=True)
-        # Log any stdout/stderr output from skopeo to stderr (not stdout)
-        if result.stdout:
-            log(f"skopeo stdout: {result.stdout}")
-        if result.stderr:
-            log(f"skopeo stderr: {result.stderr}")
-        log("Image downloaded successfully")
-    except subprocess.TimeoutExpired:
-        error(f"Timeout downloading image {image_ref}")
-    except subprocess.CalledProcessError as e:
-        error(f"Failed to download image {image_ref}: {e}")
-
-def import_to_proxmox(storage: str, tarball_path: str, image_name: str, tag: str) -> str:
-    """
-    Import OCI tarball to Proxmox storage.
-    
-    Proxmox stores OCI images in the vztmpl cache directory of the storage.
-    For local storage, this is typically /var/lib/vz/template/cache/
-    
-    Returns the template path in format: storage:vztmpl/image_tag.tar
-    """
-    # Extract image name for filename (last component)
-    image_base = image_name.split('/')[-1]
-    # Create filename: image_tag.tar (replace : with _ if tag contains it)
-    safe_tag = tag.replace(':', '_').replace('/', '_')
-    filename = f"{image_base}_{safe_tag}.tar"
-    
-    # Try to determine storage path
-    if storage == "local":
-        storage_dir = "/var/lib/vz/template/cache"
-    else:
-        # Try to get storage path from pvesm status
-        try:
-            result = subprocess.run(['pvesm', 'status', '-storage', storage], 
-                                  capture_output=True, text=True, check=True)
-            # For non-local storage, use /mnt/pve/<storage>/template/cache
-            storage_dir = f"/mnt/pve/{storage}/template/cache"
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            # Fallback to local path structure
-            storage_dir = f"/var/lib/vz/template/cache"
-            log(f"Warning: Could not determine storage path for {storage}, using {storage_dir}")
-    
-    # Ensure storage directory exists
-    os.makedirs(storage_dir, mode=0o755, exist_ok=True)
-    
-    # Copy tarball to storage directory
-    dest_path = os.path.join(storage_dir, filename)
-    log(f"Copying OCI tarball to {dest_path}")
-    try:
-        shutil.copy(tarball_path, dest_path)
-        os.chmod(dest_path, 0o644)  # Set permissions
-    except PermissionError:
-        error(f"Permission denied: Cannot write to {dest_path}. Script needs root or storage access.")
-    except Exception as e:
-        error(f"Failed to copy tarball to storage: {str(e)}")
-    
-    # Return template path in Proxmox format
-    template_path = f"{storage}:vztmpl/{filename}"
-    return template_path
+def print_outputs(template_path: str, ostype: str, application_id: str, oci_image: str,
+                  oci_image_tag: str, rootfs_clone_source: str, timer: PhaseTimer) -> None:
+    """Print the template outputs (plus the phase timings) as JSON to stdout."""
+    output = [
+        {"id": "template_path", "value": template_path},
+        {"id": "ostype", "value": ostype},
+        {"id": "application_id", "value": application_id},
+        {"id": "oci_image", "value": oci_image},
+        {"id": "oci_image_tag", "value": oci_image_tag},
+        {"id": "rootfs_clone_source", "value": rootfs_clone_source},
+        timer.output("get_oci_image_timings"),
+    ]
+    print(json.dumps(output))
 
 def main() -> None:
     """Main function."""
@@ -297,10 +82,23 @@ def main() -> None:
     # Get parameters from template variables
     oci_image = "{{ oci_image }}"
     storage = "{{ storage }}"
-    registry_username = "{{ registry_username }}"
-    registry_password = "{{ registry_password }}"
-    platform = "{{ platform }}"
     application_id = "{{ application_id }}"
+    options = PullOptions.from_params(
+        registry_username="{{ registry_username }}",
+        registry_password="{{ registry_password }}",
+        platform="{{ platform }}",
+        inspect_cache_ttl="{{ inspect_cache_ttl }}",
+        pull_stall_timeout="{{ pull_stall_timeout }}",
+        max_bandwidth="{{ max_bandwidth }}",
+        download_lock_timeout="{{ download_lock_timeout }}",
+        cache_budget="{{ cache_budget }}",
+        gc_min_free="{{ gc_min_free }}",
+        oci_mirror="{{ oci_mirror }}",
+        squash="{{ squash }}",
+        squash_prune="{{ squash_prune }}",
+        host_max_bandwidth="{{ host_max_bandwidth }}",
+        bandwidth_schedule="{{ bandwidth_schedule }}",
+    )
     
     # Check if template variables were not substituted
     # VariableResolver returns "NOT_DEFINED" when a variable is not found
@@ -313,153 +111,28 @@ def main() -> None:
     if not storage or storage == "NOT_DEFINED":
         storage = 'local'  # Default
     
-    if not registry_username or registry_username == "NOT_DEFINED":
-        registry_username = None
-    elif registry_username.strip() == "":
-        registry_username = None
-    
-    if not registry_password or registry_password == "NOT_DEFINED":
-        registry_password = None
-    elif registry_password.strip() == "":
-        registry_password = None
-    
-    if not platform or platform == "NOT_DEFINED":
-        platform = None
-    elif platform.strip() == "":
-        platform = 'linux/amd64'  # Default platform
-    
-    log(f"Downloading OCI image: {oci_image}")
-    if platform:
-        log(f"Target platform: {platform}")
-    
-    # Parse and normalize image reference
-    image_ref = parse_image_ref(oci_image)
-    log(f"Image reference: {image_ref}")
-    
-    # Extract image name and tag for filename
-    image_with_tag = image_ref.replace('docker://', '')
-    if ':' in image_with_tag:
-        image, tag = image_with_tag.rsplit(':', 1)
-    else:
-        image = image_with_tag
-        tag = "latest"
-
-    # Normalize application_id (optional) - derive from image name if not provided
     if (
         not application_id
         or application_id == "NOT_DEFINED"
         or application_id.strip() == "{{ application_id }}"
         or not application_id.strip()
     ):
-        application_id = image.split('/')[-1]
-    
-    # Check if image already exists in storage (before download)
-    try:
-        result = subprocess.run(['pveam', 'list', storage], capture_output=True, text=True, check=True)
-        image_base = image.split('/')[-1]
-        safe_tag = tag.replace(':', '_').replace('/', '_').replace('\\', '_')
-        search_pattern = f"{image_base}_{safe_tag}"
-        
-        # Check for exact match in pveam output
-        lines = result.stdout.split('\n')
-        for line in lines:
-            if search_pattern in line and '.tar' in line:
-                template_path = line.split()[0]  # First field is storage:path
-                if search_pattern in template_path:
-                    log(f"OCI image already exists: {template_path}")
-                    
-                    # Still need to detect ostype - inspect the existing image or use default
-                    # For simplicity, inspect the source image
-                    log("Inspecting image to detect ostype...")
-                    inspect_output = skopeo_inspect(image_ref, registry_username, registry_password)
-                    ostype = detect_ostype_from_inspect(inspect_output)
-                    actual_tag = tag
-                    if tag == "latest" or tag.lower() == "latest":
-                        extracted_version = extract_version_from_inspect(inspect_output)
-                        if extracted_version:
-                            actual_tag = extracted_version
-                    
-                    output = [
-                        {"id": "template_path", "value": template_path},
-                        {"id": "ostype", "value": ostype},
-                        {"id": "application_id", "value": application_id},
-                        {"id": "oci_image", "value": oci_image},
-                        {"id": "oci_image_tag", "value": actual_tag}
-                    ]
-                    print(json.dumps(output))
-                    sys.exit(0)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        # pveam not available or storage not accessible, continue with download
-        log("pveam not available or storage not accessible, continuing with download...")
-    
-    # Inspect image to extract version (for "latest" tag) and detect ostype
-    log("Inspecting image...")
-    inspect_output = skopeo_inspect(image_ref, registry_username, registry_password)
+        application_id = None
     
-    # Extract version if tag is "latest"
-    actual_tag = tag
-    if tag == "latest" or tag.lower() == "latest":
-        extracted_version = extract_version_from_inspect(inspect_output)
-        if extracted_version:
-            actual_tag = extracted_version
-            log(f"Extracted version from image labels: {actual_tag}")
-    
-    # Detect ostype
-    ostype = detect_ostype_from_inspect(inspect_output)
-    log(f"Detected ostype: {ostype}")
-    
-    # Check again if image with actual_tag (extracted version) already exists
-    if actual_tag != tag:
-        try:
-            result = subprocess.run(['pveam', 'list', storage], capture_output=True, text=True, check=True)
-            image_base = image.split('/')[-1]
-            safe_tag = actual_tag.replace(':', '_').replace('/', '_').replace('\\', '_')
-            search_pattern = f"{image_base}_{safe_tag}"
-            
-            lines = result.stdout.split('\n')
-            for line in lines:
-                if search_pattern in line and '.tar' in line:
-                    template_path = line.split()[0]
-                    if search_pattern in template_path:
-                        log(f"OCI image already exists (with extracted version): {template_path} (version: {actual_tag})")
-                        output = [
-                            {"id": "template_path", "value": template_path},
-                            {"id": "ostype", "value": ostype},
-                            {"id": "application_id", "value": application_id},
-                            {"id": "oci_image", "value": oci_image},
-                            {"id": "oci_image_tag", "value": actual_tag}
-                        ]
-                        print(json.dumps(output))
-                        sys.exit(0)
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            pass  # Continue with download
+    log(f"Downloading OCI image: {oci_image}")
+    if options.platform:
+        log(f"Target platform: {options.platform}")
     
-    # Download image with skopeo
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # Create temporary tarball path
-        image_base = image.split('/')[-1]
-        safe_tag = actual_tag.replace(':', '_').replace('/', '_')
-        tarball_filename = f"{image_base}_{safe_tag}.tar"
-        tarball_path = os.path.join(tmpdir, tarball_filename)
-        
-        log(f"Image with version {actual_tag} not found in storage, starting download...")
-        skopeo_copy(image_ref, tarball_path, registry_username, registry_password, platform)
-        
-        # Import to Proxmox storage
-        log(f"Importing to Proxmox storage: {storage}")
-        template_path = import_to_proxmox(storage, tarball_path, image, actual_tag)
-        
-        log(f"OCI image successfully imported: {template_path}")
+    with options.timer.phase("index"):
+        index = open_storage_index(storage)
+    try:
+        result = pull_image(oci_image, index, application_id, options)
+    except (PullError, LockTimeout) as e:
+        error(str(e))
     
-    # Output JSON
-    output = [
-        {"id": "template_path", "value": template_path},
-        {"id": "ostype", "value": ostype},
-        {"id": "application_id", "value": application_id},
-        {"id": "oci_image", "value": oci_image},
-        {"id": "oci_image_tag", "value": actual_tag}
-    ]
-    print(json.dumps(output))
+    print_outputs(result["template_path"], result["ostype"], result["application_id"],
+                  result["oci_image"], result["oci_image_tag"], result["rootfs_clone_source"],
+                  options.timer)
     sys.exit(0)
 
 if __name__ == '__main__':
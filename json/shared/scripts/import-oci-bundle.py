@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Import OCI images from an offline bundle into Proxmox storage, without registry access.
+
+For sites without a registry: the images are copied on a machine with access, e.g.
+  skopeo copy docker://ghcr.io/owner/app:1.2 oci-archive:/media/bundle/app.tar:1.2
+(or oci:/media/bundle/app:1.2 for a layout directory), and listed in a bundle.json next
+to them, each with the digest of its top-level manifest (skopeo inspect shows it as
+Digest):
+  {"images": [{"image": "ghcr.io/owner/app:1.2", "digest": "sha256:...", "path": "app.tar"}]}
+
+The import (import_bundle in oci_bundle_lib.py, prepended as library) checks manifests
+and configs against these digests, verifies the layers in parallel on all cores while
+copying them into the blob store, and writes the archives into the storage like a pull
+does. The storage index, inspect cache and ostype cache get the same entries as after a
+pull, so the rest of the template chain and later pulls of these images see no
+difference. Images whose digest has an archive in the storage already are not written
+again.
+
+Parameters (via template variables):
+  bundle (required): Bundle directory on the VE host (or the path of its bundle.json)
+  bundle_image (optional): Image of the bundle whose values are output (default: the first)
+  storage (optional): Proxmox storage name (default: local)
+  platform (optional): Platform to import of multi-platform images (default: linux/amd64)
+  download_lock_timeout, cache_budget, gc_min_free, squash, squash_prune (optional): as
+    for get-oci-image.py
+  verify_workers (optional): Threads that verify layers (default: one per core)
+
+Output (JSON to stdout): the same as get-oci-image.py, for bundle_image
+    [{"id": "template_path", "value": "storage:vztmpl/image_tag.tar"}, {"id": "ostype", "value": "alpine"}, {"id": "application_id", "value": "app"}, {"id": "oci_image", "value": "ghcr.io/owner/app:1.2"}, {"id": "oci_image_tag", "value": "1.2"}, {"id": "rootfs_clone_source", "value": ""}]
+    followed by {"id": "import_oci_bundle_timings", ...} with the phases index, inspect,
+    verify, gc, squash, import and ostype.
+
+All logs go to stderr.
+"""
+
+import json
+import os
+import sys
+
+# Optional import for editor/type checking; at runtime this script is executed with the
+# library code prepended via stdin.
+try:
+    from oci_store_lib import *  # type: ignore
+    from oci_pull_lib import *  # type: ignore
+    from oci_bundle_lib import *  # type: ignore
+except Exception:
+    pass
+
+def log(message: str) -> None:
+    """Print message to stderr (for logging/progress)."""
+    print(message, file=sys.stderr, flush=True)
+
+def error(message: str, exit_code: int = 1) -> None:
+    """Print error to stderr and exit."""
+    log(f"Error: {message}")
+    sys.exit(exit_code)
+
+def main() -> None:
+    """Main function."""
+    bundle = "{{ bundle }}"
+    oci_image = "{{ bundle_image }}"
+    storage = "{{ storage }}"
+    application_id = "{{ application_id }}"
+    verify_workers = "{{ verify_workers }}"
+    # No registry and no OCI cache: the bundle is the only source
+    options = PullOptions.from_params(
+        platform="{{ platform }}",
+        download_lock_timeout="{{ download_lock_timeout }}",
+        cache_budget="{{ cache_budget }}",
+        gc_min_free="{{ gc_min_free }}",
+        oci_mirror="none",
+        squash="{{ squash }}",
+        squash_prune="{{ squash_prune }}",
+    )
+
+    if not bundle or bundle == "NOT_DEFINED":
+        error("bundle parameter is required!")
+    if not os.path.exists(bundle):
+        error(f"Bundle {bundle} not found on this host")
+    if not storage or storage == "NOT_DEFINED":
+        storage = 'local'
+    if not oci_image or oci_image == "NOT_DEFINED":
+        oci_image = None
+    if not application_id or application_id == "NOT_DEFINED" or not application_id.strip():
+        application_id = None
+    workers = int(verify_workers) if verify_workers.strip().isdigit() else None
+
+    log(f"Importing OCI bundle: {bundle}")
+    with options.timer.phase("index"):
+        index = open_storage_index(storage)
+    try:
+        results = import_bundle(bundle, index, options, workers)
+    except (PullError, LockTimeout) as e:
+        error(str(e))
+
+    result = results[0]
+    if oci_image:
+        wanted = split_image_tag(parse_image_ref(oci_image))
+        matches = [r for r in results if split_image_tag(parse_image_ref(r["oci_image"])) == wanted]
+        if not matches:
+            error(f"{oci_image} is not in the bundle (it has {', '.join(r['oci_image'] for r in results)})")
+        result = matches[0]
+    log(f"Imported {len(results)} images from the bundle")
+
+    output = [
+        {"id": "template_path", "value": result["template_path"]},
+        {"id": "ostype", "value": result["ostype"]},
+        {"id": "application_id", "value": application_id or result["application_id"]},
+        {"id": "oci_image", "value": oci_image or result["oci_image"]},
+        {"id": "oci_image_tag", "value": result["oci_image_tag"]},
+        {"id": "rootfs_clone_source", "value": result["rootfs_clone_source"]},
+        options.timer.output("import_oci_bundle_timings"),
+    ]
+    print(json.dumps(output))
+    sys.exit(0)
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        log("Interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        error(f"Unexpected error: {str(e)}", 1)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """Map audio device to LXC container.
 
-Executed via stdin with map_device_lib.py prepended.
+Executed via stdin with deployer_common_lib.py and map_device_lib.py prepended.
 
 Migration goal:
 - Avoid heredoc-generated helper scripts.
@@ -15,6 +15,7 @@ import re
 # Optional import for editor/type checking; at runtime this script is executed with the
 # library code prepended via stdin.
 try:
+    from deployer_common_lib import PhaseTimer  # type: ignore
     from map_device_lib import *  # type: ignore
 except Exception:
     pass
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 """Map serial device to LXC container.
 
-Executed via stdin with map_device_lib.py prepended.
-All output goes to stderr; stdout should remain empty.
+Executed via stdin with deployer_common_lib.py and map_device_lib.py prepended.
+All logs go to stderr; stdout only carries the "map_serial_device_timings" output (phase durations).
 """
 
+import json
 import os
 import re
 import sys
@@ -12,6 +13,7 @@ import sys
 # Optional import for editor/type checking; at runtime this script is executed with the
 # library code prepended via stdin.
 try:
+    from deployer_common_lib import PhaseTimer  # type: ignore
     from map_device_lib import *  # type: ignore
 except Exception:
     pass
@@ -26,6 +28,9 @@ def log(msg: str) -> None:
     eprint(f"map-serial-device: {msg}")
 
 
+TIMER = PhaseTimer()
+
+
 def _parse_lxc_idmap_ranges(config_text: str) -> list[tuple[str, int, int, int]]:
     ranges: list[tuple[str, int, int, int]] = []
     for line in config_text.splitlines():
@@ -117,7 +122,8 @@ def main() -> int:
         + f"install_replug_watcher={install_replug}"
     )
 
-    vm_type = detect_vm_type(vm_id)
+    with TIMER.phase("detect_vm"):
+        vm_type = detect_vm_type(vm_id)
     if vm_type != "lxc":
         eprint(f"Error: map-serial-device currently supports LXC only (vm_id={vm_id}, type={vm_type})")
         return 1
@@ -126,7 +132,8 @@ def main() -> int:
 
     config_file = f"/etc/pve/lxc/{vm_id}.conf"
     try:
-        config = read_text(config_file)
+        with TIMER.phase("read_config"):
+            config = read_text(config_file)
     except Exception as ex:
         eprint(f"Error: Cannot read {config_file}: {ex}")
         return 1
@@ -231,10 +238,13 @@ def main() -> int:
     else:
         log("allowed cgroup device majors 188:* and 166:* (fallback)")
 
-    if not check_vm_stopped(vm_id, vm_type):
+    with TIMER.phase("check_stopped"):
+        stopped = check_vm_stopped(vm_id, vm_type)
+    if not stopped:
         eprint(f"Warning: Container {vm_id} is running; config changes take effect after restart.")
     try:
-        write_text_atomic(config_file, config)
+        with TIMER.phase("write_config"):
+            write_text_atomic(config_file, config)
     except Exception as ex:
         eprint(f"Error: Failed to write {config_file}: {ex}")
         return 1
@@ -265,7 +275,8 @@ def main() -> int:
             devnode_for_match = host_device_path
 
         try:
-            match = udev_match_for_tty(devnode_for_match)
+            with TIMER.phase("udev_match"):
+                match = udev_match_for_tty(devnode_for_match)
             unit_name = f"lxc-serial-rebind-{vm_id}.service"
             rule_lines = render_udev_rule_lines(match, unit_name)
         except Exception as ex:
@@ -300,9 +311,10 @@ WantedBy=multi-user.target
 
         log(f"installed systemd unit: {unit_path}")
 
-        systemctl("daemon-reload")
-        systemctl("enable", f"lxc-serial-rebind-{vm_id}.service")
-        udev_reload_rules()
+        with TIMER.phase("systemd_udev_reload"):
+            systemctl("daemon-reload")
+            systemctl("enable", f"lxc-serial-rebind-{vm_id}.service")
+            udev_reload_rules()
 
         log("replug watcher enabled + udev rules reloaded")
 
@@ -310,4 +322,7 @@ WantedBy=multi-user.target
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    rc = main()
+    if rc == 0:
+        print(json.dumps([TIMER.output("map_serial_device_timings")]))
+    raise SystemExit(rc)
@@ -225,12 +225,21 @@ def render_udev_rule_lines(match: UdevMatch, systemd_unit: str) -> List[str]:
     return [", ".join(clauses) + "\n"]
 
 
+_which_cache: Dict[str, Optional[str]] = {}
+
+
 def shutil_which(cmd: str) -> Optional[str]:
+    # Memoized: systemctl()/udev_reload_rules() are called several times per run
+    if cmd in _which_cache:
+        return _which_cache[cmd]
+    found = None
     for p in os.environ.get("PATH", "").split(":"):
         full = os.path.join(p, cmd)
         if os.path.isfile(full) and os.access(full, os.X_OK):
-            return full
-    return None
+            found = full
+            break
+    _which_cache[cmd] = found
+    return found
 
 
 def systemctl(*args: str) -> None:
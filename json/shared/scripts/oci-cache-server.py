@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+"""
+Pull-through OCI cache for all Proxmox nodes of a cluster.
+
+Starts a small registry (OCI distribution API, pull only) on this node and announces
+it in the cluster file system (/etc/pve/oci-lxc-deployer/oci-mirror.json). The other
+nodes then pull through it automatically (see mirror_source in oci_mirror_lib.py, which
+is prepended as library), so an image rollout to N nodes downloads it from the internet
+only once.
+
+Every registry is served under its own name: <node>:5050/ghcr.io/owner/app proxies
+ghcr.io/owner/app, and <node>:5050/library/alpine (no registry) proxies Docker Hub.
+Only the registries of the managed containers of the cluster and those listed in
+allowed_registries are proxied; requests for others get 403 (the nodes then pull
+from that registry directly).
+
+- Blobs are served from the host's content-addressed blob store, the same one
+  get-oci-image.py fills. A blob that is missing is downloaded once (resuming an
+  interrupted download) and streamed to all clients that request it meanwhile.
+- Manifests are passed through byte for byte and cached. Tags are revalidated with a
+  manifest HEAD after manifest_ttl seconds, digests never expire. If the registry is
+  unreachable, the cached manifest is served.
+- The server speaks plain HTTP, so the nodes never send it registry credentials:
+  their pulls with credentials go to the registry directly (see PullOptions).
+  Credentials a client does send (Basic auth, e.g. through a TLS proxy in front of
+  the server) are used for the upstream registry. Manifests are cached per credentials. A blob is served to credentials only if they
+  got a manifest of the repository that references it, or the registry answers a
+  HEAD request for the blob with them, so private layers do not leak through the
+  shared store.
+
+The server runs detached from the SSH session; running the template again restarts
+it with the new settings. It removes its announcement when it stops. After a reboot
+of the node it has to be started again; the announcement it left behind is not
+trusted: the server refreshes it every minute and the nodes ignore it after five
+minutes without refresh, and they only use a server that answers /v2/ with the
+instance token of the announcement. Until then they pull from the registries directly.
+
+Parameters (via template variables):
+  port (optional): TCP port (default: 5050)
+  listen_address (optional): Address to listen on (default: this node's address in the
+    cluster network from /etc/pve/.members, else the address its hostname resolves to)
+  advertise_address (optional): Address the other nodes use to reach this node
+    (default: the listen address, or the node's address if that is 0.0.0.0/::)
+  allowed_registries (optional): Comma separated registries to proxy besides those of
+    the managed containers, e.g. ghcr.io,docker.io (default: none)
+  manifest_ttl (optional): Seconds a cached tag manifest is used without asking the
+    registry (default: 300)
+  max_bandwidth (optional): Limit for the upstream downloads in KiB/s (default: 0 = unlimited);
+    the host-wide limit of the pulls (host_max_bandwidth of get-oci-image.py) applies too
+  stop (optional): Stop the cache and remove the announcement (default: false)
+
+Output (JSON to stdout):
+  [{"id": "oci_mirror", "value": "http://192.168.1.10:5050"}]   (empty when stopped)
+
+All logs and errors go to stderr; the running server logs to
+/var/log/oci-lxc-deployer-cache.log.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+# Optional import for editor/type checking; at runtime this script is executed with the
+# library code prepended via stdin.
+try:
+    from deployer_common_lib import *  # type: ignore
+    from oci_registry_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+    from oci_mirror_lib import *  # type: ignore
+    from oci_daemon_lib import *  # type: ignore
+except Exception:
+    pass
+
+PID_FILE = "/run/oci-lxc-deployer-cache.pid"
+LOG_FILE = "/var/log/oci-lxc-deployer-cache.log"
+DEFAULT_MANIFEST_TTL = 300
+UPSTREAM_TIMEOUT = 120
+# Seconds the registries of the managed containers are used before they are read again
+ALLOWED_REGISTRIES_REFRESH = 60
+ROUTE_RE = re.compile(r"^/v2/(?P<name>.+)/(?P<kind>manifests|blobs)/(?P<reference>[^/]+)$")
+
+def log(message: str) -> None:
+    """Print message to stderr (for logging/progress)."""
+    print(message, file=sys.stderr, flush=True)
+
+def error(message: str, exit_code: int = 1) -> None:
+    """Print error to stderr and exit."""
+    log(f"Error: {message}")
+    sys.exit(exit_code)
+
+def parse_basic_auth(header: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(username, password) from a Basic Authorization header, (None, None) otherwise."""
+    scheme, _, value = (header or "").partition(" ")
+    if scheme.lower() != "basic" or not value:
+        return None, None
+    try:
+        username, _, password = base64.b64decode(value.strip()).decode("utf-8").partition(":")
+    except (ValueError, UnicodeDecodeError):
+        return None, None
+    return username or None, password or None
+
+def credential_fingerprint(username: Optional[str], password: Optional[str]) -> str:
+    return sha256_digest(f"{username}:{password}".encode("utf-8")) if username else "anonymous"
+
+def normalize_registry(registry: str) -> str:
+    return registry_host(registry.strip().rstrip("/").lower())
+
+def managed_registries() -> set:
+    """Registries the managed containers of all nodes of the cluster were created from."""
+    try:
+        lxc_dirs = [os.path.join(PVE_NODES_DIR, entry.name, "lxc") for entry in os.scandir(PVE_NODES_DIR)
+                    if entry.is_dir()]
+    except OSError:
+        lxc_dirs = [lxc_conf_dir()]
+    registries = set()
+    for lxc_dir in lxc_dirs:
+        for container in managed_containers(lxc_dir):
+            if container["oci_image"]:
+                image, _tag = split_image_tag(parse_image_ref(container["oci_image"]))
+                registries.add(normalize_registry(split_image_name(image)[0]))
+    return registries
+
+class RegistryAllowList:
+    """Upstream registries the cache proxies: the configured ones plus managed_registries()."""
+
+    def __init__(self, configured: List[str]) -> None:
+        self.configured = {normalize_registry(r) for r in configured if r.strip()}
+        self.managed: set = set()
+        self.read_at = 0.0
+        self.lock = threading.Lock()
+
+    def allows(self, registry: str) -> bool:
+        registry = normalize_registry(registry)
+        if registry in self.configured:
+            return True
+        with self.lock:
+            if time.monotonic() - self.read_at >= ALLOWED_REGISTRIES_REFRESH:
+                # Containers deployed since the last read, without restarting the cache
+                self.managed = managed_registries()
+                self.read_at = time.monotonic()
+            return registry in self.managed
+
+class BlobGrants:
+    """Digests each credential fingerprint may read from a repository.
+
+    Filled from the manifests served to the credentials (and upstream HEAD checks), so
+    a blob in the shared store is only served to clients the registry would give it to.
+    """
+
+    def __init__(self) -> None:
+        self.directory = os.path.join(OCI_CACHE_DIR, "mirror", "grants")
+        self.lock = threading.Lock()
+
+    def _path(self, registry: str, repository: str, username: Optional[str], password: Optional[str]) -> str:
+        key = f"{registry}/{repository}|{credential_fingerprint(username, password)}"
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def allowed(self, registry: str, repository: str, digest: str, username: Optional[str],
+                password: Optional[str]) -> bool:
+        return digest in (read_json(self._path(registry, repository, username, password)) or [])
+
+    def add(self, registry: str, repository: str, digests: List[str], username: Optional[str],
+            password: Optional[str]) -> None:
+        path = self._path(registry, repository, username, password)
+        with self.lock:
+            granted = read_json(path) or []
+            new = [digest for digest in digests if digest not in granted]
+            if new:
+                write_json_atomic(path, granted + new)
+
+def manifest_references(body: bytes) -> List[str]:
+    """Digests a manifest (config and layers) or an index (its manifests) references."""
+    try:
+        manifest = json.loads(body.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return []
+    descriptors = [manifest.get("config") or {}] + (manifest.get("layers") or []) + (manifest.get("manifests") or [])
+    return [d["digest"] for d in descriptors if isinstance(d, dict) and d.get("digest")]
+
+def write_blob(digest: str, data: bytes) -> None:
+    """Store a small blob (manifest) in the blob store."""
+    ensure_cache_dirs()
+    path = blob_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class ManifestCache:
+    """Manifests by registry/repository:reference, bodies kept in the blob store."""
+
+    def __init__(self, ttl: int) -> None:
+        self.ttl = ttl
+        self.directory = os.path.join(OCI_CACHE_DIR, "mirror", "manifests")
+
+    def _entry_path(self, registry: str, repository: str, reference: str,
+                    username: Optional[str], password: Optional[str]) -> str:
+        fingerprint = credential_fingerprint(username, password)
+        key = hashlib.sha256(f"{registry}/{repository}:{reference}|{fingerprint}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, registry: str, repository: str, reference: str, username: Optional[str],
+            password: Optional[str]) -> dict:
+        """Entry {"digest", "media_type", "size", "fetched_at"} of a manifest whose body is in the store."""
+        path = self._entry_path(registry, repository, reference, username, password)
+        entry = read_json(path)
+        if entry and not has_blob(entry.get("digest", "")):
+            entry = None
+        if entry and (reference.startswith("sha256:") or time.time() - entry["fetched_at"] < self.ttl):
+            return entry
+        with RegistryClient(registry, username, password, UPSTREAM_TIMEOUT) as client:
+            if entry:
+                try:
+                    if client.head_manifest(repository, reference) == entry["digest"]:
+                        entry["fetched_at"] = time.time()
+                        write_json_atomic(path, entry)
+                        return entry
+                except RegistryError as e:
+                    if e.status in (401, 403):
+                        raise
+                    log(f"Revalidating {registry}/{repository}:{reference} failed ({e}), serving cached manifest")
+                    return entry
+                except OSError as e:
+                    log(f"Registry {registry} not reachable ({e}), serving cached manifest")
+                    return entry
+            status, headers, body = client.request("GET", repository, f"manifests/{reference}", MANIFEST_ACCEPT)
+        if status != 200:
+            raise RegistryError(f"GET manifest {registry}/{repository}:{reference} returned {status}", status)
+        digest = sha256_digest(body)
+        if reference.startswith("sha256:") and digest != reference:
+            raise RegistryError(f"Digest mismatch for manifest {reference}: got {digest}")
+        media_type = (headers.get("content-type") or "").split(";")[0].strip()
+        if not media_type:
+            media_type = json.loads(body.decode("utf-8")).get("mediaType") or "application/json"
+        write_blob(digest, body)
+        entry = {"digest": digest, "media_type": media_type, "size": len(body), "fetched_at": time.time()}
+        write_json_atomic(path, entry)
+        return entry
+
+class BlobDownload(threading.Thread):
+    """One upstream blob download into the store, readable while it is running.
+
+    Data goes to staging/<hex>.partial (resuming a partial download of an earlier
+    pull) and is moved into the store once the digest is verified. Readers follow
+    `written` under `cond` and stream the partial file as it grows.
+    """
+
+    def __init__(self, server: "CacheServer", registry: str, repository: str, digest: str,
+                 username: Optional[str], password: Optional[str]) -> None:
+        super().__init__(daemon=True)
+        self.server = server
+        self.registry = registry
+        self.repository = repository
+        self.digest = digest
+        self.username = username
+        self.password = password
+        self.cond = threading.Condition()
+        self.path: Optional[str] = None
+        self.written = 0
+        self.total: Optional[int] = None
+        self.done = False
+        self.error: Optional[Exception] = None
+
+    def run(self) -> None:
+        try:
+            self._download()
+        except Exception as e:
+            log(f"Download of {self.digest} from {self.registry}/{self.repository} failed: {e}")
+            with self.cond:
+                self.error = e
+        finally:
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+            self.server.forget(self)
+
+    def _download(self) -> None:
+        # Shared with get-oci-image.py on this node: one download per blob
+        with FileLock(f"blob {self.digest}"):
+            if has_blob(self.digest):
+                return
+            ensure_cache_dirs()
+            partial = staging_path(self.digest)
+            offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+            resp = open_blob_stream(f"{self.registry}/{self.repository}", self.digest, self.username,
+                                    self.password, UPSTREAM_TIMEOUT, offset)
+            with resp:
+                if offset and resp.status != 206:
+                    offset = 0
+                length = resp.headers.get("Content-Length")
+                hasher = hashlib.sha256()
+                with open(partial, "r+b" if offset else "wb") as f:
+                    while f.tell() < offset:
+                        chunk = f.read(min(1024 * 1024, offset - f.tell()))
+                        if not chunk:
+                            break
+                        hasher.update(chunk)
+                    f.seek(offset)
+                    f.truncate()
+                    with self.cond:
+                        self.path = partial
+                        self.written = offset
+                        self.total = offset + int(length) if length and length.isdigit() else None
+                        self.cond.notify_all()
+                    while True:
+                        chunk = resp.read(256 * 1024)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        f.flush()
+                        hasher.update(chunk)
+                        self.server.limiter.consume(len(chunk))
+                        with self.cond:
+                            self.written += len(chunk)
+                            self.cond.notify_all()
+                    os.fsync(f.fileno())
+            if self.total is not None and self.written < self.total:
+                raise IOError(f"Download interrupted at {self.written} of {self.total} bytes")
+            actual = "sha256:" + hasher.hexdigest()
+            if actual != self.digest:
+                os.unlink(partial)
+                raise IOError(f"Digest mismatch: got {actual}")
+            os.replace(partial, blob_path(self.digest))
+            log(f"Cached {self.digest} ({self.written} bytes) from {self.registry}/{self.repository}")
+
+    def wait_started(self) -> None:
+        """Wait until data is being written (or the download ended)."""
+        with self.cond:
+            while self.path is None and not self.done:
+                self.cond.wait()
+
+class CacheServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], manifest_ttl: int, max_bandwidth: int,
+                 registries: RegistryAllowList) -> None:
+        super().__init__(address, CacheRequestHandler)
+        self.manifests = ManifestCache(manifest_ttl)
+        self.registries = registries
+        self.grants = BlobGrants()
+        # Upstream downloads count towards the host-wide limit of the pulls, too
+        self.limiter = BandwidthLimiter(max_bandwidth, HostBandwidthLimiter())
+        self.downloads = {}
+        self.lock = threading.Lock()
+        # Token of this run's announcement, returned on /v2/ so that clients can tell
+        # this server from whatever listens at an announced address later
+        self.instance = os.urandom(16).hex()
+
+    def download(self, registry: str, repository: str, digest: str, username: Optional[str],
+                 password: Optional[str]) -> BlobDownload:
+        """Running download of digest, started if there is none."""
+        with self.lock:
+            download = self.downloads.get(digest)
+            if download is None:
+                download = BlobDownload(self, registry, repository, digest, username, password)
+                self.downloads[digest] = download
+                download.start()
+            return download
+
+    def forget(self, download: BlobDownload) -> None:
+        with self.lock:
+            if self.downloads.get(download.digest) is download:
+                del self.downloads[download.digest]
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    server_version = "oci-lxc-deployer-cache"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        log(f"{self.address_string()} {format % args}")
+
+    def send_response(self, code: int, message: Optional[str] = None) -> None:
+        self.response_started = True
+        super().send_response(code, message)
+
+    def do_GET(self) -> None:
+        self.handle_registry_request(head=False)
+
+    def do_HEAD(self) -> None:
+        self.handle_registry_request(head=True)
+
+    def send_json(self, status: int, data: object, headers: Optional[dict] = None) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Docker-Distribution-API-Version", "registry/2.0")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_registry_error(self, status: int, code: str, message: str) -> None:
+        headers = {}
+        if status == 401:
+            headers["WWW-Authenticate"] = 'Basic realm="oci-lxc-deployer cache"'
+        self.send_json(status, {"errors": [{"code": code, "message": message}]}, headers)
+
+    def handle_registry_request(self, head: bool) -> None:
+        path = urllib.parse.urlsplit(self.path).path
+        if path in ("/v2", "/v2/"):
+            self.send_json(200, {}, {MIRROR_INSTANCE_HEADER: self.server.instance})
+            return
+        match = ROUTE_RE.match(path)
+        if not match:
+            self.send_registry_error(404, "NAME_UNKNOWN", f"Unknown path {path}")
+            return
+        registry, repository = split_image_name(match.group("name"))
+        if not self.server.registries.allows(registry):
+            # Not an open proxy: only registries the cluster deploys from
+            self.send_registry_error(403, "DENIED", f"Registry {registry} is not served by this cache")
+            return
+        reference = match.group("reference")
+        username, password = parse_basic_auth(self.headers.get("Authorization"))
+        kind = match.group("kind")
+        unknown = "MANIFEST_UNKNOWN" if kind == "manifests" else "BLOB_UNKNOWN"
+        self.response_started = False
+        try:
+            if kind == "manifests":
+                self.serve_manifest(registry, repository, reference, username, password, head)
+            else:
+                self.serve_blob(registry, repository, reference, username, password, head)
+        except Exception as e:
+            if self.response_started:
+                # Failed while sending the body (client gone, upstream aborted)
+                log(f"{self.path}: {e}")
+                self.close_connection = True
+                return
+            self.send_failure(e, unknown, registry)
+
+    def send_failure(self, e: Exception, unknown: str, registry: str) -> None:
+        """Map an upstream or request error to a registry error response."""
+        if isinstance(e, RegistryError):
+            status = e.status or 502
+        elif isinstance(e, urllib.error.HTTPError):
+            status = e.code
+        elif isinstance(e, ValueError):
+            self.send_registry_error(400, "DIGEST_INVALID", str(e))
+            return
+        else:
+            status = 502
+        if status in (401, 403):
+            self.send_registry_error(status, "UNAUTHORIZED", str(e))
+        elif status == 404:
+            self.send_registry_error(404, unknown, str(e))
+        else:
+            self.send_registry_error(502, "UNKNOWN", f"{registry}: {e}")
+
+    def serve_manifest(self, registry: str, repository: str, reference: str, username: Optional[str],
+                       password: Optional[str], head: bool) -> None:
+        entry = self.server.manifests.get(registry, repository, reference, username, password)
+        with open(blob_path(entry["digest"]), "rb") as f:
+            body = f.read()
+        # These credentials got the manifest, so they may read what it references
+        self.server.grants.add(registry, repository, manifest_references(body), username, password)
+        self.send_response(200)
+        self.send_header("Content-Type", entry["media_type"])
+        self.send_header("Content-Length", str(entry["size"]))
+        self.send_header("Docker-Content-Digest", entry["digest"])
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def requested_range(self, size: Optional[int]) -> Optional[Tuple[int, Optional[int]]]:
+        """(start, end exclusive) of a "Range: bytes=N-[M]" request, None without one."""
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", (self.headers.get("Range") or "").strip())
+        if not match:
+            return None
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else size
+        if size is not None and end is not None:
+            end = min(end, size)
+        return start, end
+
+    def send_blob_headers(self, digest: str, byte_range: Optional[Tuple[int, Optional[int]]],
+                          size: Optional[int]) -> None:
+        """Status and headers for a blob body of byte_range (None = whole blob)."""
+        start, end = byte_range or (0, size)
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Docker-Content-Digest", digest)
+        self.send_header("Accept-Ranges", "bytes")
+        if end is not None:
+            self.send_header("Content-Length", str(end - start))
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size if size is not None else '*'}")
+        else:
+            # Length unknown while the upstream download runs: end of body = end of connection
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+
+    def head_upstream_blob(self, registry: str, repository: str, digest: str, username: Optional[str],
+                           password: Optional[str]) -> dict:
+        """Headers of the registry's answer to a blob HEAD with the client's credentials."""
+        with RegistryClient(registry, username, password, UPSTREAM_TIMEOUT) as client:
+            status, headers, _body = client.request("HEAD", repository, f"blobs/{digest}")
+        if status != 200:
+            raise RegistryError(f"HEAD blob {registry}/{repository}@{digest} returned {status}", status)
+        self.server.grants.add(registry, repository, [digest], username, password)
+        return headers
+
+    def serve_blob(self, registry: str, repository: str, digest: str, username: Optional[str],
+                   password: Optional[str], head: bool) -> None:
+        path = blob_path(digest)
+        if not has_blob(digest) and head:
+            headers = self.head_upstream_blob(registry, repository, digest, username, password)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Docker-Content-Digest", digest)
+            self.send_header("Content-Length", headers.get("content-length", "0"))
+            self.end_headers()
+            return
+        if not self.server.grants.allowed(registry, repository, digest, username, password):
+            # Stored (or being downloaded) for someone else: the registry decides
+            self.head_upstream_blob(registry, repository, digest, username, password)
+        if not has_blob(digest):
+            download = self.server.download(registry, repository, digest, username, password)
+            download.wait_started()
+            if download.path is None and download.error is not None:
+                raise download.error
+            if download.path is not None and not has_blob(digest):
+                self.stream_download(download)
+                return
+        size = os.path.getsize(path)
+        byte_range = self.requested_range(size)
+        start, end = byte_range or (0, size)
+        if start >= end and size:
+            self.send_registry_error(416, "UNKNOWN", f"Range start {start} beyond {size} bytes")
+            return
+        self.send_blob_headers(digest, byte_range, size)
+        if not head:
+            with open(path, "rb") as f:
+                self.wfile.flush()
+                self.connection.sendfile(f, start, end - start)
+
+    def stream_download(self, download: BlobDownload) -> None:
+        """Send a blob while it is being downloaded from the registry."""
+        byte_range = self.requested_range(download.total)
+        start, stop = byte_range or (0, download.total)
+        self.send_blob_headers(download.digest, byte_range, download.total)
+        with open(download.path, "rb") as f:
+            f.seek(start)
+            position = start
+            while stop is None or position < stop:
+                with download.cond:
+                    while position >= download.written and not download.done:
+                        download.cond.wait(30)
+                    available = download.written
+                if position >= available:
+                    break  # Download ended (or failed) before this point
+                limit = available if stop is None else min(available, stop)
+                data = f.read(min(limit - position, 1024 * 1024))
+                if not data:
+                    break
+                self.wfile.write(data)
+                position += len(data)
+        if download.error is not None or (stop is not None and position < stop):
+            # Short body: the client resumes with a range request
+            self.close_connection = True
+
+def node_address() -> str:
+    """This node's address in the cluster network, else the one its hostname resolves to."""
+    return cluster_address() or socket.gethostbyname(socket.gethostname())
+
+def advertised_url(advertise_address: Optional[str], listen_address: str, port: int) -> str:
+    address = advertise_address or (listen_address if listen_address not in ("0.0.0.0", "::") else node_address())
+    if ":" in address and not address.startswith("["):
+        address = f"[{address}]"
+    return f"http://{address}:{port}"
+
+def announce(url: str, instance: str, started_at: int) -> None:
+    """Publish the cache for all nodes (/etc/pve is the cluster file system)."""
+    os.makedirs(os.path.dirname(OCI_MIRROR_CONFIG), exist_ok=True)
+    # Plain write: pmxcfs does not allow the chmod of write_json_atomic
+    with open(OCI_MIRROR_CONFIG, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "node": socket.gethostname(), "instance": instance,
+                   "started_at": started_at, "heartbeat_at": int(time.time())}, f)
+
+def keep_announced(url: str, instance: str, stopped: threading.Event) -> None:
+    """Refresh the announcement's heartbeat until stopped or another cache replaced it.
+
+    Without the heartbeat the nodes ignore the announcement after
+    MIRROR_ANNOUNCEMENT_MAX_AGE, e.g. when this node rebooted and the cache is gone.
+    """
+    started_at = int(time.time())
+    while not stopped.wait(MIRROR_HEARTBEAT):
+        if (read_json(OCI_MIRROR_CONFIG) or {}).get("instance") != instance:
+            log("The announcement was replaced by another cache, no longer refreshing it")
+            return
+        try:
+            announce(url, instance, started_at)
+        except OSError as e:
+            log(f"Warning: could not refresh the announcement in {OCI_MIRROR_CONFIG}: {e}")
+
+def withdraw(instance: Optional[str] = None) -> None:
+    """Remove the announcement if it is this node's (and of that instance, if given)."""
+    config = read_json(OCI_MIRROR_CONFIG) or {}
+    if config.get("node") != socket.gethostname():
+        return
+    if instance is not None and config.get("instance") != instance:
+        return
+    try:
+        os.unlink(OCI_MIRROR_CONFIG)
+    except OSError:
+        pass
+
+def serve(server: CacheServer, url: str) -> None:
+    """Run the server in a daemon process detached from the SSH session."""
+    if not daemonize(PID_FILE, LOG_FILE):
+        return
+    log(f"OCI cache listening on {server.server_address[0]}:{server.server_address[1]}, announced as {url}")
+    try:
+        announce(url, server.instance, int(time.time()))
+    except OSError as e:
+        log(f"Warning: could not announce the cache in {OCI_MIRROR_CONFIG}: {e}")
+    stopped = threading.Event()
+    threading.Thread(target=keep_announced, args=(url, server.instance, stopped), daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        stopped.set()
+        withdraw(server.instance)
+        server.server_close()
+        try:
+            os.unlink(PID_FILE)
+        except OSError:
+            pass
+        os._exit(0)
+
+def main() -> None:
+    """Main function."""
+    port = "{{ port }}"
+    listen_address = "{{ listen_address }}"
+    advertise_address = "{{ advertise_address }}"
+    manifest_ttl = "{{ manifest_ttl }}"
+    max_bandwidth = "{{ max_bandwidth }}"
+    allowed_registries = "{{ allowed_registries }}"
+    stop = "{{ stop }}"
+
+    port = int(port) if port.strip().isdigit() else DEFAULT_MIRROR_PORT
+    if not advertise_address or advertise_address == "NOT_DEFINED":
+        advertise_address = None
+    if allowed_registries == "NOT_DEFINED":
+        allowed_registries = ""
+    manifest_ttl = int(manifest_ttl) if manifest_ttl.strip().isdigit() else DEFAULT_MANIFEST_TTL
+    max_bandwidth = int(max_bandwidth) * 1024 if max_bandwidth.strip().isdigit() else 0
+
+    if stop_daemon(PID_FILE):
+        log("Stopped the running OCI cache")
+    if stop.strip().lower() in ("true", "1", "yes"):
+        withdraw()
+        print(json.dumps([{"id": "oci_mirror", "value": ""}]))
+        return
+
+    try:
+        if not listen_address or listen_address == "NOT_DEFINED":
+            # Not 0.0.0.0: the cache should only be reachable from the cluster network
+            listen_address = node_address()
+        url = advertised_url(advertise_address, listen_address, port)
+    except OSError as e:
+        error(f"Cannot determine the address of this node ({e}); set listen_address and advertise_address")
+    registries = RegistryAllowList(allowed_registries.split(","))
+    log(f"Proxying {', '.join(sorted(registries.configured | managed_registries())) or 'no registries yet'}")
+    try:
+        server = CacheServer((listen_address, port), manifest_ttl, max_bandwidth, registries)
+    except OSError as e:
+        error(f"Cannot listen on {listen_address}:{port}: {e}")
+    serve(server, url)
+    server.socket.close()
+    log(f"OCI cache started, other nodes pull through {url}")
+    print(json.dumps([{"id": "oci_mirror", "value": url}]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Pre-download new versions of the OCI images that managed containers run.
+
+Runs as a daemon on the VE host. Every `interval` hours within the off-peak `window`,
+it reads the OCI image of each managed container on this node (managed_containers in
+deployer_common_lib.py) and checks the image for a new digest or version
+(prefetch_updates in oci_prefetch_lib.py, prepended as library). An unchanged image
+costs one manifest HEAD request. A new version is pulled into the template cache
+under the bandwidth limit, so an upgrade later finds the archive in the storage and
+the downtime is only the container swap.
+
+Images are pulled anonymously (or through the cluster's OCI cache); images that need
+registry credentials are reported as failed.
+
+The daemon runs detached from the SSH session; running the template again restarts
+it with the new settings. After a reboot of the node it has to be started again.
+
+Parameters (via template variables):
+  storage (optional): Proxmox storage name for the archives (default: local)
+  window (optional): Off-peak time window for the checks and downloads as "HH:MM-HH:MM"
+    in local time, may span midnight (default: 01:00-05:00, empty = any time)
+  interval (optional): Hours between two checks (default: 6)
+  max_bandwidth (optional): Limit for the downloads in KiB/s (default: 10240, 0 = unlimited);
+    the host-wide limit of the pulls (host_max_bandwidth of get-oci-image.py) applies too
+  oci_mirror (optional): as for get-oci-image.py
+  once (optional): Check (and pull) once now, outside the window, without starting the
+    daemon (default: false)
+  stop (optional): Stop the daemon (default: false)
+
+Output (JSON to stdout):
+  [{"id": "prefetched_updates", "value": "<JSON array>"}] with the records of this check
+  (once) or of the daemon's last check (see prefetch_updates).
+
+All logs and errors go to stderr; the daemon logs to
+/var/log/oci-lxc-deployer-update-prefetch.log.
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Optional, Tuple
+
+# Optional import for editor/type checking; at runtime this script is executed with the
+# library code prepended via stdin.
+try:
+    from deployer_common_lib import *  # type: ignore
+    from oci_registry_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+    from oci_mirror_lib import *  # type: ignore
+    from oci_daemon_lib import *  # type: ignore
+    from oci_pull_lib import *  # type: ignore
+    from oci_prefetch_lib import *  # type: ignore
+except Exception:
+    pass
+
+PID_FILE = "/run/oci-lxc-deployer-update-prefetch.pid"
+LOG_FILE = "/var/log/oci-lxc-deployer-update-prefetch.log"
+STATUS_FILE = "/run/oci-lxc-deployer/update-prefetch.json"
+DEFAULT_WINDOW = "01:00-05:00"
+DEFAULT_INTERVAL_HOURS = 6
+DEFAULT_MAX_BANDWIDTH_KIB = 10240
+
+def log(message: str) -> None:
+    """Print message to stderr (for logging/progress)."""
+    print(message, file=sys.stderr, flush=True)
+
+def error(message: str, exit_code: int = 1) -> None:
+    """Print error to stderr and exit."""
+    log(f"Error: {message}")
+    sys.exit(exit_code)
+
+def seconds_until_window(window: Optional[Tuple[int, int]], now: float) -> float:
+    """0 inside the window, otherwise the seconds until it opens."""
+    if in_time_window(window, now):
+        return 0.0
+    return ((window[0] - minutes_of_day(now)) % (24 * 60)) * 60
+
+def window_deadline(window: Optional[Tuple[int, int]], now: float) -> Optional[float]:
+    """time.time() at which the current window closes (None for any time)."""
+    if window is None:
+        return None
+    return now + ((window[1] - minutes_of_day(now)) % (24 * 60)) * 60
+
+def check_updates(storage: str, max_bandwidth: int, oci_mirror: str,
+                  deadline: Optional[float] = None) -> list:
+    """One check of all managed containers; the records are also kept in STATUS_FILE."""
+    # A long-running daemon probes the OCI cache again for every check
+    _mirror_reachable.clear()
+    # Revalidate every inspect result: the HEAD request is the update check
+    options = PullOptions(inspect_cache_ttl=0, max_bandwidth=max_bandwidth,
+                          mirror=configured_mirror(oci_mirror))
+    containers = managed_containers()
+    log(f"Checking the OCI images of {len(containers)} managed containers for updates")
+    index = open_storage_index(storage)
+    records = prefetch_updates(containers, index, options, deadline)
+    counts = {}
+    for record in records:
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    log("Update check done: " + (", ".join(f"{n} {status}" for status, n in sorted(counts.items())) or "no images"))
+    try:
+        write_json_atomic(STATUS_FILE, {"checked_at": int(time.time()), "storage": storage, "records": records})
+    except OSError as e:
+        log(f"Warning: could not write {STATUS_FILE}: {e}")
+    return records
+
+def run(storage: str, window: Optional[Tuple[int, int]], interval: int, max_bandwidth: int,
+        oci_mirror: str) -> None:
+    """Daemon loop: wait for the window, check, sleep for the interval."""
+    if not daemonize(PID_FILE, LOG_FILE):
+        return
+    # Downloads and archive writes yield to the containers
+    os.nice(10)
+    log(f"OCI update prefetcher started (storage {storage}, every {interval // 3600} h)")
+    try:
+        while True:
+            wait = seconds_until_window(window, time.time())
+            if wait:
+                log(f"Next check in {int(wait // 60)} minutes, when the window opens")
+                time.sleep(wait)
+            started = time.time()
+            try:
+                check_updates(storage, max_bandwidth, oci_mirror, window_deadline(window, started))
+            except Exception as e:
+                log(f"Error: update check failed: {e}")
+            time.sleep(max(interval - (time.time() - started), 60))
+    finally:
+        try:
+            os.unlink(PID_FILE)
+        except OSError:
+            pass
+        os._exit(0)
+
+def main() -> None:
+    """Main function."""
+    storage = "{{ storage }}"
+    window = "{{ window }}"
+    interval = "{{ interval }}"
+    max_bandwidth = "{{ max_bandwidth }}"
+    oci_mirror = "{{ oci_mirror }}"
+    once = "{{ once }}"
+    stop = "{{ stop }}"
+
+    if not storage or storage == "NOT_DEFINED":
+        storage = "local"
+    if window == "NOT_DEFINED":
+        window = DEFAULT_WINDOW
+    try:
+        window = parse_time_window(window)
+    except ValueError as e:
+        error(str(e))
+    interval = (int(interval) if interval.strip().isdigit() and int(interval) > 0
+                else DEFAULT_INTERVAL_HOURS) * 3600
+    max_bandwidth = (int(max_bandwidth) if max_bandwidth.strip().isdigit()
+                     else DEFAULT_MAX_BANDWIDTH_KIB) * 1024
+    if oci_mirror == "NOT_DEFINED":
+        oci_mirror = ""
+
+    if stop_daemon(PID_FILE):
+        log("Stopped the running OCI update prefetcher")
+    if stop.strip().lower() in ("true", "1", "yes"):
+        print(json.dumps([{"id": "prefetched_updates", "value": "[]"}]))
+        return
+    if not check_skopeo():
+        error("skopeo is required but not found. Please install it with: apt install skopeo")
+    if once.strip().lower() in ("true", "1", "yes"):
+        records = check_updates(storage, max_bandwidth, oci_mirror)
+        print(json.dumps([{"id": "prefetched_updates", "value": json.dumps(records)}]))
+        return
+
+    last = (read_json(STATUS_FILE) or {}).get("records") or []
+    run(storage, window, interval, max_bandwidth, oci_mirror)
+    log("OCI update prefetcher started, log: " + LOG_FILE)
+    print(json.dumps([{"id": "prefetched_updates", "value": json.dumps(last)}]))
+
+if __name__ == "__main__":
+    main()
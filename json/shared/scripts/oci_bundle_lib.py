@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Import of offline bundles of OCI images on the VE host (see import_bundle).
+
+Designed to be *prepended* (as "library") to import-oci-bundle.py and executed via
+stdin, after oci_registry_lib.py, oci_store_lib.py, oci_squash_lib.py, oci_rootfs_lib.py
+and oci_pull_lib.py, whose helpers it uses.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+The images of a bundle end up in the blob store and the storage index exactly as if
+they had been pulled, without contacting a registry.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Optional import for editor/type checking; at runtime oci_registry_lib.py,
+# oci_store_lib.py, oci_squash_lib.py, oci_rootfs_lib.py and oci_pull_lib.py are
+# prepended before this library.
+try:
+    from oci_registry_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+    from oci_squash_lib import *  # type: ignore
+    from oci_rootfs_lib import *  # type: ignore
+    from oci_pull_lib import *  # type: ignore
+except Exception:
+    pass
+
+BUNDLE_MANIFEST = "bundle.json"
+BUNDLE_MAX_JSON_BYTES = 16 * 1024 * 1024
+DIGEST_RE = re.compile(r"^sha256:[0-9a-f]{64}$")
+
+
+def read_bundle_manifest(bundle: str) -> List[dict]:
+    """Images of a bundle (its directory or its bundle.json), with the absolute source paths.
+
+    Raises PullError if the manifest is missing or invalid, or names a source outside
+    the bundle directory.
+    """
+    path = os.path.join(bundle, BUNDLE_MANIFEST) if os.path.isdir(bundle) else bundle
+    base = os.path.realpath(os.path.dirname(path))
+    data = read_json(path)
+    if not data or not isinstance(data.get("images"), list) or not data["images"]:
+        raise PullError(f"{path} is missing or lists no images")
+    entries = []
+    for entry in data["images"]:
+        image, digest, source = (entry or {}).get("image"), (entry or {}).get("digest"), (entry or {}).get("path")
+        if not image or not source or not DIGEST_RE.match(digest or ""):
+            raise PullError(f"Invalid image entry in {path} (image, sha256 digest and path are required): {entry}")
+        source = os.path.realpath(os.path.join(base, source))
+        if os.path.commonpath([base, source]) != base:
+            raise PullError(f"Source {entry['path']} of {image} is outside the bundle directory")
+        entries.append({"image": image, "digest": digest, "path": source})
+    return entries
+
+
+def bundle_source_blobs(path: str) -> Dict[str, Tuple[str, int, int]]:
+    """Where the blobs of an OCI layout or oci-archive are: {digest: (file, offset, size)}.
+
+    Of an archive, only the tar headers are read; the blobs stay in place and are
+    read at their offsets. Compressed archives cannot be read that way and raise
+    PullError.
+    """
+    blobs = {}
+    if os.path.isdir(path):
+        blob_dir = os.path.join(path, "blobs", "sha256")
+        for entry in os.scandir(blob_dir) if os.path.isdir(blob_dir) else []:
+            if entry.is_file():
+                blobs["sha256:" + entry.name] = (entry.path, 0, entry.stat().st_size)
+        return blobs
+    try:
+        with tarfile.open(path, mode="r:") as tar:
+            for member in tar:
+                name = _layer_path(member.name)
+                if member.isfile() and name.startswith("blobs/sha256/"):
+                    blobs["sha256:" + name.rsplit("/", 1)[1]] = (path, member.offset_data, member.size)
+    except (OSError, tarfile.TarError) as e:
+        raise PullError(f"Cannot read {path} as OCI layout or uncompressed oci-archive: {e}")
+    return blobs
+
+
+def read_bundle_json(blobs: Dict[str, Tuple[str, int, int]], digest: str) -> Tuple[dict, bytes]:
+    """A manifest or config of a bundle source, verified against its digest."""
+    if digest not in blobs:
+        raise PullError(f"Blob {digest} is not in the bundle")
+    path, offset, size = blobs[digest]
+    if size > BUNDLE_MAX_JSON_BYTES:
+        raise PullError(f"Blob {digest} is too large for a manifest or config ({format_size(size)})")
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        data = os.pread(fd, size, offset)
+    finally:
+        os.close(fd)
+    if sha256_digest(data) != digest:
+        raise PullError(f"Checksum mismatch for {digest} in {path}")
+    return json.loads(data.decode("utf-8")), data
+
+
+def import_bundle_blob(digest: str, location: Tuple[str, int, int],
+                       lock_timeout: int = DEFAULT_LOCK_TIMEOUT) -> bool:
+    """Copy one blob of a bundle into the blob store, hashed on the way (one read).
+
+    Returns False if the store has it already. Raises IOError if the blob does not
+    match its digest; nothing is stored then.
+    """
+    if has_blob(digest):
+        return False
+    path, offset, size = location
+    with FileLock(f"blob {digest}", lock_timeout):
+        if has_blob(digest):
+            return False
+        target = blob_path(digest)
+        tmp = f"{target}.tmp-{os.getpid()}-{threading.get_ident()}"
+        hasher = hashlib.new(digest.partition(":")[0])
+        src_fd = os.open(path, os.O_RDONLY)
+        try:
+            dst_fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.lseek(src_fd, offset, os.SEEK_SET)
+                copy_fd_range(src_fd, dst_fd, size, hasher)
+                os.fsync(dst_fd)
+            finally:
+                os.close(dst_fd)
+            if "sha256:" + hasher.hexdigest() != digest:
+                raise IOError(f"Checksum mismatch for {digest} in {path}")
+            os.replace(tmp, target)
+            record_verified_blob(digest)
+        finally:
+            os.close(src_fd)
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+    return True
+
+
+def import_bundle(bundle: str, index: StorageIndex, options: PullOptions,
+                  workers: Optional[int] = None) -> List[dict]:
+    """
+    Import the images of an offline bundle as if they had been pulled.
+
+    Manifests and configs are checked against the digests of bundle.json (see
+    read_bundle_manifest), which pins the whole image. The layers that are not in
+    the blob store yet are then copied into it and verified in parallel, one thread
+    per core by default (`workers`): sha256 and file I/O release the GIL, so the
+    threads hash on all cores. Each image gets a ref in its OCI layout, an inspect
+    cache entry and its archive in the storage, recorded in the storage index with
+    its digest, so later pulls and prefetches of it are cache hits. Images whose
+    digest has an intact archive already are not written again.
+
+    Returns one result per image, with the fields of pull_image. Raises PullError if
+    the bundle is invalid or a blob does not match its digest.
+    """
+    entries = read_bundle_manifest(bundle)
+    sources: Dict[str, Dict[str, Tuple[str, int, int]]] = {}
+    images = []
+    layers: Dict[str, Tuple[str, int, int]] = {}
+    with options.timer.phase("inspect"):
+        for entry in entries:
+            if entry["path"] not in sources:
+                sources[entry["path"]] = bundle_source_blobs(entry["path"])
+            blobs = sources[entry["path"]]
+            image, tag = split_image_tag(parse_image_ref(entry["image"]))
+            manifest, data = read_bundle_json(blobs, entry["digest"])
+            descriptor = {"mediaType": manifest.get("mediaType") or OCI_MANIFEST_MEDIA_TYPE,
+                          "digest": entry["digest"], "size": len(data)}
+            if is_image_index(manifest):
+                descriptor = select_platform_descriptor(manifest, options.platform)
+                if descriptor is None:
+                    raise PullError(f"No manifest for platform {options.platform or 'linux/amd64'} "
+                                    f"in the bundle of {entry['image']}")
+                manifest, data = read_bundle_json(blobs, descriptor["digest"])
+            if not (manifest.get("config") or {}).get("digest"):
+                raise PullError(f"Unsupported manifest format for {entry['image']}")
+            config, config_data = read_bundle_json(blobs, manifest["config"]["digest"])
+            store_blob(data)
+            store_blob(config_data)
+            for layer in manifest.get("layers") or []:
+                if layer.get("digest") not in blobs:
+                    raise PullError(f"Layer {layer.get('digest')} of {entry['image']} is not in the bundle")
+                layers[layer["digest"]] = blobs[layer["digest"]]
+            inspect = inspect_from_manifest("/".join(split_image_name(image)), tag, entry["digest"],
+                                            manifest, config)
+            images.append({"entry": entry, "image": image, "tag": tag, "inspect": inspect,
+                           "descriptor": {key: value for key, value in descriptor.items()
+                                          if key in ("mediaType", "digest", "size", "platform")}})
+
+    ensure_cache_dirs()
+    layer_data = [{"Digest": digest, "Size": size} for digest, (_path, _offset, size) in layers.items()]
+    shortages = space_shortages(layer_data, index.storage_dir)
+    if shortages:
+        raise PullError("Not enough free space for the bundle: " + "; ".join(shortages))
+    missing = [digest for digest in layers if not has_blob(digest)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(missing) or 1))
+    log(f"Layers: {len(layers) - len(missing)} of {len(layers)} already in blob store")
+    if missing:
+        log(f"Verifying {format_size(missing_layer_bytes(layer_data))} with {workers} threads")
+
+    def import_one(digest: str) -> Optional[str]:
+        try:
+            import_bundle_blob(digest, layers[digest], options.lock_timeout)
+            return None
+        except (OSError, LockTimeout) as e:
+            return str(e)
+
+    with options.timer.phase("verify"), ThreadPoolExecutor(max_workers=workers) as executor:
+        errors = [e for e in executor.map(import_one, missing) if e]
+    if errors:
+        raise PullError(f"{len(errors)} of {len(missing)} layers could not be imported: " + "; ".join(errors))
+
+    make_room(index, options)
+    results = []
+    for item in images:
+        image, tag, inspect = item["image"], item["tag"], item["inspect"]
+        oci_image, digest = item["entry"]["image"], item["entry"]["digest"]
+        actual_tag = tag
+        if tag.lower() == "latest":
+            actual_tag = extract_version_from_inspect(inspect) or tag
+        store_cached_inspect(image, tag, options.platform, inspect, digest)
+        with storage_lock(index, f"image {normalize_image_ref(image, tag)}", options.lock_timeout):
+            if index.shared:
+                index.reload()
+            template_path = intact_archive(index, index.lookup_digest(image, digest))
+            if template_path:
+                log(f"OCI image already exists: {template_path}")
+                index.mark_used(template_path)
+            else:
+                layout = layout_dir(image)
+                ref = layout_ref_name(actual_tag)
+                with FileLock(f"layout {layout}", options.lock_timeout):
+                    os.makedirs(layout, mode=0o755, exist_ok=True)
+                    if not os.path.exists(os.path.join(layout, "oci-layout")):
+                        with open(os.path.join(layout, "oci-layout"), "wb") as f:
+                            f.write(OCI_LAYOUT_CONTENT)
+                    layout_index = read_layout_index(layout)
+                    layout_index["manifests"] = [
+                        d for d in layout_index.get("manifests") or []
+                        if (d.get("annotations") or {}).get(REF_NAME_ANNOTATION) != ref
+                    ] + [{**item["descriptor"], "annotations": {REF_NAME_ANNOTATION: ref}}]
+                    write_json_atomic(os.path.join(layout, "index.json"), layout_index)
+                    if options.squash:
+                        with options.timer.phase("squash", image=oci_image):
+                            ref = squash_image(layout, ref, options.squash_prune)
+                    with options.timer.phase("import", image=oci_image):
+                        template_path = import_to_proxmox(index, layout, ref, image, actual_tag, digest)
+                log(f"OCI image successfully imported: {template_path}")
+        with options.timer.phase("ostype", image=oci_image):
+            ostype = detect_ostype(inspect, image, timeout=options.pull_stall_timeout)
+        results.append({
+            "template_path": template_path,
+            "ostype": ostype,
+            "application_id": image.split("/")[-1],
+            "oci_image": oci_image,
+            "oci_image_tag": actual_tag,
+            "rootfs_clone_source": rootfs_clone_source(index, template_path),
+        })
+    return results
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Background processes on the VE host (see daemonize).
+
+Designed to be *prepended* (as "library") to cache-oci-rootfs.py, oci-cache-server.py
+and oci-update-prefetcher.py and executed via stdin, after oci_registry_lib.py and
+oci_store_lib.py, whose helpers it uses.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+daemonize detaches a script from the SSH session that started it (oci-cache-server.py,
+oci-update-prefetcher.py, the template build of cache-oci-rootfs.py); stop_daemon ends
+the daemon of a pid file.
+"""
+
+import os
+import signal
+import sys
+import time
+
+# Optional import for editor/type checking; at runtime oci_registry_lib.py and
+# oci_store_lib.py are prepended before this library.
+try:
+    from oci_registry_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+except Exception:
+    pass
+
+def daemonize(pid_file: str, log_file: str) -> bool:
+    """Detach from the SSH session (double fork, new session).
+
+    Returns False in the calling process once the daemon is started, and True in the
+    daemon, whose stdout/stderr go to log_file and whose pid is in pid_file. SIGTERM
+    raises SystemExit in the daemon, so its finally blocks run.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if os.fork():
+        os.wait()
+        return False
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    log_fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    null_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null_fd, 0)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    with open(pid_file, "w", encoding="utf-8") as f:
+        f.write(str(os.getpid()))
+
+    def terminate(_signum, _frame) -> None:
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    return True
+
+
+def stop_daemon(pid_file: str, timeout: float = 10.0) -> bool:
+    """Terminate the daemon of pid_file (SIGTERM, then SIGKILL); True if one was running."""
+    try:
+        with open(pid_file, "r", encoding="utf-8") as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return False
+    if not _pid_alive(pid):
+        return False
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    while _pid_alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if _pid_alive(pid):
+        os.kill(pid, signal.SIGKILL)
+    return True
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Clean-up of OCI image archives on the VE host (see collect_garbage).
+
+Designed to be *prepended* (as "library") to gc-oci-images.py, get-oci-image.py,
+import-oci-bundle.py, oci-update-prefetcher.py, plan-oci-image.py and
+prefetch-oci-images.py and executed via stdin, after deployer_common_lib.py,
+oci_registry_lib.py and oci_store_lib.py, whose helpers it uses.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+Archives that managed containers still reference are never removed (see
+referenced_archives); the others go least recently used first.
+"""
+
+import os
+import re
+import time
+from typing import List, Optional, Tuple
+
+# Optional import for editor/type checking; at runtime deployer_common_lib.py,
+# oci_registry_lib.py and oci_store_lib.py are prepended before this library.
+try:
+    from deployer_common_lib import *  # type: ignore
+    from oci_registry_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+except Exception:
+    pass
+
+DEFAULT_GC_MIN_AGE = 3600
+
+
+def split_image_ref(ref: str) -> Tuple[str, str]:
+    """Split image[:tag|@digest] (with or without docker:// or oci://) into (image, tag)."""
+    ref = re.sub(r"^[^:/]+://", "", ref.strip())
+    if "@" in ref:
+        image, tag = ref.split("@", 1)
+    elif ":" in ref.split("/")[-1]:
+        image, tag = ref.rsplit(":", 1)
+    else:
+        image, tag = ref, "latest"
+    return image, tag
+
+
+def referenced_archives(index: StorageIndex, lxc_dir: Optional[str] = None) -> set:
+    """Archive filenames in index that managed containers still reference.
+
+    A template marker names the archive exactly. Otherwise the container's OCI image
+    reference is mapped to its archive; for "latest" the resolved version is unknown,
+    so every archive of that repository counts as referenced.
+    """
+    referenced = set()
+    for container in managed_containers(lxc_dir):
+        if container["template"]:
+            referenced.add(container["template"].split("/")[-1])
+        if not container["oci_image"]:
+            continue
+        image, tag = split_image_ref(container["oci_image"])
+        referenced.add(archive_filename(image, tag))
+        if tag == "latest":
+            repo_prefix = normalize_image_ref(image, "")
+            base_prefix = image.split("/")[-1] + "_"
+            for filename, entry in index.entries.items():
+                if entry.get("image", "").startswith(repo_prefix) or (
+                        not entry.get("image") and filename.startswith(base_prefix)):
+                    referenced.add(filename)
+    return referenced
+
+
+def collect_garbage(index: StorageIndex, budget_bytes: int = 0, min_free_bytes: int = 0,
+                    min_age: int = DEFAULT_GC_MIN_AGE, dry_run: bool = False,
+                    lxc_dir: Optional[str] = None) -> dict:
+    """Evict least recently used archives until the cache fits the budget.
+
+    budget_bytes limits the total size of the archives, min_free_bytes asks for that
+    much free space on the storage (0 disables either). Archives referenced by a
+    managed container (of any node if the storage is shared), and archives used within
+    the last `min_age` seconds (a concurrent deployment may be about to create a
+    container from them), are never evicted. Only archives that a pull or import
+    recorded in the index are managed here: other .tar files in the storage (uploaded
+    by hand, pveam templates) neither count towards the budget nor get evicted.
+    Returns {"removed": [...], "freed_bytes", "total_bytes", "free_bytes"}.
+    """
+    index.refresh()
+    recorded = {name: e for name, e in index.entries.items() if e.get("image")}
+    protected = referenced_archives(index, lxc_dir)
+    if index.shared and lxc_dir is None:
+        # Containers on the other nodes are created from the same archives
+        try:
+            nodes = [entry.name for entry in os.scandir(PVE_NODES_DIR) if entry.is_dir()]
+        except OSError:
+            nodes = []
+        for node in nodes:
+            protected |= referenced_archives(index, os.path.join(PVE_NODES_DIR, node, "lxc"))
+    total = sum(int(e.get("size") or 0) for e in recorded.values())
+    try:
+        free = storage_free_bytes(index.storage_dir)
+    except OSError:
+        free = 0
+    removed: List[str] = []
+    freed = 0
+    now = time.time()
+    for filename in sorted(recorded, key=index.last_used):
+        over_budget = budget_bytes > 0 and total > budget_bytes
+        low_space = min_free_bytes > 0 and free < min_free_bytes
+        if not over_budget and not low_space:
+            break
+        if filename in protected or now - index.last_used(filename) < min_age:
+            continue
+        size = int(recorded[filename].get("size") or 0)
+        if not dry_run:
+            try:
+                index.remove(filename)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log(f"Warning: could not remove {filename}: {e}")
+                continue
+        log(f"{'Would evict' if dry_run else 'Evicted'} {filename} ({size} bytes)")
+        removed.append(filename)
+        total -= size
+        free += size
+        freed += size
+    return {"removed": removed, "freed_bytes": freed, "total_bytes": total, "free_bytes": free,
+            "protected": sorted(protected & set(recorded))}
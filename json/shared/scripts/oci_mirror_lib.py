@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Use of the cluster's pull-through OCI cache (oci-cache-server.py) on the VE host.
+
+Designed to be *prepended* (as "library") to get-oci-image.py, import-oci-bundle.py,
+oci-cache-server.py, oci-update-prefetcher.py, plan-oci-image.py and
+prefetch-oci-images.py and executed via stdin, after oci_registry_lib.py, whose helpers
+it uses.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+A running cache announces itself in /etc/pve/oci-lxc-deployer/oci-mirror.json (see
+configured_mirror); pulls then go through it (see mirror_source) if it answers (see
+mirror_reachable).
+"""
+
+import os
+import time
+import urllib.parse
+import urllib.request
+from typing import Dict, Optional
+
+# Optional import for editor/type checking; at runtime oci_registry_lib.py is prepended
+# before this library.
+try:
+    from oci_registry_lib import *  # type: ignore
+except Exception:
+    pass
+
+OCI_MIRROR_CONFIG = os.environ.get("LXC_MANAGER_OCI_MIRROR_CONFIG",
+                                   "/etc/pve/oci-lxc-deployer/oci-mirror.json")
+DEFAULT_MIRROR_PORT = 5050
+MIRROR_PROBE_TIMEOUT = 3
+# A running cache rewrites heartbeat_at of its announcement every MIRROR_HEARTBEAT
+# seconds. An older announcement is left over from a cache that is gone without
+# removing it (its node crashed or rebooted).
+MIRROR_HEARTBEAT = 60
+MIRROR_ANNOUNCEMENT_MAX_AGE = 300
+# Sent by the cache on /v2/ with the instance token of its announcement
+MIRROR_INSTANCE_HEADER = "Oci-Lxc-Deployer-Instance"
+_mirror_reachable: Dict[str, bool] = {}
+# Instance token each announced cache has to answer with (see mirror_reachable)
+_mirror_instances: Dict[str, str] = {}
+
+
+def normalize_mirror_url(value: str) -> str:
+    if "://" not in value:
+        value = "http://" + value
+    return value.rstrip("/")
+
+
+def configured_mirror(override: Optional[str] = None) -> Optional[str]:
+    """URL of the cluster's pull-through cache, or None.
+
+    `override` (template parameter oci_mirror) wins; "none" disables the cache.
+    Otherwise the cache announced by oci-cache-server.py in the cluster file system
+    (/etc/pve is shared by all nodes) is used. The announcement is not trusted as is:
+    it is ignored if its heartbeat is older than MIRROR_ANNOUNCEMENT_MAX_AGE, and
+    mirror_reachable checks that the server answers with the announced instance.
+    """
+    value = (override or "").strip()
+    if value.lower() in ("none", "off", "false"):
+        return None
+    if value:
+        return normalize_mirror_url(value)
+    announcement = read_json(OCI_MIRROR_CONFIG) or {}
+    value = (announcement.get("url") or "").strip()
+    if not value:
+        return None
+    age = time.time() - (announcement.get("heartbeat_at") or announcement.get("started_at") or 0)
+    if age > MIRROR_ANNOUNCEMENT_MAX_AGE:
+        log(f"Ignoring the OCI cache announced by {announcement.get('node') or 'a node'}: "
+            f"not refreshed for {int(age)}s")
+        return None
+    mirror = normalize_mirror_url(value)
+    _mirror_instances[mirror] = str(announcement.get("instance") or "")
+    return mirror
+
+
+def mirror_netloc(mirror: str) -> str:
+    return urllib.parse.urlsplit(mirror).netloc
+
+
+def mirror_reachable(mirror: str) -> bool:
+    """Whether the cache answers /v2/ (checked once per run, with a short timeout).
+
+    An announced cache must also answer with the instance token of its announcement;
+    another server now listening at that address (or an announcement without a token)
+    is not used.
+    """
+    if mirror not in _mirror_reachable:
+        try:
+            with urllib.request.urlopen(f"{mirror}/v2/", timeout=MIRROR_PROBE_TIMEOUT) as resp:
+                expected = _mirror_instances.get(mirror)
+                if expected is not None and (not expected or resp.headers.get(MIRROR_INSTANCE_HEADER) != expected):
+                    log(f"OCI cache {mirror} is not the announced instance, pulling from the registries directly")
+                    _mirror_reachable[mirror] = False
+                else:
+                    _mirror_reachable[mirror] = resp.status == 200
+        except (OSError, ValueError) as e:
+            log(f"OCI cache {mirror} not reachable ({e}), pulling from the registries directly")
+            _mirror_reachable[mirror] = False
+    return _mirror_reachable[mirror]
+
+
+def mirror_source(image: str, mirror: Optional[str]) -> Optional[str]:
+    """Image name under which the cache serves image, or None if no cache is usable.
+
+    The cache proxies every registry under its own name, e.g. ghcr.io/owner/app is
+    pulled as <cache>/ghcr.io/owner/app and alpine as <cache>/docker.io/library/alpine.
+    Manifests pass through byte for byte, so digests are the same as upstream.
+    """
+    if not mirror or not mirror_reachable(mirror):
+        return None
+    netloc = mirror_netloc(mirror)
+    registry, repository = split_image_name(image)
+    if registry == netloc:
+        return None
+    if mirror.startswith("http://"):
+        PLAIN_HTTP_REGISTRIES.add(netloc)
+    return f"{netloc}/{registry}/{repository}"
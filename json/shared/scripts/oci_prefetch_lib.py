@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Pulls of several OCI images ahead of their installation on the VE host.
+
+Designed to be *prepended* (as "library") to oci-update-prefetcher.py and
+prefetch-oci-images.py and executed via stdin, after oci_registry_lib.py,
+oci_store_lib.py and oci_pull_lib.py, whose helpers it uses.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+prefetch_images pulls a list of images with per-registry concurrency limits,
+prefetch_updates pulls new versions of the images of the managed containers.
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Optional import for editor/type checking; at runtime oci_registry_lib.py,
+# oci_store_lib.py and oci_pull_lib.py are prepended before this library.
+try:
+    from oci_registry_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+    from oci_pull_lib import *  # type: ignore
+except Exception:
+    pass
+
+def parse_registry_limits(spec: Optional[str], default: int = 2) -> Tuple[Dict[str, int], int]:
+    """Parse per-registry concurrency limits.
+
+    Accepts a plain number ("3", the limit for every registry) or a comma separated
+    list like "ghcr.io=4,docker.io=2,default=1". Returns (limits, default limit).
+    """
+    limits: Dict[str, int] = {}
+    for item in re.split(r"[,\s]+", (spec or "").strip()):
+        if not item:
+            continue
+        name, sep, value = item.partition("=")
+        if not sep:
+            name, value = "default", name
+        if not value.strip().isdigit() or int(value) < 1:
+            log(f"Warning: ignoring invalid registry limit '{item}'")
+            continue
+        if name.strip() == "default":
+            default = int(value)
+        else:
+            limits[name.strip()] = int(value)
+    return limits, default
+
+
+def prefetch_images(oci_images: list, index: StorageIndex, options: PullOptions,
+                    registry_concurrency: Optional[str]) -> list:
+    """
+    Pull several images concurrently and return one result record per image.
+
+    Each registry gets its own limit of parallel pulls (registry_concurrency), all
+    layer downloads share the bandwidth limit of options.
+    Failed images get an "error" field instead of aborting the batch.
+    """
+    limits, default_limit = parse_registry_limits(registry_concurrency)
+    semaphores = {}
+
+    def registry_of(oci_image: str) -> str:
+        image, _tag = split_image_tag(parse_image_ref(oci_image))
+        return split_image_name(image)[0]
+
+    for oci_image in oci_images:
+        registry = registry_of(oci_image)
+        if registry not in semaphores:
+            semaphores[registry] = threading.Semaphore(limits.get(registry, default_limit))
+
+    def pull_one(oci_image: str) -> dict:
+        with semaphores[registry_of(oci_image)]:
+            try:
+                return pull_image(oci_image, index, None, options)
+            except Exception as e:
+                log(f"Error: {oci_image}: {e}")
+                return {"oci_image": oci_image, "error": str(e)}
+
+    workers = sum(limits.get(r, default_limit) for r in semaphores) or 1
+    with ThreadPoolExecutor(max_workers=min(workers, len(oci_images))) as executor:
+        return list(executor.map(pull_one, oci_images))
+
+
+def prefetch_updates(containers: List[dict], index: StorageIndex, options: PullOptions,
+                     deadline: Optional[float] = None) -> list:
+    """
+    Pre-download new versions of the images that managed containers run.
+
+    Every image reference (see managed_containers) is checked once with plan_pull.
+    With options.inspect_cache_ttl = 0, an unchanged image costs one manifest HEAD
+    request (see inspect_image). If the storage has no archive of the current digest,
+    the image is pulled; pulls run one after another under the bandwidth limit of
+    options, so the later upgrade is a cache hit. After `deadline` (time.time()) no
+    new pull is started, the remaining updates are reported as "deferred".
+
+    Returns one record per image: {"oci_image", "vm_ids", "versions" (of the
+    containers), "status" (up_to_date, prefetched, deferred or failed), "version"}
+    plus "template_path" or "error".
+    """
+    images: Dict[str, dict] = {}
+    for container in containers:
+        if not container.get("oci_image"):
+            continue
+        record = images.setdefault(container["oci_image"], {
+            "oci_image": container["oci_image"], "vm_ids": [], "versions": []})
+        record["vm_ids"].append(container["vm_id"])
+        if container.get("version") and container["version"] not in record["versions"]:
+            record["versions"].append(container["version"])
+
+    for oci_image, record in images.items():
+        try:
+            plan = plan_pull(oci_image, index, options)
+            record["version"] = plan.get("version")
+            if plan["cached"]:
+                record.update({"status": "up_to_date", "template_path": plan["template_path"]})
+                continue
+            if deadline is not None and time.time() >= deadline:
+                log(f"{oci_image}: version {plan.get('version')} available, deferred to the next window")
+                record["status"] = "deferred"
+                continue
+            log(f"{oci_image}: prefetching version {plan.get('version')} "
+                f"({format_size(plan['bytes_to_download'])} to download)")
+            result = pull_image(oci_image, index, None, options)
+            record.update({"status": "prefetched", "version": result["oci_image_tag"],
+                           "template_path": result["template_path"]})
+        except Exception as e:
+            log(f"Error: {oci_image}: {e}")
+            record.update({"status": "failed", "error": str(e)})
+    return list(images.values())
+
+
+def parse_image_list(value: str) -> list:
+    """Split a list of image references (one per line, or separated by commas/spaces)."""
+    images = []
+    for item in re.split(r'[\s,]+', value or ''):
+        item = item.strip()
+        if item and item not in images:
+            images.append(item)
+    return images
@@ -0,0 +1,1136 @@
+#!/usr/bin/env python3
+"""Pull of OCI images into the vztmpl cache of a storage on the VE host.
+
+Designed to be *prepended* (as "library") to get-oci-image.py, import-oci-bundle.py,
+oci-update-prefetcher.py, plan-oci-image.py and prefetch-oci-images.py and executed via
+stdin, after deployer_common_lib.py, oci_registry_lib.py, oci_store_lib.py,
+oci_squash_lib.py, oci_mirror_lib.py, oci_gc_lib.py and oci_rootfs_lib.py, whose helpers
+it uses.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+pull_image downloads an image into the blob store (from a sibling node that has the
+archive, the cluster's pull-through cache or the registry), writes the oci-archive
+and records it in the StorageIndex; plan_pull tells beforehand what a pull would do.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Optional import for editor/type checking; at runtime deployer_common_lib.py,
+# oci_registry_lib.py, oci_store_lib.py, oci_squash_lib.py, oci_mirror_lib.py,
+# oci_gc_lib.py and oci_rootfs_lib.py are prepended before this library.
+try:
+    from deployer_common_lib import *  # type: ignore
+    from oci_registry_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+    from oci_squash_lib import *  # type: ignore
+    from oci_mirror_lib import *  # type: ignore
+    from oci_gc_lib import *  # type: ignore
+    from oci_rootfs_lib import *  # type: ignore
+except Exception:
+    pass
+
+def _die_with_parent() -> None:
+    """preexec_fn: let the kernel terminate the child when this script dies.
+
+    Otherwise a skopeo started by a killed script (SSH drop, timeout) keeps
+    downloading next to the retry, which no longer sees it in the download lock.
+    SIGKILL, since a skopeo stopped by the rate limit (see run_with_progress) would
+    keep a SIGTERM pending and stay behind stopped.
+    """
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6", use_errno=True).prctl(1, signal.SIGKILL)  # PR_SET_PDEATHSIG
+    except Exception:
+        pass
+
+
+def run_with_progress(cmd: List[str], progress: PullProgress, image: str,
+                      stall_timeout: int = DEFAULT_STALL_TIMEOUT,
+                      env: Optional[dict] = None,
+                      limiter: Optional["BandwidthLimiter"] = None) -> Tuple[int, str]:
+    """Run skopeo copy, streaming its stderr and emitting `pull_progress` events.
+
+    There is no wall-clock limit; the process is killed only when no bytes arrived for
+    `stall_timeout` seconds. Returns (returncode, last stderr lines).
+
+    skopeo has no rate limit of its own: with a `limiter`, the bytes that arrived since
+    the last sample are charged to it, and skopeo is stopped (SIGSTOP) while the
+    limiter makes up for them. Samples are taken more often then, to keep the bursts
+    between two pauses short. This only applies to what skopeo downloads itself: the
+    layers are fetched rate-limited without skopeo first (fetch_missing_layers).
+    If the script is interrupted, skopeo is continued and killed, never left stopped.
+    """
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=sys.stderr, stderr=subprocess.PIPE,
+                            text=True, bufsize=1, env=env, preexec_fn=_die_with_parent)
+    tail: List[str] = []
+
+    def read_stderr() -> None:
+        for line in proc.stderr:
+            line = line.rstrip()
+            if not line:
+                continue
+            progress.on_line(line)
+            log(f"skopeo: {line}")
+            tail.append(line)
+            del tail[:-20]
+
+    reader = threading.Thread(target=read_stderr, daemon=True)
+    reader.start()
+    stalled = False
+    shaped = limiter is not None and (limiter.rate > 0 or bool(limiter.host and limiter.host.rate()))
+    charged = 0
+    last_event = 0.0
+    try:
+        while True:
+            try:
+                proc.wait(timeout=SHAPING_INTERVAL if shaped else PROGRESS_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            sample = progress.sample()
+            if time.monotonic() - last_event >= PROGRESS_INTERVAL:
+                emit_event("pull_progress", image=image, **sample)
+                last_event = time.monotonic()
+            if shaped and progress.bytes_done > charged:
+                paused = time.monotonic()
+                proc.send_signal(signal.SIGSTOP)
+                try:
+                    limiter.consume(progress.bytes_done - charged)
+                finally:
+                    proc.send_signal(signal.SIGCONT)
+                charged = progress.bytes_done
+                if time.monotonic() - paused > 1.0:
+                    # Time spent paused is no stall
+                    progress.last_change = time.monotonic()
+            if progress.stalled_for() > stall_timeout:
+                stalled = True
+                log(f"No download progress for {stall_timeout} seconds, aborting skopeo")
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                    proc.wait()
+                break
+    finally:
+        if proc.poll() is None:
+            # Interrupted (e.g. SystemExit from SIGTERM): a stopped skopeo ignores
+            # SIGTERM until continued, so continue it and kill it
+            proc.send_signal(signal.SIGCONT)
+            proc.kill()
+            proc.wait()
+    reader.join(timeout=5)
+    if proc.returncode == 0:
+        emit_event("pull_progress", image=image, **progress.sample())
+        if shaped and progress.bytes_done > charged:
+            # The bytes since the last sample, so the next download waits for them
+            limiter.consume(progress.bytes_done - charged)
+    if stalled:
+        tail.append(f"stalled: no progress for {stall_timeout} seconds")
+    return proc.returncode, "\n".join(tail)
+
+
+PEER_PROBE_TIMEOUT = 15
+# A plan only names a peer if it answers quickly (see plan_pull)
+PLAN_PEER_PROBE_TIMEOUT = 3
+
+# Run on a peer (python3 -c): print the archive of `image` with manifest `digest`
+# from the peer's storage index as {"filename", "size"}, or nothing.
+PEER_LOOKUP_CODE = """
+import json, os, sys
+index_path, storage_dir, image, digest = sys.argv[1:5]
+try:
+    with open(index_path) as f:
+        entries = json.load(f).get("entries") or {}
+except Exception:
+    entries = {}
+for name, entry in entries.items():
+    if entry.get("digest") != digest or not (entry.get("image") or "").startswith(image):
+        continue
+    try:
+        size = os.path.getsize(os.path.join(storage_dir, name))
+    except OSError:
+        continue
+    if size == entry.get("size"):
+        print(json.dumps({"filename": name, "size": size}))
+        break
+"""
+
+
+def peer_command(address: str, args: List[str], connect_timeout: int = 5) -> List[str]:
+    """ssh command running args on a peer, using the cluster's root SSH trust."""
+    remote = " ".join(shlex.quote(arg) for arg in args)
+    return [tool_path("ssh") or "ssh", "-T", "-o", "BatchMode=yes", "-o", f"ConnectTimeout={connect_timeout}",
+            f"root@{address}", remote]
+
+
+def find_peer_archive(index: StorageIndex, image: str, digest: str,
+                      timeout: int = PEER_PROBE_TIMEOUT) -> Optional[Tuple[str, str, dict]]:
+    """(node, address, {"filename", "size"}) of a peer that has an archive of image@digest.
+
+    All peers are asked in parallel, each for at most `timeout` seconds; the storage
+    (and thus its path) is the same on all nodes, so each peer looks into its own
+    index of that directory.
+    """
+    peers = cluster_peers()
+    if not peers:
+        return None
+    args = ["python3", "-c", PEER_LOOKUP_CODE, index.path, index.storage_dir,
+            normalize_image_ref(image, ""), digest]
+
+    def probe(peer: Tuple[str, str]) -> Optional[dict]:
+        try:
+            result = subprocess.run(peer_command(peer[1], args, min(5, timeout)), capture_output=True,
+                                    text=True, timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        try:
+            found = json.loads(result.stdout) if result.returncode == 0 and result.stdout.strip() else None
+        except ValueError:
+            return None
+        return found if isinstance(found, dict) and found.get("filename") else None
+
+    with ThreadPoolExecutor(max_workers=min(8, len(peers))) as pool:
+        for peer, found in zip(peers, pool.map(probe, peers)):
+            if found:
+                return peer[0], peer[1], found
+    return None
+
+
+class _TeeReader:
+    """File-like reader that copies everything read into a file descriptor."""
+
+    def __init__(self, src, out_fd: int) -> None:
+        self.src = src
+        self.out_fd = out_fd
+        self.size = 0
+
+    def read(self, n: int = -1) -> bytes:
+        data = self.src.read(n)
+        if data:
+            os.write(self.out_fd, data)
+            self.size += len(data)
+        return data
+
+
+def copy_archive_from_peer(index: StorageIndex, address: str, remote_name: str, size: int,
+                           filename: str) -> int:
+    """Stream a peer's archive into the storage as `filename`, verifying its content.
+
+    While the bytes are written to a hidden temp file, the tar stream is parsed and
+    every blob is hashed and compared with its sha256 name, and the index.json must
+    reference a manifest contained in the archive (verify_archive_stream). Only a
+    complete, verified archive is renamed into place, with a verification sidecar.
+    Returns the number of bytes copied.
+    """
+    os.makedirs(index.storage_dir, mode=0o755, exist_ok=True)
+    remove_stale_partials(index.storage_dir, filename)
+    tmp_path = os.path.join(index.storage_dir, f".{filename}.partial-{os.getpid()}")
+    cmd = peer_command(address, ["cat", os.path.join(index.storage_dir, remote_name)])
+    out_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                preexec_fn=_die_with_parent)
+        try:
+            reader = _TeeReader(proc.stdout, out_fd)
+            manifest_digest = verify_archive_stream(reader)
+        finally:
+            proc.stdout.close()
+            stderr = proc.stderr.read().decode("utf-8", "replace").strip()
+            returncode = proc.wait()
+        if returncode != 0:
+            raise IOError(f"ssh {address} exited with {returncode}: {stderr[-500:]}")
+        if reader.size != size:
+            raise IOError(f"Got {reader.size} of {size} bytes")
+        os.fsync(out_fd)
+        os.close(out_fd)
+        out_fd = -1
+        os.replace(tmp_path, os.path.join(index.storage_dir, filename))
+    except BaseException:
+        if out_fd >= 0:
+            os.close(out_fd)
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    write_verified_sidecar(index.storage_dir, filename, manifest_digest)
+    return reader.size
+
+
+def fetch_from_peer(index: StorageIndex, image: str, tag: str, digest: Optional[str]) -> Optional[str]:
+    """Copy the archive of image@digest from a sibling node instead of pulling it.
+
+    Returns the template path, or None if no peer has it or the copy failed (the
+    caller then pulls from the registry).
+    """
+    if not digest or index.shared:
+        # On a shared storage the peers' archives are already in this index
+        return None
+    found = find_peer_archive(index, image, digest)
+    if not found:
+        return None
+    node, address, archive = found
+    filename = archive_filename(image, tag)
+    try:
+        free = storage_free_bytes(_existing_ancestor(index.storage_dir))
+    except OSError:
+        free = None
+    if free is not None and archive["size"] + SPACE_MARGIN_BYTES > free:
+        log(f"Node {node} has {archive['filename']}, but {index.storage_dir} has only {format_size(free)} free")
+        return None
+    log(f"Copying {archive['filename']} ({format_size(archive['size'])}) from node {node}")
+    started = time.monotonic()
+    try:
+        copy_archive_from_peer(index, address, archive["filename"], archive["size"], filename)
+    except (OSError, tarfile.TarError, ValueError) as e:
+        log(f"Warning: Copy from node {node} failed ({e}), pulling from the registry")
+        return None
+    seconds = max(time.monotonic() - started, 0.001)
+    log(f"Copied and verified {filename} from node {node} in {seconds:.1f} s "
+        f"({format_size(int(archive['size'] / seconds))}/s)")
+    index.record(image, tag, digest)
+    return index.volume_id(filename)
+
+
+class PullError(Exception):
+    """A single image could not be pulled (fatal in single mode, recorded in batch mode)."""
+
+
+def check_skopeo() -> bool:
+    """Check if skopeo is available (host capability cache, no process spawn)."""
+    return tool_path('skopeo') is not None
+
+
+def extract_version_from_inspect(inspect_output: dict) -> str:
+    """
+    Extract version tag from skopeo inspect output.
+
+    Tries to find version in Labels:
+    - org.opencontainers.image.version
+    - io.hass.version
+    - org.opencontainers.image.revision
+    - version
+
+    Returns the extracted version, or None if not found.
+    """
+    try:
+        labels = inspect_output.get('Labels', {})
+        if not labels:
+            return None
+
+        # Try common version label fields (in order of preference)
+        version_fields = [
+            'org.opencontainers.image.version',
+            'io.hass.version',
+            'org.opencontainers.image.revision',
+            'version',
+        ]
+
+        for field in version_fields:
+            if field in labels:
+                version = labels[field]
+                if version and version.strip():
+                    # Clean up version tag (remove leading 'v' if present)
+                    version = version.strip()
+                    if version.lower().startswith('v') and len(version) > 1:
+                        version = version[1:]
+                    return version
+
+        return None
+    except Exception:
+        return None
+
+
+def detect_ostype_from_inspect(inspect_output: dict) -> str:
+    """
+    Detect operating system type from skopeo inspect output.
+
+    Returns ostype compatible with Proxmox (alpine, debian, ubuntu, fedora, centos).
+    """
+    try:
+        # Check architecture
+        arch = inspect_output.get('Architecture', 'amd64')
+
+        # Try to detect from labels
+        labels = inspect_output.get('Labels', {})
+        if labels:
+            # Check common label fields
+            os_name = labels.get('org.opencontainers.image.title', '').lower()
+            description = labels.get('org.opencontainers.image.description', '').lower()
+            combined = f"{os_name} {description}"
+
+            # Check for known distributions
+            if 'alpine' in combined or 'alpine' in labels.get('io.hass.base.name', '').lower():
+                return 'alpine'
+            elif 'debian' in combined:
+                return 'debian'
+            elif 'ubuntu' in combined:
+                return 'ubuntu'
+            elif 'fedora' in combined:
+                return 'fedora'
+            elif 'centos' in combined or 'rocky' in combined:
+                return 'centos'
+
+        # Check base image name
+        base_name = inspect_output.get('Labels', {}).get('io.hass.base.name', '').lower()
+        if 'alpine' in base_name:
+            return 'alpine'
+        elif 'debian' in base_name:
+            return 'debian'
+        elif 'ubuntu' in base_name:
+            return 'ubuntu'
+
+        # Default to alpine (most common for container images)
+        return 'alpine'
+    except Exception:
+        return 'alpine'
+
+
+# os-release ID (or ID_LIKE) to Proxmox ostype
+OS_RELEASE_OSTYPES = {
+    "alpine": "alpine", "debian": "debian", "ubuntu": "ubuntu", "devuan": "devuan",
+    "fedora": "fedora", "centos": "centos", "rhel": "centos", "rocky": "centos",
+    "almalinux": "centos", "ol": "centos", "opensuse": "opensuse", "suse": "opensuse",
+    "sles": "opensuse", "arch": "archlinux", "gentoo": "gentoo", "nixos": "nixos",
+}
+OS_RELEASE_PATHS = ("etc/os-release", "usr/lib/os-release")
+OS_RELEASE_MAX_BYTES = 64 * 1024
+# Layers not in the blob store that read_os_release may download, and their bytes
+OS_RELEASE_MAX_STREAMED_LAYERS = 3
+OS_RELEASE_MAX_STREAMED_BYTES = 64 * 1024 * 1024
+
+
+def ostype_cache_path(inspect_output: dict) -> Optional[str]:
+    """Cache file of the ostype of an image config (None if the digest is unknown).
+
+    Old inspect results (and skopeo's) have no ConfigDigest; the manifest digest plus
+    architecture identifies the config as well.
+    """
+    key = inspect_output.get("ConfigDigest")
+    if not key and inspect_output.get("Digest"):
+        key = f"{inspect_output['Digest']}|{inspect_output.get('Architecture')}"
+    if not key:
+        return None
+    return os.path.join(OCI_CACHE_DIR, "ostype", hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+
+def parse_os_release(text: str) -> Dict[str, str]:
+    fields = {}
+    for line in text.splitlines():
+        key, sep, value = line.strip().partition("=")
+        if sep and key and not key.startswith("#"):
+            fields[key] = value.strip().strip("\"'")
+    return fields
+
+
+def ostype_from_os_release(text: str) -> Optional[str]:
+    """Proxmox ostype for an os-release file: its ID, else the first known ID_LIKE."""
+    fields = parse_os_release(text)
+    for os_id in [fields.get("ID", "")] + fields.get("ID_LIKE", "").split():
+        os_id = os_id.lower()
+        if os_id in OS_RELEASE_OSTYPES:
+            return OS_RELEASE_OSTYPES[os_id]
+        if os_id.startswith("opensuse"):
+            return "opensuse"
+    return None
+
+
+class StreamLimit(Exception):
+    pass
+
+
+class _CappedReader:
+    """File-like object that raises StreamLimit once more than `budget[0]` bytes were read."""
+
+    def __init__(self, source, budget: List[int]) -> None:
+        self.source = source
+        self.budget = budget
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.source.read(size)
+        self.budget[0] -= len(data)
+        if self.budget[0] < 0:
+            raise StreamLimit(f"os-release not found in the first {OS_RELEASE_MAX_STREAMED_BYTES} "
+                              "downloaded bytes")
+        return data
+
+
+def read_os_release(image: str, layers: List[dict], username: Optional[str] = None,
+                    password: Optional[str] = None, timeout: int = DEFAULT_STALL_TIMEOUT) -> Optional[str]:
+    """/etc/os-release of an image, read from its layers without pulling the image.
+
+    Layers are searched from the top down, since the topmost copy of the file wins.
+    Layers in the blob store are read from there; the others are decompressed while
+    they stream in from the registry, and the download stops as soon as the file is
+    found. A symlink (Debian: ../usr/lib/os-release) is followed into the same or a
+    lower layer. Returns None if no layer has the file. Raises OSError, tarfile.TarError
+    (e.g. zstd layers, which tarfile cannot read) if a layer cannot be read, and
+    StreamLimit before more than OS_RELEASE_MAX_STREAMED_LAYERS layers or
+    OS_RELEASE_MAX_STREAMED_BYTES would be downloaded (a large base layer deep down).
+    """
+    wanted = OS_RELEASE_PATHS[0]
+    streamed, budget = 0, [OS_RELEASE_MAX_STREAMED_BYTES]
+    for layer in reversed(layers):
+        digest = layer.get("Digest")
+        if not digest:
+            continue
+        seen: Dict[str, str] = {}
+        if has_blob(digest):
+            source = reader = open(blob_path(digest), "rb")
+        else:
+            streamed += 1
+            if streamed > OS_RELEASE_MAX_STREAMED_LAYERS:
+                raise StreamLimit(f"os-release not found in the top {OS_RELEASE_MAX_STREAMED_LAYERS} "
+                                  "downloaded layers")
+            source = open_blob_stream(image, digest, username, password, timeout)
+            reader = _CappedReader(source, budget)
+        with source, tarfile.open(fileobj=reader, mode="r|*") as tar:
+            for member in tar:
+                name = _layer_path(member.name)
+                if name != wanted and name not in OS_RELEASE_PATHS:
+                    continue
+                if member.issym():
+                    target = os.path.join(os.path.dirname(name), member.linkname)
+                    seen[name] = "->" + _layer_path(target)
+                elif member.islnk():
+                    seen[name] = "->" + _layer_path(member.linkname)
+                elif member.isfile():
+                    seen[name] = tar.extractfile(member).read(OS_RELEASE_MAX_BYTES).decode("utf-8", "replace")
+                for _hop in range(8):
+                    if wanted not in seen or not seen[wanted].startswith("->"):
+                        break
+                    wanted = seen[wanted][2:]
+                if wanted in seen and not seen[wanted].startswith("->"):
+                    return seen[wanted]
+    return None
+
+
+def detect_ostype(inspect_output: dict, image: str, username: Optional[str] = None,
+                  password: Optional[str] = None, timeout: int = DEFAULT_STALL_TIMEOUT,
+                  source: Optional[str] = None) -> str:
+    """
+    Proxmox ostype of an image, from its /etc/os-release (see read_os_release).
+
+    The result is cached by image config digest, so repeated lookups (other tags, cache
+    hits, other storages) cost nothing. Through the OCI cache first if `source` (see
+    mirror_source) is given. If the layers cannot be read, the file is deeper than
+    read_os_release streams, or the image has no os-release (scratch, distroless
+    static), the labels are used as before (detect_ostype_from_inspect); only the last
+    case is cached, the others are read again once the layers are in the blob store.
+    """
+    cache_path = ostype_cache_path(inspect_output)
+    cached = read_json(cache_path) if cache_path else None
+    if cached and cached.get("ostype"):
+        return cached["ostype"]
+    layers = [layer for layer in inspect_output.get('LayersData') or [] if layer.get('Digest')]
+    for name in ([source] if source else []) + [image]:
+        try:
+            text = read_os_release(name, layers, username, password, timeout)
+            break
+        except StreamLimit as e:
+            log(f"{e}, using the image labels")
+            return detect_ostype_from_inspect(inspect_output)
+        except (OSError, tarfile.TarError, ValueError, EOFError) as e:
+            log(f"Warning: could not read /etc/os-release from {split_image_name(name)[0]} ({e})")
+    else:
+        return detect_ostype_from_inspect(inspect_output)
+    ostype = (ostype_from_os_release(text) if text else None) or detect_ostype_from_inspect(inspect_output)
+    if text:
+        fields = parse_os_release(text)
+        log(f"/etc/os-release: {fields.get('PRETTY_NAME') or fields.get('ID')} (ostype {ostype})")
+    if cache_path:
+        try:
+            write_json_atomic(cache_path, {"ostype": ostype, "os_release": text})
+        except OSError as e:
+            log(f"Warning: could not write ostype cache: {e}")
+    return ostype
+
+
+def skopeo_auth_args(image_ref: str, username: Optional[str], password: Optional[str],
+                     token_option: str = '--registry-token', creds_option: str = '--creds') -> list:
+    """
+    Authentication arguments for skopeo.
+
+    A token from the host token cache saves skopeo the 401/token round trips;
+    otherwise the credentials are passed (if any).
+    """
+    token = cached_bearer_token(split_image_tag(image_ref)[0], username, password)
+    if token:
+        return [token_option, token]
+    if username and password:
+        return [creds_option, f'{username}:{password}']
+    if username:
+        # Password might be empty, use credentials anyway
+        return [creds_option, f'{username}']
+    return []
+
+
+def skopeo_inspect(image_ref: str, username: Optional[str] = None, password: Optional[str] = None,
+                   platform: Optional[str] = None) -> dict:
+    """Inspect image using skopeo and return JSON output."""
+    cmd = ['skopeo', 'inspect', '--format', '{{json .}}']
+    cmd.extend(skopeo_platform_args(platform))
+    cmd.extend(skopeo_auth_args(image_ref, username, password))
+    cmd.append(image_ref)
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300, check=True)
+        return json.loads(result.stdout)
+    except subprocess.TimeoutExpired:
+        raise PullError(f"Timeout inspecting image {image_ref}")
+    except subprocess.CalledProcessError as e:
+        raise PullError(f"Failed to inspect image {image_ref}: {e.stderr}")
+    except json.JSONDecodeError as e:
+        raise PullError(f"Failed to parse inspect output: {e}")
+
+
+def skopeo_manifest_digest(image_ref: str, username: Optional[str] = None,
+                           password: Optional[str] = None) -> Optional[str]:
+    """
+    Return the digest of the raw (top-level) manifest.
+
+    This only fetches the manifest, not the image config, so it is the cheapest way
+    to check whether a tag still points to the same image. Returns None on failure.
+    """
+    cmd = ['skopeo', 'inspect', '--raw']
+    cmd.extend(skopeo_auth_args(image_ref, username, password))
+    cmd.append(image_ref)
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=60, check=True)
+        return sha256_digest(result.stdout)
+    except (subprocess.TimeoutExpired, subprocess.CalledProcessError):
+        return None
+
+
+def registry_inspect(image: str, tag: str, username: Optional[str], password: Optional[str],
+                     platform: Optional[str], entry: Optional[dict]) -> Tuple[dict, Optional[str]]:
+    """
+    Inspect image with the native registry client (see RegistryClient).
+
+    A manifest HEAD on a warm connection revalidates a cached entry; only if the
+    digest changed are the manifest and config fetched. Returns (inspect, digest).
+    """
+    registry, repository = split_image_name(image)
+    with RegistryClient(registry, username, password) as client:
+        manifest_digest = client.head_manifest(repository, tag)
+        if manifest_digest is None:
+            raise PullError(f"Image {image}:{tag} not found")
+        if entry and entry.get('manifest_digest') == manifest_digest:
+            return entry['inspect'], manifest_digest
+        return client.inspect(image, tag, platform), manifest_digest
+
+
+def inspect_image(image_ref: str, image: str, tag: str, username: Optional[str],
+                  password: Optional[str], platform: Optional[str], ttl: int,
+                  source: Optional[str] = None) -> dict:
+    """
+    Inspect image, using the on-host inspect cache.
+
+    - Fresh entry (younger than ttl, or digest reference): no registry access at all
+    - Stale entry: revalidate with a manifest digest check, full inspect only if it changed;
+      used as it is if the registry is not reachable
+    - No entry: full inspect
+
+    Registry access goes through the native client, via the cluster's OCI cache if
+    `source` (see mirror_source) is given; skopeo is only used if that fails
+    (e.g. a registry with an unsupported auth scheme).
+    """
+    entry = load_cached_inspect(image, tag, platform)
+    if entry and inspect_cache_is_fresh(entry, tag, ttl):
+        log("Using cached inspect result")
+        return entry['inspect']
+
+    try:
+        inspect_output = None
+        if source:
+            try:
+                inspect_output, manifest_digest = registry_inspect(source, tag, username, password,
+                                                                   platform, entry)
+                if not (entry and inspect_output is entry['inspect']):
+                    inspect_output["Name"] = "/".join(split_image_name(image))
+            except (RegistryError, PullError, OSError, ValueError) as e:
+                log(f"Inspect via OCI cache failed ({e}), asking the registry")
+                inspect_output = None
+        if inspect_output is None:
+            inspect_output, manifest_digest = registry_inspect(image, tag, username, password, platform, entry)
+    except (RegistryError, OSError, ValueError) as e:
+        if entry and isinstance(e, OSError):
+            # Registry not reachable (URLError is an OSError), like ManifestCache.get in
+            # oci-cache-server.py: serve the stale entry instead of failing the deployment
+            log(f"Registry of {image} not reachable ({e}), using stale cached inspect result")
+            return entry['inspect']
+        log(f"Native registry inspect failed ({e}), falling back to skopeo")
+        manifest_digest = skopeo_manifest_digest(image_ref, username, password)
+        if entry and manifest_digest and entry.get('manifest_digest') == manifest_digest:
+            inspect_output = entry['inspect']
+        else:
+            inspect_output = skopeo_inspect(image_ref, username, password, platform)
+
+    if entry and inspect_output is entry['inspect']:
+        log(f"Cached inspect result revalidated ({manifest_digest})")
+        touch_cached_inspect(image, tag, platform, entry)
+    else:
+        store_cached_inspect(image, tag, platform, inspect_output, manifest_digest)
+    return inspect_output
+
+
+def skopeo_copy(image_ref: str, layout: str, ref: str, username: Optional[str] = None,
+                password: Optional[str] = None, platform: Optional[str] = None,
+                layers: Optional[list] = None, stall_timeout: int = DEFAULT_STALL_TIMEOUT,
+                tls_verify: bool = True, limiter: Optional[BandwidthLimiter] = None) -> None:
+    """
+    Copy image using skopeo into an OCI image layout backed by the shared blob store.
+
+    The destination is 'oci:<layout>:<ref>' with --dest-shared-blob-dir, so all blobs
+    (manifest, config, layers) end up in the content-addressed store. Blobs that are
+    already present are not downloaded again.
+
+    skopeo's stderr is streamed line by line and progress is reported as JSON
+    "pull_progress" events on stderr. The copy is aborted only if it stalls.
+
+    Args:
+        image_ref: Source image reference (docker://image:tag)
+        layout: OCI layout directory of the repository
+        ref: Ref name inside the layout (usually the version tag)
+        username: Registry username (optional)
+        password: Registry password (optional)
+        platform: Target platform (e.g., linux/amd64) (optional)
+        layers: LayersData from skopeo inspect (sizes for progress reporting)
+        stall_timeout: Seconds without any downloaded byte before skopeo is killed
+        tls_verify: False for a plain HTTP source (the cluster's OCI cache)
+        limiter: Bandwidth limit for the layers skopeo downloads itself
+    """
+    cmd = ['skopeo', 'copy']
+    cmd.extend(skopeo_platform_args(platform))
+    if not tls_verify:
+        cmd.append('--src-tls-verify=false')
+
+    # Add authentication if provided (cached token or credentials)
+    cmd.extend(skopeo_auth_args(image_ref, username, password, '--src-registry-token', '--src-creds'))
+
+    # Retry transient registry errors inside skopeo for layers it downloads itself
+    if skopeo_supports('--retry-times'):
+        cmd.extend(['--retry-times', '3'])
+
+    # Blobs go to the shared store, only index.json/oci-layout are written to the layout dir
+    cmd.extend(['--dest-shared-blob-dir', blob_store_dir()])
+    cmd.extend([image_ref, f'oci:{layout}:{ref}'])
+
+    log(f"Downloading image with skopeo...")
+    progress = PullProgress(layout, layers or [])
+    try:
+        returncode, stderr_tail = run_with_progress(cmd, progress, image_ref, stall_timeout,
+                                                    env={**os.environ, 'TMPDIR': cache_tmp_dir()},
+                                                    limiter=limiter)
+    except FileNotFoundError as e:
+        raise PullError(f"Failed to run skopeo: {e}")
+    if returncode != 0:
+        raise PullError(f"Failed to download image {image_ref} (exit code {returncode}): {stderr_tail}")
+    log("Image downloaded successfully")
+
+
+def import_to_proxmox(index: StorageIndex, layout: str, ref: str, image_name: str, tag: str,
+                      digest: Optional[str] = None) -> str:
+    """
+    Import OCI image from the blob store to Proxmox storage.
+
+    Proxmox stores OCI images in the vztmpl cache directory of the storage.
+    For local storage, this is typically /var/lib/vz/template/cache/
+
+    The oci-archive is assembled straight into a hidden temp file in that directory
+    and renamed atomically (see install_oci_archive), so there is no intermediate
+    copy in /tmp and no truncated .tar after an interruption.
+    The archive is registered in the storage index together with its manifest digest.
+
+    On a shared storage, the archive is written under a cluster-wide lock and only if
+    no other node wrote it in the meantime (e.g. while pulling it by another tag).
+
+    Returns the template path in format: storage:vztmpl/image_tag.tar
+    """
+    if not index.shared:
+        return _import_to_proxmox(index, layout, ref, image_name, tag, digest)
+    with storage_lock(index, f"archive {archive_filename(image_name, tag)}"):
+        index.reload()
+        template_path = index.lookup(image_name, tag)
+        if template_path:
+            log(f"Another node already wrote {template_path}")
+            index.mark_used(template_path)
+            return template_path
+        return _import_to_proxmox(index, layout, ref, image_name, tag, digest)
+
+
+def _import_to_proxmox(index: StorageIndex, layout: str, ref: str, image_name: str, tag: str,
+                       digest: Optional[str]) -> str:
+    filename = archive_filename(image_name, tag)
+    dest_path = os.path.join(index.storage_dir, filename)
+    log(f"Writing OCI archive to {dest_path}")
+    try:
+        size = install_oci_archive(layout, ref, index.storage_dir, filename)
+    except PermissionError:
+        raise PullError(f"Permission denied: Cannot write to {dest_path}. Script needs root or storage access.")
+    except Exception as e:
+        raise PullError(f"Failed to write OCI archive to storage: {str(e)}")
+    log(f"Wrote OCI archive {filename} ({size} bytes) from blob store")
+
+    index.record(image_name, tag, digest)
+
+    # Return template path in Proxmox format
+    return index.volume_id(filename)
+
+
+class PullOptions:
+    """Settings shared by all pulls of one script run."""
+
+    def __init__(self, username: Optional[str] = None, password: Optional[str] = None,
+                 platform: Optional[str] = None, inspect_cache_ttl: int = DEFAULT_INSPECT_CACHE_TTL,
+                 pull_stall_timeout: int = DEFAULT_STALL_TIMEOUT, max_bandwidth: int = 0,
+                 lock_timeout: int = DEFAULT_LOCK_TIMEOUT, cache_budget: int = 0,
+                 gc_min_free: int = 0, mirror: Optional[str] = None, squash: bool = False,
+                 squash_prune: Optional[List[str]] = None, host_max_bandwidth: Optional[int] = None,
+                 bandwidth_schedule: Optional[str] = None) -> None:
+        self.username = username
+        self.password = password
+        self.platform = platform
+        self.inspect_cache_ttl = inspect_cache_ttl
+        self.pull_stall_timeout = pull_stall_timeout
+        # The host-wide limit stays in effect for later runs; None keeps the current one
+        if host_max_bandwidth is not None or bandwidth_schedule is not None:
+            store_host_bandwidth(host_max_bandwidth, bandwidth_schedule)
+        # One token bucket for all concurrent downloads of this run (bytes/s, 0 = unlimited),
+        # then the one of all processes on the host
+        self.limiter = BandwidthLimiter(max_bandwidth, HostBandwidthLimiter())
+        self.lock_timeout = lock_timeout
+        # LRU eviction of archives before a download (bytes, 0 = off), see collect_garbage
+        self.cache_budget = cache_budget
+        self.gc_min_free = gc_min_free
+        # Pull-through cache URL (see configured_mirror), None = pull from the registries.
+        # Registry credentials are never sent to a plain-HTTP cache, which would forward
+        # them upstream: authenticated pulls go to the registry directly.
+        if mirror and username and mirror.startswith("http://"):
+            log(f"Not using the OCI cache {mirror}: it is plain HTTP and this pull has registry credentials")
+            mirror = None
+        self.mirror = mirror
+        # Flatten the layers before the archive is written, see squash_image
+        self.squash = squash
+        self.squash_prune = squash_prune or []
+        # Phase durations for the script's timings output
+        self.timer = PhaseTimer()
+
+    @classmethod
+    def from_params(cls, *, registry_username: str = "", registry_password: str = "",
+                    platform: str = "", inspect_cache_ttl: str = "", pull_stall_timeout: str = "",
+                    max_bandwidth: str = "", download_lock_timeout: str = "", cache_budget: str = "",
+                    gc_min_free: str = "", oci_mirror: str = "", squash: str = "",
+                    squash_prune: str = "", host_max_bandwidth: str = "",
+                    bandwidth_schedule: str = "") -> "PullOptions":
+        """
+        Build the options from substituted template variables (keyword arguments only).
+
+        Variables the template does not define arrive as "NOT_DEFINED" and, like the
+        arguments a script leaves out, fall back to the defaults. max_bandwidth is given in KiB/s, cache_budget and gc_min_free in MiB.
+        An empty oci_mirror uses the cache announced for the cluster (configured_mirror).
+        squash_prune is a list of paths, separated by commas or whitespace.
+        host_max_bandwidth (KiB/s) and bandwidth_schedule change the host-wide limit only
+        if they are set ("none" clears the schedule). Raises ValueError for an invalid
+        schedule.
+        """
+        def text(value: str) -> Optional[str]:
+            value = (value or "").strip()
+            return value if value and value != "NOT_DEFINED" else None
+
+        def number(value: str, default: Optional[int], unit: int = 1) -> Optional[int]:
+            value = (value or "").strip()
+            return int(value) * unit if value.isdigit() else default
+
+        if platform == "NOT_DEFINED" or not platform:
+            platform = None
+        elif not platform.strip():
+            platform = "linux/amd64"  # Default platform
+        schedule = text(bandwidth_schedule)
+        if schedule is not None:
+            schedule = "" if schedule.lower() == "none" else schedule
+            parse_bandwidth_schedule(schedule)
+        return cls(text(registry_username), text(registry_password), platform,
+                   number(inspect_cache_ttl, DEFAULT_INSPECT_CACHE_TTL),
+                   number(pull_stall_timeout, DEFAULT_STALL_TIMEOUT),
+                   number(max_bandwidth, 0, 1024),
+                   number(download_lock_timeout, DEFAULT_LOCK_TIMEOUT),
+                   number(cache_budget, 0, 1024 * 1024),
+                   number(gc_min_free, 0, 1024 * 1024),
+                   configured_mirror(text(oci_mirror)),
+                   (text(squash) or "").lower() in ("true", "1", "yes"),
+                   [path for path in re.split(r"[\s,]+", text(squash_prune) or "") if path],
+                   number(host_max_bandwidth, None, 1024),
+                   schedule)
+
+
+def pull_image(oci_image: str, index: StorageIndex, application_id: Optional[str],
+               options: PullOptions) -> dict:
+    """
+    Make one image available in the storage and return its output values.
+
+    Only one process pulls a given image reference at a time, on a shared storage only
+    one in the whole cluster. Concurrent callers wait for the lock (up to
+    options.lock_timeout seconds), then find the archive in the storage index and
+    return it as a cache hit.
+
+    A cache hit is trusted through its verification sidecar in O(1). An archive
+    without a valid one is read and verified once (verify_oci_archive); a corrupt
+    archive is removed and pulled again.
+
+    Raises PullError if the image cannot be inspected, downloaded or imported, and
+    LockTimeout if a concurrent pull does not finish in time.
+    """
+    # Parse and normalize image reference
+    image_ref = parse_image_ref(oci_image)
+    log(f"Image reference: {image_ref}")
+    image, tag = split_image_tag(image_ref)
+    if index.lookup(image, tag) and verified_manifest_digest(index.storage_dir, archive_filename(image, tag)):
+        return _pull_image(oci_image, image_ref, image, tag, index, application_id, options)
+
+    with contextlib.ExitStack() as stack:
+        with options.timer.phase("lock_wait", image=oci_image):
+            lock = stack.enter_context(storage_lock(index, f"image {normalize_image_ref(image, tag)}",
+                                                    options.lock_timeout))
+        if lock.waited:
+            log(f"Concurrent pull finished after {int(lock.waited)}s")
+        if lock.waited or index.shared:
+            # Another node may have imported it since the index was loaded
+            index.reload()
+        return _pull_image(oci_image, image_ref, image, tag, index, application_id, options)
+
+
+def intact_archive(index: StorageIndex, template_path: Optional[str]) -> Optional[str]:
+    """template_path if its archive passes verify_oci_archive; a corrupt one is removed."""
+    if not template_path:
+        return None
+    filename = template_path.split("/")[-1]
+    if verify_oci_archive(index.storage_dir, filename):
+        return template_path
+    log(f"Removing corrupt archive {template_path}, it is pulled again")
+    try:
+        index.remove(filename)
+    except OSError as e:
+        log(f"Warning: could not remove {filename}: {e}")
+    return None
+
+
+def make_room(index: StorageIndex, options: PullOptions) -> None:
+    """Evict least recently used archives if the storage is over budget or low on space."""
+    if not options.cache_budget and not options.gc_min_free:
+        return
+    with options.timer.phase("gc"), storage_lock(index, f"gc {index.storage_dir}", options.lock_timeout):
+        result = collect_garbage(index, options.cache_budget, options.gc_min_free)
+    if result["removed"]:
+        log(f"Evicted {len(result['removed'])} unused OCI archives ({result['freed_bytes']} bytes)")
+
+
+def _pull_image(oci_image: str, image_ref: str, image: str, tag: str, index: StorageIndex,
+                application_id: Optional[str], options: PullOptions) -> dict:
+    """Pull one image (see pull_image); the caller holds the image lock if needed."""
+    username, password, platform = options.username, options.password, options.platform
+
+    # Normalize application_id (optional) - derive from image name if not provided
+    if not application_id:
+        application_id = image.split('/')[-1]
+
+    def result(template_path: str, inspect_output: dict, oci_image_tag: str) -> dict:
+        # After a download all layers are in the blob store, so this reads no network
+        with options.timer.phase("ostype", image=oci_image):
+            ostype = detect_ostype(inspect_output, image, username, password, options.pull_stall_timeout,
+                                   mirror_source(image, options.mirror))
+        log(f"Detected ostype: {ostype}")
+        return {
+            "template_path": template_path,
+            "ostype": ostype,
+            "application_id": application_id,
+            "oci_image": oci_image,
+            "oci_image_tag": oci_image_tag,
+            # A template extracted from this archive earlier: pct clone instead of create
+            "rootfs_clone_source": rootfs_clone_source(index, template_path),
+        }
+
+    # Check if image already exists in storage (before download)
+    template_path = intact_archive(index, index.lookup(image, tag))
+    if template_path:
+        log(f"OCI image already exists: {template_path}")
+        index.mark_used(template_path)
+
+        # Still need to detect ostype and version (served from the inspect cache if possible)
+        log("Inspecting image to detect ostype...")
+        with options.timer.phase("inspect", image=oci_image):
+            inspect_output = inspect_image(image_ref, image, tag, username, password, platform,
+                                           options.inspect_cache_ttl, mirror_source(image, options.mirror))
+        actual_tag = tag
+        if tag == "latest" or tag.lower() == "latest":
+            extracted_version = extract_version_from_inspect(inspect_output)
+            if extracted_version:
+                actual_tag = extracted_version
+
+        return result(template_path, inspect_output, actual_tag)
+
+    # Inspect image to extract version (for "latest" tag)
+    log("Inspecting image...")
+    source = mirror_source(image, options.mirror)
+    if source:
+        log(f"Using OCI cache {options.mirror}")
+    with options.timer.phase("inspect", image=oci_image):
+        inspect_output = inspect_image(image_ref, image, tag, username, password, platform,
+                                       options.inspect_cache_ttl, source)
+
+    # Extract version if tag is "latest"
+    actual_tag = tag
+    if tag == "latest" or tag.lower() == "latest":
+        extracted_version = extract_version_from_inspect(inspect_output)
+        if extracted_version:
+            actual_tag = extracted_version
+            log(f"Extracted version from image labels: {actual_tag}")
+
+    # Check again with the extracted version, or for an archive of the same manifest
+    digest = inspect_output.get('Digest')
+    template_path = (intact_archive(index, index.lookup(image, actual_tag))
+                     or (digest and intact_archive(index, index.lookup_digest(image, digest))))
+    if template_path:
+        log(f"OCI image already exists (with extracted version): {template_path} (version: {actual_tag})")
+        index.mark_used(template_path)
+        return result(template_path, inspect_output, actual_tag)
+
+    make_room(index, options)
+
+    # A sibling node may have imported this exact image already: copying its archive
+    # over the cluster network is faster than pulling the layers again
+    with options.timer.phase("peer", image=oci_image):
+        template_path = fetch_from_peer(index, image, actual_tag, digest)
+    if template_path:
+        log(f"OCI image successfully imported: {template_path}")
+        return result(template_path, inspect_output, actual_tag)
+
+    # Fail before the download instead of running out of space after it
+    layers = inspect_output.get('LayersData') or []
+    shortages = space_shortages(layers, index.storage_dir)
+    if shortages:
+        raise PullError(f"Not enough free space for {image}:{actual_tag}: " + "; ".join(shortages)
+                        + ". Free up space or set cache_budget/gc_min_free to evict unused OCI images.")
+
+    # Download image with skopeo into the blob store (only missing layers are fetched)
+    ensure_cache_dirs()
+    layout = layout_dir(image)
+    ref = layout_ref_name(actual_tag)
+    if layers:
+        missing = [layer for layer in layers if layer.get('Digest') and not has_blob(layer['Digest'])]
+        log(f"Layers: {len(layers) - len(missing)} of {len(layers)} already in blob store, "
+            f"{missing_layer_bytes(layers)} bytes to download")
+    log(f"Image with version {actual_tag} not found in storage, starting download...")
+    if layers:
+        # Fetch layers resumably first: a partial download from an interrupted run
+        # (SSH drop, script timeout) continues where it stopped instead of restarting.
+        # Through the OCI cache first; layers it could not deliver come from the registry.
+        for name in ([source] if source else []) + [image]:
+            try:
+                with options.timer.phase("download", image=oci_image):
+                    fetch_missing_layers(name, layers, PullProgress(layout, layers), username, password,
+                                         options.pull_stall_timeout, limiter=options.limiter,
+                                         lock_timeout=options.lock_timeout)
+                break
+            except Exception as e:
+                log(f"Warning: Resumable layer download from {split_image_name(name)[0]} failed ({e})")
+        else:
+            log("Continuing with skopeo")
+    # skopeo rewrites the layout's index.json, so one copy per layout at a time
+    with FileLock(f"layout {layout}", options.lock_timeout):
+        with options.timer.phase("copy", image=oci_image):
+            copied = False
+            if source:
+                try:
+                    skopeo_copy("docker://" + normalize_image_ref(source, tag), layout, ref, username,
+                                password, platform, layers, options.pull_stall_timeout,
+                                tls_verify=not options.mirror.startswith("http://"),
+                                limiter=options.limiter)
+                    copied = True
+                except PullError as e:
+                    log(f"Copy via OCI cache failed ({e}), copying from the registry")
+            if not copied:
+                skopeo_copy(image_ref, layout, ref, username, password, platform, layers,
+                            options.pull_stall_timeout, limiter=options.limiter)
+
+        if options.squash:
+            with options.timer.phase("squash", image=oci_image):
+                ref = squash_image(layout, ref, options.squash_prune)
+
+        # Import to Proxmox storage
+        log(f"Importing to Proxmox storage: {index.storage}")
+        with options.timer.phase("import", image=oci_image):
+            template_path = import_to_proxmox(index, layout, ref, image, actual_tag, digest)
+    log(f"OCI image successfully imported: {template_path}")
+
+    return result(template_path, inspect_output, actual_tag)
+
+
+def plan_pull(oci_image: str, index: StorageIndex, options: PullOptions, probe_peers: bool = False) -> dict:
+    """
+    Report what pulling oci_image would do, without downloading any layer.
+
+    An exact match in the storage index answers without contacting the registry.
+    Otherwise the (cached) inspect result resolves the version and digest; the layer
+    list is compared with the blob store to report the bytes still to download and
+    how much is reused from other images or an interrupted pull. With probe_peers,
+    the sibling nodes are asked (for at most PLAN_PEER_PROBE_TIMEOUT seconds) and one
+    that could provide the archive instead is named as peer_node.
+    No lock is taken, so a plan never waits for a running pull.
+    """
+    image_ref = parse_image_ref(oci_image)
+    image, tag = split_image_tag(image_ref)
+    plan = {"oci_image": oci_image, "image": image, "tag": tag}
+    template_path = index.lookup(image, tag)
+    if template_path:
+        plan.update({"cached": True, "template_path": template_path, "version": tag,
+                     "bytes_to_download": 0})
+        return plan
+
+    with options.timer.phase("inspect", image=oci_image):
+        inspect_output = inspect_image(image_ref, image, tag, options.username, options.password,
+                                       options.platform, options.inspect_cache_ttl,
+                                       mirror_source(image, options.mirror))
+    version = tag
+    if tag.lower() == "latest":
+        version = extract_version_from_inspect(inspect_output) or tag
+    digest = inspect_output.get('Digest')
+    template_path = index.lookup(image, version) or (digest and index.lookup_digest(image, digest))
+    plan.update({"version": version, "digest": digest})
+    if template_path:
+        plan.update({"cached": True, "template_path": template_path, "bytes_to_download": 0})
+        return plan
+
+    layers = inspect_output.get('LayersData') or []
+    bytes_total = sum(int(layer.get('Size') or 0) for layer in layers)
+    to_download = missing_layer_bytes(layers)
+    plan.update({
+        "cached": False,
+        "layers_total": len(layers),
+        "layers_reused": sum(1 for layer in layers if layer.get('Digest') and has_blob(layer['Digest'])),
+        "bytes_total": bytes_total,
+        "bytes_to_download": to_download,
+        "reuse_ratio": round(1 - to_download / bytes_total, 3) if bytes_total else 0.0,
+        "space_shortages": space_shortages(layers, index.storage_dir),
+    })
+    peer = None
+    if probe_peers and digest and not index.shared:
+        with options.timer.phase("peer", image=oci_image):
+            peer = find_peer_archive(index, image, digest, PLAN_PEER_PROBE_TIMEOUT)
+    plan["peer_node"] = peer[0] if peer else None
+    return plan
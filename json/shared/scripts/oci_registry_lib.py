@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""OCI distribution API client for the VE host (stdlib only).
+
+Designed to be *prepended* (as "library") to scripts that read image metadata from a
+registry: get-oci-image-annotations.py on its own, and every script that uses the
+oci_*_lib.py libraries (oci_store_lib.py first), which are prepended after this file and
+build on it.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+Bearer tokens are cached in <OCI cache>/tokens/<key>.json until they expire (root
+only, 0600), keyed by registry, scope and a fingerprint of the credentials.
+"""
+
+import base64
+import hashlib
+import http.client
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from typing import Dict, Optional, Tuple
+
+OCI_CACHE_DIR = os.environ.get("LXC_MANAGER_OCI_CACHE_DIR", "/var/lib/oci-lxc-deployer/oci-cache")
+
+
+def log(message: str) -> None:
+    """Print message to stderr (for logging/progress)."""
+    print(message, file=sys.stderr, flush=True)
+
+
+def write_json_atomic(path: str, data: object, mode: int = 0o644) -> None:
+    """Write JSON via temp file + rename so readers never see a partial file."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    finally:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+
+
+def read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def sha256_digest(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def split_image_name(image: str) -> Tuple[str, str]:
+    """Split an image name (without tag) into (registry, repository).
+
+    Mirrors the Docker Hub defaults, e.g. alpine -> (docker.io, library/alpine).
+    """
+    parts = image.split("/", 1)
+    if len(parts) == 2 and ("." in parts[0] or ":" in parts[0] or parts[0] == "localhost"):
+        registry, repository = parts
+    else:
+        registry, repository = "docker.io", image
+    if registry == "docker.io" and "/" not in repository:
+        repository = f"library/{repository}"
+    return registry, repository
+
+
+def registry_host(registry: str) -> str:
+    """API endpoint of a registry (Docker Hub serves docker.io from registry-1.docker.io)."""
+    return "registry-1.docker.io" if registry in ("docker.io", "index.docker.io") else registry
+
+
+# Registries served over plain HTTP besides localhost (the cluster's OCI cache, see mirror_source)
+PLAIN_HTTP_REGISTRIES = set()
+
+
+def registry_base_url(registry: str) -> str:
+    """Base URL of a registry; like Docker, localhost registries are plain HTTP."""
+    host = urllib.parse.urlsplit("//" + registry_host(registry)).hostname
+    plain = host in ("localhost", "127.0.0.1", "::1") or registry in PLAIN_HTTP_REGISTRIES
+    scheme = "http" if plain else "https"
+    return f"{scheme}://{registry_host(registry)}"
+
+
+def parse_www_authenticate(header: str) -> Tuple[str, Dict[str, str]]:
+    """Parse 'Bearer realm="...",service="...",scope="..."' into (scheme, params)."""
+    scheme, _, rest = (header or "").strip().partition(" ")
+    params = {k.lower(): v for k, v in re.findall(r'(\w+)="([^"]*)"', rest)}
+    return scheme.lower(), params
+
+
+def _basic_auth(username: Optional[str], password: Optional[str]) -> Optional[str]:
+    if not username:
+        return None
+    raw = f"{username}:{password or ''}".encode("utf-8")
+    return "Basic " + base64.b64encode(raw).decode("ascii")
+
+
+TOKEN_EXPIRY_MARGIN = 30
+
+
+def token_cache_dir() -> str:
+    return os.path.join(OCI_CACHE_DIR, "tokens")
+
+
+def repository_scope(repository: str) -> str:
+    return f"repository:{repository}:pull"
+
+
+def token_cache_path(registry: str, scope: str, username: Optional[str], password: Optional[str]) -> str:
+    """Cache file for a token, keyed by registry, scope and a fingerprint of the credentials.
+
+    Only the fingerprint enters the key; the credentials themselves are not stored.
+    """
+    fingerprint = sha256_digest(f"{username}:{password}".encode("utf-8")) if username else "anonymous"
+    key = hashlib.sha256(f"{registry}|{scope}|{fingerprint}".encode("utf-8")).hexdigest()
+    return os.path.join(token_cache_dir(), key + ".json")
+
+
+def load_cached_token(registry: str, scope: str, username: Optional[str],
+                      password: Optional[str]) -> Optional[str]:
+    """Authorization header value of a cached, unexpired token, or None."""
+    entry = read_json(token_cache_path(registry, scope, username, password))
+    if not entry or not entry.get("authorization"):
+        return None
+    if time.time() >= float(entry.get("expires_at", 0)):
+        return None
+    return entry["authorization"]
+
+
+def store_cached_token(registry: str, scope: str, username: Optional[str], password: Optional[str],
+                       authorization: str, expires_in: int) -> None:
+    expires_at = time.time() + max(0, expires_in - TOKEN_EXPIRY_MARGIN)
+    try:
+        os.makedirs(token_cache_dir(), mode=0o700, exist_ok=True)
+        write_json_atomic(token_cache_path(registry, scope, username, password),
+                          {"authorization": authorization, "expires_at": expires_at}, mode=0o600)
+    except OSError as e:
+        log(f"Warning: could not cache registry token: {e}")
+
+
+def drop_cached_token(registry: str, scope: str, username: Optional[str], password: Optional[str]) -> None:
+    """Forget a token the registry rejected (revoked before its expiry)."""
+    try:
+        os.unlink(token_cache_path(registry, scope, username, password))
+    except OSError:
+        pass
+
+
+def cached_bearer_token(image: str, username: Optional[str], password: Optional[str]) -> Optional[str]:
+    """Raw cached pull token for image (for skopeo --registry-token), or None."""
+    registry, repository = split_image_name(image)
+    authorization = load_cached_token(registry, repository_scope(repository), username, password)
+    if authorization and authorization.startswith("Bearer "):
+        return authorization[len("Bearer "):]
+    return None
+
+
+def fetch_registry_token(challenge: str, username: Optional[str], password: Optional[str],
+                         timeout: int, registry: Optional[str] = None) -> Optional[str]:
+    """Answer a 401 challenge: Bearer -> token from the realm, Basic -> credentials.
+
+    With `registry` given, bearer tokens are cached on the host until they expire
+    (expires_in, 60 s if the token server does not say), so the next script run
+    skips the 401 and token round trips.
+    """
+    scheme, params = parse_www_authenticate(challenge)
+    if scheme == "basic":
+        return _basic_auth(username, password)
+    if scheme != "bearer" or "realm" not in params:
+        return None
+    scope = params.get("scope", "")
+    if registry:
+        cached = load_cached_token(registry, scope, username, password)
+        if cached:
+            return cached
+    query = {k: params[k] for k in ("service", "scope") if k in params}
+    url = params["realm"] + ("?" + urllib.parse.urlencode(query) if query else "")
+    req = urllib.request.Request(url)
+    basic = _basic_auth(username, password)
+    if basic:
+        req.add_header("Authorization", basic)
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        data = json.loads(resp.read().decode("utf-8"))
+    token = data.get("token") or data.get("access_token")
+    if not token:
+        return None
+    authorization = f"Bearer {token}"
+    if registry:
+        store_cached_token(registry, scope, username, password, authorization,
+                           int(data.get("expires_in") or 60))
+    return authorization
+
+
+MANIFEST_ACCEPT = ", ".join([
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+])
+INDEX_MEDIA_TYPES = (
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+)
+
+
+class RegistryError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def parse_platform(platform: Optional[str]) -> Tuple[str, str, Optional[str]]:
+    """(os, architecture, variant) of "linux/arm64/v8", "arm64" or None (linux/amd64)."""
+    if not platform:
+        return "linux", "amd64", None
+    parts = platform.split("/")
+    if len(parts) == 1:
+        return "linux", parts[0], None
+    return parts[0], parts[1], parts[2] if len(parts) > 2 else None
+
+
+def is_image_index(manifest: dict) -> bool:
+    return manifest.get("mediaType") in INDEX_MEDIA_TYPES or "manifests" in manifest
+
+
+def select_platform_descriptor(index: dict, platform: Optional[str]) -> Optional[dict]:
+    """Descriptor of the image manifest for platform in an image index, or None."""
+    os_type, arch, variant = parse_platform(platform)
+    candidates = [m for m in index.get("manifests", [])
+                  if (m.get("platform") or {}).get("os") == os_type
+                  and (m.get("platform") or {}).get("architecture") == arch]
+    if variant:
+        candidates = [m for m in candidates if (m.get("platform") or {}).get("variant") in (variant, None)] or candidates
+    return candidates[0] if candidates else None
+
+
+def inspect_from_manifest(name: str, tag: str, digest: str, manifest: dict, config: dict) -> dict:
+    """skopeo-inspect compatible metadata of an image manifest and its config.
+
+    digest is the one of the top-level manifest (an index for multi-platform images).
+    """
+    image_config = config.get("config") or {}
+    layers = manifest.get("layers") or []
+    result = {
+        "Name": name,
+        "Digest": digest,
+        "Created": config.get("created"),
+        "DockerVersion": config.get("docker_version", ""),
+        "Labels": image_config.get("Labels") or {},
+        "Architecture": config.get("architecture"),
+        "Os": config.get("os"),
+        "Layers": [layer.get("digest") for layer in layers],
+        "LayersData": [
+            {"MIMEType": layer.get("mediaType"), "Digest": layer.get("digest"),
+             "Size": layer.get("size"), "Annotations": layer.get("annotations")}
+            for layer in layers
+        ],
+        "Env": image_config.get("Env") or [],
+        "ConfigDigest": manifest["config"]["digest"],
+        "Config": image_config,
+        "History": config.get("history") or [],
+    }
+    if not tag.startswith("sha256:"):
+        result["Tag"] = tag
+    return result
+
+
+class RegistryClient:
+    """Small OCI distribution API client for image metadata (stdlib only).
+
+    One client keeps one HTTP/1.1 connection per host open, so the manifest, the
+    platform manifest and the config blob of an image cost a few requests on a warm
+    connection instead of several skopeo processes with their own TLS handshakes.
+    Bearer tokens come from the host token cache when possible; otherwise they are
+    requested on the first 401, cached and reused for the repository scope.
+    Layer downloads are left to fetch_blob_resumable and skopeo.
+    """
+
+    def __init__(self, registry: str, username: Optional[str] = None,
+                 password: Optional[str] = None, timeout: int = 60) -> None:
+        self.registry = registry
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._connections: Dict[Tuple[str, str], http.client.HTTPConnection] = {}
+        self._authorization: Dict[str, str] = {}
+
+    def close(self) -> None:
+        for conn in self._connections.values():
+            conn.close()
+        self._connections = {}
+
+    def __enter__(self) -> "RegistryClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        key = (scheme, netloc)
+        if key not in self._connections:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            self._connections[key] = cls(netloc, timeout=self.timeout)
+        return self._connections[key]
+
+    def _send(self, method: str, url: str, headers: Dict[str, str]) -> Tuple[int, dict, bytes]:
+        parsed = urllib.parse.urlparse(url)
+        path = parsed.path + ("?" + parsed.query if parsed.query else "")
+        for attempt in range(2):
+            conn = self._connection(parsed.scheme, parsed.netloc)
+            try:
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+                return resp.status, {k.lower(): v for k, v in resp.getheaders()}, body
+            except (http.client.HTTPException, ConnectionError) as e:
+                # The server closed an idle keep-alive connection: reconnect once
+                conn.close()
+                del self._connections[(parsed.scheme, parsed.netloc)]
+                if attempt and isinstance(e, ConnectionError):
+                    # Not reachable: callers tell this OSError apart from registry errors
+                    raise
+                if attempt:
+                    raise RegistryError(f"{method} {url} failed: {e}")
+        raise RegistryError(f"{method} {url} failed")
+
+    def request(self, method: str, repository: str, path: str,
+                accept: Optional[str] = None) -> Tuple[int, dict, bytes]:
+        """Request /v2/<repository>/<path>, answering auth challenges and following redirects."""
+        url = f"{registry_base_url(self.registry)}/v2/{repository}/{path}"
+        registry_netloc = urllib.parse.urlparse(url).netloc
+        from_cache = set()
+        for _hop in range(6):
+            headers = {"User-Agent": "oci-lxc-deployer"}
+            if accept:
+                headers["Accept"] = accept
+            same_host = urllib.parse.urlparse(url).netloc == registry_netloc
+            scope = repository_scope(repository)
+            if same_host and repository not in self._authorization:
+                cached = load_cached_token(self.registry, scope, self.username, self.password)
+                if cached:
+                    self._authorization[repository] = cached
+                    from_cache.add(repository)
+            if same_host and repository in self._authorization:
+                headers["Authorization"] = self._authorization[repository]
+            status, resp_headers, body = self._send(method, url, headers)
+            if status == 401 and same_host and ("Authorization" not in headers or repository in from_cache):
+                if repository in from_cache:
+                    # Cached token was rejected (revoked early): get a fresh one once
+                    drop_cached_token(self.registry, scope, self.username, self.password)
+                    from_cache.discard(repository)
+                try:
+                    authorization = fetch_registry_token(resp_headers.get("www-authenticate", ""),
+                                                         self.username, self.password, self.timeout,
+                                                         self.registry)
+                except (OSError, ValueError) as e:
+                    raise RegistryError(f"Authentication at {self.registry} failed: {e}", 401)
+                if not authorization:
+                    raise RegistryError(f"Authentication required for {self.registry}/{repository}", 401)
+                self._authorization[repository] = authorization
+                continue
+            if status in (301, 302, 303, 307, 308) and resp_headers.get("location"):
+                # Blob storage redirects are pre-signed; the registry token is not sent there
+                url = urllib.parse.urljoin(url, resp_headers["location"])
+                continue
+            return status, resp_headers, body
+        raise RegistryError(f"Too many redirects for {repository}/{path}")
+
+    def head_manifest(self, repository: str, reference: str) -> Optional[str]:
+        """Digest of the top-level manifest of reference, or None if it does not exist."""
+        status, headers, _body = self.request("HEAD", repository, f"manifests/{reference}", MANIFEST_ACCEPT)
+        if status == 404:
+            return None
+        if status != 200:
+            raise RegistryError(f"HEAD manifest {repository}:{reference} returned {status}", status)
+        digest = headers.get("docker-content-digest")
+        if not digest:
+            # Some registries omit the header on HEAD; the body digest is authoritative
+            _manifest, digest = self.get_manifest(repository, reference)
+        return digest
+
+    def get_manifest(self, repository: str, reference: str) -> Tuple[dict, str]:
+        """Manifest (or index) of reference and the sha256 digest of its raw bytes."""
+        status, _headers, body = self.request("GET", repository, f"manifests/{reference}", MANIFEST_ACCEPT)
+        if status == 404:
+            raise RegistryError(f"Manifest {repository}:{reference} not found", 404)
+        if status != 200:
+            raise RegistryError(f"GET manifest {repository}:{reference} returned {status}", status)
+        return json.loads(body.decode("utf-8")), sha256_digest(body)
+
+    def get_blob(self, repository: str, digest: str) -> bytes:
+        """Small blob (config) by digest, verified against the digest."""
+        status, _headers, body = self.request("GET", repository, f"blobs/{digest}")
+        if status != 200:
+            raise RegistryError(f"GET blob {repository}@{digest} returned {status}", status)
+        if sha256_digest(body) != digest:
+            raise RegistryError(f"Digest mismatch for blob {digest}")
+        return body
+
+    def resolve_platform(self, repository: str, manifest: dict, platform: Optional[str]) -> dict:
+        """Pick the image manifest for platform from an index; image manifests pass through."""
+        if not is_image_index(manifest):
+            return manifest
+        descriptor = select_platform_descriptor(manifest, platform)
+        if descriptor is None:
+            raise RegistryError(f"No manifest for platform {'/'.join(parse_platform(platform)[:2])} "
+                                f"in {repository}", 404)
+        child, _digest = self.get_manifest(repository, descriptor["digest"])
+        return child
+
+    def inspect(self, image: str, tag: str, platform: Optional[str] = None) -> dict:
+        """skopeo-inspect compatible metadata of image:tag.
+
+        Digest is the digest of the top-level manifest, as with skopeo. In addition
+        to skopeo's fields, ConfigDigest, Config (the image config's "config" section)
+        and History are included.
+        """
+        registry, repository = split_image_name(image)
+        top, digest = self.get_manifest(repository, tag)
+        manifest = self.resolve_platform(repository, top, platform)
+        config_desc = manifest.get("config") or {}
+        if not config_desc.get("digest"):
+            raise RegistryError(f"Unsupported manifest format for {image}:{tag}")
+        config = json.loads(self.get_blob(repository, config_desc["digest"]).decode("utf-8"))
+        return inspect_from_manifest(f"{registry}/{repository}", tag, digest, manifest, config)
+
+
+def registry_client_for(image: str, username: Optional[str] = None,
+                        password: Optional[str] = None, timeout: int = 60) -> RegistryClient:
+    return RegistryClient(split_image_name(image)[0], username, password, timeout)
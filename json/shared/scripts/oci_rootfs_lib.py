@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Extracted rootfs templates of OCI image archives on the VE host.
+
+Designed to be *prepended* (as "library") to cache-oci-rootfs.py, get-oci-image.py,
+import-oci-bundle.py, oci-update-prefetcher.py, plan-oci-image.py and
+prefetch-oci-images.py and executed via stdin, after deployer_common_lib.py,
+oci_registry_lib.py and oci_store_lib.py, whose helpers it uses.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+A rootfs template is a stopped container with the archive's root filesystem; where
+the storage supports linked clones, new containers are cloned from it instead of
+extracting the archive again (see rootfs_clone_source, build_rootfs_template).
+"""
+
+import os
+import re
+import subprocess
+import time
+import urllib.parse
+from typing import List, Optional, Tuple
+
+# Optional import for editor/type checking; at runtime deployer_common_lib.py,
+# oci_registry_lib.py and oci_store_lib.py are prepended before this library.
+try:
+    from deployer_common_lib import *  # type: ignore
+    from oci_registry_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+except Exception:
+    pass
+
+# Written into the notes of a rootfs template: the archive it was extracted from and
+# the archive's manifest digest ("-" if the index does not know it)
+ROOTFS_CACHE_MARKER_RE = re.compile(r"oci-lxc-deployer:rootfs-cache\s+(\S+)\s+(\S+)\s*-->", re.IGNORECASE)
+ROOTFS_CONF_RE = re.compile(r"^rootfs:\s*([^:\s]+):([^,\s]+)(.*)$", re.MULTILINE)
+# Storage types on which `pct clone` of a template is a linked (snapshot) clone
+LINKED_CLONE_STORAGE_TYPES = ("zfspool", "lvmthin", "btrfs", "rbd")
+PVE_VMLIST_FILE = os.environ.get("LXC_MANAGER_PVE_VMLIST", "/etc/pve/.vmlist")
+# Rootfs templates take IDs from the first ID up (the rootfs_template_first_id parameter),
+# away from the IDs pvesh hands out, but at most this many
+ROOTFS_TEMPLATE_FIRST_ID = 990000
+ROOTFS_TEMPLATE_ID_RANGE = 10000
+ROOTFS_TEMPLATE_TIMEOUT = 1800
+
+
+def read_lxc_conf(vm_id: int, lxc_dir: Optional[str] = None) -> Optional[str]:
+    """The current section of a container's config (without snapshots), or None."""
+    try:
+        with open(os.path.join(lxc_conf_dir(lxc_dir), f"{vm_id}.conf"), encoding="utf-8",
+                  errors="replace") as f:
+            text = f.read()
+    except OSError:
+        return None
+    return re.split(r"^\[", text, maxsplit=1, flags=re.MULTILINE)[0]
+
+
+def conf_rootfs(conf_text: str) -> Optional[Tuple[str, float]]:
+    """(storage, size in GiB) of the rootfs line of a container config, or None."""
+    m = ROOTFS_CONF_RE.search(conf_text)
+    if not m:
+        return None
+    size = re.search(r",size=(\d+(?:\.\d+)?)([KMGT]?)", m.group(3))
+    if not size:
+        return m.group(1), 0.0
+    factor = {"K": 1 / 1024 ** 2, "M": 1 / 1024, "G": 1, "T": 1024, "": 1 / 1024 ** 3}[size.group(2)]
+    return m.group(1), float(size.group(1)) * factor
+
+
+def archive_digest(index: StorageIndex, template_path: str) -> str:
+    """Manifest digest the index recorded for an archive, "-" if unknown."""
+    return index.entries.get(template_path.split("/")[-1], {}).get("digest") or "-"
+
+
+def rootfs_templates(lxc_dir: Optional[str] = None) -> List[dict]:
+    """Rootfs templates on this node: {"vm_id", "template_path", "digest", "storage", "size_gib"}."""
+    try:
+        conf_names = os.listdir(lxc_conf_dir(lxc_dir))
+    except FileNotFoundError:
+        return []
+    templates = []
+    for name in conf_names:
+        if not name.endswith(".conf") or not name[:-len(".conf")].isdigit():
+            continue
+        vm_id = int(name[:-len(".conf")])
+        conf_text = read_lxc_conf(vm_id, lxc_dir)
+        if not conf_text or not re.search(r"^template:\s*1\s*$", conf_text, re.MULTILINE):
+            continue
+        m = ROOTFS_CACHE_MARKER_RE.search(urllib.parse.unquote(conf_text.replace("\\n", "\n")))
+        rootfs = conf_rootfs(conf_text)
+        if not m or not rootfs:
+            continue
+        templates.append({"vm_id": vm_id, "template_path": m.group(1), "digest": m.group(2),
+                          "storage": rootfs[0], "size_gib": rootfs[1]})
+    return sorted(templates, key=lambda t: t["vm_id"])
+
+
+def rootfs_clone_source(index: StorageIndex, template_path: str, lxc_dir: Optional[str] = None) -> str:
+    """ID of the rootfs template extracted from this archive (as it is now), or ""."""
+    digest = archive_digest(index, template_path)
+    for template in rootfs_templates(lxc_dir):
+        if template["template_path"] == template_path and template["digest"] == digest:
+            return str(template["vm_id"])
+    return ""
+
+
+def vm_id_available(vm_id: int) -> bool:
+    """Whether the cluster would hand out vm_id (`pvesh get /cluster/nextid --vmid`).
+
+    True without pvesh (not a Proxmox host); the caller has checked the VM list then.
+    """
+    try:
+        result = subprocess.run(["pvesh", "get", "/cluster/nextid", "--vmid", str(vm_id)],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30)
+    except FileNotFoundError:
+        return True
+    return result.returncode == 0
+
+
+def free_rootfs_template_id(first_id: int = ROOTFS_TEMPLATE_FIRST_ID,
+                            lxc_dir: Optional[str] = None) -> Optional[int]:
+    """Lowest ID from first_id up that the cluster has not used, None if the range is full.
+
+    IDs in the cluster's VM list or with a local config are skipped without asking
+    pvesh; the first remaining one is confirmed with vm_id_available.
+    """
+    used = set(((read_json(PVE_VMLIST_FILE) or {}).get("ids") or {}).keys())
+    for vm_id in range(first_id, first_id + ROOTFS_TEMPLATE_ID_RANGE):
+        if str(vm_id) in used or os.path.exists(os.path.join(lxc_conf_dir(lxc_dir), f"{vm_id}.conf")):
+            continue
+        if vm_id_available(vm_id):
+            return vm_id
+    return None
+
+
+def _pct(args: List[str], timeout: int = ROOTFS_TEMPLATE_TIMEOUT) -> subprocess.CompletedProcess:
+    return subprocess.run(["pct"] + args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, timeout=timeout)
+
+
+def build_rootfs_template(index: StorageIndex, template_path: str, storage: str, size_gib: float,
+                          ostype: str, first_id: int = ROOTFS_TEMPLATE_FIRST_ID,
+                          lxc_dir: Optional[str] = None) -> Optional[int]:
+    """
+    Extract an archive once more into a template container for linked clones.
+
+    The template is created the way create-lxc-container.sh creates a container
+    (unprivileged, so the rootfs is already shifted into the container's ID range) on
+    the rootfs storage and with the disk size of the container that was just created,
+    then converted with `pct template`. Its ID is the lowest free one from first_id up.
+    Later containers of the same archive are `pct clone`d from it: on ZFS, LVM-thin,
+    btrfs and RBD that is a snapshot clone instead of an extraction.
+
+    Older templates of the same archive name (a re-pulled tag) are destroyed; Proxmox
+    refuses that while linked clones still use them. Returns the template's ID, or
+    None if the storage has no linked clones, no ID is free or pct failed.
+    """
+    storage_type = pve_storages().get(storage, {}).get("type")
+    if storage_type not in LINKED_CLONE_STORAGE_TYPES:
+        log(f"Not caching the rootfs: storage {storage} ({storage_type or 'unknown type'}) has no linked clones")
+        return None
+    digest = archive_digest(index, template_path)
+    vm_id = free_rootfs_template_id(first_id, lxc_dir)
+    if vm_id is None:
+        log(f"Not caching the rootfs: no free ID from {first_id} to {first_id + ROOTFS_TEMPLATE_ID_RANGE - 1}")
+        return None
+    name = re.sub(r"[^A-Za-z0-9-]+", "-", template_path.split("/")[-1][:-len(".tar")]).strip("-")
+    description = (f"<!-- oci-lxc-deployer:rootfs-cache {template_path} {digest} -->\n"
+                   f"Extracted rootfs of {template_path} for linked clones.")
+    log(f"Extracting {template_path} into rootfs template {vm_id} on {storage}")
+    start = time.monotonic()
+    created = _pct(["create", str(vm_id), template_path, "--rootfs", f"{storage}:{max(1, int(round(size_gib)))}",
+                    "--hostname", f"oci-rootfs-{name}"[:63].rstrip("-"), "--ostype", ostype or "unmanaged",
+                    "--unprivileged", "1", "--description", description])
+    if created.returncode != 0:
+        log(f"Warning: pct create failed: {created.stdout.strip()}")
+        if read_lxc_conf(vm_id, lxc_dir) is not None:
+            _pct(["destroy", str(vm_id)])
+        return None
+    converted = _pct(["template", str(vm_id)])
+    if converted.returncode != 0:
+        log(f"Warning: pct template failed: {converted.stdout.strip()}")
+        _pct(["destroy", str(vm_id)])
+        return None
+    log(f"Rootfs template {vm_id} ready after {time.monotonic() - start:.1f}s")
+    for template in rootfs_templates(lxc_dir):
+        if template["template_path"] == template_path and template["vm_id"] != vm_id:
+            destroyed = _pct(["destroy", str(template["vm_id"])])
+            if destroyed.returncode == 0:
+                log(f"Removed outdated rootfs template {template['vm_id']}")
+            else:
+                log(f"Keeping outdated rootfs template {template['vm_id']}: {destroyed.stdout.strip()}")
+    return vm_id
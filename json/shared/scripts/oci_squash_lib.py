@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Squashing of cached OCI images into a single layer on the VE host (see squash_image).
+
+Designed to be *prepended* (as "library") to get-oci-image.py, import-oci-bundle.py,
+oci-update-prefetcher.py, plan-oci-image.py and prefetch-oci-images.py and executed via
+stdin, after oci_registry_lib.py and oci_store_lib.py, whose helpers it uses.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+A squashed image is added to its layout as <ref>-squashed and archived instead of the
+layered image; it is rebuilt only when the image or the pruned paths change.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+# Optional import for editor/type checking; at runtime oci_registry_lib.py and
+# oci_store_lib.py are prepended before this library.
+try:
+    from oci_registry_lib import *  # type: ignore
+    from oci_store_lib import *  # type: ignore
+except Exception:
+    pass
+
+# "<manifest digest> <prune paths>" the squashed manifest was built from
+SQUASHED_FROM_ANNOTATION = "org.oci-lxc-deployer.squashed-from"
+SQUASH_GZIP_LEVEL = 6
+WHITEOUT_PREFIX = ".wh."
+OPAQUE_WHITEOUT = ".wh..wh..opq"
+
+
+class _HashingWriter:
+    """File-like object that hashes everything written through it."""
+
+    def __init__(self, target) -> None:
+        self.target = target
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.hasher.update(data)
+        self.size += len(data)
+        return self.target.write(data)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+
+def _drop_path(owner: Dict[str, int], is_dir: Dict[str, bool], path: str, below: int) -> None:
+    """Remove path and, if it is a directory, everything under it from layers < below."""
+    if owner.get(path, below) < below:
+        del owner[path]
+    if is_dir.get(path):
+        prefix = path + "/"
+        for name in [n for n, layer in owner.items() if layer < below and n.startswith(prefix)]:
+            del owner[name]
+
+
+def squash_plan(layer_digests: List[str], prune_paths: List[str]) -> Optional[List[set]]:
+    """
+    Paths each layer contributes to the flattened root filesystem.
+
+    Applies the layers bottom-up like an extraction would: later entries replace
+    earlier ones, whiteouts (.wh.<name>) delete, opaque whiteouts clear a directory.
+    Whiteout files themselves are never kept, and the content of prune_paths is
+    dropped (the directories stay). Returns None if the image cannot be flattened
+    safely (a hard link whose target comes from another layer).
+    """
+    owner: Dict[str, int] = {}
+    is_dir: Dict[str, bool] = {}
+    hardlinks: List[Tuple[int, str, str]] = []
+    for layer, digest in enumerate(layer_digests):
+        with tarfile.open(blob_path(digest), mode="r|*") as tar:
+            for member in tar:
+                name = _layer_path(member.name)
+                if not name or name == ".":
+                    continue
+                parent, base = os.path.split(name)
+                if base == OPAQUE_WHITEOUT:
+                    prefix = parent + "/" if parent else ""
+                    for path in [n for n, owner_layer in owner.items()
+                                 if owner_layer < layer and n.startswith(prefix)]:
+                        del owner[path]
+                    continue
+                if base.startswith(WHITEOUT_PREFIX):
+                    _drop_path(owner, is_dir, os.path.join(parent, base[len(WHITEOUT_PREFIX):]), layer)
+                    continue
+                if not member.isdir() and is_dir.get(name):
+                    _drop_path(owner, is_dir, name, layer)
+                owner[name] = layer
+                is_dir[name] = member.isdir()
+                if member.islnk():
+                    hardlinks.append((layer, name, _layer_path(member.linkname)))
+    for prune in prune_paths:
+        prefix = _layer_path(prune) + "/"
+        for name in [n for n in owner if n.startswith(prefix)]:
+            del owner[name]
+    for layer, name, target in hardlinks:
+        if owner.get(name) == layer and owner.get(target) != layer:
+            log(f"Not squashing: hard link {name} points to {target} of another layer")
+            return None
+    plan: List[set] = [set() for _ in layer_digests]
+    for name, layer in owner.items():
+        plan[layer].add(name)
+    return plan
+
+
+def squash_image(layout: str, ref: str, prune_paths: Optional[List[str]] = None) -> str:
+    """
+    Flatten the layers of `ref` into one layer and return the ref to archive.
+
+    The flattened layer has no content that later layers deleted or replaced, and
+    none under prune_paths (e.g. /var/cache/apk, /usr/share/doc), so the archive is
+    smaller and pct create extracts less. Each layer is read twice from the blob store
+    (see squash_plan), nothing is downloaded. The result is added to the layout as
+    <ref>-squashed and reused while the image and prune_paths are the same.
+
+    Returns `ref` itself if there is nothing to gain (one layer, no pruning) or the
+    layers cannot be flattened (zstd layers, see squash_plan, not enough space).
+    """
+    prune_paths = sorted(set(p.rstrip("/") for p in prune_paths or [] if p.strip("/")))
+    manifest_desc = find_manifest_descriptor(layout, ref)
+    if manifest_desc is None:
+        raise FileNotFoundError(f"Ref {ref} not found in OCI layout {layout}")
+    manifest = read_blob_json(manifest_desc["digest"])
+    layers = manifest.get("layers") or []
+    if len(layers) < 2 and not prune_paths:
+        return ref
+    squashed_ref = ref + SQUASHED_REF_SUFFIX
+    squashed_from = " ".join([manifest_desc["digest"]] + prune_paths)
+    existing = find_manifest_descriptor(layout, squashed_ref)
+    if (existing and (existing.get("annotations") or {}).get(SQUASHED_FROM_ANNOTATION) == squashed_from
+            and all(has_blob(d["digest"]) for d in manifest_blob_descriptors(existing))):
+        log(f"Using squashed image {squashed_ref}")
+        return squashed_ref
+
+    layer_bytes = sum(int(layer.get("size") or 0) for layer in layers)
+    try:
+        free = storage_free_bytes(cache_tmp_dir())
+    except OSError:
+        free = None
+    if free is not None and layer_bytes + SPACE_MARGIN_BYTES > free:
+        log(f"Not squashing: {format_size(free)} free in {cache_tmp_dir()}, up to {format_size(layer_bytes)} needed")
+        return ref
+    digests = [layer["digest"] for layer in layers]
+    try:
+        plan = squash_plan(digests, prune_paths)
+        if plan is None:
+            return ref
+        fd, tmp_path = tempfile.mkstemp(prefix="squash-", dir=cache_tmp_dir())
+        try:
+            with os.fdopen(fd, "wb") as f:
+                compressed = _HashingWriter(f)
+                with gzip.GzipFile(fileobj=compressed, mode="wb", compresslevel=SQUASH_GZIP_LEVEL,
+                                   mtime=0) as gz:
+                    uncompressed = _HashingWriter(gz)
+                    with tarfile.open(fileobj=uncompressed, mode="w|", format=tarfile.PAX_FORMAT) as out:
+                        for digest, keep in zip(digests, plan):
+                            if not keep:
+                                continue
+                            with tarfile.open(blob_path(digest), mode="r|*") as tar:
+                                for member in tar:
+                                    name = _layer_path(member.name)
+                                    if name not in keep:
+                                        continue
+                                    member.name = name
+                                    if member.islnk():
+                                        member.linkname = _layer_path(member.linkname)
+                                    out.addfile(member, tar.extractfile(member) if member.isreg() else None)
+                f.flush()
+                os.fsync(f.fileno())
+            layer_digest = "sha256:" + compressed.hasher.hexdigest()
+            os.replace(tmp_path, blob_path(layer_digest))
+            record_verified_blob(layer_digest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    except (OSError, tarfile.TarError, EOFError) as e:
+        log(f"Not squashing {ref}: {e}")
+        return ref
+
+    config = read_blob_json(manifest["config"]["digest"])
+    config["rootfs"] = {"type": "layers", "diff_ids": ["sha256:" + uncompressed.hasher.hexdigest()]}
+    config["history"] = [{"created": config.get("created"),
+                          "created_by": f"oci-lxc-deployer: {len(layers)} layers squashed",
+                          "comment": "pruned: " + ", ".join(prune_paths) if prune_paths else ""}]
+    config_data = json.dumps(config).encode("utf-8")
+    squashed = {
+        "schemaVersion": 2,
+        "mediaType": OCI_MANIFEST_MEDIA_TYPE,
+        "config": {"mediaType": manifest["config"].get("mediaType", "application/vnd.oci.image.config.v1+json"),
+                   "digest": store_blob(config_data), "size": len(config_data)},
+        "layers": [{"mediaType": "application/vnd.oci.image.layer.v1.tar+gzip",
+                    "digest": layer_digest, "size": compressed.size}],
+    }
+    if manifest.get("annotations"):
+        squashed["annotations"] = manifest["annotations"]
+    manifest_data = json.dumps(squashed).encode("utf-8")
+    descriptor = {"mediaType": OCI_MANIFEST_MEDIA_TYPE, "digest": store_blob(manifest_data),
+                  "size": len(manifest_data),
+                  "annotations": {REF_NAME_ANNOTATION: squashed_ref, SQUASHED_FROM_ANNOTATION: squashed_from}}
+    if manifest_desc.get("platform"):
+        descriptor["platform"] = manifest_desc["platform"]
+    index = read_layout_index(layout)
+    index["manifests"] = [d for d in index.get("manifests") or []
+                          if (d.get("annotations") or {}).get(REF_NAME_ANNOTATION) != squashed_ref] + [descriptor]
+    write_json_atomic(os.path.join(layout, "index.json"), index)
+    log(f"Squashed {len(layers)} layers ({format_size(layer_bytes)}) into one of {format_size(compressed.size)}")
+    return squashed_ref
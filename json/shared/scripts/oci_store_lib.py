@@ -0,0 +1,1522 @@
+#!/usr/bin/env python3
+"""Blob store, image layouts and storage index of the OCI image cache on the VE host.
+
+Designed to be *prepended* (as "library") to cache-oci-rootfs.py, gc-oci-images.py,
+get-oci-image.py, import-oci-bundle.py, oci-cache-server.py, oci-update-prefetcher.py,
+plan-oci-image.py and prefetch-oci-images.py and executed via stdin, after
+oci_registry_lib.py, whose registry client, token cache and small helpers (log,
+read_json, write_json_atomic, split_image_name) it uses.
+Therefore it must not rely on package imports from the filesystem and must not contain
+template variables.
+
+The base of the oci_*_lib.py libraries; the others (oci_squash_lib.py, oci_mirror_lib.py,
+oci_daemon_lib.py, oci_gc_lib.py, oci_rootfs_lib.py, oci_pull_lib.py, oci_prefetch_lib.py,
+oci_bundle_lib.py) are prepended after it and build on it.
+
+Layout of the persistent cache (default: /var/lib/oci-lxc-deployer/oci-cache,
+override with LXC_MANAGER_OCI_CACHE_DIR):
+
+  blobs/sha256/<hex>          content-addressed blob store shared by all images/tags
+  verified/sha256/<hex>.json  size and mtime of blobs verified when stored (see record_verified_blob)
+  layouts/<registry>/<repo>/  one OCI image layout (index.json + oci-layout) per repository,
+                              one ref per version; blobs live in the shared blob store
+  inspect/<key>.json          cached skopeo inspect results (see load_cached_inspect)
+  ostype/<key>.json           ostype and /etc/os-release per image config (see detect_ostype
+                              in oci_pull_lib.py)
+  staging/<hex>.partial       layer downloads in progress; kept across attempts so a retry
+                              resumes with an HTTP range request (see fetch_blob_resumable)
+  locks/<key>.lock            flock files serializing pulls across processes (see FileLock)
+  tokens/<key>.json           registry bearer tokens until they expire (see oci_registry_lib.py)
+  mirror/manifests/<key>.json manifests served by oci-cache-server.py (bodies in blobs/)
+  mirror/grants/<key>.json    blobs each client credential may read from a repository there
+
+Paths, versions and flags of host tools are cached in /run (see host_tool).
+
+Each vztmpl cache directory additionally gets a StorageIndex, persisted next to it.
+Storage paths and sharing come from /etc/pve/storage.cfg (see pve_storages); on a
+shared storage, pulls and writes are also locked cluster-wide (see StorageLock).
+"""
+
+import contextlib
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Optional import for editor/type checking; at runtime oci_registry_lib.py is prepended
+# before this library.
+try:
+    from oci_registry_lib import *  # type: ignore
+except Exception:
+    pass
+
+REF_NAME_ANNOTATION = "org.opencontainers.image.ref.name"
+OCI_LAYOUT_CONTENT = b'{"imageLayoutVersion": "1.0.0"}'
+DEFAULT_INSPECT_CACHE_TTL = 3600
+DEFAULT_STALL_TIMEOUT = 300
+DEFAULT_LOCK_TIMEOUT = 1800
+PROGRESS_INTERVAL = 2.0
+# Sampling interval while a skopeo copy is rate limited (see run_with_progress)
+SHAPING_INTERVAL = 0.25
+
+
+def emit_event(event: str, **fields: object) -> None:
+    """Print a structured JSON event line to stderr.
+
+    stderr is streamed to the backend as partial messages while the script runs,
+    so these lines show up live (stdout stays reserved for the final outputs).
+    """
+    # One write per event, so lines from concurrent pulls do not interleave
+    sys.stderr.write(json.dumps({"event": event, **fields}) + "\n")
+    sys.stderr.flush()
+
+
+HOST_CAPABILITIES_FILE = os.environ.get("LXC_MANAGER_HOST_CAPABILITIES",
+                                        "/run/oci-lxc-deployer/host-capabilities.json")
+# skopeo flags that callers check with skopeo_supports()
+SKOPEO_PROBED_FLAGS = ("--retry-times", "--dest-shared-blob-dir", "--src-registry-token")
+
+_host_tools: Optional[Dict[str, dict]] = None
+_host_tools_lock = threading.Lock()
+
+
+def _file_state(path: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _path_dirs_state() -> Dict[str, Optional[List[int]]]:
+    return {d: _file_state(d) for d in os.environ.get("PATH", "").split(os.pathsep) if d}
+
+
+def _which(name: str) -> Optional[str]:
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        path = os.path.join(directory, name)
+        if directory and os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def _probe_tool(name: str) -> dict:
+    path = _which(name)
+    entry: dict = {"path": path, "state": _file_state(path) if path else None}
+    if name == "skopeo" and path:
+        # The only probes that spawn processes; they run again only after an upgrade
+        try:
+            out = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=10).stdout
+            m = re.search(r"version\s+(\S+)", out)
+            entry["version"] = m.group(1) if m else None
+            out = subprocess.run([path, "copy", "--help"], capture_output=True, text=True, timeout=10).stdout
+            entry["flags"] = [flag for flag in SKOPEO_PROBED_FLAGS if re.search(re.escape(flag) + r"\b", out)]
+        except (OSError, subprocess.SubprocessError):
+            pass
+    return entry
+
+
+def host_tool(name: str) -> dict:
+    """Path (None if missing), version and flags of a host tool.
+
+    Results are cached in HOST_CAPABILITIES_FILE (on /run, so a reboot starts fresh)
+    and shared by all script runs. An entry is probed again when the binary's
+    mtime/size changed, and all entries when a PATH directory changed (a tool was
+    installed or removed). A cache hit costs a few stat calls and no process.
+    """
+    global _host_tools
+    with _host_tools_lock:
+        if _host_tools is None:
+            cached = read_json(HOST_CAPABILITIES_FILE) or {}
+            valid = cached.get("path_dirs") == _path_dirs_state() and isinstance(cached.get("tools"), dict)
+            _host_tools = cached["tools"] if valid else {}
+        entry = _host_tools.get(name)
+        if entry is not None and (entry.get("path") is None or _file_state(entry["path"]) == entry.get("state")):
+            return entry
+        entry = _probe_tool(name)
+        _host_tools[name] = entry
+        try:
+            write_json_atomic(HOST_CAPABILITIES_FILE, {"path_dirs": _path_dirs_state(), "tools": _host_tools})
+        except OSError:
+            pass
+        return entry
+
+
+def tool_path(name: str) -> Optional[str]:
+    return host_tool(name).get("path")
+
+
+def skopeo_supports(flag: str) -> bool:
+    return flag in (host_tool("skopeo").get("flags") or [])
+
+
+def blob_store_dir() -> str:
+    """Directory passed to skopeo as --dest-shared-blob-dir (contains sha256/<hex>)."""
+    return os.path.join(OCI_CACHE_DIR, "blobs")
+
+
+def blob_path(digest: str) -> str:
+    """Path of a blob in the shared store, e.g. sha256:abc -> blobs/sha256/abc."""
+    algorithm, _, hex_digest = digest.partition(":")
+    if not hex_digest or not re.fullmatch(r"[a-f0-9]+", hex_digest):
+        raise ValueError(f"Invalid digest: {digest}")
+    return os.path.join(blob_store_dir(), algorithm, hex_digest)
+
+
+def has_blob(digest: str) -> bool:
+    return os.path.isfile(blob_path(digest))
+
+
+def blob_record_path(digest: str) -> str:
+    # Outside the store, so skopeo and PullProgress only ever see blobs there
+    return os.path.join(OCI_CACHE_DIR, "verified", os.path.relpath(blob_path(digest), blob_store_dir()) + ".json")
+
+
+def record_verified_blob(digest: str) -> None:
+    """Record that the blob in the store matched its digest, for its size and mtime."""
+    try:
+        st = os.stat(blob_path(digest))
+        write_json_atomic(blob_record_path(digest), {"size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    except OSError as e:
+        log(f"Warning: could not record the verification of {digest}: {e}")
+
+
+def blob_is_verified(digest: str) -> bool:
+    """Whether the blob is unchanged since record_verified_blob (one stat, one small read)."""
+    record = read_json(blob_record_path(digest))
+    if not record:
+        return False
+    try:
+        st = os.stat(blob_path(digest))
+    except OSError:
+        return False
+    return st.st_size == record.get("size") and st.st_mtime_ns == record.get("mtime_ns")
+
+
+def normalize_image_ref(image: str, tag: str) -> str:
+    """Canonical registry/repository:tag (or @digest) string, e.g. docker.io/library/alpine:3.19."""
+    registry, repository = split_image_name(image)
+    separator = "@" if tag.startswith("sha256:") else ":"
+    return f"{registry}/{repository}{separator}{tag}"
+
+
+def skopeo_platform_args(platform: Optional[str]) -> List[str]:
+    """--override-os/--override-arch arguments for skopeo (default linux/amd64)."""
+    if platform and "/" in platform:
+        os_type, arch = platform.split("/", 1)
+        return ["--override-os", os_type, "--override-arch", arch]
+    if platform:
+        # Assume linux if only arch specified
+        return ["--override-os", "linux", "--override-arch", platform]
+    return ["--override-os", "linux", "--override-arch", "amd64"]
+
+
+def layout_dir(image: str) -> str:
+    """OCI layout directory for one repository (all tags of an image share it)."""
+    registry, repository = split_image_name(image)
+    safe_registry = registry.replace(":", "_")
+    return os.path.join(OCI_CACHE_DIR, "layouts", safe_registry, *repository.split("/"))
+
+
+def layout_ref_name(tag: str) -> str:
+    """Ref name for a tag inside an OCI layout (restricted character set)."""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", tag)
+
+
+def cache_tmp_dir() -> str:
+    """TMPDIR for skopeo, so large temporary files never land on /tmp (often tmpfs)."""
+    return os.path.join(OCI_CACHE_DIR, "tmp")
+
+
+def staging_dir() -> str:
+    return os.path.join(OCI_CACHE_DIR, "staging")
+
+
+def staging_path(digest: str) -> str:
+    return os.path.join(staging_dir(), digest.partition(":")[2] + ".partial")
+
+
+def ensure_cache_dirs() -> None:
+    os.makedirs(os.path.join(blob_store_dir(), "sha256"), mode=0o755, exist_ok=True)
+    os.makedirs(staging_dir(), mode=0o755, exist_ok=True)
+    os.makedirs(os.path.join(OCI_CACHE_DIR, "layouts"), mode=0o755, exist_ok=True)
+    os.makedirs(cache_tmp_dir(), mode=0o700, exist_ok=True)
+
+
+def read_layout_index(layout: str) -> dict:
+    try:
+        with open(os.path.join(layout, "index.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"schemaVersion": 2, "manifests": []}
+
+
+def find_manifest_descriptor(layout: str, ref: str) -> Optional[dict]:
+    """Return the manifest descriptor tagged with `ref` in the layout index, if any."""
+    for desc in read_layout_index(layout).get("manifests", []) or []:
+        if (desc.get("annotations") or {}).get(REF_NAME_ANNOTATION) == ref:
+            return desc
+    return None
+
+
+def read_blob_json(digest: str) -> dict:
+    with open(blob_path(digest), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def manifest_blob_descriptors(manifest_desc: dict) -> List[dict]:
+    """Return descriptors of all blobs an image needs: manifest, config and layers."""
+    manifest = read_blob_json(manifest_desc["digest"])
+    descriptors = [manifest_desc]
+    if manifest.get("config"):
+        descriptors.append(manifest["config"])
+    descriptors.extend(manifest.get("layers", []) or [])
+    return descriptors
+
+
+def copy_fd_range(src_fd: int, dst_fd: int, count: int, hasher=None) -> None:
+    """Copy `count` bytes between file descriptors at their current offsets.
+
+    Uses copy_file_range (in-kernel, server-side on NFS, no user-space buffers) and
+    falls back to sendfile/read+write when the filesystems do not support it.
+    With a `hasher`, the bytes are read and written here so they can be hashed on the
+    way through: that is the only read of the source, no second pass.
+    """
+    remaining = count
+    use_copy_file_range = hasattr(os, "copy_file_range") and hasher is None
+    while remaining > 0:
+        if use_copy_file_range:
+            try:
+                copied = os.copy_file_range(src_fd, dst_fd, remaining)
+            except OSError:
+                # EXDEV/ENOSYS/EINVAL on older kernels or across filesystem types
+                use_copy_file_range = False
+                continue
+        else:
+            chunk = os.read(src_fd, min(remaining, 1024 * 1024))
+            copied = len(chunk)
+            if copied:
+                if hasher is not None:
+                    hasher.update(chunk)
+                os.write(dst_fd, chunk)
+        if copied == 0:
+            raise IOError("Unexpected end of file while copying blob")
+        remaining -= copied
+
+
+def _write_tar_member(out_fd: int, name: str, size: int, data: Optional[bytes] = None,
+                      src_path: Optional[str] = None, hasher=None) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mode = 0o644
+    os.write(out_fd, info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+    if data is not None:
+        os.write(out_fd, data)
+    else:
+        src_fd = os.open(src_path, os.O_RDONLY)
+        try:
+            copy_fd_range(src_fd, out_fd, size, hasher)
+        finally:
+            os.close(src_fd)
+    padding = (-size) % tarfile.BLOCKSIZE
+    if padding:
+        os.write(out_fd, b"\0" * padding)
+
+
+def write_oci_archive(layout: str, ref: str, output_path: str) -> int:
+    """Build a self-contained oci-archive tarball for `ref` from the blob store.
+
+    The archive has the same structure skopeo writes for `oci-archive:`
+    (oci-layout, index.json, blobs/sha256/...), so Proxmox can use it as vztmpl.
+    Blobs verified when they were stored (see record_verified_blob) and unchanged since
+    are copied with copy_file_range. All others (e.g. downloaded by skopeo) are hashed
+    while they are copied and recorded if they match; a blob that does not is removed
+    from the store (the next pull downloads it again) and IOError is raised, so a
+    corrupt store never turns into a corrupt archive.
+
+    Returns the number of bytes written.
+    """
+    manifest_desc = find_manifest_descriptor(layout, ref)
+    if manifest_desc is None:
+        raise FileNotFoundError(f"Ref {ref} not found in OCI layout {layout}")
+    if ref.endswith(SQUASHED_REF_SUFFIX):
+        # The archive of a squashed image carries the image's own ref name
+        annotations = {**manifest_desc["annotations"], REF_NAME_ANNOTATION: ref[:-len(SQUASHED_REF_SUFFIX)]}
+        manifest_desc = {**manifest_desc, "annotations": annotations}
+
+    index = json.dumps({"schemaVersion": 2, "manifests": [manifest_desc]}).encode("utf-8")
+    seen = set()
+    out_fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        _write_tar_member(out_fd, "oci-layout", len(OCI_LAYOUT_CONTENT), data=OCI_LAYOUT_CONTENT)
+        _write_tar_member(out_fd, "index.json", len(index), data=index)
+        for desc in manifest_blob_descriptors(manifest_desc):
+            digest = desc["digest"]
+            if digest in seen:
+                continue
+            seen.add(digest)
+            algorithm, _, hex_digest = digest.partition(":")
+            path = blob_path(digest)
+            if blob_is_verified(digest):
+                # Checked when it was stored and unchanged since: copy_file_range, no read
+                _write_tar_member(out_fd, f"blobs/{algorithm}/{hex_digest}", os.path.getsize(path), src_path=path)
+                continue
+            hasher = hashlib.new(algorithm)
+            _write_tar_member(out_fd, f"blobs/{algorithm}/{hex_digest}", os.path.getsize(path), src_path=path,
+                              hasher=hasher)
+            if hasher.hexdigest() != hex_digest:
+                os.unlink(path)
+                raise IOError(f"Blob {digest} in the blob store is corrupt (got {algorithm}:{hasher.hexdigest()}), "
+                              "removed it; pull again to download it")
+            record_verified_blob(digest)
+        # End-of-archive marker, padded to a full record like tarfile does
+        end = os.lseek(out_fd, 0, os.SEEK_CUR) + 2 * tarfile.BLOCKSIZE
+        os.write(out_fd, b"\0" * (2 * tarfile.BLOCKSIZE + (-end) % tarfile.RECORDSIZE))
+        os.fsync(out_fd)
+        return os.lseek(out_fd, 0, os.SEEK_CUR)
+    finally:
+        os.close(out_fd)
+
+
+# Ref suffix of the squashed variant of an image in its layout (see squash_image)
+SQUASHED_REF_SUFFIX = "-squashed"
+OCI_MANIFEST_MEDIA_TYPE = "application/vnd.oci.image.manifest.v1+json"
+
+
+def store_blob(data: bytes) -> str:
+    """Put a small blob (config, manifest) into the blob store; returns its digest."""
+    digest = sha256_digest(data)
+    if not has_blob(digest):
+        path = blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return digest
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale_partials(storage_dir: str, filename: str) -> None:
+    """Remove hidden temp files of `filename` left behind by killed processes."""
+    prefix = f".{filename}.partial-"
+    try:
+        entries = list(os.scandir(storage_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if not entry.name.startswith(prefix):
+            continue
+        pid = entry.name[len(prefix):]
+        if pid.isdigit() and _pid_alive(int(pid)):
+            continue
+        try:
+            os.unlink(entry.path)
+            log(f"Removed stale partial archive {entry.path}")
+        except OSError:
+            pass
+
+
+def verified_sidecar_path(storage_dir: str, filename: str) -> str:
+    # Hidden, so neither pveam nor the storage index list it
+    return os.path.join(storage_dir, f".{filename}.verified")
+
+
+def write_verified_sidecar(storage_dir: str, filename: str, manifest_digest: str) -> None:
+    """Record that every blob of an archive matched its digest, for this size and mtime."""
+    st = os.stat(os.path.join(storage_dir, filename))
+    try:
+        write_json_atomic(verified_sidecar_path(storage_dir, filename), {
+            "manifest_digest": manifest_digest,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "verified_at": int(time.time()),
+        })
+    except OSError as e:
+        log(f"Warning: could not record the verification of {filename}: {e}")
+
+
+def verified_manifest_digest(storage_dir: str, filename: str) -> Optional[str]:
+    """Manifest digest from the sidecar if the archive is unchanged since it was verified.
+
+    One stat() and one small read instead of hashing the archive again. Any change of
+    size or mtime (a rewrite, a copy by hand, truncation) invalidates the sidecar.
+    """
+    sidecar = read_json(verified_sidecar_path(storage_dir, filename))
+    if not sidecar:
+        return None
+    try:
+        st = os.stat(os.path.join(storage_dir, filename))
+    except OSError:
+        return None
+    if st.st_size != sidecar.get("size") or st.st_mtime_ns != sidecar.get("mtime_ns"):
+        return None
+    return sidecar.get("manifest_digest")
+
+
+def verify_archive_stream(fileobj) -> str:
+    """Read an oci-archive tar stream and check every blob against its sha256 name.
+
+    The index.json must reference a manifest contained in the archive. Returns the
+    manifest digest; raises IOError (or tarfile.TarError) otherwise.
+    """
+    blobs, manifests = set(), []
+    with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+        for member in tar:
+            data = tar.extractfile(member) if member.isfile() else None
+            if data is None:
+                continue
+            if member.name == "index.json":
+                manifests = json.loads(data.read().decode("utf-8")).get("manifests") or []
+            elif member.name.startswith("blobs/sha256/"):
+                hasher = hashlib.sha256()
+                for chunk in iter(lambda: data.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+                if hasher.hexdigest() != member.name.rsplit("/", 1)[1]:
+                    raise IOError(f"Checksum mismatch for {member.name}")
+                blobs.add("sha256:" + hasher.hexdigest())
+    while fileobj.read(1024 * 1024):
+        pass  # Trailing zero records
+    if not manifests or any(m.get("digest") not in blobs for m in manifests):
+        raise IOError("Archive does not contain the manifest of its index.json")
+    return manifests[0]["digest"]
+
+
+def verify_oci_archive(storage_dir: str, filename: str) -> bool:
+    """Whether an archive is intact: from the sidecar, else by reading it once.
+
+    Archives written before sidecars existed, or changed since, are read and hashed
+    completely; if they are intact, a sidecar is written so the next check is O(1).
+    """
+    if verified_manifest_digest(storage_dir, filename):
+        return True
+    path = os.path.join(storage_dir, filename)
+    log(f"Verifying {filename} (no valid verification record)")
+    try:
+        with open(path, "rb") as f:
+            manifest_digest = verify_archive_stream(f)
+    except (OSError, tarfile.TarError, ValueError) as e:
+        log(f"Warning: {filename} is corrupt: {e}")
+        return False
+    write_verified_sidecar(storage_dir, filename, manifest_digest)
+    return True
+
+
+def install_oci_archive(layout: str, ref: str, storage_dir: str, filename: str) -> int:
+    """Write the oci-archive for `ref` directly into the vztmpl cache directory.
+
+    The archive is written to a hidden temp file in `storage_dir` (not listed by
+    pveam, same filesystem as the target) and renamed atomically, so an interrupted
+    run never leaves a truncated .tar that looks like a valid template. The blobs were
+    verified while they were copied, which the sidecar records (see
+    write_verified_sidecar).
+
+    Returns the archive size in bytes.
+    """
+    os.makedirs(storage_dir, mode=0o755, exist_ok=True)
+    remove_stale_partials(storage_dir, filename)
+    tmp_path = os.path.join(storage_dir, f".{filename}.partial-{os.getpid()}")
+    try:
+        size = write_oci_archive(layout, ref, tmp_path)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, os.path.join(storage_dir, filename))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    write_verified_sidecar(storage_dir, filename, find_manifest_descriptor(layout, ref)["digest"])
+    return size
+
+
+def missing_layer_bytes(layers: Iterable[dict]) -> int:
+    """Bytes still to download for layers (from skopeo inspect LayersData).
+
+    Layers in the blob store count as 0, partially staged layers (see
+    fetch_blob_resumable) with their remaining bytes.
+    """
+    total = 0
+    for layer in layers or []:
+        digest = layer.get("Digest") or layer.get("digest")
+        if not digest or has_blob(digest):
+            continue
+        size = int(layer.get("Size") or layer.get("size") or 0)
+        try:
+            staged = os.path.getsize(staging_path(digest))
+        except OSError:
+            staged = 0
+        total += max(size - staged, 0)
+    return total
+
+
+def inspect_cache_path(image: str, tag: str, platform: Optional[str]) -> str:
+    key = f"{normalize_image_ref(image, tag)}|{platform or 'linux/amd64'}"
+    return os.path.join(OCI_CACHE_DIR, "inspect", hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+
+def load_cached_inspect(image: str, tag: str, platform: Optional[str]) -> Optional[dict]:
+    """Return the cache entry {fetched_at, manifest_digest, inspect} or None."""
+    entry = read_json(inspect_cache_path(image, tag, platform))
+    if not entry or not isinstance(entry.get("inspect"), dict):
+        return None
+    return entry
+
+
+def inspect_cache_is_fresh(entry: dict, tag: str, ttl: int) -> bool:
+    """Digest references are immutable; everything else is fresh for `ttl` seconds."""
+    if tag.startswith("sha256:"):
+        return True
+    return time.time() - float(entry.get("fetched_at", 0)) < ttl
+
+
+def store_cached_inspect(image: str, tag: str, platform: Optional[str], inspect: dict,
+                         manifest_digest: Optional[str]) -> None:
+    entry = {
+        "image": normalize_image_ref(image, tag),
+        "platform": platform or "linux/amd64",
+        "fetched_at": time.time(),
+        "manifest_digest": manifest_digest,
+        "inspect": inspect,
+    }
+    try:
+        write_json_atomic(inspect_cache_path(image, tag, platform), entry)
+    except OSError as e:
+        log(f"Warning: could not write inspect cache: {e}")
+
+
+def touch_cached_inspect(image: str, tag: str, platform: Optional[str], entry: dict) -> None:
+    """Mark a revalidated entry as fresh again."""
+    store_cached_inspect(image, tag, platform, entry["inspect"], entry.get("manifest_digest"))
+
+
+def archive_filename(image: str, tag: str) -> str:
+    """Filename of the oci-archive in the vztmpl cache: <image base>_<tag>.tar."""
+    image_base = image.split("/")[-1]
+    safe_tag = tag.replace(":", "_").replace("/", "_").replace("\\", "_")
+    return f"{image_base}_{safe_tag}.tar"
+
+
+PVE_STORAGE_CFG = os.environ.get("LXC_MANAGER_PVE_STORAGE_CFG", "/etc/pve/storage.cfg")
+# Network file systems: mounted under /mnt/pve/<storage> on every node, shared without a flag
+SHARED_STORAGE_TYPES = ("nfs", "cifs", "cephfs", "glusterfs")
+
+_storage_cfg: Optional[Tuple[Optional[List[int]], Dict[str, dict]]] = None
+_storage_cfg_lock = threading.Lock()
+
+
+def parse_storage_cfg(text: str) -> Dict[str, dict]:
+    """Storages of a storage.cfg as {id: {"type", "path", "shared", "content", "nodes"}}.
+
+    Sections start with "<type>: <id>" followed by indented "<key> <value>" lines.
+    path is None for storages without a file system (lvm, zfspool, rbd, ...); nodes is
+    None if the storage is available on all nodes.
+    """
+    sections: Dict[str, dict] = {}
+    current: Optional[dict] = None
+    for line in text.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        if not line[0].isspace():
+            m = re.match(r"^([\w-]+):\s*(\S+)", line)
+            current = sections.setdefault(m.group(2), {"type": m.group(1)}) if m else None
+            continue
+        if current is not None:
+            parts = line.split(None, 1)
+            current[parts[0]] = parts[1].strip() if len(parts) > 1 else ""
+    storages = {}
+    for storage, options in sections.items():
+        kind = options["type"]
+        path = options.get("path")
+        if not path and kind in SHARED_STORAGE_TYPES:
+            path = f"/mnt/pve/{storage}"
+        storages[storage] = {
+            "type": kind,
+            "path": path,
+            "shared": kind in SHARED_STORAGE_TYPES or options.get("shared") == "1",
+            "content": [c.strip() for c in options.get("content", "").split(",") if c.strip()],
+            "nodes": [n.strip() for n in options["nodes"].split(",") if n.strip()] if options.get("nodes") else None,
+        }
+    return storages
+
+
+def pve_storages() -> Dict[str, dict]:
+    """Parsed PVE_STORAGE_CFG (see parse_storage_cfg), {} if it does not exist.
+
+    The file is parsed once per process and again only when its mtime/size changed,
+    so the batch scripts and the cache server can ask for every image.
+    """
+    global _storage_cfg
+    state = _file_state(PVE_STORAGE_CFG)
+    with _storage_cfg_lock:
+        if _storage_cfg is None or _storage_cfg[0] != state:
+            try:
+                with open(PVE_STORAGE_CFG, encoding="utf-8", errors="replace") as f:
+                    storages = parse_storage_cfg(f.read())
+            except OSError:
+                storages = {}
+            _storage_cfg = (state, storages)
+        return _storage_cfg[1]
+
+
+def storage_is_shared(storage: str) -> bool:
+    """True if all nodes see the same files in the storage (NFS, CephFS, dir with shared 1, ...)."""
+    return bool(pve_storages().get(storage, {}).get("shared"))
+
+
+def resolve_storage_dir(storage: str) -> str:
+    """vztmpl cache directory of a Proxmox storage.
+
+    The path comes from storage.cfg; without an entry (or without a path) the
+    default locations of local and /mnt/pve/<storage> are tried.
+    """
+    path = pve_storages().get(storage, {}).get("path")
+    if path:
+        return os.path.join(path, "template", "cache")
+    if storage == "local":
+        return "/var/lib/vz/template/cache"
+    mount_point = f"/mnt/pve/{storage}"
+    if os.path.isdir(mount_point):
+        return os.path.join(mount_point, "template", "cache")
+    storage_dir = "/var/lib/vz/template/cache"
+    log(f"Warning: Could not determine storage path for {storage}, using {storage_dir}")
+    return storage_dir
+
+
+class StorageIndex:
+    """Index of the OCI archives in one vztmpl cache directory.
+
+    Maps exact archive filenames (<image base>_<tag>.tar) to their volume ID and the
+    image/tag/digest they were imported from, so existence checks are one dictionary
+    lookup instead of a `pveam list` process plus substring scan.
+
+    The index is persisted next to the cache directory (a file inside it would change
+    the directory mtime on every save). It is refreshed from the directory listing only
+    when the directory mtime changed; entries of files whose size/mtime did not change
+    are kept as they are.
+    """
+
+    def __init__(self, storage: str, storage_dir: str, shared: bool = False) -> None:
+        self.storage = storage
+        self.storage_dir = storage_dir
+        # Other nodes read and write the same directory (and this index, see storage_lock)
+        self.shared = shared
+        self.path = os.path.join(os.path.dirname(storage_dir.rstrip("/")), ".oci-lxc-deployer-index.json")
+        data = read_json(self.path) or {}
+        self.dir_mtime_ns = int(data.get("dir_mtime_ns", 0))
+        self.entries = data.get("entries", {}) if isinstance(data.get("entries"), dict) else {}
+        self._by_digest = {}
+        self._lock = threading.RLock()
+
+    def reload(self) -> None:
+        """Pick up entries another process recorded since this index was loaded."""
+        data = read_json(self.path) or {}
+        with self._lock:
+            if isinstance(data.get("entries"), dict):
+                self.entries.update(data["entries"])
+            self.refresh()
+
+    def refresh(self) -> None:
+        try:
+            dir_mtime_ns = os.stat(self.storage_dir).st_mtime_ns
+        except FileNotFoundError:
+            self.entries = {}
+            self._by_digest = {}
+            return
+        if dir_mtime_ns != self.dir_mtime_ns:
+            entries = {}
+            for entry in os.scandir(self.storage_dir):
+                if entry.name.startswith(".") or not entry.name.endswith(".tar") or not entry.is_file():
+                    continue
+                st = entry.stat()
+                known = self.entries.get(entry.name)
+                if known and known.get("size") == st.st_size and known.get("mtime_ns") == st.st_mtime_ns:
+                    entries[entry.name] = known
+                else:
+                    entries[entry.name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            self.entries = entries
+            self.dir_mtime_ns = dir_mtime_ns
+            self.save()
+        self._by_digest = {e["digest"]: name for name, e in self.entries.items() if e.get("digest")}
+
+    def save(self) -> None:
+        try:
+            write_json_atomic(self.path, {"dir_mtime_ns": self.dir_mtime_ns, "entries": self.entries})
+        except OSError as e:
+            log(f"Warning: could not write storage index {self.path}: {e}")
+
+    def volume_id(self, filename: str) -> str:
+        return f"{self.storage}:vztmpl/{filename}"
+
+    def _existing(self, filename: Optional[str]) -> Optional[str]:
+        if not filename or filename not in self.entries:
+            return None
+        # The directory mtime does not change when a file is rewritten in place
+        try:
+            st = os.stat(os.path.join(self.storage_dir, filename))
+        except FileNotFoundError:
+            return None
+        if st.st_size != self.entries[filename].get("size"):
+            return None
+        return self.volume_id(filename)
+
+    def lookup(self, image: str, tag: str) -> Optional[str]:
+        """Volume ID of the archive for image:tag, or None."""
+        return self._existing(archive_filename(image, tag))
+
+    def lookup_digest(self, image: str, digest: str) -> Optional[str]:
+        """Volume ID of an archive of `image` imported from the manifest `digest`, or None."""
+        filename = self._by_digest.get(digest)
+        if not filename or not self.entries[filename].get("image", "").startswith(normalize_image_ref(image, "")):
+            return None
+        return self._existing(filename)
+
+    def record(self, image: str, tag: str, digest: Optional[str]) -> None:
+        """Register an archive that was just written to the cache directory."""
+        filename = archive_filename(image, tag)
+        st = os.stat(os.path.join(self.storage_dir, filename))
+        with self._lock:
+            # Keep entries recorded by concurrent processes since we loaded the index
+            persisted = (read_json(self.path) or {}).get("entries")
+            if isinstance(persisted, dict):
+                for name, entry in persisted.items():
+                    self.entries.setdefault(name, entry)
+            self.entries[filename] = {
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "image": normalize_image_ref(image, tag),
+                "tag": tag,
+                "digest": digest,
+                "last_used": time.time(),
+            }
+            if digest:
+                self._by_digest[digest] = filename
+            self.save()
+
+    def mark_used(self, volume_id: str) -> None:
+        """Record that an archive was used (a pull hit it), for LRU eviction."""
+        filename = volume_id.split("/")[-1]
+        with self._lock:
+            if filename in self.entries:
+                self.entries[filename]["last_used"] = time.time()
+                self.save()
+
+    def last_used(self, filename: str) -> float:
+        entry = self.entries.get(filename, {})
+        return float(entry.get("last_used") or entry.get("mtime_ns", 0) / 1e9)
+
+    def remove(self, filename: str) -> None:
+        with self._lock:
+            os.unlink(os.path.join(self.storage_dir, filename))
+            try:
+                os.unlink(verified_sidecar_path(self.storage_dir, filename))
+            except FileNotFoundError:
+                pass
+            self.entries.pop(filename, None)
+            self._by_digest = {d: f for d, f in self._by_digest.items() if f != filename}
+            self.save()
+
+
+def open_storage_index(storage: str) -> StorageIndex:
+    index = StorageIndex(storage, resolve_storage_dir(storage), storage_is_shared(storage))
+    index.refresh()
+    return index
+
+
+class PullProgress:
+    """Tracks download progress of layers into the blob store.
+
+    skopeo prints no byte counts when stderr is not a terminal, so progress is measured
+    on disk: finished layers are blobs in the store, running ones are staging partials
+    (fetch_blob_resumable) or skopeo's oci-put-blob* temp files. skopeo logs
+    "Copying blob <digest>" right before it creates the temp file, so temp files (by
+    creation time) are attributed to the active layers in log order.
+    """
+
+    COPYING_BLOB_RE = re.compile(r"Copying blob (sha256:[a-f0-9]{64})")
+
+    def __init__(self, layout: str, layers: Iterable[dict]) -> None:
+        self.layout = layout
+        # Only layers missing at start are downloaded, the rest is reused from the store
+        self.layers = {}
+        for layer in layers or []:
+            digest = layer.get("Digest") or layer.get("digest")
+            if digest and not has_blob(digest):
+                self.layers[digest] = int(layer.get("Size") or layer.get("size") or 0)
+        self.bytes_total = sum(self.layers.values())
+        self.active: List[str] = []
+        self.samples: List[Tuple[float, int]] = []
+        self.bytes_done = 0
+        self.last_change = time.monotonic()
+        # Temp files left behind by earlier, killed runs are not ours
+        self.started_at = time.time()
+
+    def start_layer(self, digest: str) -> None:
+        if digest not in self.active:
+            self.active.append(digest)
+
+    def on_line(self, line: str) -> None:
+        m = self.COPYING_BLOB_RE.search(line)
+        if m and m.group(1) in self.layers and m.group(1) not in self.active and "skipped" not in line:
+            self.active.append(m.group(1))
+
+    def _temp_file_sizes(self) -> List[int]:
+        temp_files = []
+        for directory in (self.layout, os.path.join(blob_store_dir(), "sha256")):
+            try:
+                for entry in os.scandir(directory):
+                    if entry.name.startswith("oci-put-blob"):
+                        st = entry.stat()
+                        if st.st_ctime >= self.started_at - 1:
+                            temp_files.append((st.st_ctime, st.st_size))
+            except FileNotFoundError:
+                continue
+        return [size for _ctime, size in sorted(temp_files)]
+
+    def sample(self) -> dict:
+        """Measure progress now and return a progress event payload."""
+        now = time.monotonic()
+        finished = [d for d in self.layers if has_blob(d)]
+        self.active = [d for d in self.active if d not in finished]
+        temp_sizes = self._temp_file_sizes()
+        layer_done = {d: self.layers[d] for d in finished}
+        for digest in self.layers:
+            if digest not in layer_done:
+                try:
+                    layer_done[digest] = min(os.path.getsize(staging_path(digest)), self.layers[digest])
+                except OSError:
+                    pass
+        for digest, size in zip(self.active, temp_sizes):
+            layer_done[digest] = min(size, self.layers[digest])
+        bytes_done = sum(layer_done.values())
+        if bytes_done != self.bytes_done:
+            self.last_change = now
+        self.bytes_done = bytes_done
+
+        # Throughput over a sliding window of ~10 seconds
+        self.samples.append((now, bytes_done))
+        self.samples = [(t, b) for t, b in self.samples if now - t <= 10.0] or [(now, bytes_done)]
+        t0, b0 = self.samples[0]
+        throughput = (bytes_done - b0) / (now - t0) if now > t0 else 0.0
+
+        def eta(remaining: int) -> Optional[int]:
+            return int(remaining / throughput) if throughput > 0 else None
+
+        active_layers = []
+        for digest in self.active:
+            total = self.layers[digest]
+            done = layer_done.get(digest, 0)
+            active_layers.append({
+                "digest": digest,
+                "bytes_done": done,
+                "bytes_total": total,
+                # Parallel layers share the bandwidth
+                "eta_seconds": eta((total - done) * max(len(self.active), 1)),
+            })
+        return {
+            "bytes_done": bytes_done,
+            "bytes_total": self.bytes_total,
+            "throughput_bps": int(throughput),
+            "eta_seconds": eta(max(self.bytes_total - bytes_done, 0)),
+            "layers": active_layers,
+        }
+
+    def stalled_for(self) -> float:
+        return time.monotonic() - self.last_change
+
+
+def lock_dir() -> str:
+    return os.path.join(OCI_CACHE_DIR, "locks")
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class FileLock:
+    """Exclusive lock shared by all processes (and threads) on the VE host.
+
+    Uses flock() on locks/<sha256 of key>.lock. The kernel releases the lock when the
+    holder exits, including kill -9 or a dropped SSH session, so a dead holder never
+    blocks the next caller. The descriptor is not inherited by child processes, so an
+    orphaned skopeo does not keep the lock either. The holder writes its pid and key
+    into the file, which is shown while others wait.
+    """
+
+    def __init__(self, key: str, timeout: int = DEFAULT_LOCK_TIMEOUT, directory: Optional[str] = None) -> None:
+        self.key = key
+        self.timeout = timeout
+        self.directory = directory or lock_dir()
+        self.path = os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".lock")
+        self.fd: Optional[int] = None
+        self.waited = 0.0
+
+    def _lock(self, fd: int) -> None:
+        """Take the lock without blocking; raises BlockingIOError if it is held."""
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(self, fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _owner(self) -> str:
+        return f"pid {os.getpid()}"
+
+    def _holder(self) -> str:
+        try:
+            with open(self.path) as f:
+                return f.read().strip() or "unknown"
+        except OSError:
+            return "unknown"
+
+    def acquire(self) -> None:
+        """Acquire the lock, waiting up to `timeout` seconds. Raises LockTimeout."""
+        os.makedirs(self.directory, mode=0o755, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        start = time.monotonic()
+        announced = False
+        while True:
+            try:
+                self._lock(fd)
+                break
+            except BlockingIOError:
+                elapsed = time.monotonic() - start
+                if elapsed >= self.timeout:
+                    os.close(fd)
+                    raise LockTimeout(f"Timeout after {int(elapsed)}s waiting for {self.key} "
+                                      f"(held by {self._holder()})")
+                if not announced:
+                    log(f"Waiting for concurrent pull of {self.key} ({self._holder()})")
+                    announced = True
+                time.sleep(1.0)
+        self.waited = time.monotonic() - start if announced else 0.0
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, f"{self._owner()}: {self.key}\n".encode("utf-8"), 0)
+        self.fd = fd
+
+    def release(self) -> None:
+        if self.fd is not None:
+            os.ftruncate(self.fd, 0)
+            self._unlock(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class StorageLock(FileLock):
+    """Exclusive lock shared by all nodes that mount a shared storage.
+
+    The lock file lives in .oci-lxc-deployer-locks next to the vztmpl cache directory
+    and is locked with a POSIX record lock (lockf), which NFS, CIFS, CephFS and
+    GlusterFS pass on to the server. pmxcfs locks in /etc/pve/priv/lock expire after
+    120 seconds, too early for copying a multi-GB archive. A record lock belongs to the
+    process, not to the descriptor, so it does not exclude threads of the same process:
+    use storage_lock(), which takes the FileLock of the key first.
+    """
+
+    def __init__(self, index: "StorageIndex", key: str, timeout: int = DEFAULT_LOCK_TIMEOUT) -> None:
+        super().__init__(key, timeout, os.path.join(os.path.dirname(index.storage_dir.rstrip("/")),
+                                                    ".oci-lxc-deployer-locks"))
+
+    def _lock(self, fd: int) -> None:
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            if e.errno in (errno.EACCES, errno.EAGAIN):
+                raise BlockingIOError(e.errno, e.strerror)
+            raise
+
+    def _unlock(self, fd: int) -> None:
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+
+    def _owner(self) -> str:
+        return f"node {socket.gethostname().split('.')[0]} pid {os.getpid()}"
+
+
+@contextlib.contextmanager
+def storage_lock(index: "StorageIndex", key: str, timeout: int = DEFAULT_LOCK_TIMEOUT):
+    """FileLock for key, plus a StorageLock if other nodes share the storage.
+
+    Yields the FileLock; its `waited` includes the time spent waiting for other nodes.
+    """
+    with FileLock(key, timeout) as lock:
+        if not index.shared:
+            yield lock
+            return
+        with StorageLock(index, key, max(1, int(timeout - lock.waited))) as shared:
+            lock.waited += shared.waited
+            yield lock
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all download threads of one process.
+
+    consume() blocks until the bytes fit into the configured rate. A rate of 0 or less
+    disables the limit. The bucket holds at most one second worth of bytes, so short
+    idle phases do not allow large bursts afterwards.
+    """
+
+    def __init__(self, rate_bps: int, host: Optional["HostBandwidthLimiter"] = None) -> None:
+        self.rate = max(0, int(rate_bps or 0))
+        self.tokens = float(self.rate)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        # The ceiling for all processes on the host, applied after this one
+        self.host = host
+
+    def consume(self, n: int) -> None:
+        if self.rate > 0:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(float(self.rate), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                self.tokens -= n
+                wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if wait > 0:
+                time.sleep(wait)
+        if self.host:
+            self.host.consume(n)
+
+
+TIME_WINDOW_RE = re.compile(r"^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$")
+
+
+def parse_time_window(window: str) -> Optional[Tuple[int, int]]:
+    """(start, end) in minutes after midnight, or None for any time. Raises ValueError."""
+    window = window.strip()
+    if not window:
+        return None
+    m = TIME_WINDOW_RE.match(window)
+    if not m:
+        raise ValueError(f"invalid window {window!r}, expected HH:MM-HH:MM")
+    start = int(m.group(1)) * 60 + int(m.group(2))
+    end = int(m.group(3)) * 60 + int(m.group(4))
+    if start >= 24 * 60 or end > 24 * 60 or start == end:
+        raise ValueError(f"invalid window {window!r}")
+    return start, end
+
+
+def minutes_of_day(now: float) -> float:
+    local = time.localtime(now)
+    return local.tm_hour * 60 + local.tm_min + local.tm_sec / 60
+
+
+def in_time_window(window: Optional[Tuple[int, int]], now: float) -> bool:
+    """Whether time.time() `now` is inside the window (local time, may span midnight)."""
+    if window is None:
+        return True
+    start, end = window
+    minute = minutes_of_day(now)
+    return start <= minute < end if start < end else (minute >= start or minute < end)
+
+
+HOST_BANDWIDTH_CONFIG = os.environ.get("LXC_MANAGER_HOST_BANDWIDTH",
+                                       "/var/lib/oci-lxc-deployer/bandwidth.json")
+HOST_BANDWIDTH_STATE = os.path.join(os.path.dirname(HOST_CAPABILITIES_FILE), "bandwidth-bucket")
+# How long a computed rate is used before the schedule is evaluated again
+HOST_RATE_RECHECK = 5.0
+
+
+def parse_bandwidth_schedule(spec: str) -> List[Tuple[Tuple[int, int], int]]:
+    """Parse "HH:MM-HH:MM=<KiB/s>, ..." into [((start, end), bytes/s)]. Raises ValueError.
+
+    A rate of 0 lifts the limit inside its window. The first matching window wins.
+    """
+    schedule = []
+    for entry in re.split(r"[\s,;]+", spec.strip()):
+        if not entry:
+            continue
+        window, _, rate = entry.partition("=")
+        if not rate.strip().isdigit():
+            raise ValueError(f"invalid schedule entry {entry!r}, expected HH:MM-HH:MM=<KiB/s>")
+        schedule.append((parse_time_window(window), int(rate) * 1024))
+    return schedule
+
+
+def store_host_bandwidth(max_bandwidth: Optional[int], schedule: Optional[str]) -> None:
+    """Set the host-wide limit (bytes/s) and/or schedule; None keeps the current value."""
+    config = read_json(HOST_BANDWIDTH_CONFIG) or {}
+    if max_bandwidth is not None:
+        config["max_bandwidth"] = max(0, max_bandwidth)
+    if schedule is not None:
+        parse_bandwidth_schedule(schedule)
+        config["schedule"] = schedule.strip()
+    try:
+        os.makedirs(os.path.dirname(HOST_BANDWIDTH_CONFIG), exist_ok=True)
+        write_json_atomic(HOST_BANDWIDTH_CONFIG, config)
+    except OSError as e:
+        log(f"Warning: could not write {HOST_BANDWIDTH_CONFIG}: {e}")
+
+
+class HostBandwidthLimiter:
+    """Token bucket shared by all processes on the VE host (pulls, prefetcher, OCI cache).
+
+    The limit is read from HOST_BANDWIDTH_CONFIG: "max_bandwidth" in bytes/s, replaced
+    by the rate of the first "schedule" window that contains the current local time
+    (e.g. "00:00-06:00=0, 18:00-23:00=2048" lifts the limit at night and halves a
+    4096 KiB/s day limit in the evening). The bucket is a single number in /run, the
+    time at which all bytes consumed so far are paid for (GCRA). consume() advances it
+    under flock() and sleeps until it is at most one second ahead, the same burst the
+    per-process BandwidthLimiter allows.
+    """
+
+    def __init__(self, config_path: Optional[str] = None, state_path: Optional[str] = None) -> None:
+        self.config_path = config_path or HOST_BANDWIDTH_CONFIG
+        self.state_path = state_path or HOST_BANDWIDTH_STATE
+        self._rate = 0
+        self._checked = float("-inf")
+
+    def rate(self, now: Optional[float] = None) -> int:
+        """Current limit in bytes/s (0 = unlimited)."""
+        config = read_json(self.config_path) or {}
+        rate = int(config.get("max_bandwidth") or 0)
+        try:
+            schedule = parse_bandwidth_schedule(str(config.get("schedule") or ""))
+        except ValueError as e:
+            log(f"Warning: ignoring bandwidth schedule in {self.config_path}: {e}")
+            schedule = []
+        now = time.time() if now is None else now
+        for window, window_rate in schedule:
+            if in_time_window(window, now):
+                return window_rate
+        return rate
+
+    def consume(self, n: int) -> None:
+        now = time.monotonic()
+        if now - self._checked >= HOST_RATE_RECHECK:
+            self._rate = self.rate()
+            self._checked = now
+        if self._rate <= 0:
+            return
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                paid_until = float(os.pread(fd, 32, 0).decode("ascii").strip() or 0)
+            except ValueError:
+                paid_until = 0.0
+            now = time.monotonic()
+            paid_until = max(paid_until, now) + n / self._rate
+            os.pwrite(fd, f"{paid_until:<31.6f}\n".encode("ascii"), 0)
+        finally:
+            os.close(fd)
+        wait = paid_until - now - 1.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _StripAuthOnRedirect(urllib.request.HTTPRedirectHandler):
+    """Drop the Authorization header when a registry redirects to blob storage.
+
+    Docker Hub redirects blob downloads to S3/CDN URLs that are already signed; sending
+    the registry token along makes S3 reject the request (missing x-amz-content-sha256).
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        new = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if new is not None and urllib.parse.urlparse(newurl).netloc != urllib.parse.urlparse(req.full_url).netloc:
+            new.remove_header("Authorization")
+        return new
+
+
+def open_blob_stream(image: str, digest: str, username: Optional[str] = None,
+                     password: Optional[str] = None, timeout: int = DEFAULT_STALL_TIMEOUT,
+                     offset: int = 0):
+    """Open a blob download (HTTP response), answering auth challenges and following redirects.
+
+    With offset > 0 a range request is sent; the caller checks for status 206, since
+    registries may ignore the range and send the whole blob.
+    """
+    registry, repository = split_image_name(image)
+    url = f"{registry_base_url(registry)}/v2/{repository}/blobs/{digest}"
+    opener = urllib.request.build_opener(_StripAuthOnRedirect)
+    scope = repository_scope(repository)
+    authorization = load_cached_token(registry, scope, username, password)
+    from_cache = authorization is not None
+    for _attempt in range(3):
+        req = urllib.request.Request(url)
+        if authorization:
+            req.add_header("Authorization", authorization)
+        if offset:
+            req.add_header("Range", f"bytes={offset}-")
+        try:
+            return opener.open(req, timeout=timeout)
+        except urllib.error.HTTPError as e:
+            if e.code != 401 or (authorization and not from_cache):
+                raise
+            if from_cache:
+                drop_cached_token(registry, scope, username, password)
+                from_cache = False
+            authorization = fetch_registry_token(e.headers.get("WWW-Authenticate", ""), username, password,
+                                                 timeout, registry)
+            if not authorization:
+                raise
+    raise IOError(f"Authentication for blob {digest} of {image} failed")
+
+
+def fetch_blob_resumable(image: str, digest: str, size: int, username: Optional[str] = None,
+                         password: Optional[str] = None, timeout: int = DEFAULT_STALL_TIMEOUT,
+                         on_chunk=None, limiter: Optional[BandwidthLimiter] = None) -> None:
+    """Download one blob into the store, resuming a partial download from an earlier attempt.
+
+    Data is appended to staging/<hex>.partial. If that file exists, only the missing
+    range is requested (Range: bytes=<n>-); registries that ignore ranges answer 200 and
+    the download restarts from zero. The sha256 is verified before the blob is moved
+    into the store. `timeout` applies per socket operation, so a stalled connection fails
+    after `timeout` seconds without limiting the total duration.
+    """
+    if has_blob(digest):
+        return
+    partial = staging_path(digest)
+    offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+    if size and offset >= size:
+        offset = 0  # Complete but unverified, or bigger than expected: start over
+
+    resp = open_blob_stream(image, digest, username, password, timeout, offset)
+    with resp:
+        if offset and resp.status != 206:
+            log(f"Registry does not support range requests, restarting {digest}")
+            offset = 0
+        elif offset:
+            log(f"Resuming {digest} at {offset} of {size} bytes")
+        hasher = hashlib.sha256()
+        mode = "r+b" if offset else "wb"
+        with open(partial, mode) as f:
+            if offset:
+                # Hash the bytes kept from the earlier attempt, then append
+                while f.tell() < offset:
+                    chunk = f.read(min(1024 * 1024, offset - f.tell()))
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                f.seek(offset)
+                f.truncate()
+            while True:
+                chunk = resp.read(256 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+                hasher.update(chunk)
+                if limiter:
+                    limiter.consume(len(chunk))
+                if on_chunk:
+                    on_chunk(len(chunk))
+            f.flush()
+            os.fsync(f.fileno())
+            received = f.tell()
+    if size and received < size:
+        # Connection closed early; keep the partial for the next attempt
+        raise IOError(f"Download of {digest} interrupted at {received} of {size} bytes")
+    actual = "sha256:" + hasher.hexdigest()
+    if actual != digest:
+        os.unlink(partial)
+        raise IOError(f"Digest mismatch for {digest}: got {actual}")
+    os.replace(partial, blob_path(digest))
+    record_verified_blob(digest)
+
+
+def fetch_missing_layers(image: str, layers: Iterable[dict], progress: PullProgress,
+                         username: Optional[str] = None, password: Optional[str] = None,
+                         timeout: int = DEFAULT_STALL_TIMEOUT, attempts: int = 3,
+                         limiter: Optional[BandwidthLimiter] = None,
+                         lock_timeout: int = DEFAULT_LOCK_TIMEOUT) -> None:
+    """Fetch all layers that are not in the blob store yet (resumable, sequential).
+
+    Network errors are retried `attempts` times per layer, each retry resuming the
+    partial download. HTTP errors (auth, not found) are raised immediately.
+    Layers shared by images that are pulled concurrently (threads or processes) are
+    downloaded only once.
+
+    Afterwards skopeo finds every layer in the store and only copies manifest and config.
+    """
+    last_event = [0.0]
+
+    def on_chunk(_n: int) -> None:
+        now = time.monotonic()
+        if now - last_event[0] >= PROGRESS_INTERVAL:
+            last_event[0] = now
+            emit_event("pull_progress", image=image, **progress.sample())
+
+    for layer in layers or []:
+        digest = layer.get("Digest") or layer.get("digest")
+        if not digest or has_blob(digest):
+            continue
+        progress.start_layer(digest)
+        size = int(layer.get("Size") or layer.get("size") or 0)
+        with FileLock(f"blob {digest}", lock_timeout):
+            for attempt in range(1, attempts + 1):
+                try:
+                    fetch_blob_resumable(image, digest, size, username, password, timeout,
+                                         on_chunk, limiter)
+                    break
+                except urllib.error.HTTPError:
+                    raise
+                except (OSError, urllib.error.URLError) as e:
+                    # Unknown host: retrying does not help, let skopeo take over
+                    if attempt == attempts or isinstance(getattr(e, "reason", None), socket.gaierror):
+                        raise
+                    log(f"Download of {digest} failed ({e}), retrying ({attempt}/{attempts - 1})")
+                    time.sleep(min(2 ** attempt, 30))
+    emit_event("pull_progress", image=image, **progress.sample())
+
+
+def storage_free_bytes(path: str) -> int:
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+SPACE_MARGIN_BYTES = 64 * 1024 * 1024
+
+
+def format_size(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}" if unit != "B" else f"{int(value)} B"
+        value /= 1024
+    return f"{value:.1f} TiB"
+
+
+def _existing_ancestor(path: str) -> str:
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+
+def space_shortages(layers: Iterable[dict], storage_dir: str,
+                    margin: int = SPACE_MARGIN_BYTES) -> List[str]:
+    """Check up front whether a pull of `layers` fits on disk.
+
+    The cache (blob store, staging, skopeo's TMPDIR) needs the compressed layers that
+    are not downloaded yet, minus bytes already staged by an interrupted run. The
+    storage needs the oci-archive, which contains all layers. If both are on the same
+    filesystem the needs add up. Returns one message per filesystem that is too small
+    (empty if the pull fits or the sizes are unknown).
+    """
+    layers = list(layers or [])
+    archive = sum(int(layer.get("Size") or layer.get("size") or 0) for layer in layers)
+    download = missing_layer_bytes(layers)
+    needs: Dict[int, List] = {}
+    for path, need in ((OCI_CACHE_DIR, download), (storage_dir, archive)):
+        path = _existing_ancestor(path)
+        try:
+            device = os.stat(path).st_dev
+        except OSError:
+            continue
+        needs.setdefault(device, [path, 0])[1] += need
+    shortages = []
+    for path, need in needs.values():
+        if not need:
+            continue
+        try:
+            free = storage_free_bytes(path)
+        except OSError:
+            continue
+        if need + margin > free:
+            shortages.append(f"{path} needs {format_size(need + margin)} "
+                             f"(including {format_size(margin)} reserve), {format_size(free)} free")
+    return shortages
+
+
+PVE_MEMBERS_FILE = os.environ.get("LXC_MANAGER_PVE_MEMBERS", "/etc/pve/.members")
+PVE_NODES_DIR = os.environ.get("LXC_MANAGER_PVE_NODES_DIR", "/etc/pve/nodes")
+
+
+def cluster_peers() -> List[Tuple[str, str]]:
+    """(node, address) of the other online nodes of the Proxmox cluster.
+
+    /etc/pve/.members has the addresses and online state; without it the node
+    directories in /etc/pve/nodes are used with the node name as address.
+    """
+    own = socket.gethostname().split(".")[0]
+    members = (read_json(PVE_MEMBERS_FILE) or {}).get("nodelist")
+    if isinstance(members, dict):
+        return [(node, info.get("ip") or node) for node, info in sorted(members.items())
+                if node != own and info.get("online", 1)]
+    try:
+        nodes = sorted(entry.name for entry in os.scandir(PVE_NODES_DIR) if entry.is_dir())
+    except OSError:
+        return []
+    return [(node, node) for node in nodes if node != own]
+
+
+def cluster_address() -> Optional[str]:
+    """This node's address in the cluster network (/etc/pve/.members), None without one."""
+    own = socket.gethostname().split(".")[0]
+    members = (read_json(PVE_MEMBERS_FILE) or {}).get("nodelist")
+    if isinstance(members, dict) and isinstance(members.get(own), dict):
+        return members[own].get("ip") or None
+    return None
+
+
+def parse_image_ref(oci_image: str) -> str:
+    """
+    Parse and normalize OCI image reference for skopeo.
+
+    Returns docker:// formatted image reference.
+    Examples:
+      alpine:latest -> docker://alpine:latest
+      docker://alpine:latest -> docker://alpine:latest
+      docker://user/image:tag -> docker://user/image:tag
+      oci://ghcr.io/owner/repo:tag -> docker://ghcr.io/owner/repo:tag
+    """
+    # Remove protocol prefix if present
+    image_ref = re.sub(r'^[^:]+://', '', oci_image)
+
+    # Add docker:// prefix (skopeo accepts docker:// for all registries)
+    if not image_ref.startswith('docker://'):
+        # Check if it's already a full registry URL
+        if '/' in image_ref and ('.' in image_ref.split('/')[0] or ':' in image_ref.split('/')[0]):
+            # Has explicit registry (e.g., ghcr.io/image:tag)
+            return f"docker://{image_ref}"
+        else:
+            # Docker Hub image (e.g., alpine:latest or user/image:tag)
+            return f"docker://{image_ref}"
+
+    return image_ref
+
+
+def _layer_path(name: str) -> str:
+    return os.path.normpath("/" + name).lstrip("/")
+
+
+def split_image_tag(image_ref: str) -> Tuple[str, str]:
+    """Split docker://image:tag (or image@sha256:...) into image name and tag."""
+    image_with_tag = image_ref.replace('docker://', '')
+    if '@' in image_with_tag:
+        # Digest reference (image@sha256:...), pinned to one manifest
+        image, tag = image_with_tag.split('@', 1)
+    elif ':' in image_with_tag.split('/')[-1]:
+        image, tag = image_with_tag.rsplit(':', 1)
+    else:
+        image = image_with_tag
+        tag = "latest"
+    return image, tag
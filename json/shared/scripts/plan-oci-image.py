@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Report what pulling an OCI image would do, without downloading any layer.
+
+An archive that is already in the storage index is reported as cached without
+contacting the registry. Otherwise only manifest and config are read (within
+inspect_cache_ttl not even those) and compared with the blob store of
+oci_store_lib.py (prepended as library, with plan_pull in oci_pull_lib.py).
+
+Parameters (via template variables):
+  oci_image (required): OCI image reference
+  storage (optional): Proxmox storage name (default: local)
+  registry_username, registry_password, platform, inspect_cache_ttl, oci_mirror (optional):
+    as for get-oci-image.py
+  probe_peers (optional): "true" to ask the other cluster nodes (over SSH, a few
+    seconds at most) for an archive of the image (default: false, peer_node is null)
+
+Output (JSON to stdout):
+  [{"id": "pull_plan", "value": "{\"oci_image\", \"image\", \"tag\", \"version\", \"digest\",
+    \"cached\", \"template_path\", \"layers_total\", \"layers_reused\", \"bytes_total\",
+    \"bytes_to_download\", \"reuse_ratio\", \"space_shortages\", \"peer_node\"}"},
+   {"id": "plan_oci_image_timings", "value": "..."}]
+
+All logs go to stderr.
+"""
+
+import json
+import sys
+
+# Optional import for editor/type checking; at runtime this script is executed with the
+# library code prepended via stdin.
+try:
+    from oci_store_lib import *  # type: ignore
+    from oci_pull_lib import *  # type: ignore
+except Exception:
+    pass
+
+def log(message: str) -> None:
+    """Print message to stderr (for logging/progress)."""
+    print(message, file=sys.stderr, flush=True)
+
+def error(message: str, exit_code: int = 1) -> None:
+    """Print error to stderr and exit."""
+    log(f"Error: {message}")
+    sys.exit(exit_code)
+
+def main() -> None:
+    """Main function."""
+    oci_image = "{{ oci_image }}"
+    storage = "{{ storage }}"
+    probe_peers = "{{ probe_peers }}".strip().lower() in ("true", "1", "yes")
+    options = PullOptions.from_params(
+        registry_username="{{ registry_username }}",
+        registry_password="{{ registry_password }}",
+        platform="{{ platform }}",
+        inspect_cache_ttl="{{ inspect_cache_ttl }}",
+        oci_mirror="{{ oci_mirror }}",
+    )
+
+    if not oci_image or oci_image == "NOT_DEFINED":
+        error("oci_image parameter is required!")
+    if not storage or storage == "NOT_DEFINED":
+        storage = 'local'
+
+    with options.timer.phase("index"):
+        index = open_storage_index(storage)
+    try:
+        plan = plan_pull(oci_image, index, options, probe_peers)
+    except PullError as e:
+        error(str(e))
+    print(json.dumps([{"id": "pull_plan", "value": json.dumps(plan)},
+                      options.timer.output("plan_oci_image_timings")]))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        log("Interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        error(f"Unexpected error: {str(e)}", 1)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Prefetch several OCI images into a Proxmox storage (template cache warm-up).
+
+Each image is pulled like get-oci-image.py does (pull_image in oci_pull_lib.py,
+prepended as library). Pulls run in parallel, limited per registry, and share one
+bandwidth limit; layers common to several images are downloaded only once.
+
+Parameters (via template variables):
+  oci_images (required): Image references, one per line (or comma separated)
+  storage (optional): Proxmox storage name (default: local)
+  registry_username, registry_password, platform, inspect_cache_ttl, pull_stall_timeout,
+  max_bandwidth, download_lock_timeout, cache_budget, gc_min_free, oci_mirror, squash,
+  squash_prune, host_max_bandwidth, bandwidth_schedule (optional): as for get-oci-image.py
+  registry_concurrency (optional): Parallel pulls per registry, either one number for
+    all registries or e.g. "ghcr.io=4,docker.io=2,default=1" (default: 2)
+
+Output (JSON to stdout):
+  [{"id": "prefetched_images", "value": "<JSON array>"}, {"id": "prefetch_oci_images_timings", "value": "..."}]
+  with one record per image (template_path, ostype, application_id, oci_image,
+  oci_image_tag), or {"oci_image": ..., "error": ...} for images that failed.
+  The script fails only if all images failed.
+
+All logs and progress go to stderr.
+"""
+
+import json
+import sys
+
+# Optional import for editor/type checking; at runtime this script is executed with the
+# library code prepended via stdin.
+try:
+    from oci_store_lib import *  # type: ignore
+    from oci_pull_lib import *  # type: ignore
+    from oci_prefetch_lib import *  # type: ignore
+except Exception:
+    pass
+
+def log(message: str) -> None:
+    """Print message to stderr (for logging/progress)."""
+    print(message, file=sys.stderr, flush=True)
+
+def error(message: str, exit_code: int = 1) -> None:
+    """Print error to stderr and exit."""
+    log(f"Error: {message}")
+    sys.exit(exit_code)
+
+def main() -> None:
+    """Main function."""
+    if not check_skopeo():
+        error("skopeo is required but not found. Please install it with: apt install skopeo")
+
+    oci_images = "{{ oci_images }}"
+    storage = "{{ storage }}"
+    registry_concurrency = "{{ registry_concurrency }}"
+    options = PullOptions.from_params(
+        registry_username="{{ registry_username }}",
+        registry_password="{{ registry_password }}",
+        platform="{{ platform }}",
+        inspect_cache_ttl="{{ inspect_cache_ttl }}",
+        pull_stall_timeout="{{ pull_stall_timeout }}",
+        max_bandwidth="{{ max_bandwidth }}",
+        download_lock_timeout="{{ download_lock_timeout }}",
+        cache_budget="{{ cache_budget }}",
+        gc_min_free="{{ gc_min_free }}",
+        oci_mirror="{{ oci_mirror }}",
+        squash="{{ squash }}",
+        squash_prune="{{ squash_prune }}",
+        host_max_bandwidth="{{ host_max_bandwidth }}",
+        bandwidth_schedule="{{ bandwidth_schedule }}",
+    )
+
+    if not oci_images or oci_images == "NOT_DEFINED":
+        error("oci_images parameter is required!")
+    images = parse_image_list(oci_images)
+    if not images:
+        error("oci_images does not contain any image reference")
+    if not storage or storage == "NOT_DEFINED":
+        storage = 'local'
+    if not registry_concurrency or registry_concurrency == "NOT_DEFINED":
+        registry_concurrency = None
+
+    log(f"Prefetching {len(images)} OCI images")
+    if options.platform:
+        log(f"Target platform: {options.platform}")
+    with options.timer.phase("index"):
+        index = open_storage_index(storage)
+    results = prefetch_images(images, index, options, registry_concurrency)
+    failed = [r for r in results if r.get("error")]
+    log(f"Prefetched {len(results) - len(failed)} of {len(results)} images")
+    print(json.dumps([{"id": "prefetched_images", "value": json.dumps(results)},
+                      options.timer.output("prefetch_oci_images_timings")]))
+    sys.exit(1 if failed and len(failed) == len(results) else 0)
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        log("Interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        error(f"Unexpected error: {str(e)}", 1)
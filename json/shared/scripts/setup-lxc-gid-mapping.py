@@ -14,7 +14,7 @@ Mock paths for testing:
   - MOCK_CONFIG_DIR: Override /etc/pve/lxc directory
 
 Output: JSON to stdout with mapped_gid (errors to stderr)
-    [{"id": "mapped_gid", "value": "101000"}]
+    [{"id": "mapped_gid", "value": "101000"}, {"id": "setup_lxc_gid_mapping_timings", "value": "..."}]
 """
 
 import json
@@ -45,9 +45,14 @@ try:
 except Exception:
     # If the module isn't available as a file, we expect it to be prepended.
     pass
+try:
+    from deployer_common_lib import PhaseTimer  # type: ignore
+except Exception:
+    pass
 
 
 def main() -> None:
+    timer = PhaseTimer()
     gid_str = "{{ gid }}"
     vm_id = "{{ vm_id }}"
 
@@ -68,21 +73,23 @@ def main() -> None:
 
     eprint(f"setup-lxc-gid-mapping: requested GIDs for 1:1 mapping: {gid_list}")
 
-    update_file(subgid_path, calculate_subid_entries(gid_list))
+    with timer.phase("subgid"):
+        update_file(subgid_path, calculate_subid_entries(gid_list))
     eprint(f"setup-lxc-gid-mapping: ensured /etc/subgid entries for {len(gid_list)} GID(s)")
 
     config_lines: List[str] = []
     config_path: Path | None = None
     if vm_id and vm_id.isdigit():
-        config_path = Path(config_dir) / f"{vm_id}.conf"
-        idmap_entries = calculate_idmap_entries(gid_list, "g")
-        if idmap_entries:
-            update_lxc_config_kind(config_path, "g", idmap_entries)
-            eprint(f"setup-lxc-gid-mapping: updated {config_path} with {len(idmap_entries)} GID idmap line(s)")
-        try:
-            config_lines = config_path.read_text(encoding="utf-8").splitlines(True)
-        except Exception:
-            config_lines = []
+        with timer.phase("lxc_config"):
+            config_path = Path(config_dir) / f"{vm_id}.conf"
+            idmap_entries = calculate_idmap_entries(gid_list, "g")
+            if idmap_entries:
+                update_lxc_config_kind(config_path, "g", idmap_entries)
+                eprint(f"setup-lxc-gid-mapping: updated {config_path} with {len(idmap_entries)} GID idmap line(s)")
+            try:
+                config_lines = config_path.read_text(encoding="utf-8").splitlines(True)
+            except Exception:
+                config_lines = []
     else:
         if vm_id:
             eprint("setup-lxc-gid-mapping: vm_id is not numeric; skipping lxc config updates")
@@ -97,7 +104,7 @@ def main() -> None:
 
     mapped_gid_val = compute_host_id_for_container_id(gid_list[0], g_segments, unprivileged)
     eprint(f"setup-lxc-gid-mapping: mapped_gid for container gid {gid_list[0]} -> host gid {mapped_gid_val}")
-    print(json.dumps([{"id": "mapped_gid", "value": str(mapped_gid_val)}]))
+    print(json.dumps([{"id": "mapped_gid", "value": str(mapped_gid_val)}, timer.output("setup_lxc_gid_mapping_timings")]))
 
 
 if __name__ == "__main__":
@@ -14,7 +14,7 @@ Mock paths for testing:
     - MOCK_CONFIG_DIR: Override /etc/pve/lxc directory
 
 Output: JSON to stdout with mapped_uid (errors to stderr)
-        [{"id": "mapped_uid", "value": "101000"}]
+        [{"id": "mapped_uid", "value": "101000"}, {"id": "setup_lxc_uid_mapping_timings", "value": "..."}]
 """
 
 import json
@@ -45,8 +45,13 @@ try:
 except Exception:
     # If the module isn't available as a file, we expect it to be prepended.
     pass
+try:
+    from deployer_common_lib import PhaseTimer  # type: ignore
+except Exception:
+    pass
 
 def main():
+    timer = PhaseTimer()
     # Get parameters from template variables (will be replaced by sed during script download)
     uid_str = "{{ uid }}"
     vm_id = "{{ vm_id }}"
@@ -69,22 +74,24 @@ def main():
         return
 
     eprint(f"setup-lxc-uid-mapping: requested UIDs for 1:1 mapping: {uid_list}")
-    update_file(subuid_path, calculate_subid_entries(uid_list))
+    with timer.phase("subuid"):
+        update_file(subuid_path, calculate_subid_entries(uid_list))
     eprint(f"setup-lxc-uid-mapping: ensured /etc/subuid entries for {len(uid_list)} UID(s)")
 
     # Default: assume unprivileged unless config says otherwise
     config_lines: List[str] = []
     config_path: Path | None = None
     if vm_id and vm_id.isdigit():
-        config_path = Path(config_dir) / f"{vm_id}.conf"
-        idmap_entries = calculate_idmap_entries(uid_list, "u")
-        if idmap_entries:
-            update_lxc_config_kind(config_path, "u", idmap_entries)
-            eprint(f"setup-lxc-uid-mapping: updated {config_path} with {len(idmap_entries)} UID idmap line(s)")
-        try:
-            config_lines = config_path.read_text(encoding="utf-8").splitlines(True)
-        except Exception:
-            config_lines = []
+        with timer.phase("lxc_config"):
+            config_path = Path(config_dir) / f"{vm_id}.conf"
+            idmap_entries = calculate_idmap_entries(uid_list, "u")
+            if idmap_entries:
+                update_lxc_config_kind(config_path, "u", idmap_entries)
+                eprint(f"setup-lxc-uid-mapping: updated {config_path} with {len(idmap_entries)} UID idmap line(s)")
+            try:
+                config_lines = config_path.read_text(encoding="utf-8").splitlines(True)
+            except Exception:
+                config_lines = []
     else:
         if vm_id:
             eprint("setup-lxc-uid-mapping: vm_id is not numeric; skipping lxc config updates")
@@ -99,7 +106,7 @@ def main():
 
     mapped_uid_val = compute_host_id_for_container_id(uid_list[0], u_segments, unprivileged)
     eprint(f"setup-lxc-uid-mapping: mapped_uid for container uid {uid_list[0]} -> host uid {mapped_uid_val}")
-    print(json.dumps([{"id": "mapped_uid", "value": str(mapped_uid_val)}]))
+    print(json.dumps([{"id": "mapped_uid", "value": str(mapped_uid_val)}, timer.output("setup_lxc_uid_mapping_timings")]))
 
 if __name__ == '__main__':
     try: